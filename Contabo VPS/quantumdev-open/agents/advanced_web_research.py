@@ -310,7 +310,7 @@ class AdvancedWebResearch:
             Nuova query di ricerca o None se non serve
         """
         try:
-            from core.chat_engine import reply_with_llm
+            from core.chat_engine import PRIORITY_BACKGROUND, reply_with_llm
             from core.token_budget import trim_to_tokens
         except ImportError as e:
             log.error(f"Import error in follow-up generation: {e}")
@@ -350,7 +350,7 @@ REGOLE:
 NUOVA QUERY DI RICERCA:"""
         
         try:
-            follow_up = await reply_with_llm(prompt, "")
+            follow_up = await reply_with_llm(prompt, "", priority=PRIORITY_BACKGROUND)
             
             # Pulisci la risposta
             follow_up = (follow_up or "").strip()
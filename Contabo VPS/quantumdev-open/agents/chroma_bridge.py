@@ -6,7 +6,7 @@ import uuid
 
 from dotenv import load_dotenv
 from chromadb import PersistentClient
-from sentence_transformers import SentenceTransformer
+from core.embedding_service import get_embedding_service
 
 # === Load .env ===
 load_dotenv()
@@ -21,18 +21,18 @@ COLLECTION_NAME = "memory"
 
 client = PersistentClient(path=CHROMA_PATH)
 collection = client.get_or_create_collection(name=COLLECTION_NAME)
-model = SentenceTransformer("all-MiniLM-L6-v2")
+model = get_embedding_service("all-MiniLM-L6-v2")  # modello condiviso nel processo
 
 # === Funzioni ===
 def add_to_chroma(text):
-    embedding = model.encode(text).tolist()
+    embedding = model.encode_one(text).tolist()
     doc_id = str(uuid.uuid4())
     collection.add(documents=[text], embeddings=[embedding], ids=[doc_id])
     logger.info(f"✅ Aggiunto in memoria: {text[:50]}...")
     return doc_id
 
 def query_chroma(query_text, top_k=3):
-    query_embedding = model.encode(query_text).tolist()
+    query_embedding = model.encode_one(query_text).tolist()
     results = collection.query(query_embeddings=[query_embedding], n_results=top_k)
     return results
 
@@ -20,12 +20,108 @@ GUADAGNO ATTESO:
 """
 
 import asyncio
+import os
 import time
 from typing import List, Dict, Any, Tuple, Optional
 import logging
 
 log = logging.getLogger(__name__)
 
+# Tetto di fetch simultanei: con il client aiohttp nativo ogni fetch è solo
+# un socket sul loop, senza client async resta il limite del thread pool.
+NATIVE_MAX_CONCURRENT = int(os.getenv("WEB_FETCH_NATIVE_MAX_CONCURRENT", "16"))
+EXECUTOR_MAX_CONCURRENT = 6
+
+# Prefetch speculativo: quanti URL (per rank grezzo della SERP) scaricare
+# mentre reranker e diversifier lavorano. 0 = disattivato.
+PREFETCH_TOPN = int(os.getenv("WEB_PREFETCH_TOPN", "3"))
+
+
+# ==================== PREFETCH SPECULATIVO ====================
+
+class SpeculativePrefetcher:
+    """
+    Avvia il download dei primi URL della SERP prima del ranking.
+
+    - `start(items)`: lancia i fetch (saltando gli URL freschi in DomainCache,
+      rivalidando quelli stale) come task in background
+    - `retain(urls)`: a ranking finito cancella i fetch scartati
+    - `take(url)`: `parallel_fetch_and_extract` adotta il task invece di
+      riscaricare la pagina
+    - `cancel_all()`: da chiamare sempre a fine pipeline
+    """
+
+    def __init__(
+        self,
+        timeout_per_url: float = 4.0,
+        domain_cache=None,
+        category: str = "generic",
+    ) -> None:
+        self.timeout_per_url = timeout_per_url
+        self.domain_cache = domain_cache
+        self.category = category
+        self._tasks: Dict[str, "asyncio.Task[Any]"] = {}
+        self.stats = {"started": 0, "used": 0, "cancelled": 0}
+
+    def start(self, items: List[Dict[str, Any]], limit: int = PREFETCH_TOPN) -> None:
+        if limit <= 0:
+            return
+        try:
+            from core.web_tools import fetch_page_extract
+        except ImportError:
+            return
+
+        urls: List[str] = []
+        for item in items:
+            url = item.get("url", "")
+            if url and url not in self._tasks and url not in urls:
+                urls.append(url)
+            if len(urls) >= limit:
+                break
+        if not urls:
+            return
+
+        lookup: Dict[str, Any] = {}
+        if self.domain_cache is not None:
+            lookup = self.domain_cache.bulk_check(urls, self.category, include_stale=True)
+
+        for url in urls:
+            entry = lookup.get(url) or {}
+            if entry.get("content") and not entry.get("stale"):
+                continue  # già fresco in cache, niente da scaricare
+            self._tasks[url] = asyncio.create_task(
+                self._run(fetch_page_extract, url, entry.get("etag"), entry.get("last_modified"))
+            )
+            self.stats["started"] += 1
+        if self._tasks:
+            log.info(f"🚀 Prefetch speculativo: {len(self._tasks)} URL")
+
+    async def _run(self, fetch_page_extract, url: str, etag, last_modified):
+        try:
+            return await fetch_page_extract(
+                url, timeout=self.timeout_per_url, etag=etag, last_modified=last_modified
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.debug(f"Prefetch failed {url}: {e}")
+            return None
+
+    def take(self, url: str) -> Optional["asyncio.Task[Any]"]:
+        task = self._tasks.pop(url, None)
+        if task is not None:
+            self.stats["used"] += 1
+        return task
+
+    def retain(self, urls: List[str]) -> None:
+        keep = set(urls)
+        for url in [u for u in self._tasks if u not in keep]:
+            self._tasks.pop(url).cancel()
+            self.stats["cancelled"] += 1
+
+    def cancel_all(self) -> None:
+        self.retain([])
+
 
 # ==================== VERSIONE OTTIMIZZATA ====================
 
@@ -34,6 +130,9 @@ async def parallel_fetch_and_extract(
     max_concurrent: int = 4,
     timeout_per_url: float = 4.0,
     min_successful: int = 2,
+    domain_cache=None,
+    category: str = "generic",
+    prefetcher: Optional[SpeculativePrefetcher] = None,
 ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
     """
     Fetch parallelo di URLs con early exit e stats dettagliate.
@@ -44,11 +143,18 @@ async def parallel_fetch_and_extract(
         max_concurrent: Max fetch simultanei (default 4)
         timeout_per_url: Timeout PER SINGOLO URL (default 4s)
         min_successful: Esci appena hai N successi (default 2)
+        domain_cache: DomainCache opzionale (core.advanced_cache): gli URL
+            ancora freschi non vengono scaricati (un solo bulk_check), quelli
+            scaduti con ETag/Last-Modified vengono rivalidati con GET condizionale
+        category: Categoria TTL per la cache
+        prefetcher: SpeculativePrefetcher opzionale: gli URL già in download
+            vengono adottati invece di essere riscaricati
     
     Returns:
         (extracted_docs, stats)
         extracted_docs: Lista di dict con {url, title, text, og_image}
-        stats: Dict con metriche (attempted, ok, timeouts, errors, duration_ms)
+        stats: Dict con metriche (attempted, ok, timeouts, errors, duration_ms,
+            cache_hits, revalidated)
     """
     
     # OPTIMIZATION: Early return per input vuoto
@@ -56,17 +162,24 @@ async def parallel_fetch_and_extract(
         return [], {"attempted": 0, "ok": 0, "timeouts": 0, "errors": 0, "duration_ms": 0, "early_exit": False}
     
     # Import lazy per non rompere se modulo manca
+    native = False
     try:
-        from core.web_tools import fetch_and_extract_robust
+        from core.web_tools import fetch_page_extract, AIOHTTP_AVAILABLE
+        native = AIOHTTP_AVAILABLE
     except ImportError:
-        log.error("❌ fetch_and_extract_robust not found, fallback to sync version")
+        log.error("❌ fetch_page_extract not found, fallback to sync version")
         try:
+            from types import SimpleNamespace
             from core.web_tools import fetch_and_extract
             
-            # Wrap sincrona in async
-            async def fetch_and_extract_robust(url: str, timeout: float = 4.0):
+            # Wrap sincrona in async (niente GET condizionale)
+            async def fetch_page_extract(url: str, timeout: float = 4.0, **_validators):
                 loop = asyncio.get_running_loop()
-                return await loop.run_in_executor(None, fetch_and_extract, url, timeout)
+                text, og = await loop.run_in_executor(None, fetch_and_extract, url, timeout)
+                return SimpleNamespace(
+                    text=text, og_image=og, not_modified=False, etag=None, last_modified=None,
+                    ok=bool(text),
+                )
         except ImportError:
             log.error("❌ No fetch function available!")
             return [], {"error": "fetch_unavailable"}
@@ -77,35 +190,94 @@ async def parallel_fetch_and_extract(
     timeouts = 0
     errors = 0
     attempted = 0
+    cache_hits = 0
+    revalidated = 0
+    prefetched = 0
+    
+    # Pre-filtro cache: un'unica pipeline Redis per tutta la top-k
+    stale_entries: Dict[str, Dict[str, Any]] = {}
+    to_fetch: List[Tuple[int, Dict[str, Any]]] = list(enumerate(results))
+    if domain_cache is not None:
+        urls = [item.get("url", "") for item in results if item.get("url")]
+        lookup = domain_cache.bulk_check(urls, category, include_stale=True) if urls else {}
+        to_fetch = []
+        for idx, item in enumerate(results):
+            entry = lookup.get(item.get("url", ""))
+            if entry and entry.get("content") and not entry.get("stale"):
+                cache_hits += 1
+                extracted.append(_cached_doc(item, entry, idx))
+                continue
+            if entry and entry.get("content") and (entry.get("etag") or entry.get("last_modified")):
+                stale_entries[item["url"]] = entry
+            to_fetch.append((idx, item))
+        if cache_hits:
+            log.info(f"💾 Content cache: {cache_hits} hit, {len(stale_entries)} da rivalidare")
+        if 0 < min_successful <= cache_hits:
+            to_fetch = []  # la cache basta già per l'early exit
     
     # OPTIMIZATION: Aumenta concorrenza se molti URL
-    effective_concurrent = min(max_concurrent, len(results), 6)  # Max 6 paralleli
+    hard_cap = NATIVE_MAX_CONCURRENT if native else EXECUTOR_MAX_CONCURRENT
+    effective_concurrent = max(1, min(max_concurrent, len(to_fetch) or 1, hard_cap))
     
     # Semaforo per limitare concorrenza
     semaphore = asyncio.Semaphore(effective_concurrent)
     
     async def _fetch_one(item: Dict[str, Any], idx: int) -> Optional[Dict[str, Any]]:
         """Fetch singolo URL con timeout e error handling"""
-        nonlocal timeouts, errors, attempted
+        nonlocal timeouts, errors, attempted, revalidated, prefetched
         
         url = item.get("url", "")
         if not url:
             return None
         
         attempted += 1
+        entry = stale_entries.get(url)
+        task = prefetcher.take(url) if prefetcher is not None else None
         
         async with semaphore:
             try:
-                # Timeout per QUESTO URL specifico
-                text, og_img = await asyncio.wait_for(
-                    fetch_and_extract_robust(url, timeout=timeout_per_url),
-                    timeout=timeout_per_url + 1.0  # +1s safety margin
-                )
+                page = None
+                if task is not None:
+                    # download partito durante il ranking: si adotta il task
+                    page = await asyncio.wait_for(task, timeout=timeout_per_url + 1.0)
+                    prefetched += 1
+                    if page is not None and page.not_modified and not entry:
+                        page = None  # 304 senza entry in cache: serve il body
                 
-                if not text or len(text) < 100:
+                if page is None:
+                    # Timeout per QUESTO URL specifico
+                    page = await asyncio.wait_for(
+                        fetch_page_extract(
+                            url,
+                            timeout=timeout_per_url,
+                            etag=(entry or {}).get("etag"),
+                            last_modified=(entry or {}).get("last_modified"),
+                        ),
+                        timeout=timeout_per_url + 1.0  # +1s safety margin
+                    )
+                
+                if page.not_modified and entry:
+                    # 304: estratto in cache ancora valido, solo nuovo TTL
+                    revalidated += 1
+                    domain_cache.touch(entry, category)
+                    return _cached_doc(item, entry, idx, revalidated=True)
+                
+                text, og_img = page.text, page.og_image
+                # fetch fallito: mai contato come ok né scritto in DomainCache
+                if not getattr(page, "ok", True) or not text or len(text) < 100:
                     errors += 1
                     return None
                 
+                if domain_cache is not None:
+                    domain_cache.set(
+                        url,
+                        text,
+                        {"og_image": og_img},
+                        category,
+                        etag=page.etag,
+                        last_modified=page.last_modified,
+                    )
+                
                 return {
                     "url": url,
                     "title": item.get("title", url),
@@ -126,11 +298,13 @@ async def parallel_fetch_and_extract(
     # Crea task per tutti gli URL
     tasks = [
         asyncio.create_task(_fetch_one(item, idx))
-        for idx, item in enumerate(results)
+        for idx, item in to_fetch
     ]
     
     # Strategy: return_when=FIRST_COMPLETED per early exit
-    if min_successful > 0:
+    if not tasks:
+        pass
+    elif min_successful > 0:
         # Aspetta task uno per uno
         pending = set(tasks)
         
@@ -167,7 +341,7 @@ async def parallel_fetch_and_extract(
     else:
         # Nessun early exit, aspetta tutti
         results_list = await asyncio.gather(*tasks, return_exceptions=True)
-        extracted = [r for r in results_list if isinstance(r, dict) and r.get("text")]
+        extracted += [r for r in results_list if isinstance(r, dict) and r.get("text")]
     
     duration_ms = int((time.perf_counter() - t_start) * 1000)
     
@@ -177,7 +351,10 @@ async def parallel_fetch_and_extract(
         "timeouts": timeouts,
         "errors": errors,
         "duration_ms": duration_ms,
-        "early_exit": len(extracted) >= min_successful and len(tasks) > len(extracted),
+        "early_exit": len(extracted) >= min_successful and len(results) > len(extracted),
+        "cache_hits": cache_hits,
+        "revalidated": revalidated,
+        "prefetched": prefetched,
     }
     
     log.info(f"📊 Fetch stats: {stats}")
@@ -185,6 +362,24 @@ async def parallel_fetch_and_extract(
     return extracted, stats
 
 
+def _cached_doc(
+    item: Dict[str, Any],
+    entry: Dict[str, Any],
+    idx: int,
+    revalidated: bool = False,
+) -> Dict[str, Any]:
+    """Documento estratto ricostruito da una entry DomainCache."""
+    return {
+        "url": item.get("url", ""),
+        "title": item.get("title", item.get("url", "")),
+        "text": entry.get("content", ""),
+        "og_image": (entry.get("metadata") or {}).get("og_image"),
+        "index": idx,
+        "cached": True,
+        "revalidated": revalidated,
+    }
+
+
 # ==================== PATCH PER quantum_api.py ====================
 
 def generate_quantum_api_patch():
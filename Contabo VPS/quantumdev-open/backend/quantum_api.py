@@ -55,10 +55,11 @@ import json
 import hashlib
 import logging
 import math
-from typing import Optional, List, Dict, Tuple, Any
+from typing import Optional, List, Dict, Tuple, Any, AsyncIterator
 
 import redis
 from fastapi import FastAPI, Request, Body, UploadFile, File
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from urllib.parse import urlparse
 from pydantic import BaseModel, Field
@@ -79,6 +80,19 @@ if ROOT not in sys.path:
 # === CORE ===
 from core.persona_store import get_persona, set_persona, reset_persona
 from core.web_tools import fetch_and_extract
+from core.singleflight import get_singleflight, normalize_query, singleflight_stats
+from core.inference_executor import inference_stats, shutdown_inference_executor
+from core.embedding_context import embedding_context_stats, embedding_scope
+from core.embedding_service import embedding_service_stats
+from core.hybrid_retrieval import hybrid_stats
+from core.llm_client import close_llm_client, llm_client_stats, post_json
+from core.endpoint_manager import (
+    LLM_EP_MANAGER_ENABLED,
+    EndpointManager,
+    get_endpoint_manager,
+    report_endpoint,
+    set_endpoint_manager,
+)
 
 # Mini-cache web (import resiliente)
 try:
@@ -101,7 +115,16 @@ except Exception:  # pragma: no cover
         return base
 
 
-from core.chat_engine import reply_with_llm
+from core.chat_engine import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    LLMOverloadedError,
+    background_slots,
+    llm_priority,
+    reply_with_llm,
+    stream_completion,
+    stream_with_llm,
+)
 from core.memory_autosave import autosave
 
 # LLM config presets for optimized parameters
@@ -296,6 +319,7 @@ def _ensure_semcache_import() -> None:
 
 # search helpers
 from core.source_policy import pick_domains
+from core.advanced_cache import detect_category
 from core.web_querybuilder import build_query_variants
 from core.reranker import Reranker
 
@@ -341,6 +365,7 @@ from utils.chroma_handler import (
     add_pref,
     add_bet,
     search_topk,
+    search_topk_async,
     debug_dump,
     _substring_fallback,
     FACTS,
@@ -359,7 +384,7 @@ from utils.chroma_handler import (
 
 # 🔥 Nuovi import (sintesi aggressiva + fetch parallelo ottimizzato)
 from backend.synthesis_prompt_v2 import build_aggressive_synthesis_prompt
-from backend.parallel_fetch_optimizer import parallel_fetch_and_extract
+from backend.parallel_fetch_optimizer import parallel_fetch_and_extract, SpeculativePrefetcher
 
 # 🆕 PROBLEMA 2 & 3: Web response formatter + Conversational context
 from core.web_response_formatter import format_web_response
@@ -380,6 +405,14 @@ app = FastAPI()
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
+
+@app.middleware("http")
+async def _embedding_scope_mw(request: Request, call_next):
+    # Un embedding per testo per richiesta: semantic cache, search_topk e memorie
+    # riusano lo stesso vettore (contextvar → si propaga a task e threadpool).
+    with embedding_scope():
+        return await call_next(request)
+
 # ============================= ENV ===================================
 
 
@@ -435,8 +468,12 @@ WEB_USE_CONCISE_FORMATTER = env_bool("WEB_USE_CONCISE_FORMATTER", True)  # Enabl
 
 # ⚡️ Parallel fetch env
 WEB_FETCH_TIMEOUT_S = env_float("WEB_FETCH_TIMEOUT_S", 3.0)
-WEB_FETCH_MAX_INFLIGHT = env_int("WEB_FETCH_MAX_INFLIGHT", 4)
+WEB_FETCH_MAX_INFLIGHT = env_int("WEB_FETCH_MAX_INFLIGHT", 8)
 WEB_READ_TIMEOUT_S = env_float("WEB_READ_TIMEOUT_S", 6.0)
+# Cache contenuti estratti per URL canonico (+ rivalidazione ETag/Last-Modified)
+DOMAIN_CACHE_ENABLED = env_bool("DOMAIN_CACHE_ENABLED", True)
+# Prefetch speculativo dei primi URL SERP durante il ranking (0 = off)
+WEB_PREFETCH_TOPN = env_int("WEB_PREFETCH_TOPN", 3)
 
 # 🚀 Live Agent Cache TTL (in secondi)
 LIVE_CACHE_TTL_WEATHER = env_int("LIVE_CACHE_TTL_WEATHER", 1800)  # 30 min
@@ -462,6 +499,7 @@ redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
 USE_RERANKER = env_bool("USE_RERANKER", True)
 RERANKER_MODEL = os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-base")
 RERANKER_DEVICE = os.getenv("RERANKER_DEVICE", "cpu")
+RERANKER_WARMUP = env_bool("RERANKER_WARMUP", True)
 
 # Diversifier (flag globale)
 DIVERSIFIER_ENABLED = env_bool("DIVERSIFIER_ENABLED", True)
@@ -580,6 +618,25 @@ def get_reranker() -> Optional[Reranker]:
     return _reranker
 
 
+_DOMAIN_CACHE: Optional[Any] = None
+
+
+def get_domain_cache() -> Optional[Any]:
+    """DomainCache (core.advanced_cache) sul redis_client condiviso, se abilitata."""
+    global _DOMAIN_CACHE
+    if not DOMAIN_CACHE_ENABLED:
+        return None
+    if _DOMAIN_CACHE is None:
+        try:
+            from core.advanced_cache import DomainCache
+
+            _DOMAIN_CACHE = DomainCache(redis_client)
+        except Exception as e:
+            log.error(f"DomainCache init failed: {e}")
+            return None
+    return _DOMAIN_CACHE
+
+
 def _normalize_base(u: str) -> str:
     return u.rstrip("/")
 
@@ -603,6 +660,14 @@ def _get_redis_str(k: str) -> Optional[str]:
 
 
 def get_endpoints() -> List[str]:
+    """Endpoint LLM da provare: dal manager (sani, per latenza) se attivo."""
+    mgr = get_endpoint_manager()
+    if mgr is not None:
+        return mgr.endpoints()
+    return _resolve_endpoints()
+
+
+def _resolve_endpoints() -> List[str]:
     tunnel = _get_redis_str("gpu_tunnel_endpoint") or ENV_TUNNEL_ENDPOINT
     direct = _get_redis_str("gpu_active_endpoint") or ENV_LLM_ENDPOINT
     out: List[str] = []
@@ -656,10 +721,40 @@ def _wrap(text: str, model: str) -> Dict[str, Any]:
     }
 
 
-def _run_direct(
-    payload: Dict[str, Any],
-    force: Optional[str],
-) -> Tuple[Optional[Dict[str, Any]], Optional[str], Optional[str]]:
+# Risposta rapida quando lo scheduler LLM scarta la richiesta (coda satura)
+LLM_OVERLOADED_REPLY = (
+    "Sono sotto carico in questo momento e non riesco a rispondere subito. "
+    "Riprova tra qualche secondo."
+)
+
+
+def _sse(event: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """
+    Risposta SSE per le varianti stream di /chat, /generate, /web/summarize.
+
+    Eventi: {"delta": "..."} per ogni pezzo di testo, poi un solo
+    {"done": true, ...} con la risposta completa (stessi campi della
+    variante JSON); {"error": "..."} se l'LLM cade a metà stream.
+    """
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _sse_once(text: str, final: Dict[str, Any]) -> AsyncIterator[str]:
+    """Stream di una risposta già pronta (cache, agent, errori)."""
+    if text:
+        yield _sse({"delta": text})
+    yield _sse({"done": True, **final})
+
+
+def _ordered_endpoints(force: Optional[str]) -> List[str]:
     endpoints = get_endpoints()
     if force == "tunnel":
         endpoints = [e for e in endpoints if "trycloudflare.com" in e] + [
@@ -669,15 +764,28 @@ def _run_direct(
         endpoints = [e for e in endpoints if "trycloudflare.com" not in e] + [
             e for e in endpoints if "trycloudflare.com" in e
         ]
+    return endpoints
+
+
+async def _run_direct(
+    payload: Dict[str, Any],
+    force: Optional[str],
+    priority: Optional[str] = None,
+) -> Tuple[Optional[Dict[str, Any]], Optional[str], Optional[str]]:
+    """Prova gli endpoint in ordine; LLMOverloadedError (coda satura) non fa failover."""
+    endpoints = _ordered_endpoints(force)
     last: Optional[str] = None
     for url in endpoints:
         try:
-            r = requests.post(url, json=payload, timeout=30)
-            r.raise_for_status()
-            return r.json(), url, None
+            result = await post_json(url, payload, timeout=30, priority=priority)
+        except LLMOverloadedError:
+            raise
         except Exception as e:
+            report_endpoint(url, False, e)
             last = str(e)
             continue
+        report_endpoint(url, True)
+        return result, url, None
     return None, None, last
 
 
@@ -796,7 +904,25 @@ async def cached_live_call(
     
     Returns:
         Risultato dalla cache o dalla coroutine
+
+    Chiamate concorrenti con la stessa chiave condividono una sola esecuzione:
+    la coroutine dei chiamanti agganciati viene chiusa senza essere eseguita.
     """
+    return await _LIVE_CALL_SF.do(
+        cache_key,
+        lambda: _cached_live_call_impl(cache_key, ttl_seconds, coro),
+        on_join=coro.close,
+    )
+
+
+_LIVE_CALL_SF = get_singleflight("live_call", copy_result=False)
+
+
+async def _cached_live_call_impl(
+    cache_key: str,
+    ttl_seconds: int,
+    coro,
+) -> Optional[str]:
     try:
         # Check cache
         cached = redis_client.get(cache_key)
@@ -899,6 +1025,19 @@ def _semcache_dualwrite(
         log.warning(f"Semantic cache set error (dualwrite): {e}")
 
 
+async def _semcache_dualwrite_async(
+    prompt: str,
+    system_prompt: str,
+    model_name: str,
+    used_intent: str,
+    response_obj: Dict[str, Any],
+) -> None:
+    # encode della query (executor di inferenza) e journal: fuori dall'event loop
+    await asyncio.to_thread(
+        _semcache_dualwrite, prompt, system_prompt, model_name, used_intent, response_obj
+    )
+
+
 # --------- Meta/capability queries → mai WEB --------------------------
 _META_PATTERNS = [
     r"\b(chi\s+sei|che\s+cosa\s+puoi\s+fare|cosa\s+puoi\s+fare|come\s+funzioni)\b",
@@ -1062,12 +1201,39 @@ async def _fallback_internal_answer(
 
 
 # ===================== Web search pipeline ===========================
+_WEB_PIPELINE_SF = get_singleflight("web_pipeline")
+
+
 async def _web_search_pipeline(
     q: str,
     src: str,
     sid: str,
     k: int = 6,
     nsum: int = 2,
+) -> Dict[str, Any]:
+    """
+    Richieste identiche in volo (query normalizzata + k/nsum + persona)
+    condividono un'unica esecuzione di search → fetch → sintesi LLM. La
+    persona è nella chiave: la sintesi è scritta con il system prompt di
+    chi la esegue, utenti con persona diverse non la condividono.
+    """
+    try:
+        persona = await get_persona(src, sid)
+    except Exception:
+        persona = f"{src}:{sid}"  # persona non leggibile: nessuna condivisione tra utenti
+    persona_fp = hashlib.sha256(persona.encode("utf-8")).hexdigest()[:12]
+    key = f"{normalize_query(q)}|k={k}|nsum={nsum}|persona={persona_fp}"
+    return await _WEB_PIPELINE_SF.do(
+        key, lambda: _web_search_pipeline_impl(q, src, sid, k, nsum)
+    )
+
+
+async def _web_search_pipeline_impl(
+    q: str,
+    src: str,
+    sid: str,
+    k: int = 6,
+    nsum: int = 2,
 ) -> Dict[str, Any]:
     t_start = time.perf_counter()
     
@@ -1104,19 +1270,19 @@ async def _web_search_pipeline(
     variants = build_query_variants(q, pol)
 
     try:
-        from core.web_search import search as web_search_core
+        from core.web_search import search_async as web_search_async
     except Exception as e:
         return {
             "error": "Backend web_search non configurato (core/web_search.py).",
             "_exception": str(e),
         }
 
+    # Tutte le varianti in una sola fan-out concorrente sui provider
     raw: List[Dict[str, Any]] = []
-    for v in variants:
-        try:
-            raw.extend(web_search_core(v, num=6))
-        except Exception:
-            pass
+    try:
+        raw = await web_search_async(q, num=6 * len(variants), variants=variants)
+    except Exception as e:
+        log.warning(f"Web search fan-out failed: {e}")
 
     seen: set[str] = set()
     dedup: List[Dict[str, Any]] = []
@@ -1133,6 +1299,18 @@ async def _web_search_pipeline(
         )
         seen.add(u)
 
+    # ⚡ Prefetch speculativo: i primi URL per rank grezzo partono subito,
+    # in parallelo a deep retry, reranker e diversifier
+    domain_cache = get_domain_cache()
+    fetch_category = detect_category(q)
+    prefetcher = SpeculativePrefetcher(
+        timeout_per_url=WEB_FETCH_TIMEOUT_S,
+        domain_cache=domain_cache,
+        category=fetch_category,
+    )
+    if nsum > 0:
+        prefetcher.start(dedup, limit=min(WEB_PREFETCH_TOPN, max(nsum, 1) + 1))
+
     # STEP 2: Deep-mode automatic retry if results are poor
     deep_retry_used = False
     good_results = [r for r in dedup if r.get("url")]
@@ -1156,12 +1334,16 @@ async def _web_search_pipeline(
                 )
                 
                 # Second search with relaxed query
+                relaxed_variants = build_query_variants(relaxed_q, pol)
                 raw_deep: List[Dict[str, Any]] = []
-                for v in build_query_variants(relaxed_q, pol):
-                    try:
-                        raw_deep.extend(web_search_core(v, num=6))
-                    except Exception:
-                        pass
+                try:
+                    raw_deep = await web_search_async(
+                        relaxed_q,
+                        num=6 * len(relaxed_variants),
+                        variants=relaxed_variants,
+                    )
+                except Exception as e:
+                    log.warning(f"Deep retry fan-out failed: {e}")
                 
                 # Deduplicate and merge with first results
                 for r in raw_deep:
@@ -1211,15 +1393,20 @@ async def _web_search_pipeline(
     used = False
     ranked: List[Dict[str, Any]]
 
+    rerank_ms = 0
     rr = get_reranker()
     if rr and len(dedup) > 1:
+        t_rerank_start = time.perf_counter()
         try:
-            ranked = rr.rerank(q, dedup, top_k=min(k * 2, len(dedup)))
+            # fuori dal loop: intanto i fetch speculativi avanzano; lo scoring
+            # gira sull'executor di inferenza (coda satura → fallback lessicale)
+            ranked = await asyncio.to_thread(rr.rerank, q, dedup, min(k * 2, len(dedup)))
             used = True
-            log.info(f"Reranker: {len(dedup)} → top {len(ranked)}")
+            log.info(f"Reranker[{rr.backend}]: {len(dedup)} → top {len(ranked)}")
         except Exception as e:
             log.warning(f"Reranker failed: {e}")
             ranked = _boost(dedup, pol.get("prefer", []))
+        rerank_ms = int((time.perf_counter() - t_rerank_start) * 1000)
     else:
         ranked = _boost(dedup, pol.get("prefer", []))
 
@@ -1250,6 +1437,9 @@ async def _web_search_pipeline(
             log.warning(f"Diversification failed: {e}")
             # continua con topk non diversificato
 
+    # scarta i prefetch di URL usciti dalla top-k
+    prefetcher.retain([r.get("url", "") for r in topk[:nsum]])
+
     # === ⚡ PARALLEL FETCHING (con helper ottimizzato) ⚡
     t_fetch_start = time.perf_counter()
 
@@ -1259,6 +1449,9 @@ async def _web_search_pipeline(
     errors = 0
     done_early = False
     fetch_duration_ms = 0
+    fetch_cache_hits = 0
+    fetch_revalidated = 0
+    fetch_prefetched = 0
 
     if topk and nsum > 0:
         # ⚡ PARALLEL FETCH
@@ -1267,6 +1460,9 @@ async def _web_search_pipeline(
             max_concurrent=WEB_FETCH_MAX_INFLIGHT,
             timeout_per_url=WEB_FETCH_TIMEOUT_S,
             min_successful=2,
+            domain_cache=domain_cache,
+            category=fetch_category,
+            prefetcher=prefetcher,
         )
 
         attempted = int(fetch_stats.get("attempted", 0))
@@ -1275,8 +1471,13 @@ async def _web_search_pipeline(
         errors = int(fetch_stats.get("errors", 0))
         fetch_duration_ms = int(fetch_stats.get("duration_ms", 0))
         done_early = bool(fetch_stats.get("early_exit", False))
+        fetch_cache_hits = int(fetch_stats.get("cache_hits", 0))
+        fetch_revalidated = int(fetch_stats.get("revalidated", 0))
+        fetch_prefetched = int(fetch_stats.get("prefetched", 0))
     else:
         fetch_duration_ms = int((time.perf_counter() - t_fetch_start) * 1000)
+    # i fetch speculativi non sopravvissuti al ranking vengono cancellati
+    prefetcher.cancel_all()
 
     log.info(
         f"Parallel fetch: {len(extracts)}/{attempted} in {fetch_duration_ms}ms "
@@ -1412,8 +1613,9 @@ async def _web_search_pipeline(
                     )
 
                     try:
+                        # miglioramento opzionale: cede il posto alle richieste interattive
                         summary_retry = await reply_with_llm(
-                            retry_prompt, persona
+                            retry_prompt, persona, priority=PRIORITY_BACKGROUND
                         )
                         if summary_retry:
                             syn_validation_retry = validator.validate(
@@ -1470,11 +1672,12 @@ async def _web_search_pipeline(
 
     # Calculate total time and post-process time
     total_ms = int((time.perf_counter() - t_start) * 1000)
-    post_ms = total_ms - fetch_duration_ms - preprocess_ms - llm_ms
+    post_ms = total_ms - rerank_ms - fetch_duration_ms - preprocess_ms - llm_ms
     
     # Performance breakdown log
     log.info(
         f"[PERF] Web synthesis breakdown: "
+        f"rerank={rerank_ms}ms, "
         f"fetch={fetch_duration_ms}ms, "
         f"preprocess={preprocess_ms}ms, "
         f"llm={llm_ms}ms, "
@@ -1486,11 +1689,15 @@ async def _web_search_pipeline(
         "raw_results": len(raw),
         "dedup_results": len(dedup),
         "returned": len(topk),
+        "rerank_ms": rerank_ms,
         "fetch_attempted": attempted,
         "fetch_ok": len([e for e in extracts if e.get("text")]),
         "fetch_timeouts": timeouts,
         "fetch_errors": errors,
         "fetch_duration_ms": fetch_duration_ms,
+        "fetch_cache_hits": fetch_cache_hits,
+        "fetch_revalidated": fetch_revalidated,
+        "fetch_prefetched": fetch_prefetched,
         "early_exit": done_early,
         "validation_confidence": (validation or {}).get("confidence")
         if validation
@@ -1616,11 +1823,74 @@ def _init_memory() -> None:
             log.error(f"Semantic cache init failed: {e}")
 
 
+@app.on_event("startup")
+def _warmup_reranker() -> None:
+    # primo batch a vuoto: la prima query non paga caricamento pesi/kernel
+    if not (USE_RERANKER and RERANKER_WARMUP):
+        return
+    rr = get_reranker()
+    if rr is not None:
+        t0 = time.perf_counter()
+        ok = rr.warmup()
+        log.info(
+            f"Reranker warmup ({rr.backend}): "
+            f"{'ok' if ok else 'skipped'} in {int((time.perf_counter() - t0) * 1000)}ms"
+        )
+
+
+@app.on_event("startup")
+async def _start_endpoint_manager() -> None:
+    if not LLM_EP_MANAGER_ENABLED:
+        return
+    try:
+        mgr = EndpointManager(_resolve_endpoints, redis_client=redis_client, model=LLM_MODEL)
+        set_endpoint_manager(mgr)
+        await mgr.start()
+    except Exception as e:
+        set_endpoint_manager(None)
+        log.warning(f"Endpoint manager not started: {e}")
+
+
+@app.on_event("shutdown")
+async def _close_web_workers() -> None:
+    mgr = get_endpoint_manager()
+    if mgr is not None:
+        await mgr.stop()
+    try:
+        await close_llm_client()
+    except Exception as e:
+        log.warning(f"LLM client close failed: {e}")
+    try:
+        from core.web_tools import close_http_session
+
+        await close_http_session()
+    except Exception as e:
+        log.warning(f"HTTP session close failed: {e}")
+    try:
+        from core.robust_content_extraction import shutdown_extraction_pool
+
+        shutdown_extraction_pool()
+    except Exception as e:
+        log.warning(f"Extraction pool shutdown failed: {e}")
+    shutdown_inference_executor()
+    # snapshot della semantic cache (se persistente): il prossimo avvio riparte a caldo
+    if _SEMCACHE is not None and hasattr(_SEMCACHE, "compact"):
+        try:
+            _SEMCACHE.close()
+            _SEMCACHE.compact()
+        except Exception as e:
+            log.warning(f"Semantic cache snapshot failed: {e}")
+
+
 @app.get("/healthz")
 def healthz() -> Dict[str, Any]:
+    ep_mgr = get_endpoint_manager()
     rer_status = "disabled"
+    rer_stats: Dict[str, Any] = {}
     if USE_RERANKER:
-        rer_status = "ready" if get_reranker() else "failed"
+        rr = get_reranker()
+        rer_status = "ready" if rr else "failed"
+        rer_stats = rr.stats() if rr else {}
 
     cache_info: Dict[str, Any] = {"enabled": False}
     try:
@@ -1644,14 +1914,24 @@ def healthz() -> Dict[str, Any]:
         "unified_web": UNIFIED_WEB_HANDLER_AVAILABLE,
     }
 
+    # 🔌 Circuit breaker + stats provider di ricerca
+    try:
+        from core.system_status import get_web_health_metrics
+
+        web_health = get_web_health_metrics()
+    except Exception as e:
+        web_health = {"error": str(e)}
+
     return {
         "ok": True,
         "model": LLM_MODEL,
         "endpoints_to_try": get_endpoints(),
+        "llm_endpoints": ep_mgr.snapshot() if ep_mgr else None,
         "reranker": {
             "enabled": USE_RERANKER,
             "status": rer_status,
             "model": RERANKER_MODEL if USE_RERANKER else None,
+            **rer_stats,
         },
         "redis": {
             "gpu_tunnel_endpoint": _get_redis_str("gpu_tunnel_endpoint"),
@@ -1659,6 +1939,13 @@ def healthz() -> Dict[str, Any]:
         },
         "semantic_cache": cache_info,
         "live_agents": live_agents,
+        "web_health": web_health,
+        "singleflight": singleflight_stats(),
+        "inference": inference_stats(),
+        "embedding_context": embedding_context_stats(),
+        "embedding_service": embedding_service_stats(),
+        "hybrid_retrieval": hybrid_stats(),
+        "llm_client": llm_client_stats(),
         "live_cache_ttl": {
             "weather": LIVE_CACHE_TTL_WEATHER,
             "price": LIVE_CACHE_TTL_PRICE,
@@ -1898,12 +2185,14 @@ def cache_flush(req: FlushReq) -> Dict[str, Any]:
 # --------- Endpoints admin (list/update) ---------
 @app.get("/endpoints")
 def endpoints_list() -> Dict[str, Any]:
+    mgr = get_endpoint_manager()
     return {
         "active_env": ENV_LLM_ENDPOINT,
         "tunnel_env": ENV_TUNNEL_ENDPOINT,
         "active_redis": _get_redis_str("gpu_active_endpoint"),
         "tunnel_redis": _get_redis_str("gpu_tunnel_endpoint"),
         "resolved": get_endpoints(),
+        "health": mgr.snapshot() if mgr else None,
     }
 
 
@@ -1934,6 +2223,10 @@ def endpoints_update(req: EndpointsUpdateReq, request: Request) -> Dict[str, Any
     except Exception as e:
         return {"ok": False, "error": str(e)}
 
+    if changed:
+        mgr = get_endpoint_manager()
+        if mgr is not None:
+            mgr.publish_update()  # questo worker subito, gli altri via pub/sub
     return {"ok": True, "changed": changed, "resolved": get_endpoints()}
 
 
@@ -1965,10 +2258,13 @@ async def cache_warm(req: WarmReq) -> Dict[str, Any]:
         done = 0
         errors: List[str] = []
 
-        for p in (req.prompts or []):
-            p = (p or "").strip()
-            if not p:
-                continue
+        prompts = [p.strip() for p in (req.prompts or []) if (p or "").strip()]
+
+        # al più `background_slots()` prompt alla volta: oltre, la coda dello
+        # scheduler si riempirebbe e i prompt in eccesso verrebbero scartati
+        sem = asyncio.Semaphore(background_slots())
+
+        async def _warm_one(p: str):
             payload = {
                 "model": model,
                 "messages": [
@@ -1978,10 +2274,20 @@ async def cache_warm(req: WarmReq) -> Dict[str, Any]:
                 "temperature": TEMPERATURE,
                 "max_tokens": 256,
             }
-            result, _, last_err = _run_direct(payload, force=None)
+            async with sem:
+                try:
+                    return await _run_direct(payload, force=None)
+                except LLMOverloadedError as e:
+                    return None, None, str(e)
+
+        # in parallelo sul client LLM condiviso, come job di background: lo
+        # scheduler dà precedenza alle richieste interattive
+        with llm_priority(PRIORITY_BACKGROUND):
+            outcomes = await asyncio.gather(*(_warm_one(p) for p in prompts))
+        for p, (result, _, last_err) in zip(prompts, outcomes):
             if result:
                 try:
-                    _semcache_dualwrite(
+                    await _semcache_dualwrite_async(
                         p,
                         sys_prompt,
                         model,
@@ -2012,7 +2318,35 @@ def _fb_record(**kw: Any) -> None:
 async def generate(
     request: Request,
     force: Optional[str] = None,
+    stream: bool = False,
 ) -> Dict[str, Any]:
+    """
+    Router intent → cache / web / LLM diretto.
+
+    Con `stream=true` (query o body) risponde in SSE: sul percorso LLM
+    diretto i token arrivano man mano, gli altri percorsi (cache, web)
+    producono la risposta completa in un solo delta.
+    """
+    try:
+        body = await request.json()
+        stream = stream or bool(isinstance(body, dict) and body.get("stream"))
+    except Exception:
+        pass
+    out = await _generate_impl(request, force, stream)
+    if stream and isinstance(out, dict):
+        try:
+            text = out["response"]["choices"][0]["message"]["content"]
+        except Exception:
+            text = ""
+        return _sse_response(_sse_once(text or "", out))
+    return out
+
+
+async def _generate_impl(
+    request: Request,
+    force: Optional[str],
+    stream: bool,
+) -> Any:
     global _SEMCACHE
     try:
         _ensure_semcache_import()
@@ -2070,7 +2404,7 @@ async def generate(
                 model_name,
                 "AUTO",
             )
-            hit = _SEMCACHE.get(prompt, ctx_fp_auto)
+            hit = await _SEMCACHE.get_async(prompt, ctx_fp_auto)
             if hit:
                 sim = hit.get("similarity")
                 if sim is None:
@@ -2228,7 +2562,7 @@ async def generate(
                 model_name,
                 used_intent,
             )
-            hit2 = _SEMCACHE.get(prompt, ctx_fp)
+            hit2 = await _SEMCACHE.get_async(prompt, ctx_fp)
             if hit2:
                 sim2 = hit2.get("similarity")
                 if sim2 is None:
@@ -2323,7 +2657,7 @@ async def generate(
                         _SEMCACHE = get_semantic_cache()  # type: ignore[name-defined]
                     except Exception:
                         pass
-                _semcache_dualwrite(
+                await _semcache_dualwrite_async(
                     prompt,
                     system_prompt,
                     model_name,
@@ -2531,7 +2865,7 @@ async def generate(
                         _SEMCACHE = get_semantic_cache()  # type: ignore[name-defined]
                     except Exception:
                         pass
-                _semcache_dualwrite(
+                await _semcache_dualwrite_async(
                     prompt,
                     system_prompt,
                     model_name,
@@ -2598,7 +2932,7 @@ async def generate(
                     _SEMCACHE = get_semantic_cache()  # type: ignore[name-defined]
                 except Exception:
                     pass
-            _semcache_dualwrite(
+            await _semcache_dualwrite_async(
                 prompt,
                 system_prompt,
                 model_name,
@@ -2628,8 +2962,7 @@ async def generate(
             "temperature": temperature,
             "max_tokens": LLM_OUTPUT_BUDGET_TOK,
         }
-        result, endpoint_used, last_err = _run_direct(payload, force)
-        if not result:
+        def _direct_fail(last_err: Optional[str]) -> Dict[str, Any]:
             fail = {
                 "ok": False,
                 "error": "Nessun endpoint raggiungibile.",
@@ -2643,47 +2976,100 @@ async def generate(
             redis_client.setex(cache_key, 300, json.dumps(fail))
             return fail
 
-        try:
-            msg = (
-                (result.get("choices") or [{}])[0]
-                .get("message", {})
-                .get("content", "")
-            )
-            if msg:
-                asv = autosave(msg, source="direct_llm")
-                if any([asv.get("facts"), asv.get("prefs"), asv.get("bet")]):
-                    log.info(f"[autosave:direct_llm] {asv}")
-        except Exception as e:
-            log.warning(f"AutoSave direct_llm failed: {e}")
-
-        out.update(
-            {
-                "cached": False,
-                "endpoint_used": endpoint_used,
-                "response": result,
+        def _direct_overloaded(e: LLMOverloadedError) -> Dict[str, Any]:
+            # niente cache Redis: la prossima richiesta deve riprovare
+            return {
+                "ok": False,
+                "error": LLM_OVERLOADED_REPLY,
+                "overloaded": True,
+                "last_error": str(e),
+                "intent": used_intent,
+                "router_build": BUILD_SIGNATURE,
             }
-        )
-        _fb_record(
-            query=prompt,
-            intent_used="DIRECT_LLM",
-            satisfaction=1.0,
-            response_time_s=time.perf_counter() - t0,
-        )
-        _ensure_semcache_import()
-        if _SEMCACHE is None:
+
+        async def _direct_store(result: Dict[str, Any], endpoint_used: Optional[str]) -> Dict[str, Any]:
+            global _SEMCACHE
             try:
-                _SEMCACHE = get_semantic_cache()  # type: ignore[name-defined]
-            except Exception:
-                pass
-        _semcache_dualwrite(
-            prompt,
-            system_prompt,
-            model_name,
-            out["intent"],
-            out["response"],
-        )
-        redis_client.setex(cache_key, 86400, json.dumps(out))
-        return out
+                msg = (
+                    (result.get("choices") or [{}])[0]
+                    .get("message", {})
+                    .get("content", "")
+                )
+                if msg:
+                    asv = autosave(msg, source="direct_llm")
+                    if any([asv.get("facts"), asv.get("prefs"), asv.get("bet")]):
+                        log.info(f"[autosave:direct_llm] {asv}")
+            except Exception as e:
+                log.warning(f"AutoSave direct_llm failed: {e}")
+
+            out.update(
+                {
+                    "cached": False,
+                    "endpoint_used": endpoint_used,
+                    "response": result,
+                }
+            )
+            _fb_record(
+                query=prompt,
+                intent_used="DIRECT_LLM",
+                satisfaction=1.0,
+                response_time_s=time.perf_counter() - t0,
+            )
+            _ensure_semcache_import()
+            if _SEMCACHE is None:
+                try:
+                    _SEMCACHE = get_semantic_cache()  # type: ignore[name-defined]
+                except Exception:
+                    pass
+            await _semcache_dualwrite_async(
+                prompt,
+                system_prompt,
+                model_name,
+                out["intent"],
+                out["response"],
+            )
+            redis_client.setex(cache_key, 86400, json.dumps(out))
+            return out
+
+        if stream:
+            async def _events() -> AsyncIterator[str]:
+                parts: List[str] = []
+                meta: Dict[str, Any] = {}
+                try:
+                    async for delta in stream_completion(
+                        payload,
+                        endpoints=_ordered_endpoints(force),
+                        meta=meta,
+                        priority=PRIORITY_INTERACTIVE,
+                    ):
+                        parts.append(delta)
+                        yield _sse({"delta": delta})
+                except LLMOverloadedError as e:
+                    yield _sse({"done": True, **_direct_overloaded(e)})
+                    return
+                except Exception as e:
+                    if parts:
+                        # stream interrotto: niente cache per una risposta parziale
+                        log.warning(f"/generate stream interrupted: {e}")
+                        yield _sse({"error": "stream_interrupted"})
+                        return
+                    yield _sse({"done": True, **_direct_fail(str(e))})
+                    return
+                # cache e autosave solo a stream completato
+                final = await _direct_store(_wrap("".join(parts), model_name), meta.get("endpoint"))
+                yield _sse({"done": True, **final, "ttft_ms": meta.get("ttft_ms")})
+
+            return _sse_response(_events())
+
+        try:
+            result, endpoint_used, last_err = await _run_direct(
+                payload, force, priority=PRIORITY_INTERACTIVE
+            )
+        except LLMOverloadedError as e:
+            return _direct_overloaded(e)
+        if not result:
+            return _direct_fail(last_err)
+        return await _direct_store(result, endpoint_used)
     except Exception:
         err = {
             "ok": False,
@@ -2705,8 +3091,13 @@ async def generate(
 async def chat(payload: dict = Body(...)) -> Dict[str, Any]:
     """
     Chat avanzata (v2) with Personal Memory System.
+
+    Con `"stream": true` nel payload risponde in SSE (delta man mano, poi
+    done con la reply completa); memoria episodica, autosave e semantic
+    cache vengono scritti solo a stream completato.
     """
     global _SEMCACHE
+    stream = bool(payload.get("stream"))
 
     # ======== Normalizzazione input: messages vs legacy ========
     messages = payload.get("messages")
@@ -2804,7 +3195,7 @@ async def chat(payload: dict = Body(...)) -> Dict[str, Any]:
                 LLM_MODEL,
                 "CHAT",
             )
-            hit = _SEMCACHE.get(text, ctx_fp)
+            hit = await _SEMCACHE.get_async(text, ctx_fp)
         except Exception as e:
             log.warning(f"Semantic cache get error in /chat: {e}")
             hit = None
@@ -2844,6 +3235,10 @@ async def chat(payload: dict = Body(...)) -> Dict[str, Any]:
                         f"AutoSave chat_reply_cache failed: {e}"
                     )
 
+                if stream:
+                    return _sse_response(
+                        _sse_once(reply_cached, {"reply": reply_cached, "cached": True})
+                    )
                 return {"reply": reply_cached}
 
     # =================== Helper: query su hardware Jarvis ===================
@@ -2875,7 +3270,7 @@ async def chat(payload: dict = Body(...)) -> Dict[str, Any]:
     # =================== Memory search (Chroma - OLD SYSTEM) ===================
     mem_items: List[Dict[str, Any]] = []
     try:
-        mem_items = search_topk(text, k=10, half_life_days=MEM_HALF_LIFE_D)
+        mem_items = await search_topk_async(text, k=10, half_life_days=MEM_HALF_LIFE_D)
     except Exception as e:
         log.warning(f"memory search in /chat failed: {e}")
         mem_items = []
@@ -2946,7 +3341,7 @@ async def chat(payload: dict = Body(...)) -> Dict[str, Any]:
 
         if _SEMCACHE:
             try:
-                _semcache_dualwrite(
+                await _semcache_dualwrite_async(
                     text,
                     base_sys,
                     LLM_MODEL,
@@ -2956,6 +3351,8 @@ async def chat(payload: dict = Body(...)) -> Dict[str, Any]:
             except Exception as e:
                 log.warning(f"Semantic cache write (hw) failed: {e}")
 
+        if stream:
+            return _sse_response(_sse_once(reply_hw, {"reply": reply_hw}))
         return {"reply": reply_hw}
 
     # =================== Costruzione contesto dai facts (OLD LEGACY SYSTEM) ===================
@@ -3007,52 +3404,85 @@ async def chat(payload: dict = Body(...)) -> Dict[str, Any]:
 
     sys_trim = trim_to_tokens(full_sys, 600)
 
-    # =================== Chiamata LLM ===================
-    reply_text = await reply_with_llm(text, sys_trim)
-
-    # =================== NEW: Record conversation turn for episodic memory ===================
-    try:
-        from core.memory_manager import record_conversation_turn
-        record_result = await record_conversation_turn(
-            conversation_id=conversation_id,
-            user_message=text,
-            assistant_message=reply_text,
-            user_id=user_id,
-            llm_func=reply_with_llm
-        )
-        if record_result.get("summarized"):
-            log.info(f"[memory] Created conversation summary for {conversation_id}")
-    except Exception as e:
-        log.warning(f"Record conversation turn failed: {e}")
-
-    # Autosave output
-    try:
-        if reply_text:
-            asv_out = autosave(reply_text, source="chat_reply")
-            if any(
-                [
-                    asv_out.get("facts"),
-                    asv_out.get("prefs"),
-                    asv_out.get("bet"),
-                ]
-            ):
-                log.info(f"[autosave:chat_reply] {asv_out}")
-    except Exception as e:
-        log.warning(f"AutoSave chat_reply failed: {e}")
-
-    # Scrivi in semantic cache per future richieste simili
-    if _SEMCACHE and reply_text:
+    async def _after_reply(reply_text: str) -> None:
+        # =================== NEW: Record conversation turn for episodic memory ===================
         try:
-            _semcache_dualwrite(
-                text,
-                base_sys,
-                LLM_MODEL,
-                "CHAT",
-                {"reply": reply_text},
+            from core.memory_manager import record_conversation_turn
+            record_result = await record_conversation_turn(
+                conversation_id=conversation_id,
+                user_message=text,
+                assistant_message=reply_text,
+                user_id=user_id,
+                llm_func=reply_with_llm,
+                # riassunto a priorità background: non deve ritardare la risposta
+                background=True,
             )
+            if record_result.get("summarizing"):
+                log.info(f"[memory] Summarizing conversation {conversation_id} in background")
+        except Exception as e:
+            log.warning(f"Record conversation turn failed: {e}")
+
+        # Autosave output
+        try:
+            if reply_text:
+                asv_out = autosave(reply_text, source="chat_reply")
+                if any(
+                    [
+                        asv_out.get("facts"),
+                        asv_out.get("prefs"),
+                        asv_out.get("bet"),
+                    ]
+                ):
+                    log.info(f"[autosave:chat_reply] {asv_out}")
         except Exception as e:
-            log.warning(f"Semantic cache write (/chat) failed: {e}")
+            log.warning(f"AutoSave chat_reply failed: {e}")
 
+        # Scrivi in semantic cache per future richieste simili
+        if _SEMCACHE and reply_text:
+            try:
+                await _semcache_dualwrite_async(
+                    text,
+                    base_sys,
+                    LLM_MODEL,
+                    "CHAT",
+                    {"reply": reply_text},
+                )
+            except Exception as e:
+                log.warning(f"Semantic cache write (/chat) failed: {e}")
+
+    # =================== Chiamata LLM ===================
+    if stream:
+        async def _events() -> AsyncIterator[str]:
+            parts: List[str] = []
+            meta: Dict[str, Any] = {}
+            try:
+                async for delta in stream_with_llm(
+                    text, sys_trim, meta=meta, priority=PRIORITY_INTERACTIVE
+                ):
+                    parts.append(delta)
+                    yield _sse({"delta": delta})
+            except LLMOverloadedError:
+                async for ev in _sse_once(
+                    LLM_OVERLOADED_REPLY, {"reply": LLM_OVERLOADED_REPLY, "overloaded": True}
+                ):
+                    yield ev
+                return
+            except Exception as e:
+                log.warning(f"/chat stream failed: {e}")
+                yield _sse({"error": "stream_interrupted" if parts else "llm_unavailable"})
+                return
+            reply_text = "".join(parts).strip()
+            await _after_reply(reply_text)
+            yield _sse({"done": True, "reply": reply_text, "ttft_ms": meta.get("ttft_ms")})
+
+        return _sse_response(_events())
+
+    try:
+        reply_text = await reply_with_llm(text, sys_trim, priority=PRIORITY_INTERACTIVE)
+    except LLMOverloadedError:
+        # shed rapido: niente memoria né cache per una risposta di ripiego
+        return {"reply": LLM_OVERLOADED_REPLY, "overloaded": True}
+    await _after_reply(reply_text)
     return {"reply": reply_text}
 
 
@@ -3154,10 +3584,24 @@ class WebSummarizeQueryReq(BaseModel):
     k: int = 6
     summarize_top: int = WEB_SUMMARIZE_TOP_DEFAULT
     return_sources: bool = True
+    stream: bool = False
 
 
 @app.post("/web/summarize")
 async def web_summarize(payload: WebSummarizeQueryReq) -> Dict[str, Any]:
+    """
+    Riassunto di una query (agent / web search) o di un URL.
+
+    Con `stream=true` risponde in SSE: il riassunto di un URL arriva token
+    per token, gli altri percorsi in un solo delta.
+    """
+    out = await _web_summarize_impl(payload)
+    if payload.stream and isinstance(out, dict):
+        return _sse_response(_sse_once(out.get("summary") or "", out))
+    return out
+
+
+async def _web_summarize_impl(payload: WebSummarizeQueryReq) -> Any:
     if payload.q:
         if _is_smalltalk_query(payload.q):
             return {
@@ -3281,27 +3725,53 @@ async def web_summarize(payload: WebSummarizeQueryReq) -> Dict[str, Any]:
         f"URL: {url}\n\n"
         f"TESTO PAGINA:\n{trimmed}"
     )
-    try:
-        summary = await reply_with_llm(prompt, persona)
-    except Exception:
-        summary = (
-            "Non sono riuscito a generare un riassunto strutturato, ma il contenuto della "
-            "pagina potrebbe comunque esserti utile se consultato."
-        )
+    fallback_summary = (
+        "Non sono riuscito a generare un riassunto strutturato, ma il contenuto della "
+        "pagina potrebbe comunque esserti utile se consultato."
+    )
+
+    def _finish(summary: str) -> Dict[str, Any]:
+        try:
+            if summary:
+                asv = autosave(summary, source="web_summarize")
+                if any([asv.get("facts"), asv.get("prefs"), asv.get("bet")]):
+                    log.info(f"[autosave:web_summarize] {asv}")
+        except Exception as e:
+            log.warning(f"AutoSave web_summarize failed: {e}")
+
+        return {
+            "summary": summary,
+            "og_image": og_img,
+            "results": [{"url": url, "title": url}],
+        }
+
+    if payload.stream:
+        async def _events() -> AsyncIterator[str]:
+            parts: List[str] = []
+            meta: Dict[str, Any] = {}
+            try:
+                async for delta in stream_with_llm(
+                    prompt, persona, meta=meta, priority=PRIORITY_INTERACTIVE
+                ):
+                    parts.append(delta)
+                    yield _sse({"delta": delta})
+            except Exception as e:
+                if parts:
+                    log.warning(f"/web/summarize stream interrupted: {e}")
+                    yield _sse({"error": "stream_interrupted"})
+                    return
+                parts = [fallback_summary]
+                yield _sse({"delta": fallback_summary})
+            yield _sse({"done": True, **_finish("".join(parts)), "ttft_ms": meta.get("ttft_ms")})
+
+        return _sse_response(_events())
 
     try:
-        if summary:
-            asv = autosave(summary, source="web_summarize")
-            if any([asv.get("facts"), asv.get("prefs"), asv.get("bet")]):
-                log.info(f"[autosave:web_summarize] {asv}")
-    except Exception as e:
-        log.warning(f"AutoSave web_summarize failed: {e}")
+        summary = await reply_with_llm(prompt, persona, priority=PRIORITY_INTERACTIVE)
+    except Exception:
+        summary = fallback_summary
 
-    return {
-        "summary": summary,
-        "og_image": og_img,
-        "results": [{"url": url, "title": url}],
-    }
+    return _finish(summary)
 
 
 # -------------------------- /web/search -------------------------------
@@ -4380,11 +4850,13 @@ class MigrateReq(BaseModel):
     new_model: str = "sentence-transformers/all-MiniLM-L6-v2"
     batch_size: int = 500
     delete_old: bool = False
+    resume: bool = True  # riprende dal checkpoint di un job interrotto
 
 
 class ReembedReq(BaseModel):
     name: Optional[str] = Field(None, description="Nome collection o 'all'")
     batch: int = 512
+    resume: bool = True
 
 
 @app.post("/memory/search/advanced")
@@ -4429,13 +4901,17 @@ def memory_cleanup(req: CleanupReq) -> Dict[str, Any]:
 
 @app.post("/memory/migrate")
 def memory_migrate(req: MigrateReq) -> Dict[str, Any]:
-    res = migrate_collection(
-        old_name=req.old_name,
-        new_name=req.new_name,
-        new_model=req.new_model,
-        batch_size=req.batch_size,
-        delete_old=req.delete_old,
-    )
+    try:
+        res = migrate_collection(
+            old_name=req.old_name,
+            new_name=req.new_name,
+            new_model=req.new_model,
+            batch_size=req.batch_size,
+            delete_old=req.delete_old,
+            resume=req.resume,
+        )
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
     return {"ok": True, **res}
 
 
@@ -4445,7 +4921,7 @@ def memory_reembed(req: Optional[ReembedReq] = None) -> Dict[str, Any]:
         if req is None or (req.name in (None, "", "all")):
             processed = reembed_all(batch=(req.batch if req else 512))
             return {"ok": True, "reembedded": processed}
-        count = reembed_collection(req.name, batch=req.batch)
+        count = reembed_collection(req.name, batch=req.batch, resume=req.resume)
         return {"ok": True, "collection": req.name, "count": count}
     except Exception as e:
         return {"ok": False, "error": str(e)}
@@ -4748,11 +5224,11 @@ async def test_diversity_endpoint(
         return {"ok": False, "error": "unauthorized"}
     try:
         try:
-            from core.web_search import search as web_search_core
+            from core.web_search import search_async as web_search_async
         except Exception as e:
             return {"ok": False, "error": f"web_search_import_failed:{e}"}
 
-        results = web_search_core(query, num=16) or []
+        results = await web_search_async(query, num=16) or []
 
         if not results:
             return {"ok": False, "error": "no_results"}
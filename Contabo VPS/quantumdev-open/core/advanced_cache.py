@@ -5,6 +5,7 @@ import os
 import logging
 from typing import Dict, Any, Optional, List
 from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 import redis
 import json
 
@@ -47,11 +48,78 @@ def get_ttl_for_category(category: str) -> int:
     return CATEGORY_TTL_MAP.get(category, CACHE_TTL_GENERIC)
 
 
+# Dopo il TTL l'entry resta in Redis per questa finestra: serve solo a
+# rivalidarla con GET condizionale (ETag/Last-Modified) invece di riscaricarla
+DOMAIN_CACHE_REVALIDATE_S = int(os.getenv("DOMAIN_CACHE_REVALIDATE_S", "86400"))
+
+# dominio del query expander -> categoria di CATEGORY_TTL_MAP
+_DOMAIN_TO_CATEGORY = {
+    "weather": "weather",
+    "crypto": "price",
+    "finance": "price",
+    "sports": "sports",
+    "news": "news",
+}
+
+
+def detect_category(query: str) -> str:
+    """
+    Categoria TTL di una query (weather/price/sports/news/generic).
+    Le query temporali senza dominio specifico valgono come news.
+    """
+    try:
+        from core.query_expander import get_query_expander
+        expander = get_query_expander()
+        category = _DOMAIN_TO_CATEGORY.get(expander.detect_domain(query), "generic")
+        if category == "generic" and expander.is_temporal_query(query):
+            category = "news"
+        return category
+    except Exception:
+        return "generic"
+
+
+# parametri di tracking che non cambiano il contenuto della pagina
+_TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_src"}
+
+
+def canonical_url(url: str) -> str:
+    """
+    URL canonico per la cache dei contenuti: schema/host in minuscolo,
+    niente porta di default, frammento o parametri di tracking (utm_*, fbclid…),
+    query ordinata e senza slash finale.
+    """
+    try:
+        parts = urlsplit((url or "").strip())
+    except ValueError:
+        return (url or "").strip()
+    scheme = parts.scheme.lower() or "http"
+    host = (parts.hostname or "").lower()
+    if parts.port and not (
+        (scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)
+    ):
+        host = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = urlencode(
+        sorted(
+            (k, v)
+            for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS
+        )
+    )
+    return urlunsplit((scheme, host, path, query, ""))
+
+
 class DomainCache:
     """
     Cache intelligente per domini già fetchati.
     Evita refetch dello stesso dominio in finestre temporali brevi.
     Supporta TTL differenti per categoria.
+
+    Le entry sono indicizzate per URL canonico e conservano ETag/Last-Modified:
+    scaduto il TTL restano per DOMAIN_CACHE_REVALIDATE_S come "stale", così
+    il fetch può rivalidarle con un GET condizionale (304 → nessun download).
     """
     
     def __init__(self, redis_client, ttl_hours: int = DEFAULT_TTL_HOURS):
@@ -59,36 +127,57 @@ class DomainCache:
         self.default_ttl_seconds = ttl_hours * 3600
     
     def _key(self, url: str, category: str = "generic") -> str:
-        """Cache key basata su dominio+path+categoria."""
-        from urllib.parse import urlparse
-        parsed = urlparse(url)
-        canonical = f"{parsed.netloc}{parsed.path}:{category}".lower()
+        """Cache key basata su URL canonico + categoria."""
+        canonical = f"{canonical_url(url)}:{category}"
         return f"domain_cache:{hashlib.md5(canonical.encode()).hexdigest()}"
     
-    def get(self, url: str, category: str = "generic") -> Optional[Dict[str, Any]]:
+    @staticmethod
+    def _decode(data, ttl: int) -> Optional[Dict[str, Any]]:
+        """Entry JSON → dict con flag `stale` (None se illeggibile)."""
+        try:
+            cached = json.loads(data)
+            cached_time = datetime.fromisoformat(cached.get('cached_at', '2020-01-01'))
+        except Exception:
+            return None
+        cached["stale"] = datetime.now() - cached_time >= timedelta(seconds=ttl)
+        return cached
+    
+    def get(
+        self,
+        url: str,
+        category: str = "generic",
+        include_stale: bool = False,
+    ) -> Optional[Dict[str, Any]]:
         """
         Retrieve cached content per URL.
         
         Args:
             url: URL da cercare
             category: Categoria per determinare TTL
+            include_stale: ritorna anche entry scadute (con stale=True) da rivalidare
         """
         try:
             key = self._key(url, category)
             data = self.redis.get(key)
             if data:
-                cached = json.loads(data)
-                # Check se non expired (TTL gestito da Redis, questo è extra check)
-                cached_time = datetime.fromisoformat(cached.get('cached_at', '2020-01-01'))
                 ttl = get_ttl_for_category(category)
-                if datetime.now() - cached_time < timedelta(seconds=ttl):
+                cached = self._decode(data, ttl)
+                if cached and (include_stale or not cached["stale"]):
                     log.debug(f"Cache HIT: {url} (cat={category}, ttl={ttl}s)")
                     return cached
         except Exception as e:
             log.warning(f"Cache get error: {e}")
         return None
     
-    def set(self, url: str, content: str, metadata: Dict = None, category: str = "generic"):
+    def set(
+        self,
+        url: str,
+        content: str,
+        metadata: Dict = None,
+        category: str = "generic",
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
         """
         Cache content con TTL specifico per categoria.
         
@@ -97,6 +186,7 @@ class DomainCache:
             content: Contenuto estratto
             metadata: Metadati aggiuntivi
             category: Categoria per determinare TTL
+            etag / last_modified: validator HTTP per la rivalidazione condizionale
         """
         try:
             key = self._key(url, category)
@@ -107,24 +197,45 @@ class DomainCache:
                 "content": content,
                 "metadata": metadata or {},
                 "category": category,
+                "etag": etag,
+                "last_modified": last_modified,
                 "cached_at": datetime.now().isoformat()
             }
+            # con validator l'entry sopravvive al TTL per poter essere rivalidata
+            expire = ttl + (DOMAIN_CACHE_REVALIDATE_S if (etag or last_modified) else 0)
             self.redis.setex(
                 key,
-                ttl,
+                expire,
                 json.dumps(data, ensure_ascii=False)
             )
             log.debug(f"Cache SET: {url} (cat={category}, ttl={ttl}s)")
         except Exception as e:
             log.warning(f"Cache set error: {e}")
     
-    def bulk_check(self, urls: List[str], category: str = "generic") -> Dict[str, Optional[Dict]]:
+    def touch(self, entry: Dict[str, Any], category: str = "generic") -> None:
+        """Rinnova un'entry rivalidata con 304 (stesso contenuto, nuovo cached_at)."""
+        self.set(
+            entry.get("url", ""),
+            entry.get("content", ""),
+            entry.get("metadata"),
+            category,
+            etag=entry.get("etag"),
+            last_modified=entry.get("last_modified"),
+        )
+    
+    def bulk_check(
+        self,
+        urls: List[str],
+        category: str = "generic",
+        include_stale: bool = False,
+    ) -> Dict[str, Optional[Dict]]:
         """
         Check multiple URLs at once (pipeline).
         
         Args:
             urls: Lista di URL da controllare
             category: Categoria per tutti gli URL
+            include_stale: include le entry scadute (stale=True) da rivalidare
         """
         result = {}
         try:
@@ -139,16 +250,11 @@ class DomainCache:
             ttl = get_ttl_for_category(category)
             
             for (url, key), data in zip(keys, responses):
-                if data:
-                    try:
-                        cached = json.loads(data)
-                        cached_time = datetime.fromisoformat(cached.get('cached_at', '2020-01-01'))
-                        if datetime.now() - cached_time < timedelta(seconds=ttl):
-                            result[url] = cached
-                            continue
-                    except Exception:
-                        pass
-                result[url] = None
+                cached = self._decode(data, ttl) if data else None
+                if cached and (include_stale or not cached["stale"]):
+                    result[url] = cached
+                else:
+                    result[url] = None
         except Exception as e:
             log.warning(f"Cache bulk_check error: {e}")
         
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+core/ann_index.py — Indice ANN (IVF) per la semantic cache
+
+IVF "flat" in numpy puro, costruito sopra la matrice float32 di un
+namespace (core/semantic_cache._NsIndex) senza duplicare i vettori:
+
+- train(mat): k-means sferico (dot product) su un campione → `nlist` centroidi,
+  poi ogni riga viene assegnata al centroide più vicino (`assign[row]`).
+- add(row, vec): inserimento incrementale (assegna la riga al centroide).
+- move(src, dst): la riga `src` ora vive in `dst` (swap-remove del chiamante).
+- candidate_mask(n, q): righe nelle `nprobe` liste più vicine alla query.
+
+Il chiamante ri-calcola lo score esatto dei candidati sulla matrice, quindi
+la soglia di similarità resta applicata a valori esatti: l'approssimazione
+è solo su *quali* righe vengono confrontate (recall), non sullo score.
+
+Qualsiasi oggetto con la stessa interfaccia (trained, trained_n, train, add,
+move, candidate_mask, stats) può essere usato come indice alternativo.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+_ASSIGN_CHUNK = 8192
+
+
+class IVFIndex:
+    def __init__(
+        self,
+        nlist: int = 0,
+        nprobe: int = 8,
+        iters: int = 6,
+        sample_per_list: int = 32,
+        seed: int = 0,
+    ) -> None:
+        self.nlist = nlist  # 0 = automatico (≈ sqrt(n), in [16, 1024])
+        self.nprobe = max(1, nprobe)
+        self.iters = max(1, iters)
+        self.sample_per_list = sample_per_list
+        self._rng = np.random.default_rng(seed)
+        self.centroids: Optional[np.ndarray] = None
+        self._assign = np.zeros(0, dtype=np.int32)
+        self.trained_n = 0
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    # ---------- Training ----------
+    def _nearest(self, rows: np.ndarray) -> np.ndarray:
+        out = np.empty(len(rows), dtype=np.int32)
+        for i in range(0, len(rows), _ASSIGN_CHUNK):
+            chunk = rows[i:i + _ASSIGN_CHUNK]
+            if chunk.dtype != np.float32:
+                chunk = chunk.astype(np.float32)
+            out[i:i + len(chunk)] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return out
+
+    def train(self, mat: np.ndarray) -> None:
+        n = len(mat)
+        if n == 0:
+            return
+        k = self.nlist or int(min(1024, max(16, np.sqrt(n))))
+        k = min(k, n)
+        sample_n = min(n, k * self.sample_per_list)
+        sample = mat[self._rng.choice(n, size=sample_n, replace=False)].astype(np.float32)
+        cent = sample[self._rng.choice(sample_n, size=k, replace=False)].copy()
+
+        for _ in range(self.iters):
+            a = np.argmax(sample @ cent.T, axis=1)
+            order = np.argsort(a, kind="stable")
+            counts = np.bincount(a, minlength=k)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            sums = np.zeros_like(cent)
+            nz = counts > 0
+            sums[nz] = np.add.reduceat(sample[order], starts[nz], axis=0)
+            empty = counts == 0
+            if empty.any():  # liste vuote → riseminate su righe casuali
+                sums[empty] = sample[self._rng.choice(sample_n, size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            cent = sums / np.maximum(norms, 1e-12)
+
+        self.centroids = cent.astype(np.float32)
+        self._assign = np.zeros(max(n, 64), dtype=np.int32)
+        self._assign[:n] = self._nearest(mat)
+        self.trained_n = n
+
+    # ---------- Aggiornamenti incrementali ----------
+    def _ensure(self, row: int) -> None:
+        if row >= len(self._assign):
+            grown = np.zeros(max(row + 1, len(self._assign) * 2), dtype=np.int32)
+            grown[:len(self._assign)] = self._assign
+            self._assign = grown
+
+    def add(self, row: int, vec: Any) -> None:
+        if self.centroids is None:
+            return
+        self._ensure(row)
+        q = np.asarray(vec, dtype=np.float32)
+        self._assign[row] = int(np.argmax(self.centroids @ q))
+
+    def move(self, src: int, dst: int) -> None:
+        if self.centroids is not None:
+            self._assign[dst] = self._assign[src]
+
+    # ---------- Query ----------
+    def candidate_mask(self, n: int, q: np.ndarray) -> np.ndarray:
+        probe = np.zeros(len(self.centroids), dtype=bool)
+        probe[np.argsort(-(self.centroids @ q))[:self.nprobe]] = True
+        return probe[self._assign[:n]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": "ivf",
+            "nlist": 0 if self.centroids is None else len(self.centroids),
+            "nprobe": self.nprobe,
+            "trained_n": self.trained_n,
+        }
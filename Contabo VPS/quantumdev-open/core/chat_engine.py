@@ -2,11 +2,21 @@
 # core/chat_engine.py — LLM Chat Engine (robusto) con contesto temporale
 # Patch 2025-11: endpoint robusto, hard-cap token budget, retry/backoff,
 #                parsing OpenAI-compat, nessun errore testuale all’utente (raise)
+# PERF: reply_with_llm sul client async condiviso (core/llm_client): keep-alive,
+#       HTTP/2 se disponibile, niente thread per richiesta
+# STREAM: stream_with_llm / stream_completion producono i delta di testo man mano
+#         (SSE OpenAI-compat); retry/failover solo prima del primo token
+# FAILOVER: endpoint dal manager (core/endpoint_manager) se attivo: sani e più
+#           veloci prima, esito di ogni chiamata riportato come health passivo
+# SCHED: ogni chiamata passa dallo scheduler LLM (core/llm_client.LLMScheduler):
+#        priority = interactive | normal | background (param o llm_priority()),
+#        cap globale in volo, deadline di coda; LLMOverloadedError = scartata subito,
+#        senza retry (il chiamante usa il suo fallback)
 
 from __future__ import annotations
 
 import os, json, asyncio, time, math
-from typing import Dict, Any, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional
 import requests
 from dotenv import load_dotenv
 
@@ -14,6 +24,18 @@ from dotenv import load_dotenv
 import logging
 
 from core.datetime_helper import format_datetime_context
+from core.llm_client import (  # noqa: F401  (API scheduler ri-esportata)
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_NORMAL,
+    LLMOverloadedError,
+    background_slots,
+    llm_priority,
+    llm_scheduler_stats,
+    post_json,
+    stream_sse,
+)
+from core.endpoint_manager import report_endpoint, routed_endpoints
 
 # === Token budget utils (fallback interni se modulo non presente) ===
 try:
@@ -76,12 +98,6 @@ REQ_TIMEOUT_S = _env_float("LLM_HTTP_TIMEOUT_S", 60.0)
 RETRY_ATTEMPTS = _env_int("LLM_RETRY_ATTEMPTS", 2)
 RETRY_BACKOFF_S = _env_float("LLM_RETRY_BACKOFF_S", 0.6)
 
-# === HTTP helper (async wrapper su requests) ===
-async def _post(url: str, payload: dict, timeout: float) -> requests.Response:
-    def _do():
-        return requests.post(url, json=payload, timeout=timeout)
-    return await asyncio.to_thread(_do)
-
 # === Payload builder + budget enforcement ===
 def _build_payload(user_text: str, system_prompt: str) -> Dict[str, Any]:
     """Costruisce il payload OpenAI-compat rispettando l'hard-cap del contesto."""
@@ -140,6 +156,32 @@ def _extract_text(data: Dict[str, Any]) -> str:
     except Exception as e:
         raise ValueError(f"Formato risposta inatteso: {e}")
 
+def _extract_delta(event: Dict[str, Any]) -> str:
+    """Testo di un chunk di streaming OpenAI-compat ('' se assente)."""
+    try:
+        ch = (event.get("choices") or [{}])[0]
+        return (ch.get("delta") or {}).get("content") or ch.get("text") or ""
+    except Exception:
+        return ""
+
+def _apply_overrides(
+    payload: Dict[str, Any],
+    temperature: Optional[float],
+    max_tokens: Optional[int],
+    stop_sequences: Optional[list],
+    repetition_penalty: Optional[float],
+) -> Dict[str, Any]:
+    if temperature is not None:
+        payload["temperature"] = float(temperature)
+    if max_tokens is not None:
+        payload["max_tokens"] = int(max_tokens)
+    if stop_sequences is not None and stop_sequences:
+        payload["stop"] = stop_sequences
+    if repetition_penalty is not None:
+        # Some backends support this, others ignore it
+        payload["repetition_penalty"] = float(repetition_penalty)
+    return payload
+
 # === Main async API ===
 async def reply_with_llm(
     user_text: str, 
@@ -148,6 +190,7 @@ async def reply_with_llm(
     max_tokens: Optional[int] = None,
     stop_sequences: Optional[list] = None,
     repetition_penalty: Optional[float] = None,
+    priority: Optional[str] = None,
 ) -> str:
     """
     Chiama il modello e RITORNA solo testo.
@@ -168,6 +211,9 @@ async def reply_with_llm(
         Sequenze di stop opzionali.
     repetition_penalty : float, optional
         Penalità per ripetizioni (supporto dipende dal backend).
+    priority : str, optional
+        Classe dello scheduler (interactive / normal / background);
+        default: quella del contesto (llm_priority), altrimenti normal.
     
     Returns
     -------
@@ -176,37 +222,27 @@ async def reply_with_llm(
     
     Raises
     ------
+    LLMOverloadedError
+        Se lo scheduler scarta la richiesta (nessun retry).
     RuntimeError
         Se tutti i tentativi falliscono.
     """
     t_start = time.perf_counter()
     
-    payload = _build_payload(user_text, persona)
-
-    # Apply optional overrides
-    if temperature is not None:
-        payload["temperature"] = float(temperature)
-    if max_tokens is not None:
-        payload["max_tokens"] = int(max_tokens)
-    if stop_sequences is not None and stop_sequences:
-        payload["stop"] = stop_sequences
-    if repetition_penalty is not None:
-        # Some backends support this, others ignore it
-        payload["repetition_penalty"] = float(repetition_penalty)
+    payload = _apply_overrides(
+        _build_payload(user_text, persona),
+        temperature, max_tokens, stop_sequences, repetition_penalty,
+    )
 
+    urls = routed_endpoints([LLM_ENDPOINT])
+    attempts = max(RETRY_ATTEMPTS + 1, len(urls))  # es. 1 tentativo + 2 retry = 3 tot
     last_exc: Optional[Exception] = None
-    for attempt in range(1, RETRY_ATTEMPTS + 2):  # es. 1 tentativo + 2 retry = 3 tot
+    for attempt in range(1, attempts + 1):
+        url = urls[(attempt - 1) % len(urls)]
         try:
-            r = await _post(LLM_ENDPOINT, payload, timeout=REQ_TIMEOUT_S)
-            if r.status_code != 200:
-                # prova a leggere un minimo di dettaglio per logging a monte
-                try:
-                    err_snip = (r.text or "")[:300]
-                except Exception:
-                    err_snip = f"HTTP {r.status_code}"
-                raise RuntimeError(f"LLM HTTP {r.status_code}: {err_snip}")
-
-            data = r.json()
+            # status != 2xx → LLMHTTPError (con snippet del body per il logging a monte)
+            data = await post_json(url, payload, timeout=REQ_TIMEOUT_S, priority=priority)
+            report_endpoint(url, True)
             response_text = _extract_text(data)
             
             # Log timing
@@ -215,22 +251,99 @@ async def reply_with_llm(
             
             return response_text
 
-        except (requests.exceptions.Timeout, asyncio.TimeoutError) as e:
-            last_exc = e
-        except requests.exceptions.ConnectionError as e:
-            last_exc = e
-        except Exception as e:
+        except LLMOverloadedError:
+            raise  # coda satura: ritentare peggiorerebbe la situazione
+        except Exception as e:  # timeout, connessione, HTTP, formato
+            if not isinstance(e, ValueError):
+                report_endpoint(url, False, e)
             last_exc = e
 
         # backoff tra i tentativi
-        if attempt < (RETRY_ATTEMPTS + 1):
+        if attempt < attempts:
             await asyncio.sleep(RETRY_BACKOFF_S * attempt)
 
     # Se siamo qui, tutti i tentativi sono falliti → alza l’ultima eccezione
     raise RuntimeError(f"LLM failure after retries: {type(last_exc).__name__}: {last_exc}")
 
+# === Streaming API ===
+async def stream_completion(
+    payload: Dict[str, Any],
+    endpoints: Optional[List[str]] = None,
+    meta: Optional[Dict[str, Any]] = None,
+    priority: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Streamma un payload OpenAI-compat già costruito e produce i delta di testo.
+
+    Prima del primo token gli errori fanno retry con backoff, ruotando su
+    `endpoints` (default: endpoint sani dal manager, altrimenti
+    LLM_ENDPOINT); dopo il primo token un errore viene
+    propagato (il testo è già arrivato al client, un retry lo duplicherebbe).
+    Se `meta` è passato viene riempito con endpoint usato, ttft_ms e total_ms.
+    """
+    urls = endpoints or routed_endpoints([LLM_ENDPOINT])
+    body = {**payload, "stream": True}
+    attempts = max(RETRY_ATTEMPTS + 1, len(urls))
+    last_exc: Optional[Exception] = None
+    for attempt in range(1, attempts + 1):
+        url = urls[(attempt - 1) % len(urls)]
+        t_start = time.perf_counter()
+        started = False
+        try:
+            async for event in stream_sse(url, body, timeout=REQ_TIMEOUT_S, priority=priority):
+                delta = _extract_delta(event)
+                if not delta:
+                    continue
+                if not started:
+                    started = True
+                    ttft_ms = int((time.perf_counter() - t_start) * 1000)
+                    log.info(f"LLM time-to-first-token: {ttft_ms}ms")
+                    if meta is not None:
+                        meta.update({"endpoint": url, "ttft_ms": ttft_ms})
+                yield delta
+            if not started:
+                raise ValueError("stream senza contenuto")
+            report_endpoint(url, True)
+            total_ms = int((time.perf_counter() - t_start) * 1000)
+            log.info(f"LLM stream time: {total_ms}ms")
+            if meta is not None:
+                meta["total_ms"] = total_ms
+            return
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            if not isinstance(e, ValueError):
+                report_endpoint(url, False, e)
+            if started:
+                raise
+            last_exc = e
+
+        if attempt < attempts:
+            await asyncio.sleep(RETRY_BACKOFF_S * attempt)
+
+    raise RuntimeError(f"LLM failure after retries: {type(last_exc).__name__}: {last_exc}")
+
+async def stream_with_llm(
+    user_text: str,
+    persona: str,
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    stop_sequences: Optional[list] = None,
+    repetition_penalty: Optional[float] = None,
+    meta: Optional[Dict[str, Any]] = None,
+    priority: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """Come reply_with_llm, ma produce i delta di testo man mano che arrivano."""
+    payload = _apply_overrides(
+        _build_payload(user_text, persona),
+        temperature, max_tokens, stop_sequences, repetition_penalty,
+    )
+    async for delta in stream_completion(payload, meta=meta, priority=priority):
+        yield delta
+
 # === Synchronous fallback (stessa policy: raise su errori) ===
 def reply_with_llm_sync(user_text: str, persona: str) -> str:
+    t_start = time.perf_counter()
     payload = _build_payload(user_text, persona)
 
     attempts = RETRY_ATTEMPTS + 1
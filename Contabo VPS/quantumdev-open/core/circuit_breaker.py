@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+core/circuit_breaker.py — Circuit breaker per backend di ricerca e domini fetchati
+
+Stati classici:
+- closed    : tutto passa, si contano i fallimenti consecutivi
+- open      : dopo N fallimenti consecutivi le chiamate vengono saltate
+              subito (microsecondi invece di timeout + retry)
+- half_open : scaduto il cool-down passa UNA sola chiamata di probe;
+              successo → closed, fallimento → di nuovo open
+
+Due registry condivisi a livello di processo:
+- PROVIDER_BREAKERS : provider SERP di core/web_search (ddg_post, bing, ...)
+- DOMAIN_BREAKERS   : host delle pagine scaricate da core/web_tools
+
+Thread-safe: i provider girano su thread pool.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+log = logging.getLogger(__name__)
+
+# ===================== ENVIRONMENT CONFIG =====================
+CB_FAILURE_THRESHOLD = int(os.getenv("CB_FAILURE_THRESHOLD", "3"))
+CB_COOLDOWN_S = float(os.getenv("CB_COOLDOWN_S", "30"))
+CB_DOMAIN_FAILURE_THRESHOLD = int(os.getenv("CB_DOMAIN_FAILURE_THRESHOLD", "3"))
+CB_DOMAIN_COOLDOWN_S = float(os.getenv("CB_DOMAIN_COOLDOWN_S", "120"))
+CB_DOMAIN_MAX_ENTRIES = int(os.getenv("CB_DOMAIN_MAX_ENTRIES", "2000"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Circuit breaker per una singola risorsa (provider o dominio)."""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CB_FAILURE_THRESHOLD,
+        cooldown_s: float = CB_COOLDOWN_S,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown_s = float(cooldown_s)
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_inflight = False
+        self._trips = 0
+        self._skipped = 0
+        self._last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        True se la chiamata può partire. In half-open riserva lo slot di probe:
+        ogni allow() == True va chiuso con record_success/record_failure/release.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown_s:
+                    self._skipped += 1
+                    return False
+                self._state = HALF_OPEN
+            if self._probe_inflight:
+                self._skipped += 1
+                return False
+            self._probe_inflight = True
+            return True
+
+    def is_open(self) -> bool:
+        """Peek senza effetti collaterali: True se saltato fino a fine cool-down."""
+        with self._lock:
+            return (
+                self._state == OPEN
+                and time.monotonic() - self._opened_at < self.cooldown_s
+            )
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                log.info(f"Circuit {self.name}: {self._state} → closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_inflight = False
+
+    def record_failure(self, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._failures += 1
+            self._last_error = error
+            self._probe_inflight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._trips += 1
+                    log.warning(
+                        f"Circuit {self.name}: {self._state} → open "
+                        f"({self._failures} failures, last={error})"
+                    )
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Libera lo slot di probe senza esito (chiamata cancellata)."""
+        with self._lock:
+            self._probe_inflight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown_s:
+                return HALF_OPEN
+            return self._state
+
+    def snapshot(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            retry_in = 0.0
+            if self._state == OPEN:
+                retry_in = max(0.0, self.cooldown_s - (time.monotonic() - self._opened_at))
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "trips": self._trips,
+                "skipped": self._skipped,
+                "retry_in_s": round(retry_in, 1),
+                "last_error": self._last_error,
+            }
+
+
+class BreakerRegistry:
+    """
+    Breaker creati on-demand per nome. Con `max_entries` il registry è un LRU:
+    quando è pieno vengono scartati per primi i breaker chiusi meno recenti.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        cooldown_s: float,
+        max_entries: Optional[int] = None,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.max_entries = max_entries
+        self._breakers: "OrderedDict[str, CircuitBreaker]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        key = (name or "").lower()
+        with self._lock:
+            br = self._breakers.get(key)
+            if br is not None:
+                self._breakers.move_to_end(key)
+                return br
+            br = CircuitBreaker(key, self.failure_threshold, self.cooldown_s)
+            self._breakers[key] = br
+            if self.max_entries and len(self._breakers) > self.max_entries:
+                self._evict()
+            return br
+
+    def _evict(self) -> None:
+        for key in list(self._breakers):
+            if len(self._breakers) <= self.max_entries:
+                return
+            if self._breakers[key].state == CLOSED:
+                del self._breakers[key]
+        while len(self._breakers) > self.max_entries:
+            self._breakers.popitem(last=False)
+
+    def snapshot(self, only_unhealthy: bool = False) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            items = list(self._breakers.items())
+        out: Dict[str, Dict[str, Any]] = {}
+        for key, br in items:
+            snap = br.snapshot()
+            if only_unhealthy and snap["state"] == CLOSED and not snap["consecutive_failures"]:
+                continue
+            out[key] = snap
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self._breakers.clear()
+
+
+PROVIDER_BREAKERS = BreakerRegistry(CB_FAILURE_THRESHOLD, CB_COOLDOWN_S)
+DOMAIN_BREAKERS = BreakerRegistry(
+    CB_DOMAIN_FAILURE_THRESHOLD, CB_DOMAIN_COOLDOWN_S, max_entries=CB_DOMAIN_MAX_ENTRIES
+)
+
+
+def breaker_status() -> Dict[str, Any]:
+    """Stato JSON-safe dei breaker (per /healthz e /system/status)."""
+    providers = PROVIDER_BREAKERS.snapshot()
+    domains = DOMAIN_BREAKERS.snapshot(only_unhealthy=True)
+    return {
+        "providers": providers,
+        "domains": domains,
+        "open_providers": sorted(k for k, v in providers.items() if v["state"] != CLOSED),
+        "open_domains": len([v for v in domains.values() if v["state"] != CLOSED]),
+    }
@@ -7,7 +7,7 @@ Features:
 - Extract text from files (txt, markdown, PDF)
 - Intelligent text chunking
 - ChromaDB indexing for document retrieval
-- Query user documents with semantic search
+- Query user documents with hybrid search (BM25 + semantic, RRF-fused)
 
 Author: QuantumDev (BLOCK 4)
 Version: 1.0.0
@@ -37,7 +37,13 @@ except ImportError:
     HAS_PDF = False
 
 # ChromaDB integration
-from utils.chroma_handler import get_client, _embedder
+from utils.chroma_handler import (
+    HYBRID_ENABLED,
+    get_client,
+    hybrid_collection_query,
+    _embedder,
+    keyword_index_add,
+)
 
 log = logging.getLogger(__name__)
 
@@ -308,6 +314,7 @@ def index_document(
             documents=documents,
             metadatas=metadatas
         )
+        keyword_index_add(USER_DOCS_COLLECTION, ids, documents, metadatas)
         
         log.info(f"Indexed {len(chunks)} chunks for file {file_id} (user {user_id})")
         
@@ -341,7 +348,9 @@ def query_user_docs(
     file_id: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     """
-    Query user documents using semantic search.
+    Query user documents using hybrid search: BM25 over the keyword index and
+    the semantic query run in parallel, fused with reciprocal-rank fusion, so
+    exact identifiers (file names, tickers, odds) are not missed.
     
     Args:
         user_id: User identifier
@@ -370,6 +379,21 @@ def query_user_docs(
         if file_id:
             where_filter["file_id"] = file_id
         
+        if HYBRID_ENABLED:
+            hits = hybrid_collection_query(
+                USER_DOCS_COLLECTION, query, top_k, where=where_filter, col=collection
+            )
+            return [
+                {
+                    "text": h.get("document") or "",
+                    "file_id": h["metadata"].get("file_id", ""),
+                    "filename": h["metadata"].get("filename", ""),
+                    "chunk_index": h["metadata"].get("chunk_index", 0),
+                    "score": round(h["relevance"], 4),
+                }
+                for h in hits
+            ]
+
         # Query ChromaDB
         results = collection.query(
             query_texts=[query],
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+core/embedding_context.py — Embedding calcolato una sola volta per richiesta
+
+Durante una /chat lo stesso testo utente veniva embeddato più volte:
+SemanticCache.get, la doppia set() di _semcache_dualwrite, search_topk
+(una query Chroma per collection), query_user_profile,
+query_conversation_history. Con un contesto per richiesta (contextvar +
+piccola LRU per hash del testo) il vettore viene calcolato al primo uso e
+riusato da tutti gli altri, che passano `query_embeddings` a Chroma.
+
+Uso:
+    with embedding_scope():
+        ...  # handler della richiesta
+    vec = cached_embedding(text, model_name, compute)   # ovunque sotto lo scope
+    vec = await cached_embedding_async(text, model_name, compute_async)
+
+Fuori da uno scope `cached_embedding` calcola e basta (nessuna cache).
+Il contextvar si propaga ad asyncio task e a asyncio.to_thread.
+I vettori condivisi sono sempre normalizzati (norma 1), così semantic cache
+e Chroma possono usare lo stesso vettore per lo stesso modello.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+# ===================== ENVIRONMENT CONFIG =====================
+EMBED_CTX_ENABLED = os.getenv("EMBED_CTX_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+EMBED_CTX_MAX_ITEMS = int(os.getenv("EMBED_CTX_MAX_ITEMS", "32"))
+
+_STATS = {"scopes": 0, "computed": 0, "reused": 0}
+_STATS_LOCK = threading.Lock()
+
+
+def text_key(text: str) -> str:
+    """Chiave di un testo nelle cache di embedding (contesto e LRU di core/embedding_service)."""
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def _bump(key: str) -> None:
+    with _STATS_LOCK:
+        _STATS[key] += 1
+
+
+class EmbeddingContext:
+    """LRU (model, text_key(testo)) → vettore, valida per una sola richiesta."""
+
+    def __init__(self, max_items: int = EMBED_CTX_MAX_ITEMS) -> None:
+        self.max_items = max(1, max_items)
+        self._data: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._lock = threading.Lock()  # la richiesta può usare più thread (to_thread)
+        self.computed = 0
+        self.reused = 0
+
+    @staticmethod
+    def key(text: str, model: str) -> Tuple[str, str]:
+        return model, text_key(text)
+
+    def get(self, text: str, model: str) -> Optional[Any]:
+        k = self.key(text, model)
+        with self._lock:
+            vec = self._data.get(k)
+            if vec is not None:
+                self._data.move_to_end(k)
+            return vec
+
+    def put(self, text: str, model: str, vec: Any) -> None:
+        k = self.key(text, model)
+        with self._lock:
+            self._data[k] = vec
+            self._data.move_to_end(k)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+
+_CTX: ContextVar[Optional[EmbeddingContext]] = ContextVar("embedding_context", default=None)
+
+
+@contextlib.contextmanager
+def embedding_scope(max_items: int = EMBED_CTX_MAX_ITEMS) -> Iterator[Optional[EmbeddingContext]]:
+    """Apre un contesto per la richiesta corrente (annidato: riusa quello esterno)."""
+    if not EMBED_CTX_ENABLED or _CTX.get() is not None:
+        yield _CTX.get()
+        return
+    ctx = EmbeddingContext(max_items)
+    token = _CTX.set(ctx)
+    _bump("scopes")
+    try:
+        yield ctx
+    finally:
+        _CTX.reset(token)
+
+
+def current_context() -> Optional[EmbeddingContext]:
+    return _CTX.get()
+
+
+def cached_embedding(text: str, model: str, compute: Callable[[str], Any]) -> Any:
+    """Vettore di `text` per `model`: dal contesto se già calcolato, altrimenti compute(text)."""
+    ctx = _CTX.get()
+    if ctx is None:
+        return compute(text)
+    vec = ctx.get(text, model)
+    if vec is not None:
+        ctx.reused += 1
+        _bump("reused")
+        return vec
+    vec = compute(text)
+    ctx.put(text, model, vec)
+    ctx.computed += 1
+    _bump("computed")
+    return vec
+
+
+async def cached_embedding_async(text: str, model: str, compute: Callable[[str], Awaitable[Any]]) -> Any:
+    """Come cached_embedding, con compute asincrono (es. EmbeddingService.encode_one_async)."""
+    ctx = _CTX.get()
+    if ctx is None:
+        return await compute(text)
+    vec = ctx.get(text, model)
+    if vec is not None:
+        ctx.reused += 1
+        _bump("reused")
+        return vec
+    vec = await compute(text)
+    ctx.put(text, model, vec)
+    ctx.computed += 1
+    _bump("computed")
+    return vec
+
+
+def embedding_context_stats() -> Dict[str, Any]:
+    with _STATS_LOCK:
+        out: Dict[str, Any] = dict(_STATS)
+    total = out["computed"] + out["reused"]
+    out["reuse_rate"] = round(out["reused"] / total, 3) if total else 0.0
+    return out
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+core/embedding_service.py — Servizio di embedding condiviso dal processo
+
+Unico punto davanti a SentenceTransformer per semantic cache, Chroma
+(utils/chroma_handler, core/docs_ingest), core/vector_memory e
+agents/chroma_bridge:
+
+- Un modello per processo: `get_sentence_model(name)` carica ogni modello una
+  sola volta ("all-MiniLM-L6-v2" e "sentence-transformers/all-MiniLM-L6-v2"
+  sono lo stesso modello).
+- LRU globale testo → vettore (normalizzato, float32, read-only).
+- Batch window: gli encode concorrenti (più richieste Telegram insieme)
+  arrivati entro EMBED_BATCH_WINDOW_MS vengono fusi in un solo forward pass
+  sull'executor di inferenza (core/inference_executor, linger_s).
+
+Uso:
+    vecs = get_embedding_service(model_name).encode(["testo", ...])
+    vecs = await get_embedding_service(model_name).encode_async([...])  # handler async
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from core.embedding_context import text_key
+from core.inference_executor import get_inference_executor
+
+log = logging.getLogger(__name__)
+
+try:
+    from sentence_transformers import SentenceTransformer  # type: ignore
+except Exception:
+    SentenceTransformer = None  # type: ignore
+
+# ===================== ENVIRONMENT CONFIG =====================
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "3"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+
+_MODELS: Dict[str, Any] = {}
+_SERVICES: Dict[str, "EmbeddingService"] = {}
+_LOCK = threading.Lock()
+
+
+def canonical_model_name(name: str) -> str:
+    name = (name or "").strip()
+    return name if "/" in name or os.path.isdir(name) else f"sentence-transformers/{name}"
+
+
+def get_sentence_model(name: str):
+    """SentenceTransformer condiviso (caricato una volta per processo); None se non disponibile."""
+    key = canonical_model_name(name)
+    model = _MODELS.get(key)
+    if model is not None or SentenceTransformer is None:
+        return model
+    with _LOCK:
+        if key not in _MODELS:
+            log.info(f"Loading embedding model: {key}")
+            _MODELS[key] = SentenceTransformer(key)
+        return _MODELS[key]
+
+
+class EmbeddingService:
+    def __init__(
+        self,
+        model_name: str,
+        cache_size: int = EMBED_CACHE_SIZE,
+        window_ms: float = EMBED_BATCH_WINDOW_MS,
+        max_batch: int = EMBED_MAX_BATCH,
+        model: Any = None,
+    ) -> None:
+        self.model_name = canonical_model_name(model_name)
+        self.cache_size = max(0, cache_size)
+        self.linger_s = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._model = model
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "forward_passes": 0, "encoded": 0}
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = get_sentence_model(self.model_name)
+            if self._model is None:
+                raise RuntimeError("sentence-transformers not available")
+        return self._model
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return text_key(text)
+
+    def _forward(self, texts: List[str]) -> List[np.ndarray]:
+        vecs = np.asarray(self.model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+        self._stats["forward_passes"] += 1
+        self._stats["encoded"] += len(texts)
+        return list(vecs)
+
+    def _lookup(self, texts: List[str]):
+        out: List[Optional[np.ndarray]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+        with self._lock:
+            for i, t in enumerate(texts):
+                k = self._key(t)
+                v = self._cache.get(k)
+                if v is not None:
+                    self._cache.move_to_end(k)
+                    out[i] = v
+                    self._stats["hits"] += 1
+                else:
+                    missing.setdefault(t, []).append(i)
+            self._stats["misses"] += len(missing)
+        return out, missing
+
+    def _fill(self, out: List[Optional[np.ndarray]], missing: Dict[str, List[int]],
+              todo: List[str], vecs: Sequence[np.ndarray]) -> None:
+        with self._lock:
+            for t, v in zip(todo, vecs, strict=True):
+                v.setflags(write=False)
+                for i in missing[t]:
+                    out[i] = v
+                if self.cache_size:
+                    k = self._key(t)
+                    self._cache[k] = v
+                    self._cache.move_to_end(k)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def encode(self, texts: Sequence[str], timeout: Optional[float] = None) -> List[np.ndarray]:
+        """Vettori normalizzati (read-only) per `texts`, dalla LRU o da un batch condiviso."""
+        out, missing = self._lookup([t or "" for t in texts])
+        if missing:
+            todo = list(missing)
+            vecs = get_inference_executor().run_batch(
+                ("embed", self.model_name), self._forward, todo,
+                max_batch=self.max_batch, timeout=timeout, linger_s=self.linger_s,
+            )
+            self._fill(out, missing, todo, vecs)
+        return out  # type: ignore[return-value]
+
+    async def encode_async(self, texts: Sequence[str], timeout: Optional[float] = None) -> List[np.ndarray]:
+        """
+        Come encode, per handler async: la batch window (linger_s) e il forward
+        pass si attendono sul future dell'executor, senza bloccare l'event loop.
+        """
+        out, missing = self._lookup([t or "" for t in texts])
+        if missing:
+            todo = list(missing)
+            vecs = await asyncio.wait_for(
+                get_inference_executor().run_batch_async(
+                    ("embed", self.model_name), self._forward, todo,
+                    max_batch=self.max_batch, linger_s=self.linger_s,
+                ),
+                timeout,
+            )
+            self._fill(out, missing, todo, vecs)
+        return out  # type: ignore[return-value]
+
+    def encode_one(self, text: str) -> np.ndarray:
+        return self.encode([text])[0]
+
+    async def encode_one_async(self, text: str) -> np.ndarray:
+        return (await self.encode_async([text]))[0]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self._stats["hits"] + self._stats["misses"]
+        return {
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "cache_items": len(self._cache),
+            "hit_rate": round(self._stats["hits"] / total, 3) if total else 0.0,
+            "avg_batch": round(self._stats["encoded"] / self._stats["forward_passes"], 2)
+            if self._stats["forward_passes"] else 0.0,
+            **self._stats,
+        }
+
+
+def get_embedding_service(model_name: str) -> EmbeddingService:
+    key = canonical_model_name(model_name)
+    svc = _SERVICES.get(key)
+    if svc is None:
+        with _LOCK:
+            svc = _SERVICES.setdefault(key, EmbeddingService(key))
+    return svc
+
+
+def embedding_service_stats() -> Dict[str, Any]:
+    return {name: svc.stats() for name, svc in list(_SERVICES.items())}
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+core/endpoint_manager.py — Health probe e failover degli endpoint LLM
+
+Prima get_endpoints() faceva due GET Redis a ogni richiesta e _run_direct
+provava tunnel e diretto in ordine fisso: un tunnel morto costava il timeout
+intero (30 s) prima di passare all'endpoint diretto. Qui:
+
+- La configurazione (tunnel + diretto, da Redis o env) è in memoria nel
+  processo; si rilegge quando arriva un messaggio sul canale pub/sub
+  LLM_EP_CHANNEL (pubblicato da /endpoints/update) e comunque ogni
+  LLM_EP_REFRESH_S.
+- Un task in background sonda ogni endpoint ogni LLM_PROBE_INTERVAL_S
+  (`GET /v1/models` oppure completion da 1 token) e tiene latenza EWMA,
+  fallimenti consecutivi e ultimo errore.
+- endpoints() restituisce solo gli endpoint sani, dal più veloce; quelli
+  giù restano come ultima risorsa solo se nessuno è sano. Nessun I/O sul
+  percorso della richiesta.
+- report(): feedback passivo dalle richieste reali. Un errore di
+  connessione / 5xx marca subito l'endpoint giù e sveglia il prober, così
+  la richiesta successiva va già sull'altro.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from core.llm_client import LLMHTTPError, LLMOverloadedError, probe_json
+
+log = logging.getLogger(__name__)
+
+# ===================== ENVIRONMENT CONFIG =====================
+LLM_EP_MANAGER_ENABLED = os.getenv("LLM_EP_MANAGER_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+LLM_PROBE_INTERVAL_S = float(os.getenv("LLM_PROBE_INTERVAL_S", "10"))
+LLM_PROBE_TIMEOUT_S = float(os.getenv("LLM_PROBE_TIMEOUT_S", "3"))
+LLM_PROBE_MODE = os.getenv("LLM_PROBE_MODE", "models").strip().lower()  # models | completion
+LLM_EP_FAIL_THRESHOLD = int(os.getenv("LLM_EP_FAIL_THRESHOLD", "2"))
+LLM_EP_EWMA_ALPHA = float(os.getenv("LLM_EP_EWMA_ALPHA", "0.3"))
+LLM_EP_REFRESH_S = float(os.getenv("LLM_EP_REFRESH_S", "60"))
+LLM_EP_CHANNEL = os.getenv("LLM_EP_CHANNEL", "quantum:llm_endpoints")
+
+
+@dataclass
+class EndpointState:
+    url: str
+    healthy: Optional[bool] = None   # None = mai sondato
+    latency_ms: Optional[float] = None
+    fails: int = 0
+    probes: int = 0
+    probe_ok: int = 0
+    last_probe: float = 0.0
+    last_error: Optional[str] = None
+
+    def score(self) -> float:
+        """Più basso = migliore: latenza EWMA penalizzata dai fallimenti recenti."""
+        lat = self.latency_ms if self.latency_ms is not None else math.inf
+        return lat * (1 + self.fails)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "fails": self.fails,
+            "probes": self.probes,
+            "availability": round(self.probe_ok / self.probes, 3) if self.probes else None,
+            "last_probe": int(self.last_probe) if self.last_probe else None,
+            "last_error": self.last_error,
+        }
+
+
+def _models_url(chat_url: str) -> str:
+    if chat_url.endswith("/chat/completions"):
+        return chat_url[: -len("/chat/completions")] + "/models"
+    return chat_url.rstrip("/") + "/models"
+
+
+class EndpointManager:
+    """
+    Endpoint LLM sani ordinati per latenza, aggiornati in background.
+
+    `resolve` restituisce la lista configurata di URL chat (ordine di
+    preferenza); viene chiamata fuori dal percorso della richiesta.
+    """
+
+    def __init__(
+        self,
+        resolve: Callable[[], List[str]],
+        redis_client: Any = None,
+        model: str = "",
+        probe_mode: str = LLM_PROBE_MODE,
+        interval_s: float = LLM_PROBE_INTERVAL_S,
+        timeout_s: float = LLM_PROBE_TIMEOUT_S,
+    ) -> None:
+        self._resolve = resolve
+        self._redis = redis_client
+        self.model = model
+        self.probe_mode = probe_mode
+        self.interval_s = max(0.5, interval_s)
+        self.timeout_s = timeout_s
+        self._lock = threading.Lock()
+        self._config: Optional[List[str]] = None
+        self._config_ts = 0.0
+        self._states: Dict[str, EndpointState] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._listener: Optional[threading.Thread] = None
+        self._pubsub: Any = None
+        self._stopping = False
+
+    # ---------------- configurazione ----------------
+    def refresh_config(self) -> List[str]:
+        """Rilegge la configurazione (GET Redis / env)."""
+        try:
+            urls = list(dict.fromkeys(self._resolve()))
+        except Exception as e:
+            log.warning(f"[endpoints] resolve failed: {e}")
+            urls = list(self._config or [])
+        with self._lock:
+            changed = urls != self._config
+            self._config = urls
+            self._config_ts = time.time()
+            for u in urls:
+                self._states.setdefault(u, EndpointState(u))
+            for u in [u for u in self._states if u not in urls]:
+                del self._states[u]
+        if changed:
+            log.info(f"[endpoints] configured: {urls}")
+        return urls
+
+    def invalidate(self) -> None:
+        """Configurazione cambiata: rilegge subito e sveglia il prober."""
+        self.refresh_config()
+        self._wake_prober()
+
+    def _wake_prober(self) -> None:
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None or loop.is_closed():
+            return
+        try:
+            if loop is asyncio.get_running_loop():
+                wake.set()
+                return
+        except RuntimeError:
+            pass
+        loop.call_soon_threadsafe(wake.set)
+
+    # ---------------- routing ----------------
+    def endpoints(self) -> List[str]:
+        """
+        Endpoint da provare, dal migliore. Gli endpoint giù vengono esclusi
+        se almeno uno è sano (o non ancora sondato).
+        """
+        if self._config is None:
+            self.refresh_config()
+        with self._lock:
+            config = list(self._config or [])
+            states = [self._states[u] for u in config if u in self._states]
+        order = {u: i for i, u in enumerate(config)}
+        up = [s for s in states if s.healthy is not False]
+        pool = up or states
+        pool.sort(key=lambda s: (s.score(), order[s.url]))
+        return [s.url for s in pool]
+
+    def report(self, url: str, ok: bool, error: Optional[BaseException] = None) -> None:
+        """Esito di una richiesta reale (health passivo, non tocca la latenza)."""
+        if not ok and isinstance(error, LLMHTTPError) and error.status < 500:
+            return  # errore del payload, non dell'endpoint
+        if isinstance(error, LLMOverloadedError):
+            return  # scartata dallo scheduler locale, l'endpoint non è stato contattato
+        with self._lock:
+            st = self._states.get(url)
+            if st is None:
+                return
+            if ok:
+                st.fails = 0
+                st.healthy = True
+                return
+            st.fails += 1
+            st.last_error = f"{type(error).__name__}: {error}" if error else "request failed"
+            was_up = st.healthy is not False
+            st.healthy = False
+        if was_up:
+            log.warning(f"[endpoints] {url} marked down: {st.last_error}")
+            self._wake_prober()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            states = [self._states[u].as_dict() for u in (self._config or []) if u in self._states]
+        return {
+            "routing": self.endpoints(),
+            "probe_mode": self.probe_mode,
+            "interval_s": self.interval_s,
+            "running": self._task is not None and not self._task.done(),
+            "endpoints": states,
+        }
+
+    # ---------------- probing ----------------
+    async def _probe(self, url: str) -> None:
+        t0 = time.perf_counter()
+        err: Optional[str] = None
+        try:
+            if self.probe_mode == "completion":
+                await probe_json("POST", url, {
+                    "model": self.model,
+                    "messages": [{"role": "user", "content": "ping"}],
+                    "max_tokens": 1,
+                    "temperature": 0,
+                }, timeout=self.timeout_s)
+            else:
+                await probe_json("GET", _models_url(url), timeout=self.timeout_s)
+        except Exception as e:
+            err = f"{type(e).__name__}: {e}"[:300]
+        ms = (time.perf_counter() - t0) * 1000.0
+        with self._lock:
+            st = self._states.get(url)
+            if st is None:
+                return
+            st.probes += 1
+            st.last_probe = time.time()
+            was = st.healthy
+            if err is None:
+                st.probe_ok += 1
+                st.fails = 0
+                st.healthy = True
+                st.last_error = None
+                a = LLM_EP_EWMA_ALPHA
+                st.latency_ms = ms if st.latency_ms is None else a * ms + (1 - a) * st.latency_ms
+            else:
+                st.fails += 1
+                st.last_error = err
+                if st.fails >= LLM_EP_FAIL_THRESHOLD or st.healthy is None:
+                    st.healthy = False
+        if was is not None and was != st.healthy:
+            log.warning(f"[endpoints] {url} {'UP' if st.healthy else 'DOWN'} ({err or f'{ms:.0f}ms'})")
+
+    async def probe_all(self) -> None:
+        if self._config is None or time.time() - self._config_ts > LLM_EP_REFRESH_S:
+            await asyncio.to_thread(self.refresh_config)
+        urls = list(self._config or [])
+        if urls:
+            await asyncio.gather(*(self._probe(u) for u in urls))
+
+    async def _run(self) -> None:
+        if self._wake is None:  # avviato senza start()
+            self._wake = asyncio.Event()
+        while not self._stopping:
+            try:
+                await self.probe_all()
+            except Exception as e:  # il prober non deve morire
+                log.warning(f"[endpoints] probe cycle failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    # ---------------- pub/sub ----------------
+    def _listen(self) -> None:
+        while not self._stopping:
+            try:
+                self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(LLM_EP_CHANNEL)
+                for _msg in self._pubsub.listen():
+                    if self._stopping:
+                        return
+                    self.invalidate()
+            except Exception as e:
+                if self._stopping:
+                    return
+                log.debug(f"[endpoints] pubsub listener error: {e}")
+                time.sleep(5.0)
+
+    def publish_update(self) -> None:
+        """Notifica agli altri worker che la configurazione è cambiata."""
+        self.invalidate()
+        if self._redis is not None:
+            try:
+                self._redis.publish(LLM_EP_CHANNEL, "update")
+            except Exception as e:
+                log.warning(f"[endpoints] publish failed: {e}")
+
+    # ---------------- lifecycle ----------------
+    async def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._stopping = False
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        if self._redis is not None and hasattr(self._redis, "pubsub") and self._listener is None:
+            self._listener = threading.Thread(target=self._listen, name="llm-endpoints-pubsub", daemon=True)
+            self._listener.start()
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._pubsub is not None:
+            try:
+                self._pubsub.close()
+            except Exception as e:
+                log.debug(f"[endpoints] pubsub close failed: {e}")
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass  # atteso: il task è stato appena cancellato
+            except Exception as e:
+                log.debug(f"[endpoints] prober exited with error: {e}")
+            self._task = None
+        self._listener = None
+
+
+_MANAGER: Optional[EndpointManager] = None
+
+
+def set_endpoint_manager(manager: Optional[EndpointManager]) -> None:
+    global _MANAGER
+    _MANAGER = manager
+
+
+def get_endpoint_manager() -> Optional[EndpointManager]:
+    return _MANAGER
+
+
+def routed_endpoints(default: List[str]) -> List[str]:
+    """Endpoint dal manager se attivo, altrimenti `default`."""
+    m = _MANAGER
+    if m is None:
+        return default
+    try:
+        return m.endpoints() or default
+    except Exception:
+        return default
+
+
+def report_endpoint(url: str, ok: bool, error: Optional[BaseException] = None) -> None:
+    m = _MANAGER
+    if m is not None:
+        m.report(url, ok, error)
@@ -33,6 +33,8 @@ EPISODIC_MAX_AGE_DAYS = int(os.getenv("EPISODIC_MAX_AGE_DAYS", "90"))
 
 # In-memory buffers per conversation (session-based, not persistent)
 _conversation_buffers: Dict[str, deque] = {}
+# Conversations with a summarization in progress (no concurrent duplicates)
+_summarizing: set = set()
 
 
 def _get_chroma_collection():
@@ -133,17 +135,20 @@ async def summarize_and_save_buffer(
         return None
     
     buffer = _get_conversation_buffer(conversation_id)
-    if len(buffer) == 0:
+    if len(buffer) == 0 or conversation_id in _summarizing:
         return None
     
     col = _get_chroma_collection()
     if col is None:
         return None
     
+    # Snapshot: turns added while the LLM summarizes stay in the buffer
+    snapshot = list(buffer)
+    _summarizing.add(conversation_id)
     try:
         # Build context from buffer
         turns = []
-        for i, turn in enumerate(buffer, 1):
+        for i, turn in enumerate(snapshot, 1):
             turns.append(f"Turn {i}:")
             turns.append(f"User: {turn['user']}")
             turns.append(f"Assistant: {turn['assistant']}")
@@ -163,14 +168,17 @@ async def summarize_and_save_buffer(
                 # Simple persona for summarization
                 persona = "Sei un assistente che crea riassunti concisi e accurati."
                 
-                summary = await llm_func(prompt, persona)
+                # job di background: cede il GPU alle richieste interattive
+                from core.llm_client import PRIORITY_BACKGROUND, llm_priority
+                with llm_priority(PRIORITY_BACKGROUND):
+                    summary = await llm_func(prompt, persona)
             except Exception as e:
                 log.warning(f"LLM summarization failed: {e}")
         
         # Fallback: rule-based summary
         if not summary:
             topics = []
-            for turn in buffer:
+            for turn in snapshot:
                 # Extract first few words from each user message
                 words = turn["user"].split()[:8]
                 if words:
@@ -185,7 +193,7 @@ async def summarize_and_save_buffer(
         metadata = {
             "conversation_id": conversation_id,
             "created_at": int(time.time()),
-            "turns_count": len(buffer),
+            "turns_count": len(snapshot),
         }
         
         if user_id:
@@ -197,16 +205,20 @@ async def summarize_and_save_buffer(
             metadatas=[metadata]
         )
         
-        log.info(f"Saved conversation summary: {doc_id} ({len(buffer)} turns)")
+        log.info(f"Saved conversation summary: {doc_id} ({len(snapshot)} turns)")
         
-        # Clear buffer after successful save
+        # Clear summarized turns after successful save
+        remaining = [t for t in buffer if not any(t is s for s in snapshot)]
         buffer.clear()
+        buffer.extend(remaining)
         
         return summary
         
     except Exception as e:
         log.error(f"Failed to summarize and save buffer: {e}")
         return None
+    finally:
+        _summarizing.discard(conversation_id)
 
 
 def query_conversation_history(
@@ -233,8 +245,9 @@ def query_conversation_history(
         return []
     
     try:
+        from utils.chroma_handler import query_args
         results = col.query(
-            query_texts=[query_text],
+            **query_args(query_text),
             n_results=top_k,
             where={"conversation_id": conversation_id},
             include=["documents", "metadatas", "distances"]
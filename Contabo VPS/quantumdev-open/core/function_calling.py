@@ -654,8 +654,8 @@ async def calculator_tool(expression: str) -> Dict[str, Any]:
 async def memory_search_tool(query: str, k: int = 5) -> Dict[str, Any]:
     """Search ChromaDB memory."""
     try:
-        from utils.chroma_handler import search_topk
-        results = search_topk(query, k=k)
+        from utils.chroma_handler import search_topk_async
+        results = await search_topk_async(query, k=k)
         return {"query": query, "results": results, "count": len(results)}
     except Exception as e:
         return {"query": query, "error": str(e)}
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+core/hybrid_retrieval.py — Retrieval ibrido BM25 + vettoriale con RRF
+
+La sola ricerca per embedding perde gli identificatori esatti (squadre,
+ticker, nomi file, quote "1.85"). Per ogni query su una collection:
+
+- ramo vettoriale: col.query() con gli embedding già calcolati (query_args);
+- ramo lessicale: BM25 sull'indice keyword (utils/keyword_index), stesso `where`;
+- i due rami girano in parallelo (lessicale su un piccolo pool di thread,
+  vettoriale sul thread del chiamante) e le liste vengono fuse con
+  reciprocal-rank fusion: rrf(d) = Σ 1 / (HYBRID_RRF_K + rank_ramo(d)).
+
+Ogni ramo recupera `candidate_pool(k)` candidati (HYBRID_POOL_MULT × k,
+minimo HYBRID_MIN_POOL): con il richiamo lessicale il pool può essere più
+piccolo del vecchio `expand = k*3`. Le latenze per stadio (vector, lexical,
+fuse, total) finiscono in hybrid_stats() → /healthz.
+
+Se un ramo fallisce si usa l'altro; se falliscono entrambi l'eccezione del
+ramo vettoriale risale al chiamante (che ha già i suoi fallback).
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+log = logging.getLogger(__name__)
+
+# ===================== ENVIRONMENT CONFIG =====================
+HYBRID_ENABLED = os.getenv("HYBRID_RETRIEVAL_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_POOL_MULT = float(os.getenv("HYBRID_POOL_MULT", "2"))
+HYBRID_MIN_POOL = int(os.getenv("HYBRID_MIN_POOL", "10"))
+HYBRID_WORKERS = int(os.getenv("HYBRID_WORKERS", "4"))
+
+_STAGES = ("vector", "lexical", "fuse", "total")
+_SAMPLES = 512
+
+_POOL: Optional[ThreadPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+_LAT: Dict[str, Deque[float]] = {s: deque(maxlen=_SAMPLES) for s in _STAGES}
+_COUNTS = {"queries": 0, "vector_errors": 0, "lexical_errors": 0, "lexical_only_hits": 0}
+_STATS_LOCK = threading.Lock()
+
+
+def candidate_pool(k: int) -> int:
+    """Candidati da recuperare per ramo per restituire `k` risultati."""
+    return max(int(k), HYBRID_MIN_POOL, int(math.ceil(k * HYBRID_POOL_MULT)))
+
+
+def rrf_fuse(rankings: Sequence[Sequence[str]], rrf_k: int = HYBRID_RRF_K) -> Dict[str, float]:
+    """Reciprocal-rank fusion di più liste di id ordinate (rank 1-based)."""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, _id in enumerate(ranking, start=1):
+            fused[_id] = fused.get(_id, 0.0) + 1.0 / (rrf_k + rank)
+    return fused
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ThreadPoolExecutor(max_workers=max(1, HYBRID_WORKERS), thread_name_prefix="hybrid")
+    return _POOL
+
+
+def _record(lat: Dict[str, float], **counts: int) -> None:
+    with _STATS_LOCK:
+        for stage, ms in lat.items():
+            _LAT[stage].append(ms)
+        _COUNTS["queries"] += 1
+        for key, n in counts.items():
+            _COUNTS[key] += n
+
+
+def _vector(col: Any, qargs: Dict[str, Any], n: int, where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    kwargs: Dict[str, Any] = {"n_results": n, "include": ["documents", "metadatas", "distances"]}
+    if where:
+        kwargs["where"] = where
+    res = col.query(**qargs, **kwargs)
+    out: List[Dict[str, Any]] = []
+    if not res or not res.get("ids") or not res["ids"][0]:
+        return out
+    docs = (res.get("documents") or [[]])[0]
+    metas = (res.get("metadatas") or [[]])[0]
+    dists = (res.get("distances") or [[]])[0]
+    for i, _id in enumerate(res["ids"][0]):
+        dist = float(dists[i]) if i < len(dists) else 1.0
+        out.append({
+            "id": _id,
+            "document": docs[i] if i < len(docs) else None,
+            "metadata": (metas[i] if i < len(metas) else None) or {},
+            "distance": dist,
+            "similarity": max(0.0, 1.0 - dist),
+        })
+    return out
+
+
+def _lexical(kw: Any, name: str, query: str, n: int, where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    hits = kw.search(name, query, limit=n, where=where)
+    docs = kw.get_docs(name, [h[0] for h in hits])
+    out: List[Dict[str, Any]] = []
+    for _id, bm25 in hits:
+        doc, md = docs.get(_id, (None, {}))
+        out.append({"id": _id, "document": doc, "metadata": md, "bm25": bm25})
+    return out
+
+
+def hybrid_query(
+    col: Any,
+    name: str,
+    query: str,
+    n: int,
+    qargs: Dict[str, Any],
+    kw: Any = None,
+    where: Optional[Dict[str, Any]] = None,
+    rrf_k: int = HYBRID_RRF_K,
+) -> List[Dict[str, Any]]:
+    """
+    Top `n` documenti di `name` per RRF dei rami vettoriale e lessicale.
+
+    Ogni item: id, document, metadata, distance e similarity (ramo vettoriale,
+    0.0 se trovato solo dal lessicale), bm25, vector_rank / lexical_rank (None
+    se assente), rrf, relevance (rrf diviso il massimo teorico dei rami
+    eseguiti, in [0, 1]) e collection.
+    """
+    t0 = time.perf_counter()
+    lat: Dict[str, float] = {}
+
+    def timed_lexical() -> List[Dict[str, Any]]:
+        t = time.perf_counter()
+        try:
+            return _lexical(kw, name, query, n, where)
+        finally:
+            lat["lexical"] = (time.perf_counter() - t) * 1000
+
+    lex_future = _pool().submit(timed_lexical) if kw is not None and query.strip() else None
+
+    vec: Optional[List[Dict[str, Any]]] = None
+    vec_err: Optional[BaseException] = None
+    t = time.perf_counter()
+    try:
+        vec = _vector(col, qargs, n, where)
+    except Exception as e:
+        vec_err = e
+    lat["vector"] = (time.perf_counter() - t) * 1000
+
+    lex: Optional[List[Dict[str, Any]]] = None
+    lex_failed = 0
+    if lex_future is not None:
+        try:
+            lex = lex_future.result()
+        except Exception as e:
+            lex_failed = 1
+            log.debug(f"hybrid lexical branch failed on {name}: {e}")
+
+    if vec is None and lex is None:
+        _record(lat, vector_errors=1, lexical_errors=lex_failed)
+        raise vec_err or RuntimeError("no retrieval branch available")
+
+    t = time.perf_counter()
+    rankings = [[it["id"] for it in branch] for branch in (vec, lex) if branch is not None]
+    fused = rrf_fuse(rankings, rrf_k=rrf_k)
+    best = len(rankings) / (rrf_k + 1.0)
+    items: Dict[str, Dict[str, Any]] = {}
+    for rank, it in enumerate(vec or [], start=1):
+        items[it["id"]] = {**it, "bm25": 0.0, "vector_rank": rank, "lexical_rank": None}
+    lexical_only = 0
+    for rank, it in enumerate(lex or [], start=1):
+        cur = items.get(it["id"])
+        if cur is None:
+            lexical_only += 1
+            items[it["id"]] = {**it, "distance": 1.0, "similarity": 0.0,
+                               "vector_rank": None, "lexical_rank": rank}
+        else:
+            cur["bm25"] = it["bm25"]
+            cur["lexical_rank"] = rank
+    out = sorted(items.values(), key=lambda it: fused[it["id"]], reverse=True)[:n]
+    for it in out:
+        it["bm25"] = round(float(it["bm25"]), 6)
+        it["rrf"] = round(fused[it["id"]], 6)
+        it["relevance"] = round(min(1.0, fused[it["id"]] / best), 6)
+        it["collection"] = name
+    lat["fuse"] = (time.perf_counter() - t) * 1000
+    lat["total"] = (time.perf_counter() - t0) * 1000
+
+    _record(lat, vector_errors=int(vec is None), lexical_errors=lex_failed, lexical_only_hits=lexical_only)
+    log.debug(
+        f"hybrid [{name}] n={n} vec={len(vec or [])} lex={len(lex or [])} "
+        + " ".join(f"{s}={lat.get(s, 0.0):.1f}ms" for s in _STAGES)
+    )
+    return out
+
+
+def hybrid_stats() -> Dict[str, Any]:
+    with _STATS_LOCK:
+        out: Dict[str, Any] = {"enabled": HYBRID_ENABLED, "rrf_k": HYBRID_RRF_K,
+                               "pool_mult": HYBRID_POOL_MULT, **_COUNTS}
+        for stage in _STAGES:
+            vals = sorted(_LAT[stage])
+            n = len(vals)
+            out[f"{stage}_avg_ms"] = round(sum(vals) / n, 2) if n else 0.0
+            out[f"{stage}_p95_ms"] = round(vals[min(n - 1, int(n * 0.95))], 2) if n else 0.0
+    return out
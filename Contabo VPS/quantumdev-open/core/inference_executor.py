@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+core/inference_executor.py — Executor dedicato per le chiamate ai modelli CPU
+
+Reranker, encode di sentence-transformers (semantic cache) ed embedding
+function di Chroma passano tutti da qui invece di girare sul thread del
+chiamante (o peggio sull'event loop):
+
+- Pochi worker (default 1): i modelli usano già più thread internamente,
+  eseguirne N in parallelo fa solo contesa.
+- Coda limitata con admission control: a coda piena `submit` solleva
+  InferenceOverloadedError e il chiamante degrada (fallback lessicale, cache miss).
+- Coalescing: job "batch" con la stessa chiave (es. stesso modello) in coda
+  vengono fusi in una sola chiamata al modello, fino a `max_batch` elementi.
+  Con `linger_s` > 0 il worker attende fino a quella finestra (dall'accodamento)
+  che arrivino altri job compatibili prima di eseguire.
+- Metriche: attesa in coda (avg/p95), batch eseguiti, job fusi, rifiuti.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Sequence
+
+log = logging.getLogger(__name__)
+
+# ===================== ENVIRONMENT CONFIG =====================
+INFERENCE_WORKERS = max(1, int(os.getenv("INFERENCE_WORKERS", "1")))
+INFERENCE_QUEUE_MAX = int(os.getenv("INFERENCE_QUEUE_MAX", "64"))
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "32"))
+
+_WAIT_SAMPLES = 512
+
+
+class InferenceOverloadedError(RuntimeError):
+    """Coda dell'executor piena: la richiesta è stata rifiutata."""
+
+
+class _Job:
+    __slots__ = ("key", "fn", "args", "kwargs", "items", "max_batch", "linger_s", "future", "enqueued")
+
+    def __init__(
+        self,
+        fn: Callable[..., Any],
+        args: tuple = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+        key: Optional[Hashable] = None,
+        items: Optional[List[Any]] = None,
+        max_batch: int = INFERENCE_MAX_BATCH,
+        linger_s: float = 0.0,
+    ) -> None:
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.items = items
+        self.max_batch = max(1, max_batch)
+        self.linger_s = max(0.0, linger_s)
+        self.future: Future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class InferenceExecutor:
+    """
+    Uso:
+        ex = get_inference_executor()
+        scores = ex.run_batch(("rerank", model), model.score, pairs, max_batch=16)
+        result = await ex.run_async(fn, *args)
+    """
+
+    def __init__(
+        self,
+        workers: int = INFERENCE_WORKERS,
+        queue_max: int = INFERENCE_QUEUE_MAX,
+        name: str = "inference",
+    ) -> None:
+        self.name = name
+        self.queue_max = queue_max
+        self._queue: Deque[_Job] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._threads: List[threading.Thread] = []
+        self._workers = max(1, workers)
+        self._waits: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+        self._stats = {
+            "submitted": 0,
+            "rejected": 0,
+            "completed": 0,
+            "errors": 0,
+            "model_calls": 0,
+            "coalesced": 0,
+        }
+
+    # ---------- Worker ----------
+    def _start(self) -> None:
+        # chiamato con self._cond acquisito
+        if self._threads:
+            return
+        for i in range(self._workers):
+            t = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _take(self) -> Optional[List[_Job]]:
+        """Prossimo job + eventuali job compatibili da fondere nella stessa chiamata."""
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            head = self._queue.popleft()
+            jobs = [head]
+            if head.key is not None and head.items is not None:
+                total = self._gather(head, jobs, len(head.items))
+                deadline = head.enqueued + head.linger_s
+                while total < head.max_batch and not self._closed:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)  # finestra di batching
+                    total = self._gather(head, jobs, total)
+            return jobs
+
+    def _gather(self, head: _Job, jobs: List[_Job], total: int) -> int:
+        # chiamato con self._cond acquisito
+        for job in list(self._queue):
+            if job.key != head.key or job.items is None:
+                continue
+            if total + len(job.items) > head.max_batch:
+                break
+            self._queue.remove(job)
+            jobs.append(job)
+            total += len(job.items)
+        return total
+
+    def _worker(self) -> None:
+        while True:
+            jobs = self._take()
+            if jobs is None:
+                return
+            now = time.perf_counter()
+            # job annullati dal chiamante (timeout) non vengono eseguiti
+            jobs = [j for j in jobs if j.future.set_running_or_notify_cancel()]
+            if not jobs:
+                continue
+            for j in jobs:
+                self._waits.append(now - j.enqueued)
+            if jobs[0].items is None:
+                self._run_single(jobs[0])
+            else:
+                self._run_batch(jobs)
+
+    def _run_single(self, job: _Job) -> None:
+        try:
+            result = job.fn(*job.args, **job.kwargs)
+        except BaseException as e:
+            self._stats["errors"] += 1
+            job.future.set_exception(e)
+            return
+        self._stats["model_calls"] += 1
+        self._stats["completed"] += 1
+        job.future.set_result(result)
+
+    def _run_batch(self, jobs: List[_Job]) -> None:
+        head = jobs[0]
+        items: List[Any] = []
+        for j in jobs:
+            items.extend(j.items or [])
+        try:
+            out: List[Any] = []
+            for i in range(0, len(items), head.max_batch):
+                chunk = items[i:i + head.max_batch]
+                res = list(head.fn(chunk))
+                if len(res) != len(chunk):
+                    raise ValueError(f"batch fn returned {len(res)} results for {len(chunk)} items")
+                out.extend(res)
+                self._stats["model_calls"] += 1
+        except BaseException as e:
+            self._stats["errors"] += len(jobs)
+            for j in jobs:
+                j.future.set_exception(e)
+            return
+        self._stats["coalesced"] += len(jobs) - 1
+        self._stats["completed"] += len(jobs)
+        pos = 0
+        for j in jobs:
+            n = len(j.items or [])
+            j.future.set_result(out[pos:pos + n])
+            pos += n
+
+    # ---------- Submit ----------
+    def _in_worker(self) -> bool:
+        return threading.current_thread() in self._threads
+
+    def _enqueue(self, job: _Job) -> Future:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} executor closed")
+            if self.queue_max > 0 and len(self._queue) >= self.queue_max:
+                self._stats["rejected"] += 1
+                raise InferenceOverloadedError(
+                    f"{self.name}: queue full ({len(self._queue)}/{self.queue_max})"
+                )
+            self._start()
+            self._queue.append(job)
+            self._stats["submitted"] += 1
+            self._cond.notify()
+        return job.future
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Job singolo (nessun coalescing)."""
+        return self._enqueue(_Job(fn, args, kwargs))
+
+    def submit_batch(
+        self,
+        key: Hashable,
+        fn: Callable[[List[Any]], Sequence[Any]],
+        items: Sequence[Any],
+        max_batch: int = INFERENCE_MAX_BATCH,
+        linger_s: float = 0.0,
+    ) -> Future:
+        """
+        `fn(items) -> results` (stessa lunghezza). Job con la stessa `key`
+        ancora in coda vengono fusi; `fn` riceve al più `max_batch` elementi.
+        """
+        return self._enqueue(_Job(fn, key=key, items=list(items), max_batch=max_batch, linger_s=linger_s))
+
+    def run(self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> Any:
+        if self._in_worker():  # chiamata annidata: eseguire inline evita il deadlock
+            return fn(*args, **kwargs)
+        fut = self.submit(fn, *args, **kwargs)
+        return self._wait(fut, timeout)
+
+    def run_batch(
+        self,
+        key: Hashable,
+        fn: Callable[[List[Any]], Sequence[Any]],
+        items: Sequence[Any],
+        max_batch: int = INFERENCE_MAX_BATCH,
+        timeout: Optional[float] = None,
+        linger_s: float = 0.0,
+    ) -> List[Any]:
+        items = list(items)
+        if not items:
+            return []
+        if self._in_worker():
+            out: List[Any] = []
+            for i in range(0, len(items), max(1, max_batch)):
+                out.extend(fn(items[i:i + max(1, max_batch)]))
+            return out
+        fut = self.submit_batch(key, fn, items, max_batch=max_batch, linger_s=linger_s)
+        return self._wait(fut, timeout)
+
+    @staticmethod
+    def _wait(fut: Future, timeout: Optional[float]) -> Any:
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeoutError:  # su py<3.11 non coincide con il TimeoutError builtin
+            fut.cancel()  # se ancora in coda non verrà eseguito
+            raise
+
+    async def run_async(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    async def run_batch_async(
+        self,
+        key: Hashable,
+        fn: Callable[[List[Any]], Sequence[Any]],
+        items: Sequence[Any],
+        max_batch: int = INFERENCE_MAX_BATCH,
+        linger_s: float = 0.0,
+    ) -> List[Any]:
+        if not items:
+            return []
+        return await asyncio.wrap_future(self.submit_batch(key, fn, items, max_batch=max_batch, linger_s=linger_s))
+
+    # ---------- Stats / lifecycle ----------
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+        n = len(waits)
+        with self._cond:
+            depth = len(self._queue)
+        return {
+            **self._stats,
+            "workers": self._workers,
+            "queue_depth": depth,
+            "queue_max": self.queue_max,
+            "queue_wait_avg_ms": round(sum(waits) / n * 1000, 2) if n else 0.0,
+            "queue_wait_p95_ms": round(waits[min(n - 1, int(n * 0.95))] * 1000, 2) if n else 0.0,
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._cond:
+            self._closed = True
+            pending = list(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+        for j in pending:
+            j.future.cancel()
+        if wait:
+            for t in self._threads:
+                t.join(timeout=5.0)
+
+
+# ===================== SINGLETON =====================
+_EXECUTOR: Optional[InferenceExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_inference_executor() -> InferenceExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = InferenceExecutor()
+    return _EXECUTOR
+
+
+def inference_stats() -> Dict[str, Any]:
+    return get_inference_executor().stats() if _EXECUTOR is not None else {"started": False}
+
+
+def shutdown_inference_executor() -> None:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=False)
+            _EXECUTOR = None
@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+core/llm_client.py — Client HTTP async condiviso per le chiamate LLM
+
+Ogni chiamata al modello (chat_engine, classificatore intent, _run_direct,
+/cache/warm) faceva requests.post in un thread, senza sessione: una nuova
+connessione TCP/TLS verso il box GPU o il tunnel Cloudflare per richiesta e
+un thread occupato fino al timeout. Qui:
+
+- Un client per event loop (httpx.AsyncClient, HTTP/2 se il pacchetto `h2`
+  è installato e LLM_HTTP2=1; altrimenti aiohttp) con keep-alive: il
+  handshake verso il tunnel si paga una volta, non a ogni richiesta.
+- Limiti configurabili: connessioni totali e keep-alive del pool.
+- Scheduler con priorità davanti al GPU (LLMScheduler): cap globale di
+  richieste in volo (LLM_MAX_INFLIGHT, da allineare al batch di vLLM
+  `--max-num-seqs`), classi interactive > normal > background, quota
+  massima per il background, deadline di attesa in coda per classe e
+  admission control: se la coda è piena o l'attesa stimata supera la
+  deadline la richiesta viene rifiutata subito (LLMOverloadedError) invece di
+  scadere dopo il timeout HTTP.
+- Nessun thread: l'attesa della risposta è puro I/O sul loop.
+- Streaming SSE (`stream: true` OpenAI-compat) con time-to-first-token
+  misurato per ogni stream (llm_client_stats: ttft_*).
+
+Uso:
+    data = await post_json(url, payload, timeout=60)   # dict JSON
+    async for ev in stream_sse(url, {**payload, "stream": True}, timeout=60):
+        ...                                             # chunk JSON
+    with llm_priority("background"):                    # job non interattivi
+        await post_json(...)
+Errori: LLMHTTPError per status != 2xx, LLMOverloadedError se la richiesta viene
+scartata dallo scheduler, asyncio.TimeoutError / eccezioni del trasporto per
+timeout e connessione.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional
+
+log = logging.getLogger(__name__)
+
+try:
+    import httpx  # type: ignore
+    HTTPX_AVAILABLE = True
+except Exception:  # pragma: no cover
+    httpx = None  # type: ignore
+    HTTPX_AVAILABLE = False
+
+try:
+    import aiohttp  # type: ignore
+    AIOHTTP_AVAILABLE = True
+except Exception:  # pragma: no cover
+    aiohttp = None  # type: ignore
+    AIOHTTP_AVAILABLE = False
+
+try:
+    import h2  # type: ignore  # noqa: F401
+    H2_AVAILABLE = True
+except Exception:
+    H2_AVAILABLE = False
+
+# ===================== ENVIRONMENT CONFIG =====================
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "32"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "16"))
+LLM_HTTP_KEEPALIVE_S = float(os.getenv("LLM_HTTP_KEEPALIVE_S", "60"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1").strip().lower() in ("1", "true", "yes", "on")
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "16"))
+LLM_BACKGROUND_MAX_INFLIGHT = int(os.getenv("LLM_BACKGROUND_MAX_INFLIGHT", "0"))  # 0 = LLM_MAX_INFLIGHT // 4
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "64"))
+LLM_QUEUE_DEADLINE_S = {
+    "interactive": float(os.getenv("LLM_QUEUE_DEADLINE_INTERACTIVE_S", "10")),
+    "normal": float(os.getenv("LLM_QUEUE_DEADLINE_NORMAL_S", "20")),
+    "background": float(os.getenv("LLM_QUEUE_DEADLINE_BACKGROUND_S", "120")),
+}
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_NORMAL = "normal"
+PRIORITY_BACKGROUND = "background"
+_PRIORITIES = {PRIORITY_INTERACTIVE: 0, PRIORITY_NORMAL: 1, PRIORITY_BACKGROUND: 2}
+_BG = _PRIORITIES[PRIORITY_BACKGROUND]
+_PRIORITY: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default=PRIORITY_NORMAL)
+
+
+class LLMHTTPError(RuntimeError):
+    """Risposta HTTP non 2xx dal backend LLM."""
+
+    def __init__(self, status: int, body: str) -> None:
+        super().__init__(f"LLM HTTP {status}: {body[:300]}")
+        self.status = status
+        self.body = body
+
+
+class LLMOverloadedError(RuntimeError):
+    """Richiesta scartata dallo scheduler (coda piena o deadline di attesa)."""
+
+    def __init__(self, priority: str, reason: str) -> None:
+        super().__init__(f"LLM overloaded ({priority}): {reason}")
+        self.priority = priority
+        self.reason = reason
+
+
+@contextmanager
+def llm_priority(priority: str) -> Iterator[None]:
+    """
+    Classe di priorità delle chiamate LLM nel blocco (e nei task creati al
+    suo interno): interactive, normal (default) o background.
+    """
+    if priority not in _PRIORITIES:
+        raise ValueError(f"unknown LLM priority: {priority}")
+    token = _PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+def current_priority() -> str:
+    return _PRIORITY.get()
+
+
+class _Waiter:
+    __slots__ = ("prio", "name", "seq", "fut", "t0")
+
+    def __init__(self, prio: int, name: str, seq: int, fut: asyncio.Future) -> None:
+        self.prio, self.name, self.seq, self.fut = prio, name, seq, fut
+        self.t0 = time.perf_counter()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.prio, self.seq) < (other.prio, other.seq)
+
+
+class LLMScheduler:
+    """
+    Ammissione delle richieste LLM di un event loop.
+
+    Uno slot libero va sempre al waiter con priorità più alta (FIFO nella
+    stessa classe); il background non supera `background_cap` slot, così le
+    richieste interattive trovano posto anche con job lunghi in corso. La
+    deadline vale per l'attesa in coda, non per la generazione.
+    """
+
+    def __init__(self, capacity: int, background_cap: int, queue_max: int) -> None:
+        self.capacity = max(1, capacity)
+        self.background_cap = max(1, min(background_cap or self.capacity // 4, self.capacity))
+        self.queue_max = max(0, queue_max)
+        self.inflight = 0
+        self.inflight_bg = 0
+        self.service_ewma_s = 0.0
+        self._heap: List[_Waiter] = []
+        self._waiting = 0
+        self._seq = itertools.count()
+
+    def _can_run(self, prio: int) -> bool:
+        if self.inflight >= self.capacity:
+            return False
+        return prio < _BG or self.inflight_bg < self.background_cap
+
+    def _take(self, prio: int) -> None:
+        self.inflight += 1
+        if prio == _BG:
+            self.inflight_bg += 1
+
+    def _dispatch(self) -> None:
+        while self._heap:
+            w = self._heap[0]
+            if w.fut.done():  # scaduto, cancellato o espulso
+                heapq.heappop(self._heap)
+                continue
+            if not self._can_run(w.prio):
+                break
+            heapq.heappop(self._heap)
+            self._waiting -= 1
+            self._take(w.prio)
+            _record_wait(w.name, time.perf_counter() - w.t0)
+            w.fut.set_result(True)
+
+    def _has_waiting_at_or_above(self, prio: int) -> bool:
+        return any(w.prio <= prio and not w.fut.done() for w in self._heap)
+
+    def _estimated_wait_s(self, prio: int) -> float:
+        ahead = sum(1 for w in self._heap if w.prio <= prio and not w.fut.done())
+        slots = self.background_cap if prio == _BG else self.capacity  # il background ne usa al più tanti
+        return (ahead + 1) * self.service_ewma_s / slots
+
+    def _shed_for(self, prio: int) -> bool:
+        """Coda piena: espelle il waiter meno prioritario (più recente) se sotto `prio`."""
+        live = [w for w in self._heap if not w.fut.done()]
+        if not live:
+            return False
+        victim = max(live, key=lambda w: (w.prio, w.seq))
+        if victim.prio <= prio:
+            return False
+        self._waiting -= 1
+        victim.fut.set_exception(LLMOverloadedError(victim.name, "evicted by higher priority"))
+        return True
+
+    async def acquire(self, priority: str, deadline_s: Optional[float] = None) -> None:
+        prio = _PRIORITIES[priority]
+        if self._can_run(prio) and not self._has_waiting_at_or_above(prio):
+            self._take(prio)
+            _record_wait(priority, 0.0)
+            return
+        budget = LLM_QUEUE_DEADLINE_S[priority] if deadline_s is None else deadline_s
+        if self._waiting >= self.queue_max and not self._shed_for(prio):
+            _record_shed(priority, "queue_full")
+            raise LLMOverloadedError(priority, f"queue full ({self._waiting} waiting)")
+        if self.service_ewma_s > 0 and self._estimated_wait_s(prio) > budget:
+            _record_shed(priority, "deadline")
+            raise LLMOverloadedError(priority, f"estimated wait {self._estimated_wait_s(prio):.1f}s > {budget:.1f}s")
+
+        w = _Waiter(prio, priority, next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heap, w)
+        self._waiting += 1
+        _bump("waited")
+        try:
+            await asyncio.wait({w.fut}, timeout=max(0.0, budget))
+        except asyncio.CancelledError:
+            self._abandon(w)
+            raise
+        if not w.fut.done():
+            self._abandon(w)
+            _record_shed(priority, "deadline")
+            raise LLMOverloadedError(priority, f"no slot within {budget:.1f}s")
+        if w.fut.exception() is not None:
+            _record_shed(priority, "evicted")
+            raise w.fut.exception()  # type: ignore[misc]
+
+    def _abandon(self, w: _Waiter) -> None:
+        if w.fut.done():
+            if not w.fut.cancelled() and w.fut.exception() is None:
+                self.release(w.name, None)  # slot concesso ma il chiamante se n'è andato
+            return
+        w.fut.cancel()
+        self._waiting -= 1
+        self._dispatch()
+
+    def release(self, priority: str, service_s: Optional[float]) -> None:
+        self.inflight -= 1
+        if _PRIORITIES[priority] == _BG:
+            self.inflight_bg -= 1
+        if service_s is not None:
+            a = 0.2
+            self.service_ewma_s = service_s if self.service_ewma_s == 0 else a * service_s + (1 - a) * self.service_ewma_s
+        self._dispatch()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "inflight": self.inflight,
+            "inflight_background": self.inflight_bg,
+            "queued": self._waiting,
+            "capacity": self.capacity,
+            "background_cap": self.background_cap,
+            "service_ewma_s": round(self.service_ewma_s, 3),
+        }
+
+
+class _LoopClient:
+    """Client + scheduler legati a un event loop."""
+
+    def __init__(self) -> None:
+        self.sched = LLMScheduler(LLM_MAX_INFLIGHT, LLM_BACKGROUND_MAX_INFLIGHT, LLM_QUEUE_MAX)
+        self.http2 = False
+        if HTTPX_AVAILABLE:
+            self.backend = "httpx"
+            self.http2 = LLM_HTTP2 and H2_AVAILABLE
+            self.client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=LLM_HTTP_KEEPALIVE_S,
+                ),
+                trust_env=False,
+            )
+        elif AIOHTTP_AVAILABLE:
+            self.backend = "aiohttp"
+            self.client = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=LLM_HTTP_MAX_CONNECTIONS,
+                    keepalive_timeout=LLM_HTTP_KEEPALIVE_S,
+                    ttl_dns_cache=300,
+                ),
+                trust_env=False,
+            )
+        else:  # pragma: no cover
+            raise RuntimeError("no async HTTP client available (install httpx or aiohttp)")
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.client.is_closed if self.backend == "httpx" else self.client.closed)
+
+    async def close(self) -> None:
+        if self.backend == "httpx":
+            await self.client.aclose()
+        else:
+            await self.client.close()
+
+
+# Client legati al loop: uno per loop (un solo loop per worker uvicorn;
+# i test e gli script usano asyncio.run ripetuti).
+_CLIENTS: Dict[asyncio.AbstractEventLoop, _LoopClient] = {}
+_STATS = {"requests": 0, "errors": 0, "inflight": 0, "max_inflight": 0, "waited": 0, "streams": 0}
+_STATS_LOCK = threading.Lock()
+_TTFT_MS: Deque[float] = deque(maxlen=512)
+_SCHED_STATS: Dict[str, Dict[str, Any]] = {
+    p: {"admitted": 0, "shed_queue_full": 0, "shed_deadline": 0, "shed_evicted": 0,
+        "wait_ms": deque(maxlen=512)}
+    for p in _PRIORITIES
+}
+
+
+def _record_wait(priority: str, wait_s: float) -> None:
+    with _STATS_LOCK:
+        st = _SCHED_STATS[priority]
+        st["admitted"] += 1
+        st["wait_ms"].append(wait_s * 1000.0)
+
+
+def _record_shed(priority: str, reason: str) -> None:
+    with _STATS_LOCK:
+        _SCHED_STATS[priority][f"shed_{reason}"] += 1
+    log.warning(f"LLM request shed ({priority}): {reason}")
+
+
+def background_slots() -> int:
+    """Slot LLM concessi al background sul loop corrente: limite di concorrenza per i job batch."""
+    return _get_client().sched.background_cap
+
+
+def _get_client() -> _LoopClient:
+    loop = asyncio.get_running_loop()
+    c = _CLIENTS.get(loop)
+    if c is None or c.closed:
+        for old in [lp for lp in _CLIENTS if lp.is_closed()]:
+            del _CLIENTS[old]
+        c = _LoopClient()
+        _CLIENTS[loop] = c
+        log.info(f"LLM client: {c.backend} (http2={c.http2}, max_conn={LLM_HTTP_MAX_CONNECTIONS})")
+    return c
+
+
+def _bump(key: str, n: int = 1) -> None:
+    with _STATS_LOCK:
+        _STATS[key] += n
+        if key == "inflight":
+            _STATS["max_inflight"] = max(_STATS["max_inflight"], _STATS["inflight"])
+
+
+async def _send(c: _LoopClient, method: str, url: str, payload: Optional[Dict[str, Any]],
+                timeout: float, headers: Optional[Dict[str, str]]) -> Dict[str, Any]:
+    if c.backend == "httpx":
+        r = await c.client.request(method, url, json=payload, headers=headers, timeout=timeout)
+        if not 200 <= r.status_code < 300:
+            raise LLMHTTPError(r.status_code, r.text or "")
+        return r.json()
+    async with c.client.request(
+        method, url, json=payload, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as r:
+        if not 200 <= r.status < 300:
+            raise LLMHTTPError(r.status, await r.text())
+        return await r.json(content_type=None)
+
+
+async def post_json(url: str, payload: Dict[str, Any], timeout: float,
+                    headers: Optional[Dict[str, str]] = None,
+                    priority: Optional[str] = None,
+                    deadline_s: Optional[float] = None) -> Dict[str, Any]:
+    """
+    POST JSON sul client condiviso; ritorna il body JSON (dict).
+
+    `priority` (default: classe del contesto, vedi llm_priority) e
+    `deadline_s` (attesa massima di uno slot) passano allo scheduler.
+    """
+    c = _get_client()
+    prio = priority or _PRIORITY.get()
+    await c.sched.acquire(prio, deadline_s)
+    _bump("requests")
+    _bump("inflight")
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        out = await _send(c, "POST", url, payload, timeout, headers)
+        ok = True
+        return out
+    except Exception:
+        _bump("errors")
+        raise
+    finally:
+        _bump("inflight", -1)
+        c.sched.release(prio, time.perf_counter() - t0 if ok else None)
+
+
+async def probe_json(method: str, url: str, payload: Optional[Dict[str, Any]] = None,
+                     timeout: float = 3.0) -> Dict[str, Any]:
+    """
+    Richiesta di health check sul client condiviso (stesse connessioni
+    keep-alive), fuori dal semaforo e dalle statistiche: un probe non deve
+    aspettare dietro le richieste in volo né risultarne rallentato.
+    """
+    return await _send(_get_client(), method, url, payload, timeout, None)
+
+
+def _has_content(ev: Dict[str, Any]) -> bool:
+    try:
+        ch = (ev.get("choices") or [{}])[0]
+        return bool((ch.get("delta") or {}).get("content") or ch.get("text"))
+    except Exception:
+        return False
+
+
+async def _sse_lines(c: _LoopClient, url: str, payload: Dict[str, Any], timeout: float,
+                     headers: Optional[Dict[str, str]]) -> AsyncIterator[str]:
+    if c.backend == "httpx":
+        async with c.client.stream("POST", url, json=payload, headers=headers, timeout=timeout) as r:
+            if not 200 <= r.status_code < 300:
+                body = (await r.aread()).decode("utf-8", "replace")
+                raise LLMHTTPError(r.status_code, body)
+            async for line in r.aiter_lines():
+                yield line
+        return
+    # timeout per lettura, non totale: uno stream lungo non deve scadere
+    tmo = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    async with c.client.post(url, json=payload, headers=headers, timeout=tmo) as r:
+        if not 200 <= r.status < 300:
+            raise LLMHTTPError(r.status, await r.text())
+        async for raw in r.content:
+            yield raw.decode("utf-8", "replace")
+
+
+async def stream_sse(url: str, payload: Dict[str, Any], timeout: float,
+                     headers: Optional[Dict[str, str]] = None,
+                     priority: Optional[str] = None,
+                     deadline_s: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    POST con risposta Server-Sent Events (OpenAI-compat `stream: true`).
+
+    Produce i chunk JSON fino a `data: [DONE]`; `timeout` vale per la
+    connessione e per ogni lettura. Lo slot dello scheduler resta occupato
+    per tutta la durata dello stream. Registra il time-to-first-token (primo
+    chunk con contenuto, attesa in coda inclusa).
+    """
+    c = _get_client()
+    prio = priority or _PRIORITY.get()
+    t0 = time.perf_counter()
+    await c.sched.acquire(prio, deadline_s)
+    _bump("requests")
+    _bump("streams")
+    _bump("inflight")
+    t_run = time.perf_counter()
+    first = True
+    ok = False
+    try:
+        async for line in _sse_lines(c, url, payload, timeout, headers):
+            line = line.strip()
+            if not line.startswith("data:"):
+                continue  # keep-alive, commenti, event:/id:
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                ev = json.loads(data)
+            except ValueError:
+                continue
+            if first and _has_content(ev):
+                first = False
+                with _STATS_LOCK:
+                    _TTFT_MS.append((time.perf_counter() - t0) * 1000.0)
+            yield ev
+        ok = True
+    except Exception:
+        _bump("errors")
+        raise
+    finally:
+        _bump("inflight", -1)
+        c.sched.release(prio, time.perf_counter() - t_run if ok else None)
+
+
+async def close_llm_client() -> None:
+    """Chiude il client del loop corrente (da chiamare allo shutdown)."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    c = _CLIENTS.pop(loop, None)
+    if c is not None and not c.closed:
+        await c.close()
+
+
+def llm_client_stats() -> Dict[str, Any]:
+    with _STATS_LOCK:
+        out: Dict[str, Any] = dict(_STATS)
+        ttft = sorted(_TTFT_MS)
+    n = len(ttft)
+    out["ttft_avg_ms"] = round(sum(ttft) / n, 1) if n else 0.0
+    out["ttft_p50_ms"] = round(ttft[n // 2], 1) if n else 0.0
+    out["ttft_p95_ms"] = round(ttft[min(n - 1, int(n * 0.95))], 1) if n else 0.0
+    backends = [c.backend for c in _CLIENTS.values()]
+    out.update({
+        "backend": backends[0] if backends else ("httpx" if HTTPX_AVAILABLE else "aiohttp"),
+        "http2": any(c.http2 for c in _CLIENTS.values()),
+        "max_inflight_limit": LLM_MAX_INFLIGHT,
+        "max_connections": LLM_HTTP_MAX_CONNECTIONS,
+        "scheduler": llm_scheduler_stats(),
+    })
+    return out
+
+
+def llm_scheduler_stats() -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    with _STATS_LOCK:
+        for p, st in _SCHED_STATS.items():
+            waits = sorted(st["wait_ms"])
+            n = len(waits)
+            out[p] = {k: v for k, v in st.items() if k != "wait_ms"}
+            out[p]["wait_p95_ms"] = round(waits[min(n - 1, int(n * 0.95))], 1) if n else 0.0
+            out[p]["deadline_s"] = LLM_QUEUE_DEADLINE_S[p]
+    for c in list(_CLIENTS.values()):
+        snap = c.sched.snapshot()
+        for k in ("inflight", "inflight_background", "queued"):
+            out[k] = out.get(k, 0) + snap[k]
+        out.update({k: snap[k] for k in ("capacity", "background_cap", "service_ewma_s")})
+    return out
@@ -20,7 +20,7 @@ import time
 import logging
 from typing import Any, Dict, Optional
 
-import requests
+from core.llm_client import PRIORITY_INTERACTIVE, post_json
 
 try:
     from core.smart_intent_classifier import SmartIntentClassifier
@@ -261,17 +261,16 @@ NON AGGIUNGERE altro testo fuori dal JSON.
             "max_tokens": self.max_tokens,
         }
 
-    def _call_llm(self, query: str) -> Optional[Dict[str, Any]]:
+    async def _call_llm(self, query: str) -> Optional[Dict[str, Any]]:
         if not self.chat_url:
             return None
 
         payload = self._build_prompt(query)
         try:
-            r = requests.post(
-                self.chat_url, json=payload, timeout=self.timeout_s
+            # sul percorso della richiesta utente: stessa classe di /chat
+            data = await post_json(
+                self.chat_url, payload, timeout=self.timeout_s, priority=PRIORITY_INTERACTIVE
             )
-            r.raise_for_status()
-            data = r.json()
         except Exception as e:
             log.warning(f"[LLMIntent] HTTP error: {e}")
             return None
@@ -368,7 +367,7 @@ NON AGGIUNGERE altro testo fuori dal JSON.
             return res
 
         # Chiamata LLM vera e propria
-        parsed = self._call_llm(query)
+        parsed = await self._call_llm(query)
 
         if not parsed or "intent" not in parsed:
             # Fallback completo
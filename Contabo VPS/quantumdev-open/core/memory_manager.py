@@ -9,6 +9,7 @@ Provides a single interface for memory operations in chat flow.
 
 import os
 import re
+import asyncio
 import logging
 from typing import Dict, List, Any, Optional, Tuple
 from dotenv import load_dotenv
@@ -49,6 +50,9 @@ MEMORY_PROFILE_TOP_K = int(os.getenv("MEMORY_PROFILE_TOP_K", "5"))
 MEMORY_EPISODIC_TOP_K = int(os.getenv("MEMORY_EPISODIC_TOP_K", "3"))
 MEMORY_MAX_CONTEXT_TOKENS = int(os.getenv("MEMORY_MAX_CONTEXT_TOKENS", "800"))
 
+# Detached summarization tasks (strong refs so they are not garbage-collected)
+_background_tasks: set = set()
+
 # Secret/sensitive data patterns (basic filtering)
 SENSITIVE_PATTERNS = [
     r'\b[A-Za-z0-9]{25,}\b',  # Very long alphanumeric strings (potential API keys)
@@ -220,7 +224,8 @@ async def record_conversation_turn(
     user_message: str,
     assistant_message: str,
     user_id: Optional[str] = None,
-    llm_func: Optional[Any] = None
+    llm_func: Optional[Any] = None,
+    background: bool = False
 ) -> Dict[str, Any]:
     """
     Record a conversation turn and handle automatic summarization.
@@ -231,6 +236,8 @@ async def record_conversation_turn(
         assistant_message: Assistant's response
         user_id: Optional user identifier
         llm_func: Optional LLM function for summarization
+        background: Run the summarization as a detached task, so the
+            caller (e.g. a finished /chat reply) does not wait for it
         
     Returns:
         Dict with recording results
@@ -238,6 +245,7 @@ async def record_conversation_turn(
     result = {
         "recorded": False,
         "summarized": False,
+        "summarizing": False,
         "summary": None,
     }
     
@@ -259,6 +267,17 @@ async def record_conversation_turn(
         if buffer_result.get("needs_summarization"):
             log.info(f"Conversation buffer threshold reached for {conversation_id}, summarizing...")
             
+            if background:
+                task = asyncio.create_task(summarize_and_save_buffer(
+                    conversation_id=conversation_id,
+                    user_id=user_id,
+                    llm_func=llm_func
+                ))
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
+                result["summarizing"] = True
+                return result
+            
             summary = await summarize_and_save_buffer(
                 conversation_id=conversation_id,
                 user_id=user_id,
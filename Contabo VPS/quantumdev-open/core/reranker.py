@@ -5,15 +5,31 @@
 # - Fallback lessicale (cosine su BoW) quando il modello non è disponibile
 # - Limite candidati e limite testo per stabilità su CPU
 # - API compatibile: Reranker(model, device).rerank(query, results, top_k)
+# Patch 2026-10:
+# - Backend configurabile: flag (FlagEmbedding) | onnx (ONNX Runtime, anche int8) | lexical
+# - Batch a dimensione fissa (RERANKER_BATCH_SIZE) + warmup all'avvio
+# - Cache LRU (query_hash, url) → score condivisa tra richieste
 
 from __future__ import annotations
-import os, math, re
+import os, math, re, time, hashlib, threading, logging
+from collections import OrderedDict
 from typing import List, Dict, Tuple, Optional
 
+from core.inference_executor import get_inference_executor
+
+log = logging.getLogger(__name__)
+
 # ==== ENV ====
 _RR_MAX_CANDS = int(os.getenv("RERANKER_MAX_CANDIDATES", "32"))      # lim. risultati in input
 _RR_TEXT_LIM  = int(os.getenv("RERANKER_TEXT_LIMIT_CHARS", "600"))   # lim. testo (titolo+snippet)
 _RR_NORMALIZE = (os.getenv("RERANKER_NORMALIZE", "1").strip().lower() in ("1","true","yes","on"))
+_RR_BACKEND   = os.getenv("RERANKER_BACKEND", "flag").strip().lower()  # flag | onnx | lexical
+_RR_BATCH     = max(1, int(os.getenv("RERANKER_BATCH_SIZE", "16")))
+_RR_MAX_LEN   = int(os.getenv("RERANKER_MAX_LENGTH", "512"))            # token per coppia (onnx)
+_RR_ONNX_PATH = os.getenv("RERANKER_ONNX_PATH", "")                     # file .onnx (es. model_quantized.onnx)
+_RR_ONNX_THR  = int(os.getenv("RERANKER_ONNX_THREADS", "0"))            # 0 = default onnxruntime
+_RR_CACHE_MAX = int(os.getenv("RERANKER_CACHE_SIZE", "4096"))           # 0 = cache disattivata
+_RR_CACHE_TTL = float(os.getenv("RERANKER_CACHE_TTL_S", "3600"))
 
 # ==== Import opzionale ====
 _FlagReranker = None  # type: ignore
@@ -23,6 +39,15 @@ try:
 except Exception:
     _FlagReranker = None  # non disponibile → fallback lessicale
 
+try:
+    import numpy as _np  # type: ignore
+    import onnxruntime as _ort  # type: ignore
+    from transformers import AutoTokenizer as _AutoTokenizer  # type: ignore
+except Exception:
+    _np = None  # type: ignore
+    _ort = None  # type: ignore
+    _AutoTokenizer = None  # type: ignore
+
 
 # ==== Utils lessicali (fallback) ====
 _TOK = re.compile(r"[a-z0-9àèéìíòóùú]+", re.I)
@@ -50,22 +75,160 @@ def _cos_bow(a: Dict[str, float], b: Dict[str, float]) -> float:
         return sum(a.get(k, 0.0) * vb for k, vb in b.items())
 
 
+def query_hash(query: str) -> str:
+    """
+    Hash della query normalizzata: minuscole, punteggiatura e ordine delle
+    parole ignorati, così riformulazioni banali condividono gli score.
+    """
+    toks = sorted(set(_tok(query)))
+    return hashlib.sha256(" ".join(toks).encode("utf-8")).hexdigest()[:16]
+
+
+# ==== Cache score (query_hash, url) → score ====
+class ScoreCache:
+    """LRU thread-safe con TTL; le chiamate a rerank girano in thread diversi."""
+
+    def __init__(self, max_size: int = _RR_CACHE_MAX, ttl_s: float = _RR_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[float]:
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (time.time() - item[0]) > self.ttl_s:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Tuple[str, str], score: float) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.time(), float(score))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            size = len(self._data)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+# ==== Backend ====
+class _FlagBackend:
+    """FlagEmbedding (PyTorch) — fp32 su CPU."""
+    name = "flag"
+
+    def __init__(self, model: str, device: str):
+        if _FlagReranker is None:
+            raise RuntimeError("FlagEmbedding non installato")
+        # base è più leggero e ok su CPU
+        self._rr = _FlagReranker(model, use_fp16=False, device=device)
+
+    def score(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        out = self._rr.compute_score(pairs, normalize=True, batch_size=_RR_BATCH)
+        if not isinstance(out, list):  # una sola coppia → float
+            out = [out]
+        return [float(x) for x in out]
+
+
+class _OnnxBackend:
+    """
+    ONNX Runtime su CPU. Il file indicato da RERANKER_ONNX_PATH può essere
+    il modello quantizzato int8 (es. export con `optimum-cli export onnx`
+    + `onnxruntime.quantization.quantize_dynamic`).
+    """
+    name = "onnx"
+
+    def __init__(self, model: str, onnx_path: str = _RR_ONNX_PATH):
+        if _ort is None or _AutoTokenizer is None:
+            raise RuntimeError("onnxruntime/transformers non installati")
+        if not onnx_path or not os.path.exists(onnx_path):
+            raise RuntimeError(f"RERANKER_ONNX_PATH non valido: {onnx_path!r}")
+        opts = _ort.SessionOptions()
+        if _RR_ONNX_THR > 0:
+            opts.intra_op_num_threads = _RR_ONNX_THR
+        self._sess = _ort.InferenceSession(
+            onnx_path, sess_options=opts, providers=["CPUExecutionProvider"]
+        )
+        self._inputs = {i.name for i in self._sess.get_inputs()}
+        self._tok = _AutoTokenizer.from_pretrained(model)
+
+    def score(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        enc = self._tok(
+            [p[0] for p in pairs],
+            [p[1] for p in pairs],
+            padding=True,
+            truncation=True,
+            max_length=_RR_MAX_LEN,
+            return_tensors="np",
+        )
+        feed = {k: v.astype(_np.int64) for k, v in enc.items() if k in self._inputs}
+        logits = self._sess.run(None, feed)[0].reshape(-1)
+        return [float(x) for x in 1.0 / (1.0 + _np.exp(-logits))]
+
+
+def _make_backend(backend: str, model: str, device: str):
+    """Backend richiesto → fallback su flag → None (lessicale)."""
+    order = {"onnx": ["onnx", "flag"], "flag": ["flag"]}.get(backend, [])
+    for name in order:
+        try:
+            if name == "onnx":
+                return _OnnxBackend(model)
+            return _FlagBackend(model, device)
+        except Exception as e:
+            log.debug(f"Reranker backend {name} unavailable ({model}): {e}")
+            continue
+    return None
+
+
 class Reranker:
     """
     Wrapper robusto:
-      - se FlagEmbedding è installato → usa il modello BGE reranker
+      - backend "onnx" → ONNX Runtime (anche int8), fallback su FlagEmbedding
+      - backend "flag" → modello BGE reranker via FlagEmbedding
       - altrimenti → fallback lessicale (cosine BoW) su CPU
+    Gli score del modello vengono messi in cache per (query_hash, url).
     """
-    def __init__(self, model: str = "BAAI/bge-reranker-base", device: str = "cpu"):
+    def __init__(
+        self,
+        model: str = "BAAI/bge-reranker-base",
+        device: str = "cpu",
+        backend: Optional[str] = None,
+        batch_size: int = _RR_BATCH,
+        cache: Optional[ScoreCache] = None,
+    ):
         self.model = model
         self.device = device
-        self._rr = None
-        if _FlagReranker is not None:
-            try:
-                # base è più leggero e ok su CPU
-                self._rr = _FlagReranker(model, use_fp16=False, device=device)
-            except Exception:
-                self._rr = None  # se fallisce, useremo fallback
+        self.batch_size = max(1, int(batch_size))
+        self.cache = cache if cache is not None else ScoreCache()
+        self._rr = _make_backend((backend or _RR_BACKEND), model, device)
+        self.backend = self._rr.name if self._rr is not None else "lexical"
+        self.warmed_up = False
+        self.last_ms = 0
+        self.batches = 0
 
     def _prep_text(self, r: Dict) -> str:
         title = (r.get("title") or "").strip()
@@ -83,9 +246,44 @@ class Reranker:
             scores.append(float(max(0.0, min(1.0, _cos_bow(q_bow, t_bow)))))
         return scores
 
+    def _model_scores(self, query: str, texts: List[str]) -> List[float]:
+        """
+        Score del modello in batch di dimensione fissa, sull'executor di
+        inferenza: coppie di richieste concorrenti finiscono nello stesso batch.
+        """
+        self.batches += -(-len(texts) // self.batch_size)
+        return get_inference_executor().run_batch(
+            ("rerank", self.model, self.backend),
+            self._rr.score,
+            [(query, t) for t in texts],
+            max_batch=self.batch_size,
+        )
+
+    def warmup(self) -> bool:
+        """Un batch completo a vuoto: carica pesi/kernel prima della prima richiesta."""
+        if self._rr is None or self.warmed_up:
+            return self.warmed_up
+        try:
+            self._model_scores("warmup", ["warmup"] * self.batch_size)
+            self.warmed_up = True
+        except Exception as e:
+            log.debug(f"Reranker warmup failed: {e}")
+        return self.warmed_up
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "backend": self.backend,
+            "batch_size": self.batch_size,
+            "warmed_up": self.warmed_up,
+            "batches": self.batches,
+            "last_ms": self.last_ms,
+            "cache": self.cache.stats(),
+        }
+
     def rerank(self, query: str, results: List[Dict], top_k: int = 8) -> List[Dict]:
         if not results:
             return results
+        t0 = time.perf_counter()
 
         # limita candidati per stabilità/latency
         cand = results[:max(1, min(_RR_MAX_CANDS, len(results)))]
@@ -94,12 +292,18 @@ class Reranker:
 
         scores: List[float]
         if self._rr is not None:
+            qh = query_hash(query)
+            keys = [(qh, r.get("url") or t) for r, t in zip(cand, texts, strict=True)]
+            cached = [self.cache.get(key) for key in keys]
+            miss = [i for i, v in enumerate(cached) if v is None]
             try:
-                pairs: List[Tuple[str, str]] = [(query, t) for t in texts]
-                # normalize=True produce punteggi comparabili
-                scores = self._rr.compute_score(pairs, normalize=True)
+                fresh = self._model_scores(query, [texts[i] for i in miss]) if miss else []
+                for i, sc in zip(miss, fresh, strict=True):
+                    cached[i] = sc
+                    self.cache.put(keys[i], sc)
+                scores = [float(v) for v in cached]
             except Exception:
-                # se il modello fallisce a runtime, usa fallback
+                # modello in errore o executor saturo → fallback (non in cache)
                 scores = self._fallback_scores(query, texts)
         else:
             # nessun modello → fallback lessicale
@@ -111,4 +315,5 @@ class Reranker:
             item = dict(cand[i])
             item["rerank_score"] = float(scores[i])
             out.append(item)
+        self.last_ms = int((time.perf_counter() - t0) * 1000)
         return out
@@ -5,8 +5,14 @@ robust_content_extraction.py
 Multi-strategy content extraction per QuantumDev
 """
 
+import os
 import re
+import asyncio
 import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import Optional
 from urllib.parse import urlparse
 
@@ -312,3 +318,127 @@ def extract_content_robust(html: str, url: str) -> str:
             log.warning(f"BeautifulSoup fallback failed: {e}")
     
     return f"[Contenuto non disponibile: {url}]"
+
+
+# ===================== Process-pool extraction stage =====================
+# trafilatura/readability/BeautifulSoup sono CPU-bound (decine-centinaia di ms
+# su pagine grandi): girano in processi separati per non bloccare l'event loop.
+
+EXTRACTION_POOL_ENABLED = os.getenv("EXTRACTION_POOL_ENABLED", "1") == "1"
+EXTRACTION_POOL_WORKERS = int(
+    os.getenv("EXTRACTION_POOL_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1))))
+)
+# documenti in coda + in esecuzione; oltre si attende uno slot (entro il timeout)
+EXTRACTION_QUEUE_MAX = int(os.getenv("EXTRACTION_QUEUE_MAX", "32"))
+EXTRACTION_TIMEOUT_S = float(os.getenv("EXTRACTION_TIMEOUT_S", "3.0"))
+# sotto questa soglia il costo di IPC supera il parsing: estrazione inline
+EXTRACTION_INLINE_MAX_LEN = int(os.getenv("EXTRACTION_INLINE_MAX_LEN", "20000"))
+# ricicla i worker (lxml/bs4 frammentano la memoria su pagine enormi)
+EXTRACTION_MAX_TASKS_PER_CHILD = 200
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+_QUEUE_SLOTS: dict = {}
+EXTRACTION_STATS = {"inline": 0, "pool": 0, "timeouts": 0, "pool_errors": 0}
+
+
+def _mp_context():
+    # niente fork: il processo API ha thread attivi (executor, redis, aiohttp)
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _POOL
+    if not EXTRACTION_POOL_ENABLED:
+        return None
+    with _POOL_LOCK:
+        if _POOL is None:
+            try:
+                _POOL = ProcessPoolExecutor(
+                    max_workers=EXTRACTION_POOL_WORKERS,
+                    mp_context=_mp_context(),
+                    max_tasks_per_child=EXTRACTION_MAX_TASKS_PER_CHILD,
+                )
+                log.info(f"Extraction pool started ({EXTRACTION_POOL_WORKERS} workers)")
+            except Exception as e:
+                log.warning(f"Extraction pool unavailable, using threads: {e}")
+                return None
+        return _POOL
+
+
+def _reset_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_extraction_pool() -> None:
+    """Ferma i worker di estrazione (shutdown dell'app)."""
+    _reset_pool()
+
+
+def _queue_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _QUEUE_SLOTS.get(loop)
+    if sem is None:
+        for old in [lp for lp in _QUEUE_SLOTS if lp.is_closed()]:
+            del _QUEUE_SLOTS[old]
+        sem = _QUEUE_SLOTS[loop] = asyncio.Semaphore(EXTRACTION_QUEUE_MAX)
+    return sem
+
+
+def _placeholder(text: str, url: str) -> bool:
+    """Marker di fallimento di extract_content_robust (non è contenuto)."""
+    return text in (f"[Contenuto troppo breve: {url}]", f"[Contenuto non disponibile: {url}]")
+
+
+async def extract_content_async(
+    html: str,
+    url: str,
+    timeout: Optional[float] = None,
+) -> str:
+    """
+    `extract_content_robust` fuori dall'event loop.
+
+    - pagine piccole: in un thread (fast path, niente IPC; la catena di
+      fallback readability/regex/BeautifulSoup non gira comunque sul loop)
+    - altrimenti: ProcessPoolExecutor, con coda limitata a
+      EXTRACTION_QUEUE_MAX e timeout per documento (attesa dello slot inclusa)
+    - pool non disponibile o rotto: thread, per non bloccare comunque il loop
+
+    Ritorna "" se non c'è contenuto utile (timeout o placeholder di
+    extract_content_robust): il fallimento non dipende dalla lunghezza dell'URL.
+    """
+    if not html or len(html) <= EXTRACTION_INLINE_MAX_LEN:
+        EXTRACTION_STATS["inline"] += 1
+        text = await asyncio.to_thread(extract_content_robust, html, url)
+        return "" if _placeholder(text, url) else text
+
+    timeout = EXTRACTION_TIMEOUT_S if timeout is None else timeout
+    loop = asyncio.get_running_loop()
+
+    async def _run() -> str:
+        async with _queue_slots():
+            pool = _get_pool()
+            if pool is None:
+                return await asyncio.to_thread(extract_content_robust, html, url)
+            try:
+                EXTRACTION_STATS["pool"] += 1
+                return await loop.run_in_executor(pool, extract_content_robust, html, url)
+            except BrokenProcessPool as e:
+                EXTRACTION_STATS["pool_errors"] += 1
+                log.warning(f"Extraction pool broken ({e}), restarting")
+                _reset_pool()
+                return await asyncio.to_thread(extract_content_robust, html, url)
+
+    try:
+        text = await asyncio.wait_for(_run(), timeout=timeout)
+    except asyncio.TimeoutError:
+        # il worker finisce comunque il documento; il risultato viene scartato
+        EXTRACTION_STATS["timeouts"] += 1
+        log.warning(f"⏱️ Extraction timeout ({timeout:.1f}s): {url}")
+        return ""
+    return "" if _placeholder(text, url) else text
@@ -1,8 +1,19 @@
 # core/semantic_cache.py — Simple semantic cache with similarity + stats + namespaces
 from __future__ import annotations
-import os, time, math, hashlib, threading
+import os, time, math, hashlib, threading, json, logging, asyncio
 from typing import Dict, Any, Optional, List, Tuple
 
+import numpy as np
+
+from core.ann_index import IVFIndex
+from core.semcache_store import SemCacheStore
+
+log = logging.getLogger(__name__)
+
+from core.inference_executor import InferenceOverloadedError
+from core.embedding_service import get_embedding_service, get_sentence_model
+from core.embedding_context import cached_embedding, cached_embedding_async
+
 # === Opzionale: SentenceTransformers; fallback su BoW se assente ===
 _EMBED_USE_ST = True
 try:
@@ -25,6 +36,20 @@ _SEM_LAZY_EMBED      = os.getenv("SEMCACHE_LAZY_EMBED", "1").strip().lower() in
 _SEM_DEDUP_SIM       = float(os.getenv("SEMCACHE_DEDUP_SIM", "0.985"))
 # Aggiornare LRU all’hit (move-to-end tramite ts refresh)
 _SEM_UPDATE_ON_HIT   = os.getenv("SEMCACHE_UPDATE_ON_HIT", "1").strip().lower() in ("1","true","yes","on")
+# dtype della matrice dei vettori: float16 dimezza la RAM ma su CPU il matmul è molto più lento
+_SEM_VEC_DTYPE       = np.float16 if os.getenv("SEMCACHE_VEC_DTYPE", "float32").strip().lower() in ("float16", "fp16") else np.float32
+# Tier ANN (IVF) per namespace grandi: "off" | "ivf"
+_SEM_ANN             = os.getenv("SEMCACHE_ANN", "off").strip().lower()
+_SEM_ANN_MIN_ITEMS   = int(os.getenv("SEMCACHE_ANN_MIN_ITEMS", "20000"))   # sotto: scan esatto
+_SEM_ANN_NLIST       = int(os.getenv("SEMCACHE_ANN_NLIST", "0"))           # 0 = auto
+_SEM_ANN_NPROBE      = int(os.getenv("SEMCACHE_ANN_NPROBE", "8"))
+_SEM_ANN_COMPACT_S   = int(os.getenv("SEMCACHE_ANN_COMPACT_S", "60"))      # sweep delle entry scadute
+# Persistenza condivisa tra worker (snapshot mmap + journal append-only); "" = solo memoria
+_SEM_PERSIST_DIR     = os.getenv("SEMCACHE_PERSIST_DIR", "")
+_SEM_SYNC_S          = float(os.getenv("SEMCACHE_SYNC_S", "1.0"))            # tail del journal degli altri worker
+_SEM_COMPACT_S       = int(os.getenv("SEMCACHE_COMPACT_S", "600"))
+_SEM_COMPACT_MB      = float(os.getenv("SEMCACHE_COMPACT_MB", "64"))
+_SEM_HEADROOM        = float(os.getenv("SEMCACHE_SNAPSHOT_HEADROOM", "0.25"))
 
 def _now() -> int:
     return int(time.time())
@@ -55,7 +80,7 @@ class _Embedder:
                 self._ready = False
             else:
                 try:
-                    self._model = SentenceTransformer(model_name)
+                    self._model = get_sentence_model(model_name)
                     v = self._model.encode(["ok"], normalize_embeddings=True)
                     self.dim = len(v[0])
                     self.kind = "st"
@@ -71,7 +96,7 @@ class _Embedder:
             if self._ready:
                 return
             try:
-                self._model = SentenceTransformer(self.model_name)
+                self._model = get_sentence_model(self.model_name)
                 v = self._model.encode(["ok"], normalize_embeddings=True)
                 self.dim = len(v[0])
                 self._ready = True
@@ -119,28 +144,283 @@ class _Embedder:
         if self.kind == "st":
             self._ensure_ready()
             if self._model is not None:
-                return self._model.encode([text], normalize_embeddings=True)[0]
+                # servizio condiviso: LRU globale + encode concorrenti → un solo batch
+                return get_embedding_service(self.model_name).encode_one(text)
             # se init ST è fallita → BoW fallback
         return self._bow(text)
 
+    async def encode_async(self, text: str):
+        if self.kind == "st":
+            if not self._ready:
+                await asyncio.to_thread(self._ensure_ready)  # primo caricamento del modello
+            if self._model is not None:
+                return await get_embedding_service(self.model_name).encode_one_async(text)
+        return self._bow(text)
+
     def cosine(self, va, vb) -> float:
-        if self.kind == "st" and isinstance(va, (list, tuple)) and isinstance(vb, (list, tuple)):
-            s = 0.0
+        # vettori densi (ndarray/list) → dot; dict → BoW
+        if not isinstance(va, dict) and not isinstance(vb, dict):
             n = min(len(va), len(vb))
-            for i in range(n):
-                s += float(va[i]) * float(vb[i])
+            s = float(np.dot(np.asarray(va[:n], dtype=np.float32), np.asarray(vb[:n], dtype=np.float32)))
             return float(max(0.0, min(1.0, s)))
-        return self._cos_bow(va, vb)
+        if isinstance(va, dict) and isinstance(vb, dict):
+            return self._cos_bow(va, vb)
+        return 0.0
 
 # ------------------------- Entry -------------------------
 class _Entry:
-    __slots__ = ("q", "vec", "ts", "response", "meta")
-    def __init__(self, q: str, vec, response: Dict[str, Any], meta: Optional[Dict[str, Any]]):
-        self.q = q
-        self.vec = vec
-        self.ts = _now()
-        self.response = response
-        self.meta = meta or {}
+    """Entry della cache; da snapshot resta JSON (memoryview sul file) fino al primo accesso."""
+    __slots__ = ("_q", "_response", "_meta", "_raw")
+    def __init__(self, q: str, response: Dict[str, Any], meta: Optional[Dict[str, Any]]):
+        self._q = q
+        self._response = response
+        self._meta = meta or {}
+        self._raw = None
+
+    @classmethod
+    def lazy(cls, raw) -> "_Entry":
+        e = cls.__new__(cls)
+        e._q = e._response = e._meta = None
+        e._raw = raw
+        return e
+
+    def _load(self) -> None:
+        d = json.loads(bytes(self._raw))
+        self._q, self._response, self._meta = d.get("q", ""), d.get("response"), d.get("meta") or {}
+        self._raw = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"q": self.q, "response": self.response, "meta": self.meta}
+
+    @property
+    def q(self) -> str:
+        if self._raw is not None:
+            self._load()
+        return self._q
+
+    @q.setter
+    def q(self, v: str) -> None:
+        if self._raw is not None:
+            self._load()
+        self._q = v
+
+    @property
+    def response(self) -> Dict[str, Any]:
+        if self._raw is not None:
+            self._load()
+        return self._response
+
+    @response.setter
+    def response(self, v: Dict[str, Any]) -> None:
+        if self._raw is not None:
+            self._load()
+        self._response = v
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        if self._raw is not None:
+            self._load()
+        return self._meta
+
+    @meta.setter
+    def meta(self, v: Dict[str, Any]) -> None:
+        if self._raw is not None:
+            self._load()
+        self._meta = v
+
+# ------------------------- Indice per namespace -------------------------
+def _is_dense(vec) -> bool:
+    return isinstance(vec, np.ndarray) or (isinstance(vec, (list, tuple)) and bool(vec))
+
+
+class _NsIndex:
+    """
+    Indice di un namespace: matrice contigua (n, dim) dei vettori con array
+    paralleli di metadati (entries, ts). Best-match e dedup sono un solo
+    prodotto matrice-vettore; la rimozione è uno swap-remove O(1) (l'ultima
+    riga prende il posto di quella rimossa), quindi l'ordine LRU vive in `ts`.
+    Vettori BoW (fallback senza ST) restano in lista e si confrontano uno a uno.
+
+    Con `ann_factory`, oltre `ann_min_items` righe si costruisce un indice ANN
+    (core/ann_index) e best() confronta solo i candidati delle liste più vicine.
+    In quel regime le entry scadute diventano tombstone (escluse in lettura) e
+    vengono rimosse in blocco da una compaction periodica invece che a ogni get.
+    """
+    _MIN_CAP = 64
+
+    def __init__(self, dtype=_SEM_VEC_DTYPE, ann_factory=None,
+                 ann_min_items: int = _SEM_ANN_MIN_ITEMS, compact_s: int = _SEM_ANN_COMPACT_S):
+        self.dtype = dtype
+        self.n = 0
+        self.entries: List[_Entry] = []
+        self._ts = np.zeros(self._MIN_CAP, dtype=np.int64)
+        self._mat: Optional[np.ndarray] = None
+        self._vecs: List[Any] = []
+        self._ann_factory = ann_factory
+        self._ann_min_items = ann_min_items
+        self._compact_s = compact_s
+        self._last_compact = 0
+        self.ann = None
+
+    def __len__(self) -> int:
+        return self.n
+
+    def _grow(self) -> None:
+        cap = len(self._ts)
+        if self.n < cap:
+            return
+        ts = np.zeros(cap * 2, dtype=np.int64)
+        ts[:self.n] = self._ts[:self.n]
+        self._ts = ts
+        if self._mat is not None:
+            mat = np.zeros((cap * 2, self._mat.shape[1]), dtype=self.dtype)
+            mat[:self.n] = self._mat[:self.n]
+            self._mat = mat
+
+    def _fits(self, vec) -> bool:
+        if self._mat is not None:
+            return _is_dense(vec) and len(vec) == self._mat.shape[1]
+        return self.n == 0 or not _is_dense(vec)
+
+    def add(self, vec, entry: _Entry, ts: int) -> int:
+        if not self._fits(vec):
+            return -1
+        self._grow()
+        i = self.n
+        if self._mat is None and self.n == 0 and _is_dense(vec):
+            self._mat = np.zeros((len(self._ts), len(vec)), dtype=self.dtype)
+        if self._mat is not None:
+            self._mat[i] = vec
+        else:
+            self._vecs.append(vec)
+        self._ts[i] = ts
+        self.entries.append(entry)
+        self.n += 1
+        if self.ann is not None:
+            self.ann.add(i, vec)
+        elif self._ann_factory is not None and self._mat is not None and self.n >= self._ann_min_items:
+            self._build_ann()
+        return i
+
+    def update(self, i: int, vec, ts: int) -> None:
+        if self._mat is not None:
+            self._mat[i] = vec
+        else:
+            self._vecs[i] = vec
+        self._ts[i] = ts
+        if self.ann is not None:
+            self.ann.add(i, vec)
+
+    def attach(self, mat: np.ndarray, ts: np.ndarray, entries: List[_Entry]) -> None:
+        """
+        Adotta un segmento di snapshot: `mat` (cap, dim) è una mmap copy-on-write,
+        condivisa finché le righe non vengono scritte; oltre `cap` _grow ricopia.
+        """
+        self.n = len(entries)
+        self.entries = list(entries)
+        self._mat = mat
+        self._ts = np.zeros(len(mat), dtype=np.int64)
+        self._ts[:self.n] = ts
+        if self._ann_factory is not None and self.n >= self._ann_min_items:
+            self._build_ann()
+
+    def dump(self, now_ts: int, ttl_s: int) -> Optional[Tuple[np.ndarray, np.ndarray, List[Dict[str, Any]]]]:
+        """Righe vive (vettori, ts, entry) per lo snapshot; None per namespace BoW."""
+        if self._mat is None:
+            return None
+        keep = np.nonzero((now_ts - self._ts[:self.n]) <= ttl_s)[0]
+        return (np.asarray(self._mat[keep]), self._ts[keep].copy(),
+                [self.entries[int(i)].as_dict() for i in keep])
+
+    def _build_ann(self) -> None:
+        ann = self._ann_factory()
+        ann.train(self._mat[:self.n])
+        self.ann = ann
+
+    def touch(self, i: int, ts: int) -> None:
+        self._ts[i] = ts
+
+    def remove(self, i: int) -> None:
+        last = self.n - 1
+        if i != last:
+            self.entries[i] = self.entries[last]
+            self._ts[i] = self._ts[last]
+            if self._mat is not None:
+                self._mat[i] = self._mat[last]
+            else:
+                self._vecs[i] = self._vecs[last]
+            if self.ann is not None:
+                self.ann.move(last, i)
+        self.entries.pop()
+        if self._mat is None:
+            self._vecs.pop()
+        self.n -= 1
+        if self.n == 0:
+            self._mat = None  # il prossimo vettore può cambiare dimensione/modalità
+        if self.ann is not None and self.n < self._ann_min_items // 2:
+            self.ann = None  # tornato piccolo: scan esatto
+
+    def prune(self, now_ts: int, ttl_s: int, force: bool = False) -> int:
+        """
+        Rimuove le entry scadute; indici decrescenti così lo swap-remove non tocca scaduti.
+        Con indice ANN attivo è una compaction periodica (ogni `compact_s`):
+        nel frattempo le scadute restano tombstone, escluse da best().
+        """
+        if self.n == 0:
+            return 0
+        if self.ann is not None and not force and (now_ts - self._last_compact) < self._compact_s:
+            return 0
+        self._last_compact = now_ts
+        expired = np.nonzero((now_ts - self._ts[:self.n]) > ttl_s)[0]
+        for i in expired[::-1]:
+            self.remove(int(i))
+        # centroidi addestrati su un namespace molto più piccolo → riaddestra
+        if self.ann is not None and self.n >= 4 * self.ann.trained_n:
+            self._build_ann()
+        return len(expired)
+
+    def oldest(self) -> Tuple[int, int]:
+        i = int(np.argmin(self._ts[:self.n]))
+        return i, int(self._ts[i])
+
+    def latest_ts(self) -> int:
+        return int(self._ts[:self.n].max()) if self.n else 0
+
+    def best(self, vec, emb: "_Embedder", now_ts: Optional[int] = None,
+             ttl_s: Optional[int] = None) -> Tuple[int, float]:
+        """
+        (indice, similarità) del vettore vivo più vicino; (-1, 0.0) se nessuno.
+        Con l'indice ANN gli score dei candidati sono comunque esatti.
+        """
+        if self.n == 0 or not self._fits(vec):
+            return -1, 0.0
+        alive = None
+        if now_ts is not None and ttl_s is not None:
+            alive = (now_ts - self._ts[:self.n]) <= ttl_s
+        if self._mat is not None:
+            q = np.asarray(vec, dtype=np.float32)
+            if self.ann is not None:
+                mask = self.ann.candidate_mask(self.n, q)
+                if alive is not None:
+                    mask &= alive
+                rows = np.nonzero(mask)[0]
+                if rows.size == 0:
+                    return -1, 0.0
+                sims = self._mat[rows].astype(np.float32, copy=False) @ q
+                j = int(np.argmax(sims))
+                return int(rows[j]), float(max(0.0, min(1.0, sims[j])))
+            mat = self._mat[:self.n]
+            if mat.dtype != np.float32:
+                mat = mat.astype(np.float32)
+            sims = mat @ q
+        else:
+            sims = np.fromiter((emb.cosine(vec, v) for v in self._vecs), dtype=np.float32, count=self.n)
+        if alive is not None:
+            sims = np.where(alive, sims, -1.0)
+        i = int(np.argmax(sims))
+        if sims[i] < 0.0 and alive is not None and not alive[i]:
+            return -1, 0.0
+        return i, float(max(0.0, min(1.0, sims[i])))
 
 # ------------------------- Cache -------------------------
 class SemanticCache:
@@ -150,6 +430,7 @@ class SemanticCache:
     - dedup semantico in set() (configurabile), LRU refresh on-hit (configurabile)
     - stats(), stats_ns(ns), stats_all(), count()
     - flush(ns)/clear(ns)
+    - ogni namespace è un _NsIndex (matrice float32 + metadati paralleli)
     """
     def __init__(self,
                  namespace_default: str = _SEM_NS_DEFAULT,
@@ -157,7 +438,9 @@ class SemanticCache:
                  ttl_s: int = _SEM_TTL_S,
                  max_items: int = _SEM_MAX_ITEMS,
                  model_name: str = _SEM_MODEL,
-                 max_items_per_ns: int = _SEM_MAX_ITEMS_NS):
+                 max_items_per_ns: int = _SEM_MAX_ITEMS_NS,
+                 persist_dir: str = _SEM_PERSIST_DIR,
+                 sync_s: float = _SEM_SYNC_S):
         self.ns_default = namespace_default
         self.threshold = float(threshold)
         self.ttl_s = int(ttl_s)
@@ -168,25 +451,147 @@ class SemanticCache:
         self.dim = self._emb.dim
         self._lock = threading.Lock()
 
-        self._store: Dict[str, List[_Entry]] = {}
+        self._store: Dict[str, _NsIndex] = {}
         self._hits = 0
         self._miss = 0
         self._evictions = 0
 
+        # Persistenza condivisa (opzionale)
+        self._persist: Optional[SemCacheStore] = None
+        self._sync_s = float(sync_s)
+        self._restored = 0
+        self._restore_ms = 0.0
+        self._stop = threading.Event()
+        self._sync_thread: Optional[threading.Thread] = None
+        if persist_dir:
+            try:
+                self._persist = SemCacheStore(persist_dir, headroom=_SEM_HEADROOM)
+                self._restore()
+            except Exception as e:
+                log.warning(f"SemanticCache persistence disabled ({persist_dir}): {e}")
+                self._persist = None
+        # Tail del journal e compaction girano in un thread daemon: get/set restano
+        # solo in memoria (nessun I/O su file né flock sul percorso della richiesta).
+        # sync_s <= 0 → nessun thread, sync() va chiamato esplicitamente.
+        if self._persist is not None and self._sync_s > 0:
+            self._sync_thread = threading.Thread(target=self._sync_loop, name="semcache-sync", daemon=True)
+            self._sync_thread.start()
+
     # ---------- Namespace helpers ----------
     def _ensure_ns(self, ns: Optional[str]) -> str:
         if not ns: ns = self.ns_default
         if ns not in self._store:
-            self._store[ns] = []
+            self._store[ns] = self._new_index()
         return ns
 
+    def _new_index(self) -> _NsIndex:
+        factory = None
+        if _SEM_ANN == "ivf":
+            factory = lambda: IVFIndex(nlist=_SEM_ANN_NLIST, nprobe=_SEM_ANN_NPROBE)  # noqa: E731
+        return _NsIndex(ann_factory=factory)
+
+    # ---------- Persistenza ----------
+    def _restore(self) -> None:
+        """Snapshot in mmap + replay del journal: ripartenza a caldo."""
+        t0 = time.perf_counter()
+        segments, records = self._persist.load()
+        store: Dict[str, _NsIndex] = {}
+        for ns, seg in segments.items():
+            idx = self._new_index()
+            idx.attach(seg.vectors, seg.ts, [_Entry.lazy(r) for r in seg.raw])
+            store[ns] = idx
+        with self._lock:
+            self._store = store
+            self._apply_records(records)
+            self._restored = self.count()
+        self._restore_ms = round((time.perf_counter() - t0) * 1000, 2)
+        if self._restored:
+            log.info(f"SemanticCache restored {self._restored} items in {self._restore_ms}ms "
+                     f"(gen={self._persist.generation})")
+
+    def _apply_records(self, records: List[Dict[str, Any]]) -> None:
+        """Applica record del journal (set/flush di questo o altri worker). Con lock acquisito."""
+        touched = set()
+        for rec in records:
+            ns = rec.get("ns")
+            if rec.get("op") == "flush":
+                if ns:
+                    self._store[ns] = self._new_index()
+                else:
+                    self._store = {}
+                continue
+            ns = self._ensure_ns(ns)
+            self._store[ns].add(rec["vec"], _Entry(rec.get("q", ""), rec.get("response"), rec.get("meta")),
+                                int(rec.get("ts") or _now()))
+            touched.add(ns)
+        for ns in touched:
+            self._enforce_caps(self._store[ns])
+
+    def _sync_loop(self) -> None:
+        while not self._stop.wait(self._sync_s):
+            self.sync()
+
+    def sync(self) -> None:
+        """Tail del journal (scritture degli altri worker) + compaction periodica."""
+        if self._persist is None:
+            return
+        try:
+            reload, records = self._persist.poll()
+            if reload:
+                self._restore()
+            elif records:
+                with self._lock:
+                    self._apply_records(records)
+            if (self._persist.journal_bytes() > _SEM_COMPACT_MB * 1024 * 1024
+                    or (time.time() - self._persist.last_compact > _SEM_COMPACT_S
+                        and self._persist.journal_bytes() > 0)):
+                self.compact()
+        except Exception as e:
+            log.warning(f"SemanticCache sync failed: {e}")
+
+    def compact(self) -> bool:
+        """Scrive un nuovo snapshot dallo stato vivo e tronca il journal (un worker alla volta)."""
+        if self._persist is None:
+            return False
+        with self._persist.compaction() as pending:
+            if pending is None:
+                return False
+            # sotto lock solo la copia delle righe vive; la scrittura su disco avviene fuori
+            with self._lock:
+                self._apply_records(pending)
+                now_ts = _now()
+                dumped = {}
+                dim, dtype = 0, _SEM_VEC_DTYPE
+                for ns, idx in self._store.items():
+                    d = idx.dump(now_ts, self.ttl_s)
+                    if d is not None and len(d[0]):
+                        dumped[ns] = d
+                        dim, dtype = d[0].shape[1], idx.dtype
+            self._persist.write_snapshot(dumped, dim, dtype)
+        return True
+
+    def close(self) -> None:
+        """Ferma il thread di sync (allo shutdown, prima dello snapshot finale)."""
+        self._stop.set()
+        if self._sync_thread is not None:
+            self._sync_thread.join(timeout=max(1.0, self._sync_s * 2))
+            self._sync_thread = None
+
     def _prune_ns_ttl(self, ns: str, now_ts: int) -> None:
         """Rimuove nel namespace gli elementi scaduti (TTL)"""
-        lst = self._store.get(ns, [])
-        if not lst: return
-        alive = [e for e in lst if now_ts - e.ts <= self.ttl_s]
-        if len(alive) != len(lst):
-            self._store[ns] = alive
+        idx = self._store.get(ns)
+        if idx is not None:
+            idx.prune(now_ts, self.ttl_s)
+
+    def _encode(self, text: str):
+        # Vettore condiviso con Chroma/memorie nella stessa richiesta (core/embedding_context);
+        # il BoW di fallback ha una chiave propria per non mescolarsi con i vettori densi.
+        model = self._emb.model_name if self._emb.kind == "st" else "bow"
+        return cached_embedding(text, model, self._emb.encode)
+
+    async def _encode_async(self, text: str):
+        model = self._emb.model_name if self._emb.kind == "st" else "bow"
+        return await cached_embedding_async(text, model, self._emb.encode_async)
 
     # ---------- Public API ----------
     @staticmethod
@@ -195,87 +600,93 @@ class SemanticCache:
         return _sha256(base)
 
     def set(self, prompt: str, response_obj: Dict[str, Any], ctx_fp: Optional[str], meta: Optional[Dict[str, Any]] = None) -> None:
-        ns = self._ensure_ns(ctx_fp)
-        vec = self._emb.encode(prompt)
+        try:
+            vec = self._encode(prompt)
+        except InferenceOverloadedError:
+            return  # executor saturo: meglio non cachare che bloccare
         now_ts = _now()
         with self._lock:
+            # namespace risolto sotto lock: il thread di sync può sostituire lo store
+            ns = self._ensure_ns(ctx_fp)
+            idx = self._store[ns]
             # 1) TTL prune locale al namespace
-            self._prune_ns_ttl(ns, now_ts)
+            idx.prune(now_ts, self.ttl_s)
 
             # 2) Dedup semantico: se una entry molto simile esiste, aggiorna/rinfresca
-            if _SEM_DEDUP_SIM > 0.0:
-                best_i, best_sim = -1, 0.0
-                for i, e in enumerate(self._store[ns]):
-                    try:
-                        sim = self._emb.cosine(vec, e.vec)
-                    except Exception:
-                        sim = 0.0
-                    if sim > best_sim:
-                        best_sim, best_i = sim, i
-                if best_i >= 0 and best_sim >= _SEM_DEDUP_SIM:
-                    e = self._store[ns][best_i]
-                    e.q = prompt
-                    e.vec = vec
-                    e.response = response_obj
-                    e.meta = (meta or {})
-                    e.ts = now_ts
-                    # sposta in coda (LRU)
-                    self._store[ns].append(self._store[ns].pop(best_i))
-                else:
-                    self._store[ns].append(_Entry(prompt, vec, response_obj, meta))
+            best_i, best_sim = idx.best(vec, self._emb, now_ts, self.ttl_s) if _SEM_DEDUP_SIM > 0.0 else (-1, 0.0)
+            if best_i >= 0 and best_sim >= _SEM_DEDUP_SIM:
+                e = idx.entries[best_i]
+                e.q = prompt
+                e.response = response_obj
+                e.meta = (meta or {})
+                idx.update(best_i, vec, now_ts)  # ts aggiornato = in coda LRU
             else:
-                self._store[ns].append(_Entry(prompt, vec, response_obj, meta))
-
-            # 3) Enforce per-namespace cap (LRU nel namespace)
-            if len(self._store[ns]) > self.max_items_per_ns:
-                overflow = len(self._store[ns]) - self.max_items_per_ns
-                if overflow > 0:
-                    del self._store[ns][:overflow]
-                    self._evictions += overflow
-
-            # 4) Enforce cap globale (LRU globale: entry più vecchia tra i namespace)
-            total = self.count()
-            if total > self.max_items:
-                oldest_ns, oldest_idx, oldest_ts = None, None, 1 << 60
-                for n, lst in self._store.items():
-                    if lst and lst[0].ts < oldest_ts:
-                        oldest_ns, oldest_idx, oldest_ts = n, 0, lst[0].ts
-                if oldest_ns is not None and oldest_idx is not None and self._store.get(oldest_ns):
-                    self._store[oldest_ns].pop(oldest_idx)
-                    self._evictions += 1
+                idx.add(vec, _Entry(prompt, response_obj, meta), now_ts)
+
+            # 3-4) cap per-namespace e globale
+            self._enforce_caps(idx)
+
+        # 5) journal condiviso: visibile agli altri worker e al prossimo riavvio
+        if self._persist is not None and _is_dense(vec):
+            try:
+                self._persist.append({"op": "set", "ns": ns, "q": prompt, "ts": now_ts,
+                                      "vec": vec, "response": response_obj, "meta": meta or {}})
+            except Exception as e:
+                log.warning(f"SemanticCache journal append failed: {e}")
+
+    def _enforce_caps(self, idx: _NsIndex) -> None:
+        # 3) Enforce per-namespace cap (LRU nel namespace)
+        while len(idx) > self.max_items_per_ns:
+            idx.remove(idx.oldest()[0])
+            self._evictions += 1
+
+        # 4) Enforce cap globale (LRU globale: entry più vecchia tra i namespace)
+        total = self.count()
+        while total > self.max_items:
+            oldest_ns, oldest_i, oldest_ts = None, -1, 1 << 60
+            for n, other in self._store.items():
+                if len(other):
+                    i, ts = other.oldest()
+                    if ts < oldest_ts:
+                        oldest_ns, oldest_i, oldest_ts = n, i, ts
+            if oldest_ns is None:
+                break
+            self._store[oldest_ns].remove(oldest_i)
+            self._evictions += 1
+            total -= 1
 
     def get(self, prompt: str, ctx_fp: Optional[str]) -> Optional[Dict[str, Any]]:
-        ns = self._ensure_ns(ctx_fp)
-        vec_q = self._emb.encode(prompt)
-        best_sim, best_idx, best_entry = 0.0, -1, None
+        try:
+            vec_q = self._encode(prompt)
+        except InferenceOverloadedError:
+            self._miss += 1  # executor saturo → trattato come miss
+            return None
+        return self._lookup(vec_q, ctx_fp)
+
+    async def get_async(self, prompt: str, ctx_fp: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Come get, per handler async: l'embedding passa da run_batch_async (niente thread bloccato)."""
+        try:
+            vec_q = await self._encode_async(prompt)
+        except InferenceOverloadedError:
+            self._miss += 1
+            return None
+        return self._lookup(vec_q, ctx_fp)
+
+    def _lookup(self, vec_q, ctx_fp: Optional[str]) -> Optional[Dict[str, Any]]:
         now = _now()
         with self._lock:
-            lst = self._store.get(ns, [])
-            # TTL cleanup in-read & best match
-            alive: List[_Entry] = []
-            for i, e in enumerate(lst):
-                if now - e.ts <= self.ttl_s:
-                    alive.append(e)
-                    try:
-                        sim = self._emb.cosine(vec_q, e.vec)
-                    except Exception:
-                        sim = 0.0
-                    if sim > best_sim:
-                        best_sim, best_idx, best_entry = sim, i, e
-            if len(alive) != len(lst):
-                self._store[ns] = alive
-                # attenzione: best_idx potrebbe invalidarsi, ma solo se entry scaduta
-
-            if best_entry and best_sim >= self.threshold:
+            ns = self._ensure_ns(ctx_fp)
+            idx = self._store[ns]
+            # TTL cleanup in-read & best match (un solo prodotto matrice-vettore)
+            idx.prune(now, self.ttl_s)
+            best_idx, best_sim = idx.best(vec_q, self._emb, now, self.ttl_s)
+
+            if best_idx >= 0 and best_sim >= self.threshold:
                 self._hits += 1
+                best_entry = idx.entries[best_idx]
                 # LRU refresh on-hit (opzionale)
-                if _SEM_UPDATE_ON_HIT and best_idx >= 0 and best_idx < len(self._store[ns]):
-                    best_entry.ts = now
-                    # move to end
-                    try:
-                        self._store[ns].append(self._store[ns].pop(best_idx))
-                    except Exception:
-                        pass
+                if _SEM_UPDATE_ON_HIT:
+                    idx.touch(best_idx, now)
                 return {
                     "response": best_entry.response,
                     "similarity": float(best_sim),
@@ -299,6 +710,14 @@ class SemanticCache:
             "max_items_per_ns": self.max_items_per_ns,
             "size_items": self.count(),
             "dim": self.dim,
+            "vec_dtype": np.dtype(_SEM_VEC_DTYPE).name,
+            "persist": ({**self._persist.stats(), "restored_items": self._restored,
+                         "restore_ms": self._restore_ms} if self._persist else {"enabled": False}),
+            "ann": {
+                "backend": _SEM_ANN,
+                "min_items": _SEM_ANN_MIN_ITEMS,
+                "namespaces": {ns: idx.ann.stats() for ns, idx in self._store.items() if idx.ann is not None},
+            },
             "embedder": {"kind": self._emb.kind, "model": self._emb.model_name},
             "hits": self._hits,
             "miss": self._miss,
@@ -308,8 +727,8 @@ class SemanticCache:
 
     def stats_ns(self, ns: str) -> Dict[str, Any]:
         ns = self._ensure_ns(ns)
-        size_ns = len(self._store.get(ns, []))
-        latest_ts = max((e.ts for e in self._store.get(ns, [])), default=0)
+        size_ns = len(self._store[ns])
+        latest_ts = self._store[ns].latest_ts()
         return {
             "enabled": True,
             "namespace": ns,
@@ -329,10 +748,10 @@ class SemanticCache:
 
     def stats_all(self) -> Dict[str, Any]:
         per_ns = {}
-        for ns, lst in self._store.items():
+        for ns, idx in self._store.items():
             per_ns[ns] = {
-                "size_items": len(lst),
-                "latest_ts": max((e.ts for e in lst), default=0)
+                "size_items": len(idx),
+                "latest_ts": idx.latest_ts()
             }
         return {
             "enabled": True,
@@ -357,12 +776,17 @@ class SemanticCache:
         with self._lock:
             if ns:
                 ns = self._ensure_ns(ns)
-                n = len(self._store.get(ns, []))
-                self._store[ns] = []
-                return n
-            n = self.count()
-            self._store = {}
-            return n
+                n = len(self._store[ns])
+                self._store[ns] = self._new_index()
+            else:
+                n = self.count()
+                self._store = {}
+        if self._persist is not None:
+            try:
+                self._persist.append({"op": "flush", "ns": ns})
+            except Exception as e:
+                log.warning(f"SemanticCache journal append failed: {e}")
+        return n
 
     # Alias compatibilità
     def clear(self, ns: Optional[str] = None) -> int:
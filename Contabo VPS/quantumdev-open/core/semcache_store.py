@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+core/semcache_store.py — Persistenza condivisa della semantic cache
+
+Layout nella directory SEMCACHE_PERSIST_DIR:
+
+    snapshot.json          header: generation, dim, dtype, segmenti per namespace
+    vectors-<gen>.npy      matrice vettori, un segmento contiguo per namespace
+                           (+ headroom per gli append senza ricopiare)
+    ts-<gen>.npy           timestamp per riga
+    offsets-<gen>.npy      (offset, len) della riga in entries-<gen>.jsonl
+    entries-<gen>.jsonl    {"q", "response", "meta"} per riga
+    journal.jsonl          append-only: set/flush successivi allo snapshot
+    .lock                  flock: SH per append/lettura, EX per la compaction
+
+- All'avvio ogni worker mappa `vectors-<gen>.npy` in copy-on-write
+  (mmap_mode="c"): le pagine restano condivise nel page cache tra i worker e
+  il file non viene mai modificato; le entry JSON si decodificano solo al
+  primo accesso (hit). Poi riapplica il journal.
+- Ogni set() appende una riga al journal; gli altri worker la leggono con
+  poll() (tail dall'ultimo offset) → cache condivisa tra worker.
+- La compaction (un worker alla volta, flock EX non bloccante) scrive una
+  nuova generation dallo stato vivo, tronca il journal e rimuove i file
+  vecchi; gli altri worker vedono cambiare snapshot.json e ricaricano.
+"""
+
+from __future__ import annotations
+
+import base64
+import contextlib
+import fcntl
+import json
+import logging
+import mmap
+import os
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+_HEADER = "snapshot.json"
+_JOURNAL = "journal.jsonl"
+_LOCK = ".lock"
+_MIN_SEGMENT = 64
+
+
+class Segment(NamedTuple):
+    vectors: np.ndarray      # (cap, dim) copy-on-write, righe [0, n) valide
+    ts: np.ndarray           # (n,)
+    raw: List[memoryview]    # JSON delle entry, decodifica lazy
+    n: int
+
+
+class SemCacheStore:
+    def __init__(self, path: str, headroom: float = 0.25) -> None:
+        self.path = path
+        self.headroom = max(0.0, headroom)
+        os.makedirs(path, exist_ok=True)
+        self.worker_id = f"{os.getpid()}-{os.urandom(3).hex()}"
+        self.generation = 0
+        self._sig: Optional[Tuple[int, int]] = None
+        self._journal_off = 0
+        self._lock_fd = os.open(self._p(_LOCK), os.O_RDWR | os.O_CREAT, 0o644)
+        self._journal_fd = os.open(self._p(_JOURNAL), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._entries_mm: Optional[mmap.mmap] = None
+        self.last_compact = time.time()
+        self.compactions = 0
+
+    def _p(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @contextlib.contextmanager
+    def _flock(self, exclusive: bool, blocking: bool = True) -> Iterator[bool]:
+        op = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        try:
+            fcntl.flock(self._lock_fd, op if blocking else op | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _header_sig(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self._p(_HEADER))
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    # ---------- Load ----------
+    def load(self) -> Tuple[Dict[str, Segment], List[Dict[str, Any]]]:
+        """Snapshot (mmap) + journal completo. Da chiamare all'avvio o dopo un reload."""
+        with self._flock(exclusive=False):
+            self._sig = self._header_sig()
+            segments: Dict[str, Segment] = {}
+            if self._sig is not None:
+                with open(self._p(_HEADER), "r", encoding="utf-8") as f:
+                    header = json.load(f)
+                self.generation = int(header["generation"])
+                if header.get("namespaces"):
+                    segments = self._map_segments(header)
+            self._journal_off = 0
+            records = self._tail(skip_own=False)
+        return segments, records
+
+    def _map_segments(self, header: Dict[str, Any]) -> Dict[str, Segment]:
+        gen = header["generation"]
+        vectors = np.load(self._p(f"vectors-{gen}.npy"), mmap_mode="c")
+        ts = np.load(self._p(f"ts-{gen}.npy"))
+        offsets = np.load(self._p(f"offsets-{gen}.npy"))
+        with open(self._p(f"entries-{gen}.jsonl"), "rb") as f:
+            self._entries_mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._entries_mm)
+        out: Dict[str, Segment] = {}
+        for ns, seg in header["namespaces"].items():
+            off, n, cap = seg["offset"], seg["n"], seg["cap"]
+            raw = [buf[int(o):int(o) + int(ln)] for o, ln in offsets[off:off + n]]
+            out[ns] = Segment(vectors[off:off + cap], ts[off:off + n], raw, n)
+        return out
+
+    # ---------- Journal ----------
+    def append(self, record: Dict[str, Any]) -> None:
+        rec = dict(record, w=self.worker_id)
+        vec = rec.pop("vec", None)
+        if vec is not None:
+            rec["v"] = base64.b64encode(np.asarray(vec, dtype=np.float32).tobytes()).decode("ascii")
+        line = (json.dumps(rec, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        with self._flock(exclusive=False):
+            os.write(self._journal_fd, line)
+
+    def _tail(self, skip_own: bool = True) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = []
+        with open(self._p(_JOURNAL), "rb") as f:
+            f.seek(self._journal_off)
+            data = f.read()
+        end = data.rfind(b"\n")
+        if end < 0:
+            return out
+        self._journal_off += end + 1
+        for line in data[:end].split(b"\n"):
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if skip_own and rec.get("w") == self.worker_id:
+                continue
+            if "v" in rec:
+                rec["vec"] = np.frombuffer(base64.b64decode(rec.pop("v")), dtype=np.float32)
+            out.append(rec)
+        return out
+
+    def poll(self) -> Tuple[bool, List[Dict[str, Any]]]:
+        """(reload, record): reload=True se un altro worker ha compattato."""
+        if self._header_sig() != self._sig:
+            return True, []
+        with self._flock(exclusive=False):
+            return False, self._tail()
+
+    def journal_bytes(self) -> int:
+        try:
+            return os.path.getsize(self._p(_JOURNAL))
+        except OSError:
+            return 0
+
+    # ---------- Compaction ----------
+    @contextlib.contextmanager
+    def compaction(self) -> Iterator[Optional[List[Dict[str, Any]]]]:
+        """
+        Lock EX non bloccante. Dentro il blocco il chiamante applica i record
+        ancora da leggere (yield) e poi chiama write_snapshot(). None = saltare
+        (lock occupato o snapshot cambiato: prima serve un reload).
+        """
+        with self._flock(exclusive=True, blocking=False) as ok:
+            if not ok or self._header_sig() != self._sig:
+                yield None
+                return
+            yield self._tail()
+
+    def write_snapshot(self, namespaces: Dict[str, Tuple[np.ndarray, np.ndarray, List[Dict[str, Any]]]],
+                       dim: int, dtype: Any) -> None:
+        """Chiamare solo dentro compaction(): scrive la generation successiva e tronca il journal."""
+        gen = self.generation + 1
+        layout: Dict[str, Dict[str, int]] = {}
+        total = 0
+        for ns, (vecs, _, _) in namespaces.items():
+            n = len(vecs)
+            cap = max(_MIN_SEGMENT, int(n * (1.0 + self.headroom)) + 1)
+            layout[ns] = {"offset": total, "n": n, "cap": cap}
+            total += cap
+
+        if total:
+            mat = np.lib.format.open_memmap(self._p(f"vectors-{gen}.npy"), mode="w+",
+                                            dtype=np.dtype(dtype), shape=(total, dim))
+            ts_all = np.zeros(total, dtype=np.int64)
+            offsets = np.zeros((total, 2), dtype=np.int64)
+            pos = 0
+            with open(self._p(f"entries-{gen}.jsonl"), "wb") as f:
+                for ns, (vecs, ts, entries) in namespaces.items():
+                    off = layout[ns]["offset"]
+                    mat[off:off + len(vecs)] = vecs
+                    ts_all[off:off + len(ts)] = ts
+                    for i, e in enumerate(entries):
+                        line = json.dumps(e, ensure_ascii=False, default=str).encode("utf-8")
+                        f.write(line + b"\n")
+                        offsets[off + i] = (pos, len(line))
+                        pos += len(line) + 1
+            mat.flush()
+            del mat
+            np.save(self._p(f"ts-{gen}.npy"), ts_all)
+            np.save(self._p(f"offsets-{gen}.npy"), offsets)
+
+        header = {
+            "generation": gen,
+            "dim": dim,
+            "dtype": np.dtype(dtype).name,
+            "namespaces": layout if total else {},
+            "created": int(time.time()),
+        }
+        tmp = self._p(_HEADER + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+        os.replace(tmp, self._p(_HEADER))
+        os.ftruncate(self._journal_fd, 0)
+
+        for name in os.listdir(self.path):
+            stem = name.rsplit(".", 1)[0]
+            if "-" in stem and stem.rsplit("-", 1)[1].isdigit() and int(stem.rsplit("-", 1)[1]) < gen:
+                with contextlib.suppress(OSError):
+                    os.unlink(self._p(name))  # i worker che li hanno in mmap continuano a leggerli
+
+        self.generation = gen
+        self._sig = self._header_sig()
+        self._journal_off = 0
+        self.last_compact = time.time()
+        self.compactions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "dir": self.path,
+            "generation": self.generation,
+            "journal_bytes": self.journal_bytes(),
+            "compactions": self.compactions,
+        }
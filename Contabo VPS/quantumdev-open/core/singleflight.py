@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+core/singleflight.py — Coalescing di richieste identiche in volo
+
+Quando più richieste con la stessa chiave arrivano mentre la prima è ancora
+in esecuzione (es. "meteo roma" da più utenti Telegram nello stesso secondo),
+solo la prima (leader) esegue il lavoro; le altre attendono lo stesso task
+e ne ricevono il risultato (o l'eccezione).
+
+- Il task condiviso è protetto con asyncio.shield: se un chiamante viene
+  cancellato (client disconnesso) gli altri continuano ad attenderlo.
+- Con più di un chiamante ognuno riceve una deepcopy del risultato, così
+  chi arricchisce il dict non sporca le risposte degli altri.
+- Nessuna cache: la chiave viene liberata appena il task termina.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import logging
+import os
+import re
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+# ===================== ENVIRONMENT CONFIG =====================
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "1") == "1"
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_query(q: str) -> str:
+    """Normalizzazione per la chiave: lowercase, spazi compattati, niente ?!. finali."""
+    s = _WS_RE.sub(" ", (q or "").strip().lower())
+    return s.rstrip(" ?!.")
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[Any]") -> None:
+        self.task = task
+        self.waiters = 1
+
+
+class SingleFlight:
+    """
+    Gruppo di chiamate coalescenti, per event loop.
+
+    Uso:
+        sf = SingleFlight("web_pipeline")
+        result = await sf.do(key, lambda: pipeline(q))
+    """
+
+    def __init__(self, name: str, copy_result: bool = True) -> None:
+        self.name = name
+        self.copy_result = copy_result
+        self._flights: Dict[Any, Dict[str, _Flight]] = {}
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    def _table(self) -> Dict[str, _Flight]:
+        loop = asyncio.get_running_loop()
+        table = self._flights.get(loop)
+        if table is None:
+            # loop chiusi (test, asyncio.run ripetuti) non vanno trattenuti
+            for old in [lp for lp in self._flights if lp.is_closed()]:
+                del self._flights[old]
+            table = self._flights[loop] = {}
+        return table
+
+    def in_flight(self, key: str) -> bool:
+        try:
+            return key in self._table()
+        except RuntimeError:
+            return False
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        on_join: Optional[Callable[[], None]] = None,
+    ) -> Any:
+        """
+        Esegue `fn()` una sola volta per `key` tra i chiamanti concorrenti.
+
+        `on_join` viene invocato quando il chiamante si aggancia a un volo
+        esistente (es. per chiudere una coroutine già creata e non usata).
+        """
+        if not SINGLEFLIGHT_ENABLED:
+            return await fn()
+
+        table = self._table()
+        flight = table.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(fn())
+            flight = table[key] = _Flight(task)
+            self.stats["leaders"] += 1
+
+            def _done(_t: "asyncio.Task[Any]", _key: str = key) -> None:
+                if table.get(_key) is flight:
+                    del table[_key]
+                if not _t.cancelled():
+                    _t.exception()  # già consegnata ai chiamanti: niente warning se cancellati
+
+            task.add_done_callback(_done)
+        else:
+            flight.waiters += 1
+            self.stats["coalesced"] += 1
+            log.info(f"SingleFlight[{self.name}]: coalesced (waiters={flight.waiters})")
+            if on_join is not None:
+                on_join()
+
+        result = await asyncio.shield(flight.task)
+        if self.copy_result and flight.waiters > 1:
+            return copy.deepcopy(result)
+        return result
+
+
+_GROUPS: Dict[str, SingleFlight] = {}
+
+
+def get_singleflight(name: str, copy_result: bool = True) -> SingleFlight:
+    """SingleFlight condiviso di processo per `name`."""
+    sf = _GROUPS.get(name)
+    if sf is None:
+        sf = _GROUPS[name] = SingleFlight(name, copy_result=copy_result)
+    return sf
+
+
+def singleflight_stats() -> Dict[str, Dict[str, int]]:
+    """Contatori leader/coalesced dei gruppi registrati (per /healthz)."""
+    return {name: dict(sf.stats) for name, sf in _GROUPS.items()}
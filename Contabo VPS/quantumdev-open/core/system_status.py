@@ -305,6 +305,37 @@ def get_gpu_metrics() -> Dict[str, Any]:
         }
 
 
+def get_web_health_metrics() -> Dict[str, Any]:
+    """
+    Get health of the web layer: circuit breakers (search providers and
+    fetched domains) and per-provider latency/error stats.
+
+    Returns:
+        Dictionary with keys:
+        - circuit_breakers: see core.circuit_breaker.breaker_status()
+        - search_providers: see core.web_search.provider_stats()
+        - serp_cache: see core.web_search.serp_cache_stats()
+        - error: present only if the web modules cannot be imported
+    """
+    try:
+        from core.circuit_breaker import breaker_status
+        from core.web_search import provider_stats, serp_cache_stats
+
+        return {
+            "circuit_breakers": breaker_status(),
+            "search_providers": provider_stats(),
+            "serp_cache": serp_cache_stats(),
+        }
+    except Exception as e:
+        log.warning(f"Error getting web health metrics: {e}")
+        return {
+            "circuit_breakers": {},
+            "search_providers": {},
+            "serp_cache": {},
+            "error": str(e),
+        }
+
+
 def get_system_status() -> Dict[str, Any]:
     """
     Get comprehensive system status including CPU, RAM, disk, GPU, and uptime.
@@ -352,6 +383,10 @@ def get_system_status() -> Dict[str, Any]:
         },
         "uptime": {
             "seconds": int
+        },
+        "web": {
+            "circuit_breakers": {...},   # provider/domain breaker states
+            "search_providers": {...}    # latency/error EWMA per provider
         }
     }
     
@@ -364,6 +399,7 @@ def get_system_status() -> Dict[str, Any]:
     disk = get_disk_metrics()
     uptime = get_uptime_metrics()
     gpu = get_gpu_metrics()
+    web = get_web_health_metrics()
     
     # Determine overall status
     # ok = True only if we can read basic CPU and RAM metrics AND psutil is available
@@ -382,4 +418,5 @@ def get_system_status() -> Dict[str, Any]:
         "disk": disk,
         "gpu": gpu,
         "uptime": uptime,
+        "web": web,
     }
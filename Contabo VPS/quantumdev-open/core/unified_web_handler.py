@@ -26,6 +26,8 @@ import re
 from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
 
+from core.singleflight import get_singleflight, normalize_query
+
 log = logging.getLogger(__name__)
 
 # ===================== RESPONSE FORMAT =====================
@@ -467,6 +469,7 @@ class UnifiedWebHandler:
     def __init__(self):
         self.intent_detector = UnifiedIntentDetector()
         self._cache: Dict[str, Tuple[str, float]] = {}
+        self._flights = get_singleflight("unified_web", copy_result=False)
         self._cache_ttl = {
             UnifiedIntentDetector.WEATHER: 1800,  # 30 min
             UnifiedIntentDetector.PRICE: 60,       # 1 min
@@ -541,12 +544,11 @@ class UnifiedWebHandler:
                 "latency_ms": int((time.perf_counter() - t_start) * 1000),
             }
         
-        # Route to appropriate handler
-        response = await self._route_to_handler(query, intent)
-        
-        # Cache result
-        if response:
-            self._set_cached(cache_key, response)
+        # Route to appropriate handler (richieste identiche in volo condividono l'esecuzione)
+        flight_key = f"{intent}|{normalize_query(query)}"
+        response = await self._flights.do(
+            flight_key, lambda: self._route_and_cache(query, intent, cache_key)
+        )
         
         return {
             "response": response,
@@ -557,6 +559,12 @@ class UnifiedWebHandler:
             "latency_ms": int((time.perf_counter() - t_start) * 1000),
         }
     
+    async def _route_and_cache(self, query: str, intent: str, cache_key: str) -> str:
+        response = await self._route_to_handler(query, intent)
+        if response:
+            self._set_cached(cache_key, response)
+        return response
+    
     async def _route_to_handler(self, query: str, intent: str) -> str:
         """
         Routing a handler specifico per intent.
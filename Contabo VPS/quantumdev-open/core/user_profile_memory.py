@@ -180,6 +180,8 @@ def save_user_profile_fact(
             documents=[fact_text],
             metadatas=[doc_metadata]
         )
+        from utils.chroma_handler import keyword_index_add
+        keyword_index_add(USER_PROFILE_COLLECTION, [doc_id], [fact_text], [doc_metadata])
         
         log.info(f"Saved user profile fact: {doc_id} (category={category})")
         return doc_id
@@ -196,7 +198,7 @@ def query_user_profile(
     category: Optional[str] = None
 ) -> List[Dict[str, Any]]:
     """
-    Query user profile facts.
+    Query user profile facts (hybrid BM25 + vector, RRF-fused when enabled).
     
     Args:
         user_id: User identifier
@@ -220,9 +222,25 @@ def query_user_profile(
         if category:
             where_filter["category"] = category
         
+        from utils.chroma_handler import HYBRID_ENABLED, hybrid_collection_query, query_args
+        if HYBRID_ENABLED:
+            hits = hybrid_collection_query(
+                USER_PROFILE_COLLECTION, query_text, top_k, where=where_filter, col=col
+            )
+            return [
+                {
+                    "id": h["id"],
+                    "text": h.get("document") or "",
+                    "metadata": h.get("metadata") or {},
+                    "distance": h["distance"],
+                    "score": h["relevance"],
+                }
+                for h in hits
+            ]
+
         # Query collection
         results = col.query(
-            query_texts=[query_text],
+            **query_args(query_text),
             n_results=top_k,
             where=where_filter,
             include=["documents", "metadatas", "distances"]
@@ -305,6 +323,8 @@ def delete_user_fact(fact_id: str) -> bool:
     
     try:
         col.delete(ids=[fact_id])
+        from utils.chroma_handler import keyword_index_delete
+        keyword_index_delete(USER_PROFILE_COLLECTION, [fact_id])
         log.info(f"Deleted user fact: {fact_id}")
         return True
     except Exception as e:
@@ -349,6 +369,8 @@ def cleanup_old_user_facts(user_id: str, days: int = USER_PROFILE_MAX_AGE_DAYS)
         
         if old_ids:
             col.delete(ids=old_ids)
+            from utils.chroma_handler import keyword_index_delete
+            keyword_index_delete(USER_PROFILE_COLLECTION, old_ids)
             log.info(f"Cleaned up {len(old_ids)} old user facts for {user_id}")
         
         return len(old_ids)
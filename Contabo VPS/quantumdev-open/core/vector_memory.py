@@ -42,10 +42,9 @@ def _get_embedding_function():
     global _embedding_function
     if _embedding_function is None:
         try:
-            from chromadb.utils import embedding_functions
-            _embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-                model_name=EMBEDDING_MODEL
-            )
+            # servizio condiviso: stesso modello e LRU del resto del processo
+            from utils.chroma_handler import _embedder
+            _embedding_function = _embedder(EMBEDDING_MODEL)
             log.info(f"Embedding function initialized: {EMBEDDING_MODEL}")
         except Exception as e:
             log.error(f"Failed to initialize embedding function: {e}")
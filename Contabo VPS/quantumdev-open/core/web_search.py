@@ -1,6 +1,12 @@
 # core/web_search.py — resilient multi-provider + heuristic fallback (patched+snippets)
 import os, re, html, time
-from typing import List, Dict, Tuple, Optional
+import asyncio
+import hashlib
+import json
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Tuple, Optional
 from urllib.parse import urlparse, parse_qs, unquote, quote_plus, urlunparse, urlencode
 import requests
 
@@ -11,6 +17,8 @@ except Exception:
     yaml = None  # if pyyaml is unavailable the policy will not be applied
 from functools import lru_cache
 
+from core.circuit_breaker import PROVIDER_BREAKERS
+
 # ===================== Config =====================
 
 UA = os.getenv(
@@ -139,11 +147,14 @@ _session.trust_env = False  # PATCH: Ignore proxy from environment
 _session.headers.update({"User-Agent": UA, **LANG_HDR})
 
 # OPTIMIZATION: Configura connection pooling e retry strategy
+# 429 (rate limit) non si ritenta: conta come fallimento per il circuit breaker
+# del provider, che smette di interrogarlo fino al cool-down.
 _retry_strategy = Retry(
-    total=2,  # Max 2 retry
-    backoff_factor=0.3,  # 0.3s, 0.6s backoff
-    status_forcelist=[429, 500, 502, 503, 504],  # Retry su questi status
+    total=1,  # Max 1 retry
+    backoff_factor=0.3,
+    status_forcelist=[500, 502, 503, 504],  # Retry su questi status
     allowed_methods=["HEAD", "GET", "POST"],
+    respect_retry_after_header=False,
 )
 _adapter = HTTPAdapter(
     pool_connections=10,  # Pool di connessioni
@@ -493,44 +504,168 @@ def _heuristic_results(query: str, num: int) -> List[Dict[str, str]]:
     _log(f"Heuristic fallback used: {len(out)} links")
     return out
 
-# ================= Tiny in-memory cache =================
-
-# OPTIMIZATION: Cache più grande e TTL più lungo
-_CACHE: Dict[Tuple[str, int], Tuple[float, List[Dict[str, str]]]] = {}
-_CACHE_TTL = 180.0  # OPTIMIZED: 3 minuti per query più stabili (era 120s)
-_CACHE_MAX_SIZE = 1000  # OPTIMIZATION: Aumentato da 500 a 1000 per migliore hit rate
-_CACHE_CLEANUP_FREQUENCY = 50  # Cleanup ogni N inserimenti
-
-def _cache_cleanup() -> None:
-    """Rimuove entries scadute e limita dimensione cache."""
-    now = time.time()
-    expired = [k for k, (ts, _) in _CACHE.items() if now - ts > _CACHE_TTL]
-    for k in expired:
-        _CACHE.pop(k, None)
-    
-    # Se ancora troppo grande, rimuovi i più vecchi
-    if len(_CACHE) > _CACHE_MAX_SIZE:
-        sorted_keys = sorted(_CACHE.keys(), key=lambda k: _CACHE[k][0])
-        for k in sorted_keys[:len(_CACHE) - _CACHE_MAX_SIZE]:
-            _CACHE.pop(k, None)
-
-def _cache_get(q: str, n: int) -> Optional[List[Dict[str, str]]]:
-    key = (q.strip().lower(), int(n))
-    hit = _CACHE.get(key)
-    if not hit:
-        return None
-    ts, data = hit
-    if time.time() - ts > _CACHE_TTL:
-        _CACHE.pop(key, None)
+# ================= SERP cache (L1 LRU in-process + L2 Redis) =================
+
+try:
+    from core.advanced_cache import get_ttl_for_category, detect_category
+except Exception:  # pragma: no cover
+    def get_ttl_for_category(category: str) -> int:  # type: ignore
+        return 180
+
+    def detect_category(query: str) -> str:  # type: ignore
+        return "generic"
+
+SERP_CACHE_MAX_SIZE = int(os.getenv("SERP_CACHE_MAX_SIZE", "1000"))
+# Redis condiviso tra worker uvicorn (sopravvive ai restart)
+SERP_CACHE_REDIS = os.getenv("SERP_CACHE_REDIS", "1") == "1"
+SERP_CACHE_PREFIX = "serp:v1:"
+# Stale-while-revalidate: un'entry scaduta da meno di TTL × factor (max SERP_STALE_MAX_S)
+# viene servita subito mentre un task in background la rinfresca
+SERP_STALE_FACTOR = float(os.getenv("SERP_STALE_FACTOR", "1.0"))
+SERP_STALE_MAX_S = float(os.getenv("SERP_STALE_MAX_S", "3600"))
+# Dopo un errore Redis, L2 resta disattivato per questi secondi
+_REDIS_RETRY_S = 30.0
+
+def _serp_category(q: str) -> str:
+    """Categoria TTL della query (weather/price/sports/news/generic)."""
+    return detect_category(q)
+
+
+class SerpCache:
+    """
+    Cache SERP a due livelli:
+      - L1: LRU in-process (OrderedDict, eviction O(1))
+      - L2: Redis, condiviso tra worker e persistente ai restart
+
+    Ogni entry porta `ts` e `ttl` (per categoria): `get` ritorna
+    (data, stale) finché l'età è entro ttl + finestra stale, altrimenti None.
+    Redis è opzionale: se non raggiungibile la cache resta solo L1.
+    """
+
+    def __init__(self, max_size: int = SERP_CACHE_MAX_SIZE, use_redis: bool = SERP_CACHE_REDIS):
+        self.max_size = max(1, max_size)
+        self.use_redis = use_redis
+        self._l1: "OrderedDict[str, Tuple[float, float, List[Dict[str, str]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_down_until = 0.0
+        self.hits = {"l1": 0, "l2": 0, "stale": 0, "miss": 0}
+
+    @staticmethod
+    def key(q: str, n: int) -> str:
+        raw = f"{q.strip().lower()}|{int(n)}"
+        return SERP_CACHE_PREFIX + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def stale_window(ttl: float) -> float:
+        return min(ttl * SERP_STALE_FACTOR, SERP_STALE_MAX_S)
+
+    def _get_redis(self):
+        if not self.use_redis or time.time() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            try:
+                import redis  # type: ignore
+                self._redis = redis.Redis(
+                    host=os.getenv("REDIS_HOST", "localhost"),
+                    port=int(os.getenv("REDIS_PORT", "6379")),
+                    db=int(os.getenv("REDIS_DB", "0")),
+                    socket_timeout=0.25,
+                    socket_connect_timeout=0.25,
+                )
+            except Exception as e:
+                _log(f"SERP cache: Redis non disponibile ({e})")
+                self.use_redis = False
+                return None
+        return self._redis
+
+    def _redis_failed(self, e: Exception) -> None:
+        _log(f"SERP cache Redis error: {e}")
+        self._redis_down_until = time.time() + _REDIS_RETRY_S
+
+    def _l1_put(self, key: str, ts: float, ttl: float, data: List[Dict[str, str]]) -> None:
+        with self._lock:
+            self._l1[key] = (ts, ttl, data)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.max_size:
+                self._l1.popitem(last=False)
+
+    def get(self, q: str, n: int) -> Optional[Tuple[List[Dict[str, str]], bool]]:
+        key = self.key(q, n)
+        now = time.time()
+        with self._lock:
+            hit = self._l1.get(key)
+            if hit is not None:
+                self._l1.move_to_end(key)
+        level = "l1"
+        if hit is None:
+            level = "l2"
+            r = self._get_redis()
+            if r is not None:
+                try:
+                    raw = r.get(key)
+                    if raw:
+                        doc = json.loads(raw)
+                        hit = (float(doc["ts"]), float(doc["ttl"]), doc["data"])
+                        self._l1_put(key, *hit)
+                except Exception as e:
+                    self._redis_failed(e)
+        if hit is None:
+            self.hits["miss"] += 1
+            return None
+        ts, ttl, data = hit
+        age = now - ts
+        if age <= ttl:
+            self.hits[level] += 1
+            return data, False
+        if age <= ttl + self.stale_window(ttl):
+            self.hits["stale"] += 1
+            return data, True
+        with self._lock:
+            self._l1.pop(key, None)
+        self.hits["miss"] += 1
         return None
-    return data
 
-def _cache_set(q: str, n: int, data: List[Dict[str, str]]):
-    key = (q.strip().lower(), int(n))
-    _CACHE[key] = (time.time(), data[:])
-    # Cleanup periodico
-    if len(_CACHE) % _CACHE_CLEANUP_FREQUENCY == 0:
-        _cache_cleanup()
+    def set(self, q: str, n: int, data: List[Dict[str, str]], ttl: float) -> None:
+        key = self.key(q, n)
+        ts = time.time()
+        data = data[:]
+        self._l1_put(key, ts, ttl, data)
+        r = self._get_redis()
+        if r is None:
+            return
+        try:
+            expire = int(ttl + self.stale_window(ttl)) + 1
+            r.setex(key, expire, json.dumps({"ts": ts, "ttl": ttl, "data": data}, ensure_ascii=False))
+        except Exception as e:
+            self._redis_failed(e)
+
+    def clear_local(self) -> None:
+        with self._lock:
+            self._l1.clear()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            size = len(self._l1)
+        return {
+            "l1_size": size,
+            "l1_max": self.max_size,
+            "redis": self.use_redis and time.time() >= self._redis_down_until,
+            "hits": dict(self.hits),
+        }
+
+
+_SERP_CACHE = SerpCache()
+
+# refresh in background delle entry stale (una sola refresh in volo per chiave)
+_REFRESH_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="websearch-swr")
+_REFRESHING: set = set()
+_REFRESHING_LOCK = threading.Lock()
+
+
+def serp_cache_stats() -> Dict[str, object]:
+    return _SERP_CACHE.stats()
+
 
 # ===================== Domain policy (boost/allow) =====================
 
@@ -649,78 +784,394 @@ def _rank_by_domain_policy(results: List[Dict[str, str]], query: str) -> List[Di
     scored.sort(key=lambda x: (-x[0], x[1]))
     return [r for _, _, r in scored]
 
-# === Multi-backend aggregator ===
-def _aggregate_multi(query: str, num: int) -> List[Dict[str, str]]:
+# ================= Async provider fan-out =================
+
+# Deadline per singola chiamata provider (il GET sui mirror DDG può concatenare più timeout)
+PROVIDER_DEADLINE_S = float(
+    os.getenv("WEBSEARCH_PROVIDER_DEADLINE_S", str(PROVIDER_TIMEOUT_S + 1.5))
+)
+# Deadline complessiva della fan-out (varianti × provider)
+TOTAL_DEADLINE_S = float(os.getenv("WEBSEARCH_TOTAL_DEADLINE_S", "8.0"))
+# Max chiamate provider in volo contemporaneamente
+MAX_INFLIGHT = int(os.getenv("WEBSEARCH_MAX_INFLIGHT", "12"))
+
+# nome provider -> nome funzione (risolta a runtime, così resta monkeypatchabile)
+_PROVIDER_FUNCS: Dict[str, str] = {
+    "ddg_post": "_search_ddg_html_post",
+    "ddg_get": "_search_ddg_html_get_all",
+    "ddg_lite": "_search_ddg_lite",
+    "bing": "_search_bing_html",
+    "serpapi": "_search_serpapi",
+    "google": "_search_google_cse",
+}
+
+# Pool dedicato: i provider sono bloccanti (requests) e non devono occupare
+# il default executor dell'event loop (né bloccarne lo shutdown).
+_PROVIDER_POOL = ThreadPoolExecutor(
+    max_workers=max(4, MAX_INFLIGHT * 2), thread_name_prefix="websearch"
+)
+_SYNC_BRIDGE = ThreadPoolExecutor(max_workers=4, thread_name_prefix="websearch-sync")
+
+
+def _provider_fn(name: str) -> Callable[[str, int], List[Dict[str, str]]]:
+    return globals()[_PROVIDER_FUNCS[name]]
+
+
+def _provider_enabled(name: str) -> bool:
+    if name in ("ddg_post", "ddg_get"):
+        return EN_DDG_HTML
+    if name == "ddg_lite":
+        return EN_DDG_LITE
+    if name == "bing":
+        return EN_BING_HTML
+    if name == "serpapi":
+        return bool(os.getenv("SERPAPI_KEY"))
+    if name == "google":
+        return bool(os.getenv("GOOGLE_API_KEY") and os.getenv("GOOGLE_CX"))
+    return False
+
+
+def _providers_for_backend(backend: str) -> List[str]:
+    """Provider da interrogare per il SEARCH_BACKEND dato, in ordine di priorità."""
+    if backend == "serpapi":
+        names = ["serpapi"]
+    elif backend == "google":
+        names = ["google"]
+    elif backend == "multi":
+        names = ["ddg_post", "ddg_get", "ddg_lite", "bing", "serpapi", "google"]
+    else:
+        names = ["ddg_post", "ddg_get", "ddg_lite", "bing"]
+    return [n for n in names if _provider_enabled(n)]
+
+
+def _expand_variants(q: str) -> List[str]:
+    """Varianti della query via query expander (max 3), fallback alla query originale."""
+    try:
+        from core.query_expander import get_query_expander
+        expansion = get_query_expander().expand(q, max_expansions=3)
+        variants = expansion.expanded[:3] or [q]
+        _log(f"Query expanded: {q} -> {variants}")
+        return variants
+    except Exception as e:
+        _log(f"Query expansion failed: {e}, using original query")
+        return [q]
+
+
+def _dedup_variants(variants: List[str]) -> List[str]:
+    out: List[str] = []
+    seen = set()
+    for v in variants:
+        v = (v or "").strip()
+        if v and v.lower() not in seen:
+            out.append(v)
+            seen.add(v.lower())
+    return out
+
+
+# ================= Provider scheduler (latency-aware + hedging) =================
+
+# Hedging: sul backend di default si interroga prima il provider più veloce
+# e si "copre" col successivo solo se non risponde entro il suo p90.
+HEDGING_ENABLED = os.getenv("WEBSEARCH_HEDGING", "1") == "1"
+# Peso del campione nuovo nelle EWMA (latenza ed errori)
+SCHED_EWMA_ALPHA = float(os.getenv("WEBSEARCH_SCHED_EWMA_ALPHA", "0.3"))
+# Sopra questa error-EWMA un provider è considerato non sano (va in coda)
+SCHED_UNHEALTHY_ERR = float(os.getenv("WEBSEARCH_SCHED_UNHEALTHY_ERR", "0.5"))
+# Ritardo hedge finché non ci sono abbastanza campioni per un p90 affidabile
+HEDGE_DEFAULT_DELAY_S = float(os.getenv("WEBSEARCH_HEDGE_DEFAULT_DELAY_S", "1.5"))
+HEDGE_MIN_DELAY_S = float(os.getenv("WEBSEARCH_HEDGE_MIN_DELAY_S", "0.25"))
+_SCHED_WINDOW = 50
+_SCHED_MIN_SAMPLES = 5
+
+
+class _ProviderStats:
+    __slots__ = ("lat_ewma", "err_ewma", "samples", "window")
+
+    def __init__(self) -> None:
+        self.lat_ewma: Optional[float] = None
+        self.err_ewma = 0.0
+        self.samples = 0
+        self.window: "deque[float]" = deque(maxlen=_SCHED_WINDOW)
+
+
+class ProviderScheduler:
     """
-    Query all supported providers (DDG HTML POST/GET/LITE, Bing, SerpAPI or Google)
-    and merge results. Duplicate URLs are removed preserving the first appearance.
-    Results are normalised and ranked by domain policy. Heuristic fallback is used
-    only if no provider returns any result.
+    Statistiche rolling per provider SERP: EWMA di latenza ed errori più una
+    finestra degli ultimi campioni per stimare il p90.
+
+    - `order()`: provider sani prima, per latenza EWMA crescente; a parità
+      (o senza campioni) vale l'ordine statico di priorità.
+    - `hedge_delay()`: quanto aspettare un provider prima di lanciare l'hedge.
+
+    Thread-safe: il wrapper sync può far girare più event loop in parallelo.
     """
-    out: List[Dict[str, str]] = []
-    # DuckDuckGo
-    try:
-        out.extend(_search_ddg_html_post(query, num))
-    except Exception:
-        pass
-    if len(out) < num:
-        try:
-            more = _search_ddg_html_get_all(query, num - len(out))
-            _append_unique(out, more, num)
-        except Exception:
-            pass
-    if len(out) < num:
-        try:
-            more = _search_ddg_lite(query, num - len(out))
-            _append_unique(out, more, num)
-        except Exception:
-            pass
-    # Bing
-    if len(out) < num:
-        try:
-            more = _search_bing_html(query, num - len(out))
-            _append_unique(out, more, num)
-        except Exception:
-            pass
-    # SerpAPI/Google CSE (if configured)
-    if len(out) < num:
+
+    def __init__(self, alpha: float = SCHED_EWMA_ALPHA) -> None:
+        self.alpha = alpha
+        self._stats: Dict[str, _ProviderStats] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str) -> _ProviderStats:
+        st = self._stats.get(name)
+        if st is None:
+            st = self._stats[name] = _ProviderStats()
+        return st
+
+    def record(self, name: str, latency_s: float, ok: bool, censored: bool = False) -> None:
+        """
+        Registra un campione. `censored=True` indica una chiamata cancellata
+        (hedge perso): la latenza osservata è solo un limite inferiore, quindi
+        può alzare la EWMA ma mai abbassarla, e non entra nella finestra del
+        p90 né nel tasso d'errore.
+        """
+        with self._lock:
+            st = self._get(name)
+            a = self.alpha
+            if censored and st.lat_ewma is not None:
+                latency_s = max(latency_s, st.lat_ewma)
+            st.lat_ewma = latency_s if st.lat_ewma is None else a * latency_s + (1 - a) * st.lat_ewma
+            if censored:
+                return
+            st.err_ewma = a * (0.0 if ok else 1.0) + (1 - a) * st.err_ewma
+            st.window.append(latency_s)
+            st.samples += 1
+
+    def healthy(self, name: str) -> bool:
+        with self._lock:
+            st = self._stats.get(name)
+            return st is None or st.err_ewma < SCHED_UNHEALTHY_ERR
+
+    def p90(self, name: str) -> Optional[float]:
+        with self._lock:
+            st = self._stats.get(name)
+            if st is None or len(st.window) < _SCHED_MIN_SAMPLES:
+                return None
+            ordered = sorted(st.window)
+            return ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+
+    def hedge_delay(self, name: str) -> float:
+        p90 = self.p90(name)
+        if p90 is None:
+            p90 = HEDGE_DEFAULT_DELAY_S
+        return max(HEDGE_MIN_DELAY_S, min(p90, PROVIDER_DEADLINE_S))
+
+    def order(self, names: List[str]) -> List[str]:
+        def key(item: Tuple[int, str]) -> Tuple[bool, float, int]:
+            idx, name = item
+            st = self._stats.get(name)
+            if st is None or st.lat_ewma is None:
+                # nessun campione: latenza "a priori" pari al ritardo di hedge di default
+                return (False, HEDGE_DEFAULT_DELAY_S, idx)
+            return (st.err_ewma >= SCHED_UNHEALTHY_ERR, st.lat_ewma, idx)
+
+        with self._lock:
+            return [n for _, n in sorted(enumerate(names), key=key)]
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        with self._lock:
+            names = list(self._stats)
+        out: Dict[str, Dict[str, object]] = {}
+        for name in names:
+            st = self._stats[name]
+            p90 = self.p90(name)
+            out[name] = {
+                "latency_ewma_ms": int(st.lat_ewma * 1000) if st.lat_ewma is not None else None,
+                "latency_p90_ms": int(p90 * 1000) if p90 is not None else None,
+                "error_ewma": round(st.err_ewma, 3),
+                "samples": st.samples,
+                "healthy": st.err_ewma < SCHED_UNHEALTHY_ERR,
+            }
+        return out
+
+
+_SCHEDULER = ProviderScheduler()
+
+
+def get_provider_scheduler() -> ProviderScheduler:
+    return _SCHEDULER
+
+
+def provider_stats() -> Dict[str, Dict[str, object]]:
+    """Snapshot JSON-safe delle statistiche per provider (per /healthz e debug)."""
+    return _SCHEDULER.snapshot()
+
+
+async def _fan_out(
+    queries: List[str],
+    providers: List[str],
+    num: int,
+    hedge: Optional[bool] = None,
+) -> List[Dict[str, str]]:
+    """
+    Interroga tutte le varianti in parallelo e unisce i risultati man mano che
+    arrivano. Ritorna appena ci sono `num` URL validi (o scade
+    TOTAL_DEADLINE_S), cancellando il resto.
+
+    Per ogni variante i provider sono instradati dallo scheduler:
+      - hedge=True  -> parte il provider più veloce e sano; se non risponde
+                       entro il suo p90 parte il successivo (hedge). Vince la
+                       prima risposta non vuota, le altre vengono cancellate.
+      - hedge=False -> broadcast su tutti i provider (modalità 'multi').
+
+    L'ordine finale segue (variante, posizione nello scheduling, rank) e non
+    l'ordine di arrivo, così il ranking resta deterministico.
+    """
+    if not queries or not providers:
+        return []
+    if hedge is None:
+        hedge = HEDGING_ENABLED and SEARCH_BACKEND != "multi"
+
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(max(1, MAX_INFLIGHT))
+    queue: "asyncio.Queue[Tuple[int, int, List[Dict[str, str]]]]" = asyncio.Queue()
+
+    async def _call(vi: int, pos: int, variant: str, name: str):
+        breaker = PROVIDER_BREAKERS.get(name)
+        if not breaker.allow():
+            # circuito aperto: salta subito, il router passa al provider successivo
+            return vi, pos, []
         try:
-            api_res = _search_serpapi(query, num - len(out))
-            _append_unique(out, api_res, num)
-        except Exception:
-            pass
-    if len(out) < num:
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    rows = await asyncio.wait_for(
+                        loop.run_in_executor(_PROVIDER_POOL, _provider_fn(name), variant, num),
+                        timeout=PROVIDER_DEADLINE_S,
+                    )
+                    rows = rows or []
+                    _SCHEDULER.record(name, time.perf_counter() - t0, ok=bool(rows))
+                    if rows:
+                        breaker.record_success()
+                    else:
+                        # errore HTTP, CAPTCHA o parse vuoto: i provider ritornano [] in tutti i casi
+                        breaker.record_failure("empty")
+                except asyncio.TimeoutError:
+                    _log(f"{name} deadline ({PROVIDER_DEADLINE_S:.1f}s) for '{variant}'")
+                    _SCHEDULER.record(name, PROVIDER_DEADLINE_S, ok=False)
+                    breaker.record_failure("deadline")
+                    rows = []
+                except asyncio.CancelledError:
+                    _SCHEDULER.record(name, time.perf_counter() - t0, ok=True, censored=True)
+                    raise
+                except Exception as e:
+                    _log(f"{name} error for '{variant}': {e}")
+                    _SCHEDULER.record(name, time.perf_counter() - t0, ok=False)
+                    breaker.record_failure(str(e)[:120])
+                    rows = []
+        except asyncio.CancelledError:
+            # hedge perso o fan-out chiusa: nessun esito, libera l'eventuale probe
+            breaker.release()
+            raise
+        return vi, pos, rows
+
+    async def _route(vi: int, variant: str) -> None:
+        order = _SCHEDULER.order(providers) if hedge else list(providers)
+        inflight: set = set()
+        nxt = 0
+
+        def _launch() -> None:
+            nonlocal nxt
+            inflight.add(asyncio.create_task(_call(vi, nxt, variant, order[nxt])))
+            nxt += 1
+
+        if hedge:
+            _launch()
+        else:
+            while nxt < len(order):
+                _launch()
+
         try:
-            api_res = _search_google_cse(query, num - len(out))
-            _append_unique(out, api_res, num)
-        except Exception:
-            pass
-    # Heuristics if still empty
-    if HEURISTIC_SEEDS_ENABLED and not out:
-        out = _heuristic_results(query, num)
-    # normalise and rank
-    norm = [_normalize(r) for r in out if _ok_url(r.get("url", ""))]
-    ranked = _rank_by_domain_policy(norm, query)
-    return ranked[:num]
+            while inflight:
+                delay = _SCHEDULER.hedge_delay(order[nxt - 1]) if nxt < len(order) else None
+                done, inflight = await asyncio.wait(
+                    inflight, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    _log(f"hedge: {order[nxt - 1]} > p90 ({delay:.2f}s), launching {order[nxt]}")
+                    _launch()
+                    continue
+                answered = False
+                for task in done:
+                    res = task.result()
+                    answered = answered or bool(res[2])
+                    queue.put_nowait(res)
+                if hedge and answered:
+                    break
+                if hedge and not inflight and nxt < len(order):
+                    _launch()
+        finally:
+            for task in inflight:
+                task.cancel()
+
+    routers = [asyncio.create_task(_route(vi, v)) for vi, v in enumerate(queries)]
+    merged: List[Tuple[Tuple[int, int, int], Dict[str, str]]] = []
+    seen: set = set()
+    deadline = loop.time() + TOTAL_DEADLINE_S
+
+    def _drain() -> None:
+        while not queue.empty():
+            vi, pos, rows = queue.get_nowait()
+            for rank, r in enumerate(rows):
+                u = (r.get("url") or "").strip()
+                if not u or u in seen or not _ok_url(u):
+                    continue
+                merged.append(((vi, pos, rank), r))
+                seen.add(u)
+
+    try:
+        while len(merged) < num:
+            _drain()
+            if len(merged) >= num or (all(t.done() for t in routers) and queue.empty()):
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                _log(f"Fan-out deadline reached with {len(merged)} results")
+                break
+            getter = asyncio.ensure_future(queue.get())
+            active = {t for t in routers if not t.done()}
+            done, _ = await asyncio.wait(
+                active | {getter}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter in done:
+                queue.put_nowait(getter.result())
+            else:
+                getter.cancel()
+    finally:
+        for task in routers:
+            task.cancel()
+
+    merged.sort(key=lambda x: x[0])
+    return [r for _, r in merged]
+
 
 # ================= Public API =================
 
-def search(query: str, num: int = 8) -> List[Dict[str, str]]:
+async def search_async(
+    query: str,
+    num: int = 8,
+    variants: Optional[List[str]] = None,
+) -> List[Dict[str, str]]:
     """
-    Perform a web search and return up to `num` results in a normalised
-    format: each dict contains at least `url` and `title`, with optional
-    `snippet`. Results are filtered and ranked according to domain policy.
+    Async web search: interroga in parallelo tutte le varianti della query su
+    tutti i provider abilitati e ritorna fino a `num` risultati normalizzati
+    (`url`, `title`, `snippet` opzionale), filtrati e ordinati per domain policy.
+
+    Se `variants` è passato viene usato così com'è (es. da build_query_variants),
+    altrimenti le varianti arrivano dal query expander.
 
-    Behaviour depends on the `SEARCH_BACKEND` environment variable:
+    Provider per `SEARCH_BACKEND`:
 
-      'serpapi' -> query SerpAPI only.
-      'google'  -> query Google Custom Search only.
-      'multi'   -> query all available providers (DDG/Bing/SerpAPI/Google) and merge.
-      default   -> legacy sequential search (DDG -> Bing -> browserless fallback).
+      'serpapi' -> SerpAPI only.
+      'google'  -> Google Custom Search only.
+      'multi'   -> DDG/Bing/SerpAPI/Google.
+      default   -> DDG POST, DDG GET mirrors, DDG Lite, Bing.
 
-    Results are cached for a short TTL to avoid repeated network calls.
-    
-    ENHANCEMENT: Now uses intelligent query expansion for better results.
+    Fuori da 'multi' i provider di ogni variante sono instradati dallo
+    scheduler (più veloce e sano prima, hedge al suo p90), vedi `_fan_out`.
+
+    Browserless ed euristiche restano fallback solo se la fan-out è vuota.
+    Risultati in cache L1/L2 con TTL per categoria; un'entry scaduta da poco
+    viene servita subito e rinfrescata in background (stale-while-revalidate).
     """
     q = (query or "").strip()
     if not q or num <= 0:
@@ -729,118 +1180,87 @@ def search(query: str, num: int = 8) -> List[Dict[str, str]]:
     # clamp to hard cap
     num = max(1, min(int(num), MAX_RESULTS_HARD))
 
-    # check cache
-    cached = _cache_get(q, num)
+    queries = _dedup_variants(variants) if variants else _expand_variants(q)
+    if not queries:
+        queries = [q]
+    cache_q = q if not variants else "\n".join(queries)
+
+    cached = _SERP_CACHE.get(cache_q, num)
     if cached is not None:
-        return cached[:num]
+        data, stale = cached
+        if stale:
+            _schedule_refresh(q, queries, cache_q, num)
+        return data[:num]
 
-    backend = SEARCH_BACKEND
-    
-    # ENHANCEMENT: Use query expansion for better recall
-    # Try importing query expander
-    try:
-        from core.query_expander import get_query_expander
-        expander = get_query_expander()
-        expansion = expander.expand(q, max_expansions=3)
-        # Use expanded queries for better coverage
-        queries_to_try = expansion.expanded[:3]  # Try up to 3 variants
-        _log(f"Query expanded: {q} -> {queries_to_try}")
-    except Exception as e:
-        _log(f"Query expansion failed: {e}, using original query")
-        queries_to_try = [q]
-    
-    # Collect results from all query variants
-    all_results: List[Dict[str, str]] = []
-    seen_urls: set = set()
-    
-    for query_variant in queries_to_try:
-        # explicit single-backend mode
-        if backend in ("serpapi", "google"):
-            if backend == "serpapi":
-                try:
-                    results = _search_serpapi(query_variant, num)
-                except Exception:
-                    results = []
-            else:
-                try:
-                    results = _search_google_cse(query_variant, num)
-                except Exception:
-                    results = []
-            # Merge results avoiding duplicates
-            for r in results:
-                url = r.get("url", "")
-                if url and url not in seen_urls:
-                    all_results.append(r)
-                    seen_urls.add(url)
-            continue
+    final = await _search_uncached(q, queries, num)
+    _SERP_CACHE.set(cache_q, num, final, get_ttl_for_category(_serp_category(q)))
+    return final
 
-        # multi-backend aggregator mode
-        if backend == "multi":
-            results = _aggregate_multi(query_variant, num)
-            for r in results:
-                url = r.get("url", "")
-                if url and url not in seen_urls:
-                    all_results.append(r)
-                    seen_urls.add(url)
-            continue
 
-        # legacy sequential search (ddg/bing/browserless)
-        results: List[Dict[str, str]] = []
-        # 1) DDG POST
-        try:
-            results.extend(_search_ddg_html_post(query_variant, num - len(results)))
-        except Exception:
-            pass
-        if len(results) >= num:
-            break
-        # 2) DDG GET (mirrors)
-        try:
-            more = _search_ddg_html_get_all(query_variant, num - len(results))
-            _append_unique(results, more, num)
-        except Exception:
-            pass
-        if len(results) >= num:
-            break
-        # 3) DDG LITE
-        try:
-            more = _search_ddg_lite(query_variant, num - len(results))
-            _append_unique(results, more, num)
-        except Exception:
-            pass
-        if len(results) >= num:
-            break
-        # 4) Bing HTML
-        try:
-            more = _search_bing_html(query_variant, num - len(results))
-            _append_unique(results, more, num)
-        except Exception:
-            pass
-        
-        # Merge results from this variant
-        for r in results:
-            url = r.get("url", "")
-            if url and url not in seen_urls:
-                all_results.append(r)
-                seen_urls.add(url)
-        
-        # Stop if we have enough results
-        if len(all_results) >= num:
-            break
-    
+async def _search_uncached(q: str, queries: List[str], num: int) -> List[Dict[str, str]]:
+    """Fan-out + fallback browserless/euristiche, poi normalize e rank."""
+    all_results = await _fan_out(queries, _providers_for_backend(SEARCH_BACKEND), num)
+
     # If still no results, try browserless and heuristics
     if not all_results:
         try:
-            more = _search_ddg_lite_via_browserless(q, num)
+            loop = asyncio.get_running_loop()
+            more = await loop.run_in_executor(
+                _PROVIDER_POOL, _search_ddg_lite_via_browserless, q, num
+            )
             _append_unique(all_results, more, num)
         except Exception:
             pass
-    
+
     # fallback heuristics
     if HEURISTIC_SEEDS_ENABLED and not all_results:
         all_results = _heuristic_results(q, num)
-    
+
     # Normalize and rank
     norm_all = [_normalize(r) for r in all_results if _ok_url(r.get("url", ""))]
-    final = _rank_by_domain_policy(norm_all, q)[:num]
-    _cache_set(q, num, final)
-    return final
+    return _rank_by_domain_policy(norm_all, q)[:num]
+
+
+def _schedule_refresh(q: str, queries: List[str], cache_q: str, num: int) -> None:
+    """
+    Stale-while-revalidate: rinfresca l'entry su `_REFRESH_POOL` con un loop
+    proprio, così la refresh sopravvive alla chiusura del loop del chiamante.
+    Una refresh vuota non sovrascrive la SERP stale.
+    """
+    key = SerpCache.key(cache_q, num)
+    with _REFRESHING_LOCK:
+        if key in _REFRESHING:
+            return
+        _REFRESHING.add(key)
+
+    def _refresh() -> None:
+        try:
+            fresh = asyncio.run(_search_uncached(q, queries, num))
+            if fresh:
+                _SERP_CACHE.set(cache_q, num, fresh, get_ttl_for_category(_serp_category(q)))
+        except Exception as e:
+            _log(f"SERP refresh failed for {q!r}: {e}")
+        finally:
+            with _REFRESHING_LOCK:
+                _REFRESHING.discard(key)
+
+    try:
+        _REFRESH_POOL.submit(_refresh)
+    except RuntimeError:  # interpreter shutdown
+        with _REFRESHING_LOCK:
+            _REFRESHING.discard(key)
+
+
+def search(query: str, num: int = 8) -> List[Dict[str, str]]:
+    """
+    Wrapper sincrono di `search_async` (stessa semantica, stesso formato).
+
+    Se chiamato da un thread che ha già un event loop attivo, la ricerca gira
+    su un thread di appoggio per non annidare `asyncio.run`.
+    """
+    coro = search_async(query, num)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    return _SYNC_BRIDGE.submit(asyncio.run, coro).result()
@@ -17,6 +17,7 @@ Se le librerie non sono installate, usa fallback più semplici.
 
 from __future__ import annotations
 
+import codecs
 import logging
 import os
 import re
@@ -28,8 +29,16 @@ import requests
 from requests.exceptions import RequestException
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from urllib.parse import urljoin
-from core.robust_content_extraction import extract_content_robust
+from urllib.parse import urljoin, urlparse
+from core.robust_content_extraction import extract_content_async
+from core.circuit_breaker import DOMAIN_BREAKERS
+
+try:
+    import aiohttp  # type: ignore
+    AIOHTTP_AVAILABLE = True
+except Exception:  # pragma: no cover
+    aiohttp = None  # type: ignore
+    AIOHTTP_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +62,16 @@ DEFAULT_TIMEOUT_S = float(os.getenv("WEB_EXTRACT_TIMEOUT_S", "8.0"))
 # Limite massimo di byte letti dal body (per evitare esplosioni)
 MAX_HTML_BYTES = int(os.getenv("WEB_EXTRACT_MAX_BYTES", str(1_500_000)))
 
+# Streaming: chunk di lettura e stop anticipato a </article>/</main>
+_STREAM_CHUNK = 64 * 1024
+WEB_EARLY_CUTOFF = os.getenv("WEB_EXTRACT_EARLY_CUTOFF", "1") == "1"
+
+# Client async (aiohttp): pool condiviso, keep-alive, cache DNS
+WEB_HTTP_POOL_LIMIT = int(os.getenv("WEB_HTTP_POOL_LIMIT", "100"))
+WEB_HTTP_PER_HOST_LIMIT = int(os.getenv("WEB_HTTP_PER_HOST_LIMIT", "6"))
+WEB_HTTP_DNS_TTL_S = int(os.getenv("WEB_HTTP_DNS_TTL_S", "300"))
+WEB_HTTP_KEEPALIVE_S = float(os.getenv("WEB_HTTP_KEEPALIVE_S", "30"))
+
 # ===================== HTTP Session (module-level singleton) =====================
 
 def _create_http_session() -> requests.Session:
@@ -75,6 +94,61 @@ def _get_http_session() -> requests.Session:
     return _HTTP_SESSION
 
 
+# ===================== Async HTTP session (aiohttp, per event loop) =====================
+
+# Le ClientSession aiohttp sono legate al loop: una per loop (in produzione
+# c'è un solo loop per worker uvicorn; i test usano asyncio.run ripetuti).
+_AIO_SESSIONS: dict = {}
+
+
+def _accept_encoding() -> str:
+    try:
+        import brotli  # type: ignore  # noqa: F401
+        return "gzip, deflate, br"
+    except Exception:
+        return "gzip, deflate"
+
+
+def _get_aio_session() -> "aiohttp.ClientSession":
+    """Ritorna la ClientSession condivisa del loop corrente (creata lazy)."""
+    loop = asyncio.get_running_loop()
+    session = _AIO_SESSIONS.get(loop)
+    if session is None or session.closed:
+        for old in [lp for lp in _AIO_SESSIONS if lp.is_closed()]:
+            del _AIO_SESSIONS[old]
+        connector = aiohttp.TCPConnector(
+            limit=WEB_HTTP_POOL_LIMIT,
+            limit_per_host=WEB_HTTP_PER_HOST_LIMIT,
+            ttl_dns_cache=WEB_HTTP_DNS_TTL_S,
+            use_dns_cache=True,
+            keepalive_timeout=WEB_HTTP_KEEPALIVE_S,
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            headers={
+                "User-Agent": DEFAULT_UA,
+                "Accept-Language": DEFAULT_LANG,
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                "Accept-Encoding": _accept_encoding(),
+            },
+            auto_decompress=True,
+            trust_env=False,
+        )
+        _AIO_SESSIONS[loop] = session
+    return session
+
+
+async def close_http_session() -> None:
+    """Chiude la ClientSession del loop corrente (da chiamare allo shutdown)."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    session = _AIO_SESSIONS.pop(loop, None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
 # ===================== Helper dataclass =====================
 
 @dataclass
@@ -95,14 +169,191 @@ def _build_headers() -> dict:
     }
 
 
-def _http_get(url: str, timeout: float) -> Optional[requests.Response]:
+# Status che indicano un dominio che ci sta bloccando o è giù (contano per il breaker)
+_BREAKER_FAIL_STATUS = {403, 429, 500, 502, 503, 504}
+
+
+def _host(url: str) -> str:
+    try:
+        return (urlparse(url).hostname or "").lower()
+    except Exception:
+        return ""
+
+
+# ===================== Streaming decode =====================
+
+# Dopo questi marker il contenuto principale è già arrivato: smettiamo di leggere
+_EARLY_CUTOFF_MARKERS = (b"</article>", b"</main>")
+_MARKER_TAIL = max(len(m) for m in _EARLY_CUTOFF_MARKERS) - 1
+_SNIFF_BYTES = 4096
+_META_CHARSET_RE = re.compile(
+    rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_\-:.]+)""",
+    re.IGNORECASE,
+)
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def _canonical_charset(name: Optional[str]) -> Optional[str]:
+    """Normalizza un charset dichiarato; latin-1/ascii → cp1252 come fanno i browser."""
+    if not name:
+        return None
+    try:
+        canon = codecs.lookup(name.strip().strip("'\"")).name
+    except LookupError:
+        return None
+    if canon in ("latin-1", "iso8859-1", "ascii"):
+        return "cp1252"
+    # una meta utf-16 in un documento letto come ASCII-compatibile è sempre falsa
+    if canon.startswith("utf-16"):
+        return "utf-8"
+    return canon
+
+
+def _charset_from_content_type(ctype: str) -> Optional[str]:
+    m = re.search(r"charset\s*=\s*([^\s;]+)", ctype or "", re.IGNORECASE)
+    return m.group(1) if m else None
+
+
+class _HtmlStreamDecoder:
+    """
+    Decodifica incrementale di un body HTML letto a chunk.
+
+    Charset: BOM > header HTTP > <meta charset> nei primi 4 KB > utf-8.
+    `feed()` ritorna True quando conviene smettere di leggere: cap di byte
+    raggiunto oppure `</article>`/`</main>` visto (se early_cutoff).
+    """
+
+    def __init__(
+        self,
+        declared_charset: Optional[str],
+        max_bytes: int = 0,
+        early_cutoff: bool = True,
+    ) -> None:
+        self.max_bytes = max_bytes or MAX_HTML_BYTES
+        self.early_cutoff = early_cutoff
+        self.charset = _canonical_charset(declared_charset)
+        self.bytes_read = 0
+        self.cutoff: Optional[str] = None  # "max_bytes" | "marker"
+        self._pending = b""
+        self._decoder = None
+        self._parts: list[str] = []
+        self._tail = b""
+
+    def _start(self, head: bytes) -> None:
+        charset = None
+        for bom, name in _BOMS:
+            if head.startswith(bom):
+                charset = name
+                break
+        if charset is None:
+            charset = self.charset
+        if charset is None:
+            m = _META_CHARSET_RE.search(head[:_SNIFF_BYTES])
+            if m:
+                charset = _canonical_charset(m.group(1).decode("ascii", "ignore"))
+        self.charset = charset or "utf-8"
+        self._decoder = codecs.getincrementaldecoder(self.charset)(errors="replace")
+
+    def feed(self, chunk: bytes) -> bool:
+        if not chunk:
+            return False
+        room = self.max_bytes - self.bytes_read
+        if len(chunk) >= room:
+            chunk = chunk[:room]
+            self.cutoff = "max_bytes"
+        self.bytes_read += len(chunk)
+
+        if self._decoder is None:
+            self._pending += chunk
+            # con charset dichiarato basta attendere l'eventuale BOM
+            need = 4 if self.charset else _SNIFF_BYTES
+            if len(self._pending) < need and self.cutoff is None:
+                return False
+            self._start(self._pending)
+            chunk, self._pending = self._pending, b""
+        self._parts.append(self._decoder.decode(chunk))
+
+        if self.cutoff is None and self.early_cutoff:
+            window = self._tail + chunk.lower()
+            if any(m in window for m in _EARLY_CUTOFF_MARKERS):
+                self.cutoff = "marker"
+            self._tail = window[-_MARKER_TAIL:]
+        return self.cutoff is not None
+
+    def finish(self) -> str:
+        if self._decoder is None:
+            self._start(self._pending)
+            self._parts.append(self._decoder.decode(self._pending))
+            self._pending = b""
+        self._parts.append(self._decoder.decode(b"", final=True))
+        return "".join(self._parts)
+
+
+@dataclass
+class FetchedPage:
+    """Pagina HTML scaricata in streaming (già troncata e decodificata)."""
+    url: str
+    status: int
+    html: str
+    encoding: str
+    bytes_read: int = 0
+    cutoff: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+
+
+def _is_html(ctype: str) -> bool:
+    return "text/html" in ctype or "application/xhtml" in ctype
+
+
+def _conditional_headers(etag: Optional[str], last_modified: Optional[str]) -> dict:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def _http_get(
+    url: str,
+    timeout: float,
+    record_success: bool = True,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> Optional[FetchedPage]:
     """
     HTTP GET con gestione redirect e timeout separati.
     OPTIMIZED: Connection pooling e migliore gestione errori.
 
     timeout: timeout "totale" desiderato. Lo splittiamo in connect/read.
+
+    Passa dal circuit breaker del dominio: se è aperto ritorna None subito.
+    Con record_success=False l'esito positivo lo registra il chiamante
+    (es. dopo l'estrazione, così anche i parse vuoti contano come fallimento):
+    in half-open lo slot di probe resta occupato finché il chiamante non
+    chiama record_success()/record_failure().
+
+    Il body è letto in streaming: content-type non HTML rifiutato appena
+    arrivano gli header, lettura interrotta al cap o a fine contenuto.
+
+    Con etag/last_modified il GET è condizionale: un 304 ritorna una
+    FetchedPage vuota con not_modified=True.
     """
-    headers = _build_headers()
+    breaker = DOMAIN_BREAKERS.get(_host(url))
+    if not breaker.allow():
+        logger.info("Circuit open per %s, skip fetch", _host(url))
+        return None
+
+    headers = {**_build_headers(), **_conditional_headers(etag, last_modified)}
     # provo a spezzare il timeout in connect + read
     connect_timeout = min(3.0, timeout * 0.35)  # OPTIMIZED: più tempo per lettura
     read_timeout = max(2.5, timeout * 0.65)
@@ -116,15 +367,115 @@ def _http_get(url: str, timeout: float) -> Optional[requests.Response]:
             headers=headers,
             timeout=(connect_timeout, read_timeout),
             allow_redirects=True,
+            stream=True,
         )
-        # Rifiuta content-type chiaramente non HTML
-        ctype = resp.headers.get("Content-Type", "")
-        if "text/html" not in ctype and "application/xhtml" not in ctype:
-            logger.info("Non-HTML content-type per %s: %s", url, ctype)
-            return None
-
-        return resp
+        with resp:
+            if resp.status_code in _BREAKER_FAIL_STATUS:
+                breaker.record_failure(f"http_{resp.status_code}")
+            elif record_success:
+                breaker.record_success()
+            # altrimenti lo slot di probe (half-open) resta al chiamante fino all'esito
+
+            if resp.status_code == 304:
+                return FetchedPage(url=str(resp.url), status=304, html="", encoding="")
+
+            # Rifiuta content-type chiaramente non HTML (senza scaricare il body)
+            ctype = resp.headers.get("Content-Type", "")
+            if not _is_html(ctype):
+                logger.info("Non-HTML content-type per %s: %s", url, ctype)
+                if not record_success:
+                    breaker.record_success()  # il dominio risponde, il chiamante non ha nulla da giudicare
+                return None
+
+            decoder = _HtmlStreamDecoder(
+                _charset_from_content_type(ctype), early_cutoff=WEB_EARLY_CUTOFF
+            )
+            for chunk in resp.iter_content(_STREAM_CHUNK):
+                if decoder.feed(chunk):
+                    break
+            return _page(str(resp.url), resp.status_code, decoder, resp.headers)
     except RequestException as e:
+        breaker.record_failure(type(e).__name__)
+        logger.warning("HTTP error fetching %s: %s", url, e)
+        return None
+
+
+def _page(url: str, status: int, decoder: _HtmlStreamDecoder, headers) -> FetchedPage:
+    html = decoder.finish()
+    if decoder.cutoff:
+        logger.debug("Stream cutoff (%s) per %s dopo %d byte", decoder.cutoff, url, decoder.bytes_read)
+    return FetchedPage(
+        url=url,
+        status=status,
+        html=html,
+        encoding=decoder.charset or "utf-8",
+        bytes_read=decoder.bytes_read,
+        cutoff=decoder.cutoff,
+        etag=headers.get("ETag"),
+        last_modified=headers.get("Last-Modified"),
+    )
+
+
+async def _http_get_async(
+    url: str,
+    timeout: float,
+    record_success: bool = True,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> Optional[FetchedPage]:
+    """
+    Versione asyncio nativa di `_http_get` sul pool aiohttp condiviso:
+    nessun thread occupato per la durata del timeout.
+
+    Stessa semantica: circuit breaker del dominio, solo HTML, body letto
+    in streaming fino al cap o a `</article>`/`</main>`, GET condizionale
+    con etag/last_modified, None su errore.
+    """
+    breaker = DOMAIN_BREAKERS.get(_host(url))
+    if not breaker.allow():
+        logger.info("Circuit open per %s, skip fetch", _host(url))
+        return None
+
+    client_timeout = aiohttp.ClientTimeout(
+        total=timeout,
+        sock_connect=min(3.0, timeout * 0.35),
+    )
+    try:
+        session = _get_aio_session()
+        async with session.get(
+            url,
+            timeout=client_timeout,
+            allow_redirects=True,
+            headers=_conditional_headers(etag, last_modified),
+        ) as resp:
+            if resp.status in _BREAKER_FAIL_STATUS:
+                breaker.record_failure(f"http_{resp.status}")
+            elif record_success:
+                breaker.record_success()
+            # altrimenti lo slot di probe (half-open) resta al chiamante fino all'esito
+
+            if resp.status == 304:
+                return FetchedPage(url=str(resp.url), status=304, html="", encoding="")
+
+            ctype = resp.headers.get("Content-Type", "")
+            if not _is_html(ctype):
+                logger.info("Non-HTML content-type per %s: %s", url, ctype)
+                if not record_success:
+                    breaker.record_success()
+                return None
+
+            decoder = _HtmlStreamDecoder(resp.charset, early_cutoff=WEB_EARLY_CUTOFF)
+            async for chunk in resp.content.iter_chunked(_STREAM_CHUNK):
+                if decoder.feed(chunk):
+                    break
+            # uscendo dal context manager la connessione di un body non
+            # letto fino in fondo viene chiusa, non rimessa nel pool
+            return _page(str(resp.url), resp.status, decoder, resp.headers)
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        breaker.record_failure(type(e).__name__)
         logger.warning("HTTP error fetching %s: %s", url, e)
         return None
 
@@ -211,6 +562,14 @@ def _extract_og_image(html: str, base_url: str) -> Optional[str]:
     return None
 
 
+def _html_head(html: str, limit: int = 200_000) -> str:
+    """Porzione fino a </head> (o i primi `limit` caratteri se non c'è)."""
+    end = html.find("</head>", 0, limit)
+    if end < 0:
+        end = html.find("</HEAD>", 0, limit)
+    return html[: end + 7] if end >= 0 else html[:limit]
+
+
 def _simple_html_text(html: str) -> str:
     """
     Fallback leggero: elimina script/style e prende il testo complessivo.
@@ -323,44 +682,102 @@ def _strip_tags(html_fragment: str) -> str:
 
 # ===================== PATCH 1: robust async fetch =====================
 
-async def fetch_and_extract_robust(
+@dataclass
+class PageExtract:
+    """Esito di `fetch_page_extract`: testo estratto + validator HTTP."""
+    text: str
+    og_image: Optional[str] = None
+    not_modified: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    ok: bool = True              # False: nessun contenuto (text vuoto, motivo in error)
+    error: Optional[str] = None
+
+
+async def fetch_page_extract(
     url: str,
     timeout: float = DEFAULT_TIMEOUT_S,
     max_retries: int = 2,
-) -> Tuple[str, Optional[str]]:
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> PageExtract:
     """
     Fetch con retry e multiple extraction strategies.
-    SEMPRE ritorna qualcosa di utile, mai empty string.
+    Se nessun tentativo produce contenuto ritorna ok=False con text vuoto:
+    il chiamante non deve contarlo né metterlo in cache.
+
+    Con etag/last_modified (da una entry in cache) il GET è condizionale:
+    su 304 ritorna not_modified=True e testo vuoto, il chiamante riusa
+    l'estratto in cache senza download né ri-estrazione.
     """
     last_error = None
 
-    # helper async per riutilizzare l'HTTP sync senza bloccare l'event loop
-    async def _http_get_async(u: str, t: float) -> Optional[requests.Response]:
+    async def _get(u: str, t: float):
+        if AIOHTTP_AVAILABLE:
+            return await _http_get_async(u, t, False, etag, last_modified)
+        # fallback: HTTP sync su executor senza bloccare l'event loop
         loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, _http_get, u, t)
+        return await loop.run_in_executor(None, _http_get, u, t, False, etag, last_modified)
+
+    breaker = DOMAIN_BREAKERS.get(_host(url))
 
     for attempt in range(max_retries):
+        if breaker.is_open():
+            last_error = "circuit_open"
+            break
         try:
-            resp = await _http_get_async(url, timeout)
+            resp = await _get(url, timeout)
             if not resp:
                 continue
 
-            html = resp.content[:MAX_HTML_BYTES].decode("utf-8", errors="replace")
-            og_image = _extract_og_image(html, resp.url)
+            if resp.not_modified:
+                breaker.record_success()
+                return PageExtract(text="", not_modified=True, etag=etag, last_modified=last_modified)
 
-            # Multi-strategy robust extraction
-            text = extract_content_robust(html, url)
+            html = resp.html
+            # og:image sta nell'<head>: parse solo di quello sul loop
+            og_image = _extract_og_image(_html_head(html), resp.url)
 
-            if text and len(text) > 100:
-                return text, og_image
+            # Multi-strategy robust extraction (process pool, fuori dal loop)
+            text = await extract_content_async(html, url)
 
+            if text and len(text) > 100:
+                breaker.record_success()
+                return PageExtract(
+                    text=text,
+                    og_image=og_image,
+                    etag=resp.etag,
+                    last_modified=resp.last_modified,
+                )
+            # pagina scaricata ma nessun contenuto utile (JS-only, paywall, CAPTCHA)
+            breaker.record_failure("empty_extract")
+
+        except asyncio.CancelledError:
+            breaker.release()  # nessun esito: libera l'eventuale probe
+            raise
         except Exception as e:
+            breaker.release()
             last_error = e
             if attempt < max_retries - 1:
                 await asyncio.sleep(0.5 * (attempt + 1))
 
-    # LAST RESORT: Return URL + error info (NEVER empty)
-    return f"[Contenuto non disponibile per {url}. Errore: {last_error}]", None
+    return PageExtract(text="", ok=False, error=str(last_error or "empty_extract"))
+
+
+async def fetch_and_extract_robust(
+    url: str,
+    timeout: float = DEFAULT_TIMEOUT_S,
+    max_retries: int = 2,
+) -> Tuple[str, Optional[str]]:
+    """
+    Fetch con retry e multiple extraction strategies.
+    SEMPRE ritorna qualcosa di utile, mai empty string.
+    """
+    page = await fetch_page_extract(url, timeout=timeout, max_retries=max_retries)
+    if not page.ok:
+        # LAST RESORT: Return URL + error info (NEVER empty)
+        return f"[Contenuto non disponibile per {url}. Errore: {page.error}]", None
+    return page.text, page.og_image
 
 
 def _extract_aggressive(html: str) -> str:
@@ -447,14 +864,7 @@ def fetch_and_extract(url: str, timeout: float = DEFAULT_TIMEOUT_S) -> Tuple[str
     if not resp:
         return ("", None)
 
-    # Limita body
-    content = resp.content[:MAX_HTML_BYTES]
-
-    # tenta decodifica con encoding dichiarato, poi fallback
-    try:
-        html = content.decode(resp.encoding or "utf-8", errors="replace")
-    except Exception:
-        html = content.decode("utf-8", errors="replace")
+    html = resp.html
 
     # Prova OG image subito, così la abbiamo qualunque parser usiamo
     og_image = _extract_og_image(html, resp.url)
@@ -483,4 +893,11 @@ def fetch_and_extract(url: str, timeout: float = DEFAULT_TIMEOUT_S) -> Tuple[str
     return text, og_image
 
 
-__all__ = ["fetch_and_extract", "ExtractResult", "fetch_and_extract_robust"]
+__all__ = [
+    "fetch_and_extract",
+    "ExtractResult",
+    "fetch_and_extract_robust",
+    "fetch_page_extract",
+    "PageExtract",
+    "close_http_session",
+]
@@ -17,6 +17,7 @@
 # - PATCH 21/11: testi /start e /help allineati a Jarvis (AI personale incensurata)
 # - PATCH 10/12: SmartIntentClassifier per autoweb automatico
 # - PATCH 11/12: Semantic autoweb analysis per copertura universale query
+# - STREAM: risposte /chat e lettura URL in streaming (SSE) con edit progressivi
 
 from telegram import Update
 from telegram.ext import (
@@ -90,6 +91,12 @@ SOURCE_PREVIEW = os.getenv("TELEGRAM_SOURCE_PREVIEW", "0").strip() != "0"  # ant
 SHOW_SOURCES = os.getenv("TELEGRAM_SHOW_SOURCES", "1").strip() != "0"      # mostra elenco fonti
 SHOW_CACHE_BADGE = os.getenv("TELEGRAM_SHOW_CACHE_BADGE", "1").strip() != "0"
 
+# Streaming: il messaggio compare al primo token e viene editato man mano.
+# Opt-in: il percorso in streaming usa /chat e salta l'orchestratore /unified
+# (routing dei tool), che non streamma.
+TG_STREAM = os.getenv("TELEGRAM_STREAM", "0").strip() != "0"
+TG_STREAM_EDIT_S = float(os.getenv("TELEGRAM_STREAM_EDIT_S", "1.0") or "1.0")  # rate limit edit
+
 # === LOGGING ===
 logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s", level=logging.INFO)
 log = logging.getLogger(__name__)
@@ -363,6 +370,114 @@ async def call_chat(text: str, http: aiohttp.ClientSession, chat_id: int) -> dic
     return {"ok": False, "error": f"/chat {status}: {txt or ''}"}
 
 
+async def _iter_sse(http: aiohttp.ClientSession, url: str, payload: dict):
+    """Eventi JSON di un endpoint backend in modalità stream (SSE)."""
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=120)
+    async with http.post(url, json={**payload, "stream": True}, timeout=timeout) as r:
+        if r.status != 200:
+            raise RuntimeError(f"{url} {r.status}")
+        if "text/event-stream" not in (r.headers.get("Content-Type") or ""):
+            data = await r.json()  # backend senza streaming: risposta unica
+            yield {"done": True, **(data if isinstance(data, dict) else {})}
+            return
+        async for raw in r.content:
+            line = raw.decode("utf-8", "replace").strip()
+            if not line.startswith("data:"):
+                continue
+            try:
+                yield json.loads(line[5:].strip())
+            except ValueError:
+                continue
+
+
+async def stream_reply(
+    http: aiohttp.ClientSession,
+    url: str,
+    payload: dict,
+    msg,
+    size: int = 3500,
+) -> str | None:
+    """
+    Mostra la risposta mentre viene generata: un messaggio al primo delta,
+    poi edit al massimo ogni TG_STREAM_EDIT_S; oltre `size` caratteri
+    continua in un nuovo messaggio.
+
+    Ritorna il testo mostrato, oppure None se lo stream è fallito prima di
+    mostrare qualcosa (il chiamante ripiega sul percorso JSON).
+    """
+    loop = asyncio.get_running_loop()
+    sent = None        # messaggio Telegram corrente
+    cur = ""           # testo del messaggio corrente
+    shown = ""         # ultimo testo effettivamente inviato
+    full: list[str] = []
+    last_edit = 0.0
+    completed = False
+
+    async def flush(force: bool = False) -> bool:
+        """True se `cur` è ora visibile su Telegram."""
+        nonlocal sent, shown, last_edit
+        if not cur.strip() or cur == shown:
+            return True
+        if not force and loop.time() - last_edit < TG_STREAM_EDIT_S:
+            return False
+        try:
+            if sent is None:
+                sent = await msg.reply_text(cur, disable_web_page_preview=True)
+            else:
+                await sent.edit_text(cur, disable_web_page_preview=True)
+        except Exception as e:  # flood control / "message is not modified"
+            if "not modified" not in str(e).lower():
+                log.debug(f"stream edit skipped: {e}")
+                return False
+        shown = cur
+        last_edit = loop.time()
+        return True
+
+    async def deliver() -> None:
+        """Il testo di `cur` deve arrivare: se l'edit viene rifiutato, nuovo messaggio."""
+        if await flush(force=True):
+            return
+        try:
+            await msg.reply_text(cur, disable_web_page_preview=True)
+        except Exception as e:
+            log.warning(f"stream chunk not delivered: {e}")
+
+    try:
+        async for ev in _iter_sse(http, url, payload):
+            delta = ev.get("delta")
+            if delta:
+                full.append(delta)
+                cur += delta
+                while len(cur) > size:
+                    rest = cur[size:]
+                    cur = cur[:size]
+                    await deliver()  # si passa al messaggio successivo solo a pezzo consegnato
+                    sent, cur, shown = None, rest, ""
+                await flush()
+            elif ev.get("done"):
+                if not full:
+                    # risposta non streammata (cache, agent): testo nel done
+                    text = (ev.get("reply") or ev.get("summary") or "").strip()
+                    if text:
+                        for chunk in split_text(text, size):
+                            await msg.reply_text(chunk, disable_web_page_preview=True)
+                        return text
+                completed = True
+                break
+            elif ev.get("error"):
+                log.warning(f"stream error from {url}: {ev.get('error')}")
+                break
+    except Exception as e:
+        log.warning(f"stream {url} failed: {e}")
+
+    if sent is None and not cur.strip():
+        return None
+    if not completed:
+        cur += "\n\n⚠️ (risposta interrotta)"
+    await deliver()
+    return "".join(full)
+
+
 async def call_backend_json(
     http: aiohttp.ClientSession,
     url: str,
@@ -661,6 +776,15 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # ===== AUTOWEB per WEB_READ (URL) =====
             elif intent == "WEB_READ" and url:
                 log.info(f"Autoweb: Reading URL {url[:50]}...")
+                if TG_STREAM:
+                    streamed = await stream_reply(
+                        http,
+                        QUANTUM_WEB_SUMMARY_URL,
+                        {"url": url, "source": "tg", "source_id": str(chat_id)},
+                        msg,
+                    )
+                    if streamed:
+                        return
                 try:
                     read_result = await call_backend_json(
                         http,
@@ -721,6 +845,16 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Fallback to chat below
     
     # ========== LIVELLO 3: Fallback a /chat ==========
+    if TG_STREAM:
+        streamed = await stream_reply(
+            http,
+            QUANTUM_CHAT_URL,
+            {"source": "tg", "source_id": str(chat_id), "text": text},
+            msg,
+        )
+        if streamed:
+            return
+
     data = await call_chat(text, http, chat_id)
     reply = (data.get("reply") or "").strip()
     
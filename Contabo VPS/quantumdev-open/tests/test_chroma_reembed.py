@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_chroma_reembed.py
+============================
+Tests for utils/chroma_reembed: paged streaming with embeddings written
+directly, resume from checkpoint after a crash, migration into a target
+collection and the ids-only path for clients without offset/limit.
+"""
+
+import sys
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.chroma_reembed as cr
+
+
+class FakeModel:
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True):
+        self.batches.append(len(texts))
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+
+class FakeCollection:
+    def __init__(self, n=0, paged=True):
+        self.ids = [f"id{i}" for i in range(n)]
+        self.docs = {i: f"doc {i}" for i in self.ids}
+        self.embeddings = {}
+        self.metas = {i: {"ts": 1} for i in self.ids}
+        self.paged = paged
+        self.fail_update_at = None
+        self.gets = []
+
+    def get(self, ids=None, include=None, limit=None, offset=None):
+        self.gets.append({"ids": ids, "include": include, "limit": limit, "offset": offset})
+        if limit is not None and not self.paged:
+            raise TypeError("unexpected keyword argument 'offset'")
+        sel = ids if ids is not None else self.ids[offset or 0:(offset or 0) + limit if limit else None]
+        out = {"ids": list(sel)}
+        if include is None or "documents" in include:
+            out["documents"] = [self.docs[i] for i in sel]
+        if include is None or "metadatas" in include:
+            out["metadatas"] = [self.metas[i] for i in sel]
+        return out
+
+    def update(self, ids, embeddings):
+        if self.fail_update_at is not None and ids[0] == self.fail_update_at:
+            raise RuntimeError("crash")
+        self.embeddings.update(zip(ids, embeddings))
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        for i, e, d, m in zip(ids, embeddings, documents, metadatas):
+            self.ids.append(i)
+            self.docs[i], self.embeddings[i], self.metas[i] = d, e, m
+
+
+class TestReembed(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.model = FakeModel()
+        self.encoder = cr.BatchEncoder("all-MiniLM-L6-v2", model=self.model, processes=1)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _run(self, cols, name, **kw):
+        with mock.patch.object(cr, "_col", side_effect=lambda n: cols[n]), \
+                mock.patch.object(cr, "keyword_index_add") as kw_add:
+            report = cr.reembed(name, encoder=self.encoder, checkpoint_dir=self.tmp.name, **kw)
+        return report, kw_add
+
+    def test_streams_pages_and_writes_embeddings(self):
+        col = FakeCollection(25)
+        report, _ = self._run({"facts": col}, "facts", batch=10)
+        self.assertEqual(report["processed"], 25)
+        self.assertEqual(report["batches"], 3)
+        self.assertEqual(self.model.batches, [10, 10, 5])
+        self.assertEqual(col.embeddings["id0"], [7.0, 1.0])  # len("doc id0")
+        self.assertIn("rate_per_second", report)
+        self.assertEqual(os.listdir(self.tmp.name), [])  # checkpoint rimosso a fine job
+
+    def test_resume_after_crash(self):
+        col = FakeCollection(30)
+        col.fail_update_at = "id20"
+        with self.assertRaises(RuntimeError):
+            self._run({"facts": col}, "facts", batch=10)
+        col.fail_update_at = None
+        self.model.batches.clear()
+
+        report, _ = self._run({"facts": col}, "facts", batch=10)
+        self.assertEqual(report["resumed_from"], 20)
+        self.assertEqual(report["processed"], 30)
+        self.assertEqual(self.model.batches, [10])
+        self.assertEqual(len(col.embeddings), 30)
+
+    def test_migrate_into_target(self):
+        src, dst = FakeCollection(12), FakeCollection(0)
+        report, kw_add = self._run({"facts": src}, "facts", batch=5, target="facts_v2", target_col=dst)
+        self.assertEqual(report["target"], "facts_v2")
+        self.assertEqual(sorted(dst.ids), sorted(src.ids))
+        self.assertEqual(dst.docs["id3"], "doc id3")
+        self.assertEqual(src.embeddings, {})
+        self.assertEqual(kw_add.call_count, 3)
+
+    def test_unpaged_client_reads_ids_then_chunks(self):
+        col = FakeCollection(7, paged=False)
+        report, _ = self._run({"facts": col}, "facts", batch=3)
+        self.assertEqual(report["processed"], 7)
+        full_reads = [g for g in col.gets if g["ids"] is None and g["include"] != []
+                      and g["limit"] is None]
+        self.assertEqual(full_reads, [])  # mai un get() completo con documenti
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_chroma_search.py
+===========================
+Tests for utils/chroma_handler.search_topk_async: collections queried in
+parallel with one shared query embedding, partial results past the
+deadline, and the vectorized _rank matching the scalar scoring.
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.chroma_handler as ch
+
+
+class FakeCollection:
+    def __init__(self, name, delay=0.0):
+        self.name = name
+        self.delay = delay
+        self.calls = []
+
+    def query(self, n_results, include, **qargs):
+        self.calls.append((qargs, threading.get_ident()))
+        time.sleep(self.delay)
+        return {
+            "ids": [[f"{self.name}:1"]],
+            "documents": [[f"doc {self.name}"]],
+            "metadatas": [[{"source": "user", "ts": int(time.time())}]],
+            "distances": [[0.2]],
+        }
+
+
+class TestSearchTopkAsync(unittest.TestCase):
+
+    def _patch(self, cols):
+        embeds = []
+
+        async def fake_query_args(text):
+            embeds.append(text)
+            return {"query_embeddings": [[0.1, 0.2]]}
+
+        return embeds, [
+            mock.patch.object(ch, "_col", side_effect=lambda name: cols[name]),
+            mock.patch.object(ch, "query_args_async", side_effect=fake_query_args),
+            mock.patch.object(ch, "_kw_ready", return_value=None),  # solo ramo vettoriale
+        ]
+
+    def _run(self, patches, coro):
+        for p in patches:
+            p.start()
+        try:
+            return asyncio.run(coro)
+        finally:
+            for p in patches:
+                p.stop()
+
+    def test_parallel_with_one_embedding(self):
+        cols = {n: FakeCollection(n, delay=0.2) for n in (ch.FACTS, ch.PREFS, ch.BETS)}
+        embeds, patches = self._patch(cols)
+        t0 = time.perf_counter()
+        items = self._run(patches, ch.search_topk_async("quote milan", k=5, timeout_s=2.0))
+        elapsed = time.perf_counter() - t0
+
+        self.assertEqual(len(items), 3)
+        self.assertEqual(embeds, ["quote milan"])
+        self.assertLess(elapsed, 0.5)  # in serie sarebbero ~0.6s
+        for c in cols.values():
+            self.assertEqual(c.calls[0][0], {"query_embeddings": [[0.1, 0.2]]})
+            self.assertNotEqual(c.calls[0][1], threading.get_ident())
+
+    def test_partial_results_after_deadline(self):
+        cols = {
+            ch.FACTS: FakeCollection(ch.FACTS),
+            ch.PREFS: FakeCollection(ch.PREFS),
+            ch.BETS: FakeCollection(ch.BETS, delay=1.0),
+        }
+        _, patches = self._patch(cols)
+
+        async def timed():
+            # misurato dentro il loop: asyncio.run attende comunque il thread abbandonato in uscita
+            t0 = time.perf_counter()
+            items = await ch.search_topk_async("q", k=5, timeout_s=0.2)
+            return items, time.perf_counter() - t0
+
+        items, elapsed = self._run(patches, timed())
+
+        self.assertEqual({it["collection"] for it in items}, {ch.FACTS, ch.PREFS})
+        self.assertLess(elapsed, 0.8)
+
+
+def _real_chromadb():
+    try:
+        import chromadb
+        return hasattr(chromadb, "PersistentClient") and hasattr(chromadb, "__version__")
+    except Exception:
+        return False
+
+
+class FakeService:
+    def encode(self, texts):
+        return [np.array([1.0, 0.0, 0.0], dtype=np.float32) for _ in texts]
+
+
+@unittest.skipUnless(_real_chromadb(), "chromadb not installed")
+class TestExistingCollections(unittest.TestCase):
+
+    def test_reopens_collection_persisted_with_stock_function(self):
+        import chromadb
+        from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+        # funzione stock del baseline, senza caricare il modello
+        stock = object.__new__(SentenceTransformerEmbeddingFunction)
+        stock.model_name, stock.device, stock.normalize_embeddings, stock.kwargs = ch.EMBED_MODEL, "cpu", False, {}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            client = chromadb.PersistentClient(path=tmp, settings=ch.Settings(anonymized_telemetry=False))
+            with mock.patch.object(SentenceTransformerEmbeddingFunction, "build_from_config", return_value=stock):
+                old = client.create_collection(name=ch.FACTS, embedding_function=stock)
+            old.add(ids=["f1"], documents=["fatto esistente"], embeddings=[[1.0, 0.0, 0.0]])
+            self.assertEqual(old.configuration_json["embedding_function"]["name"], "sentence_transformer")
+
+            with mock.patch.object(ch, "PERSIST_DIR", tmp), \
+                    mock.patch.object(ch, "get_embedding_service", return_value=FakeService()):
+                col = ch._col(ch.FACTS)
+                col.add(ids=["f2"], documents=["fatto nuovo"])
+                res = col.query(query_texts=["fatto"], n_results=2, include=["documents"])
+
+        self.assertEqual(sorted(res["ids"][0]), ["f1", "f2"])
+
+
+class TestRankVectorized(unittest.TestCase):
+
+    def test_matches_scalar_scoring(self):
+        now = int(time.time())
+        items = [
+            {"similarity": 0.9, "metadata": {"source": "web", "ts": now - 30 * 86400}},
+            {"similarity": 0.5, "metadata": {"source": "system", "ts": now}},
+            {"similarity": 0.7, "metadata": None},
+            {"similarity": 0.7, "metadata": {"source": "unknown", "ts": now - 86400}},
+        ]
+        ranked = ch._rank([dict(it) for it in items], k=3, half_life_days=7)
+        self.assertEqual(len(ranked), 3)
+
+        expected = []
+        for it in items:
+            md = it["metadata"] or {}
+            rec = ch._recency_score(int(md.get("ts") or 0), now=now, half_life_days=7)
+            src = ch._src_prior(str(md.get("source") or ""))
+            expected.append(ch.W_SIM * it["similarity"] + ch.W_TIME * rec + ch.W_SRC * src)
+        top = sorted(expected, reverse=True)[:3]
+        np.testing.assert_allclose([it["score"] for it in ranked], top, atol=1e-5)
+
+    def test_hybrid_items_keep_absolute_similarity(self):
+        now = int(time.time())
+        md = {"source": "user", "ts": now}
+        # entrambi primi nella propria collection: stessa relevance RRF
+        items = [
+            {"id": "bet", "collection": ch.BETS, "similarity": 0.1, "relevance": 0.5, "bm25": 0.0, "metadata": md},
+            {"id": "fact", "collection": ch.FACTS, "similarity": 0.9, "relevance": 0.5, "bm25": 0.0, "metadata": md},
+        ]
+        ranked = ch._rank([dict(it) for it in items], k=2, w_kw=0.2)
+        self.assertEqual([it["id"] for it in ranked], ["fact", "bet"])
+        self.assertGreater(ranked[0]["score"] - ranked[1]["score"], 0.5)
+
+    def test_lexical_hit_surfaces_through_bm25(self):
+        md = {"source": "user", "ts": int(time.time())}
+        items = [
+            {"id": "vec", "similarity": 0.3, "bm25": 0.0, "metadata": md},
+            {"id": "lex", "similarity": 0.0, "bm25": 4.2, "metadata": md},  # solo ramo lessicale
+        ]
+        self.assertEqual(ch._rank([dict(it) for it in items], k=2, w_kw=0.0)[0]["id"], "vec")
+        self.assertEqual(ch._rank([dict(it) for it in items], k=2, w_kw=0.5)[0]["id"], "lex")
+
+    def test_empty_pool(self):
+        self.assertEqual(ch._rank([], k=5), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_circuit_breaker.py
+=============================
+Tests for core/circuit_breaker.py and the domain breaker in core/web_tools.
+"""
+
+import sys
+import os
+import time
+import unittest
+from unittest import mock
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.circuit_breaker import (
+    CircuitBreaker,
+    BreakerRegistry,
+    CLOSED,
+    OPEN,
+    HALF_OPEN,
+)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """State machine: closed → open → half_open → closed/open."""
+
+    def test_opens_after_threshold(self):
+        br = CircuitBreaker("x", failure_threshold=3, cooldown_s=60)
+        for _ in range(2):
+            br.record_failure("boom")
+            self.assertTrue(br.allow())
+        br.record_failure("boom")
+        self.assertEqual(br.state, OPEN)
+        self.assertFalse(br.allow())
+        self.assertEqual(br.snapshot()["skipped"], 1)
+
+    def test_success_resets_counter(self):
+        br = CircuitBreaker("x", failure_threshold=2, cooldown_s=60)
+        br.record_failure()
+        br.record_success()
+        br.record_failure()
+        self.assertEqual(br.state, CLOSED)
+
+    def test_half_open_single_probe(self):
+        br = CircuitBreaker("x", failure_threshold=1, cooldown_s=0.05)
+        br.record_failure()
+        self.assertFalse(br.allow())
+        time.sleep(0.06)
+        self.assertEqual(br.state, HALF_OPEN)
+        self.assertTrue(br.allow())   # probe
+        self.assertFalse(br.allow())  # only one probe in flight
+        br.record_success()
+        self.assertEqual(br.state, CLOSED)
+        self.assertTrue(br.allow())
+
+    def test_failed_probe_reopens(self):
+        br = CircuitBreaker("x", failure_threshold=1, cooldown_s=0.05)
+        br.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(br.allow())
+        br.record_failure("still down")
+        self.assertTrue(br.is_open())
+        self.assertEqual(br.snapshot()["trips"], 2)
+
+    def test_release_frees_probe(self):
+        br = CircuitBreaker("x", failure_threshold=1, cooldown_s=0.05)
+        br.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(br.allow())
+        br.release()
+        self.assertTrue(br.allow())
+
+
+class TestBreakerRegistry(unittest.TestCase):
+    """Registry creation, LRU eviction and snapshot."""
+
+    def test_same_breaker_per_name(self):
+        reg = BreakerRegistry(3, 10.0)
+        self.assertIs(reg.get("Example.com"), reg.get("example.com"))
+
+    def test_eviction_prefers_closed(self):
+        reg = BreakerRegistry(1, 60.0, max_entries=2)
+        reg.get("bad").record_failure()
+        reg.get("a")
+        reg.get("b")
+        snap = reg.snapshot()
+        self.assertIn("bad", snap)
+        self.assertEqual(len(snap), 2)
+
+    def test_snapshot_only_unhealthy(self):
+        reg = BreakerRegistry(2, 60.0)
+        reg.get("ok")
+        reg.get("flaky").record_failure()
+        self.assertEqual(list(reg.snapshot(only_unhealthy=True)), ["flaky"])
+
+
+class TestDomainBreakerInWebTools(unittest.TestCase):
+    """core/web_tools._http_get skips domains with an open circuit."""
+
+    def test_open_domain_skips_network(self):
+        import requests
+        import core.web_tools as wt
+
+        reg = BreakerRegistry(2, 60.0)
+        session = mock.Mock()
+        session.get.side_effect = requests.ConnectionError("down")
+        with mock.patch.object(wt, "DOMAIN_BREAKERS", reg), \
+             mock.patch.object(wt, "_get_http_session", return_value=session):
+            for _ in range(4):
+                self.assertIsNone(wt._http_get("https://down.example.com/a", 1.0))
+        self.assertEqual(session.get.call_count, 2)
+        self.assertEqual(reg.get("down.example.com").state, OPEN)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_domain_cache.py
+==========================
+Tests for the content cache (core/advanced_cache.DomainCache) wired into
+backend/parallel_fetch_optimizer, with ETag revalidation against a local
+aiohttp server.
+"""
+
+import sys
+import os
+import json
+import unittest
+import asyncio
+from datetime import datetime, timedelta
+from unittest import mock
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.web_tools as wt
+from core.advanced_cache import DomainCache, canonical_url
+from core.circuit_breaker import BreakerRegistry
+from backend.parallel_fetch_optimizer import parallel_fetch_and_extract
+
+try:
+    from aiohttp import web
+except ImportError:  # pragma: no cover
+    web = None
+
+_ARTICLE = (
+    "<html><head><title>T</title></head><body><article>"
+    + "<p>Contenuto dell'articolo abbastanza lungo per superare le soglie minime.</p>" * 10
+    + "</article></body></html>"
+)
+
+
+class FakeRedis:
+    """Just enough of redis-py for DomainCache."""
+
+    def __init__(self):
+        self.store = {}
+        self.expiry = {}
+        self.pipelines = 0
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def setex(self, key, ttl, value):
+        self.store[key] = value.encode("utf-8") if isinstance(value, str) else value
+        self.expiry[key] = ttl
+
+    def delete(self, key):
+        return 1 if self.store.pop(key, None) is not None else 0
+
+    def pipeline(self):
+        self.pipelines += 1
+        outer = self
+
+        class _Pipe:
+            def __init__(self):
+                self.keys = []
+
+            def get(self, key):
+                self.keys.append(key)
+
+            def execute(self):
+                return [outer.store.get(k) for k in self.keys]
+
+        return _Pipe()
+
+
+def _age(cache: DomainCache, url: str, category: str, seconds: int) -> None:
+    """Move an entry's cached_at into the past."""
+    key = cache._key(url, category)
+    entry = json.loads(cache.redis.store[key])
+    entry["cached_at"] = (datetime.now() - timedelta(seconds=seconds)).isoformat()
+    cache.redis.store[key] = json.dumps(entry).encode("utf-8")
+
+
+class TestCanonicalUrl(unittest.TestCase):
+
+    def test_tracking_params_fragment_and_case(self):
+        self.assertEqual(
+            canonical_url("HTTPS://Example.COM:443/News/?utm_source=x&b=2&a=1&fbclid=z#top"),
+            "https://example.com/News?a=1&b=2",
+        )
+
+    def test_same_key_for_equivalent_urls(self):
+        cache = DomainCache(FakeRedis())
+        self.assertEqual(
+            cache._key("https://example.com/a/?utm_medium=m"),
+            cache._key("https://EXAMPLE.com/a"),
+        )
+        self.assertNotEqual(
+            cache._key("https://example.com/p?id=1"),
+            cache._key("https://example.com/p?id=2"),
+        )
+
+
+class TestDomainCacheEntries(unittest.TestCase):
+
+    def test_stale_entry_kept_for_revalidation(self):
+        redis = FakeRedis()
+        cache = DomainCache(redis)
+        cache.set("https://e.com/a", "testo", {}, "price", etag='"v1"')
+        key = cache._key("https://e.com/a", "price")
+        self.assertGreater(redis.expiry[key], 60)  # TTL + revalidation window
+
+        _age(cache, "https://e.com/a", "price", 120)
+        self.assertIsNone(cache.get("https://e.com/a", "price"))
+        entry = cache.get("https://e.com/a", "price", include_stale=True)
+        self.assertTrue(entry["stale"])
+        self.assertEqual(entry["etag"], '"v1"')
+
+    def test_bulk_check_single_pipeline(self):
+        redis = FakeRedis()
+        cache = DomainCache(redis)
+        cache.set("https://e.com/a", "A", {}, "generic")
+        out = cache.bulk_check(["https://e.com/a", "https://e.com/b"], "generic")
+        self.assertEqual(redis.pipelines, 1)
+        self.assertEqual(out["https://e.com/a"]["content"], "A")
+        self.assertIsNone(out["https://e.com/b"])
+
+
+@unittest.skipUnless(web is not None and wt.AIOHTTP_AVAILABLE, "aiohttp not installed")
+class TestPipelineContentCache(unittest.TestCase):
+
+    def setUp(self):
+        self.hits = {"200": 0, "304": 0}
+        self._patch = mock.patch.object(wt, "DOMAIN_BREAKERS", BreakerRegistry(3, 60.0))
+        self._patch.start()
+
+    def tearDown(self):
+        self._patch.stop()
+
+    async def _serve(self, coro_fn):
+        async def page(request):
+            if request.headers.get("If-None-Match") == '"v1"':
+                self.hits["304"] += 1
+                return web.Response(status=304)
+            self.hits["200"] += 1
+            return web.Response(text=_ARTICLE, content_type="text/html", headers={"ETag": '"v1"'})
+
+        app = web.Application()
+        app.router.add_get("/a", page)
+        app.router.add_get("/b", page)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            return await coro_fn(f"http://127.0.0.1:{port}")
+        finally:
+            await wt.close_http_session()
+            await runner.cleanup()
+
+    def test_fresh_hits_skip_fetch_and_stale_revalidates(self):
+        cache = DomainCache(FakeRedis())
+
+        async def run(base):
+            items = [{"url": f"{base}/a", "title": "a"}, {"url": f"{base}/b", "title": "b"}]
+            first = await parallel_fetch_and_extract(
+                items, timeout_per_url=3.0, min_successful=0, domain_cache=cache, category="price"
+            )
+            second = await parallel_fetch_and_extract(
+                items, timeout_per_url=3.0, min_successful=0, domain_cache=cache, category="price"
+            )
+            _age(cache, f"{base}/a", "price", 120)
+            third = await parallel_fetch_and_extract(
+                items, timeout_per_url=3.0, min_successful=0, domain_cache=cache, category="price"
+            )
+            return first, second, third
+
+        first, second, third = asyncio.run(self._serve(run))
+
+        self.assertEqual(first[1]["cache_hits"], 0)
+        self.assertEqual(len(first[0]), 2)
+        # second round: everything fresh, no request at all
+        self.assertEqual(second[1]["cache_hits"], 2)
+        self.assertEqual(second[1]["attempted"], 0)
+        self.assertEqual(self.hits["200"], 2)
+        # third round: /a expired → conditional GET → 304, extract reused
+        self.assertEqual(third[1]["revalidated"], 1)
+        self.assertEqual(self.hits, {"200": 2, "304": 1})
+        texts = {d["url"].rsplit("/", 1)[-1]: d for d in third[0]}
+        self.assertTrue(texts["a"]["revalidated"])
+        self.assertIn("Contenuto dell'articolo", texts["a"]["text"])
+
+    def test_cache_hits_satisfy_early_exit(self):
+        cache = DomainCache(FakeRedis())
+        cache.set("http://x.invalid/1", "x" * 200, {}, "generic")
+        cache.set("http://x.invalid/2", "y" * 200, {}, "generic")
+        items = [{"url": f"http://x.invalid/{i}"} for i in (1, 2, 3)]
+        docs, stats = asyncio.run(
+            parallel_fetch_and_extract(items, min_successful=2, domain_cache=cache)
+        )
+        self.assertEqual(len(docs), 2)
+        self.assertEqual(stats["attempted"], 0)
+        self.assertTrue(stats["early_exit"])
+
+    def test_failed_fetch_is_not_counted_or_cached(self):
+        cache = DomainCache(FakeRedis())
+        url = "https://news.example.com/2025/11/articolo-molto-lungo-sulle-quote-della-partita"
+        items = [{"url": url, "title": "t"}]
+        failing = mock.AsyncMock(side_effect=ConnectionError("refused"))
+        with mock.patch.object(wt, "_http_get_async", failing), \
+                mock.patch.object(wt, "_http_get", side_effect=ConnectionError("refused")):
+            docs, stats = asyncio.run(
+                parallel_fetch_and_extract(items, timeout_per_url=3.0, min_successful=0, domain_cache=cache)
+            )
+        self.assertEqual(docs, [])
+        self.assertEqual((stats["ok"], stats["errors"]), (0, 1))
+        self.assertEqual(cache.redis.store, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
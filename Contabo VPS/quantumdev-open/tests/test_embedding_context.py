@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_embedding_context.py
+===============================
+Tests for core/embedding_context: one embedding per text per request,
+shared by the semantic cache get/set path, propagated to worker threads
+and isolated between requests.
+"""
+
+import sys
+import os
+import asyncio
+import unittest
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.semantic_cache as sc
+from core.embedding_context import EmbeddingContext, cached_embedding, current_context, embedding_scope
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from test_semantic_cache import FakeEmbedder  # noqa: E402
+
+
+class CountingEmbedder(FakeEmbedder):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def encode(self, text):
+        self.calls += 1
+        return super().encode(text)
+
+
+def _cache():
+    cache = sc.SemanticCache(threshold=0.9, ttl_s=3600, max_items=100, max_items_per_ns=100, persist_dir="")
+    cache._emb = CountingEmbedder()
+    return cache
+
+
+class TestEmbeddingContext(unittest.TestCase):
+
+    def test_semcache_encodes_once_per_request(self):
+        cache = _cache()
+        with embedding_scope():
+            self.assertIsNone(cache.get("meteo roma domani", "ns"))
+            cache.set("meteo roma domani", {"r": 1}, "ns")  # dual-write: due namespace
+            cache.set("meteo roma domani", {"r": 1}, "other")
+        self.assertEqual(cache._emb.calls, 1)
+
+    def test_no_scope_computes_every_time(self):
+        cache = _cache()
+        cache.get("q", "ns")
+        cache.get("q", "ns")
+        self.assertEqual(cache._emb.calls, 2)
+        self.assertIsNone(current_context())
+
+    def test_requests_are_isolated(self):
+        calls = []
+        for _ in range(2):
+            with embedding_scope():
+                cached_embedding("ciao", "m", lambda t: calls.append(t) or [1.0])
+                cached_embedding("ciao", "m", lambda t: calls.append(t) or [1.0])
+        self.assertEqual(len(calls), 2)
+
+    def test_model_is_part_of_key(self):
+        with embedding_scope():
+            a = cached_embedding("x", "model-a", lambda t: "a")
+            b = cached_embedding("x", "model-b", lambda t: "b")
+        self.assertEqual((a, b), ("a", "b"))
+
+    def test_nested_scope_reuses_outer(self):
+        with embedding_scope() as outer:
+            with embedding_scope() as inner:
+                self.assertIs(inner, outer)
+            self.assertIs(current_context(), outer)
+        self.assertIsNone(current_context())
+
+    def test_propagates_to_threads_and_tasks(self):
+        calls = []
+
+        def compute(t):
+            calls.append(t)
+            return [0.0]
+
+        async def request():
+            with embedding_scope():
+                await asyncio.to_thread(cached_embedding, "q", "m", compute)
+                await asyncio.gather(
+                    asyncio.create_task(asyncio.to_thread(cached_embedding, "q", "m", compute)),
+                    asyncio.to_thread(cached_embedding, "q", "m", compute),
+                )
+
+        asyncio.run(request())
+        self.assertEqual(calls, ["q"])
+
+    def test_keys_match_embedding_service(self):
+        from core.embedding_service import EmbeddingService
+
+        self.assertEqual(EmbeddingContext.key("ciao", "m"), ("m", EmbeddingService._key("ciao")))
+
+    def test_lru_bound(self):
+        with embedding_scope(max_items=2) as ctx:
+            for t in ("a", "b", "c"):
+                cached_embedding(t, "m", lambda x: x)
+            self.assertIsNone(ctx.get("a", "m"))
+            self.assertEqual(ctx.get("c", "m"), "c")
+
+
+if __name__ == "__main__":
+    unittest.main()
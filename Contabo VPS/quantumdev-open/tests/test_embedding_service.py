@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_embedding_service.py
+===============================
+Tests for core/embedding_service: global LRU, batch window across
+concurrent callers and one model per process. The SentenceTransformer is
+faked with a model that records its batch sizes.
+"""
+
+import sys
+import os
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+import zlib
+
+import numpy as np
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.embedding_service as es
+
+
+class FakeModel:
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, normalize_embeddings=True):
+        self.batches.append(len(texts))
+        out = []
+        for t in texts:
+            v = np.random.default_rng(zlib.crc32(t.encode())).standard_normal(8)
+            out.append(v / np.linalg.norm(v))
+        return np.array(out)
+
+
+def _service(**kw):
+    model = FakeModel()
+    return es.EmbeddingService("fake", model=model, **kw), model
+
+
+class TestEmbeddingService(unittest.TestCase):
+
+    def test_lru_hits_skip_model(self):
+        svc, model = _service()
+        a = svc.encode_one("ciao")
+        b = svc.encode_one("ciao")
+        self.assertIs(a, b)
+        self.assertEqual(model.batches, [1])
+        self.assertEqual(svc.stats()["hits"], 1)
+        self.assertFalse(a.flags.writeable)
+
+    def test_duplicates_in_one_call_encoded_once(self):
+        svc, model = _service()
+        vecs = svc.encode(["x", "y", "x"])
+        self.assertEqual(model.batches, [2])
+        self.assertIs(vecs[0], vecs[2])
+
+    def test_lru_is_bounded(self):
+        svc, _ = _service(cache_size=2)
+        svc.encode(["a", "b", "c"])
+        self.assertEqual(svc.stats()["cache_items"], 2)
+
+    def test_concurrent_encodes_share_one_batch(self):
+        svc, model = _service(window_ms=200)
+        barrier = threading.Barrier(6)
+
+        def call(i):
+            barrier.wait()
+            svc.encode_one(f"testo {i}")
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(sum(model.batches), 6)
+        self.assertLessEqual(len(model.batches), 2)  # tutti (o quasi) nello stesso forward pass
+
+    def test_async_encodes_share_one_batch_without_blocking_loop(self):
+        svc, model = _service(window_ms=200)
+
+        async def main():
+            ticks = []
+
+            async def ticker():
+                while True:
+                    ticks.append(time.perf_counter())
+                    await asyncio.sleep(0.01)
+
+            t = asyncio.ensure_future(ticker())
+            vecs = await asyncio.gather(*(svc.encode_one_async(f"testo {i}") for i in range(6)))
+            t.cancel()
+            return vecs, ticks
+
+        vecs, ticks = asyncio.run(main())
+        self.assertEqual(len(vecs), 6)
+        self.assertEqual(model.batches, [6])  # un solo forward pass
+        self.assertGreater(len(ticks), 5)     # il loop ha girato durante la batch window
+        self.assertIs(asyncio.run(svc.encode_one_async("testo 3")), vecs[3])  # dalla LRU
+        self.assertEqual(model.batches, [6])
+
+    def test_one_service_and_model_per_process(self):
+        self.assertEqual(es.canonical_model_name("all-MiniLM-L6-v2"),
+                         "sentence-transformers/all-MiniLM-L6-v2")
+        a = es.get_embedding_service("all-MiniLM-L6-v2")
+        b = es.get_embedding_service("sentence-transformers/all-MiniLM-L6-v2")
+        self.assertIs(a, b)
+
+        loads = []
+        with mock.patch.object(es, "SentenceTransformer", side_effect=lambda n: loads.append(n) or FakeModel()), \
+                mock.patch.dict(es._MODELS, clear=True):
+            m1 = es.get_sentence_model("m")
+            m2 = es.get_sentence_model("sentence-transformers/m")
+        self.assertIs(m1, m2)
+        self.assertEqual(loads, ["sentence-transformers/m"])
+
+
+if __name__ == "__main__":
+    unittest.main()
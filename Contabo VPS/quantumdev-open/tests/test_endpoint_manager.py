@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_endpoint_manager.py
+==============================
+Tests for core/endpoint_manager: probing of configured LLM endpoints,
+routing to the fastest healthy one, passive failure reports, config
+invalidation over Redis pub/sub and chat_engine failover through it.
+Uses local aiohttp servers on 127.0.0.1.
+"""
+
+import sys
+import os
+import queue
+import unittest
+import asyncio
+from unittest import mock
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.llm_client as lc
+import core.endpoint_manager as em
+
+try:
+    from aiohttp import web
+except ImportError:  # pragma: no cover
+    web = None
+
+DEAD = "http://127.0.0.1:1/v1/chat/completions"
+
+
+def _app(delay=0.0, hits=None):
+    async def models(request):
+        await asyncio.sleep(delay)
+        return web.json_response({"data": [{"id": "m"}]})
+
+    async def chat(request):
+        if hits is not None:
+            hits.append(request.path)
+        return web.json_response({"choices": [{"message": {"content": "ok"}}]})
+
+    app = web.Application()
+    app.router.add_get("/v1/models", models)
+    app.router.add_post("/v1/chat/completions", chat)
+    return app
+
+
+async def _with_servers(apps, coro):
+    runners, urls = [], []
+    for app in apps:
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        runners.append(runner)
+        urls.append(f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1/chat/completions")
+    try:
+        return await coro(urls)
+    finally:
+        await lc.close_llm_client()
+        for r in runners:
+            await r.cleanup()
+
+
+class FakePubSub:
+    def __init__(self, bus):
+        self.bus = bus
+
+    def subscribe(self, channel):
+        self.channel = channel
+
+    def listen(self):
+        while True:
+            msg = self.bus.get()
+            if msg is None:
+                return
+            yield {"type": "message", "data": msg}
+
+    def close(self):
+        self.bus.put(None)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.bus = queue.Queue()
+        self.published = []
+
+    def pubsub(self, ignore_subscribe_messages=True):
+        return FakePubSub(self.bus)
+
+    def publish(self, channel, msg):
+        self.published.append((channel, msg))
+        self.bus.put(msg)
+
+
+@unittest.skipUnless(web is not None and (lc.HTTPX_AVAILABLE or lc.AIOHTTP_AVAILABLE),
+                     "async HTTP client not installed")
+class TestEndpointManager(unittest.TestCase):
+
+    def test_dead_endpoint_is_skipped_after_probe(self):
+        async def run(urls):
+            mgr = em.EndpointManager(lambda: [DEAD, urls[0]], timeout_s=1)
+            self.assertEqual(mgr.endpoints(), [DEAD, urls[0]])  # mai sondati: ordine configurato
+            await mgr.probe_all()
+            return mgr, urls
+
+        mgr, urls = asyncio.run(_with_servers([_app()], run))
+        self.assertEqual(mgr.endpoints(), [urls[0]])
+        snap = {e["url"]: e for e in mgr.snapshot()["endpoints"]}
+        self.assertFalse(snap[DEAD]["healthy"])
+        self.assertTrue(snap[urls[0]]["healthy"])
+        self.assertIsNotNone(snap[urls[0]]["latency_ms"])
+
+    def test_fastest_healthy_first(self):
+        async def run(urls):
+            mgr = em.EndpointManager(lambda: list(urls), timeout_s=2)
+            await mgr.probe_all()
+            return mgr.endpoints(), urls
+
+        order, urls = asyncio.run(_with_servers([_app(delay=0.15), _app()], run))
+        self.assertEqual(order, [urls[1], urls[0]])
+
+    def test_all_down_still_returns_endpoints(self):
+        async def run(urls):
+            mgr = em.EndpointManager(lambda: [DEAD], timeout_s=1)
+            await mgr.probe_all()
+            return mgr.endpoints()
+
+        self.assertEqual(asyncio.run(_with_servers([], run)), [DEAD])
+
+    def test_passive_report(self):
+        mgr = em.EndpointManager(lambda: ["a", "b"])
+        mgr.report("a", False, lc.LLMHTTPError(400, "bad payload"))
+        self.assertEqual(mgr.endpoints(), ["a", "b"])  # 4xx: colpa della richiesta
+        mgr.report("a", False, ConnectionError("refused"))
+        self.assertEqual(mgr.endpoints(), ["b"])
+        mgr.report("a", True)
+        self.assertEqual(mgr.endpoints(), ["a", "b"])
+
+    def test_pubsub_invalidation(self):
+        config = ["a"]
+        fake = FakeRedis()
+
+        async def run():
+            mgr = em.EndpointManager(lambda: list(config), redis_client=fake, interval_s=60)
+            self.assertEqual(mgr.endpoints(), ["a"])
+            with mock.patch.object(mgr, "_probe", mock.AsyncMock()):
+                await mgr.start()
+                config.append("b")
+                fake.publish(em.LLM_EP_CHANNEL, "update")  # da un altro worker
+                for _ in range(100):
+                    if mgr.endpoints() == ["a", "b"]:
+                        break
+                    await asyncio.sleep(0.01)
+                await mgr.stop()
+            return mgr.endpoints()
+
+        self.assertEqual(asyncio.run(run()), ["a", "b"])
+
+    def test_chat_engine_fails_over_via_manager(self):
+        import core.chat_engine as ce
+
+        hits = []
+
+        async def run(urls):
+            mgr = em.EndpointManager(lambda: [DEAD, urls[0]], timeout_s=1)
+            em.set_endpoint_manager(mgr)
+            try:
+                with mock.patch.object(ce, "RETRY_BACKOFF_S", 0):
+                    first = await ce.reply_with_llm("ciao", "persona")
+                    routed = mgr.endpoints()  # il fallimento passivo ha escluso DEAD
+                    second = await ce.reply_with_llm("ciao", "persona")
+            finally:
+                em.set_endpoint_manager(None)
+            return first, second, routed, urls
+
+        first, second, routed, urls = asyncio.run(_with_servers([_app(hits=hits)], run))
+        self.assertEqual((first, second), ("ok", "ok"))
+        self.assertEqual(routed, [urls[0]])
+        self.assertEqual(len(hits), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,6 +10,7 @@ import sys
 import os
 import unittest
 import asyncio
+from unittest import mock
 from typing import List, Dict, Any
 
 # Add project root to path
@@ -220,6 +221,54 @@ class TestEpisodicMemory(unittest.TestCase):
             pass
 
 
+class TestBackgroundSummarization(unittest.TestCase):
+    """Summarization detached from the reply path (record_conversation_turn(background=True))."""
+
+    def test_reply_does_not_wait_for_summary(self):
+        import core.episodic_memory as epm
+        import core.memory_manager as mm
+
+        conv = "test_conv_bg_summary"
+        saved: List[str] = []
+
+        class FakeCollection:
+            def add(self, ids, documents, metadatas):
+                saved.append(documents[0])
+
+        async def run():
+            gate = asyncio.Event()
+
+            async def slow_llm(prompt, persona):
+                await gate.wait()
+                return "riassunto"
+
+            for i in range(3):
+                res = await mm.record_conversation_turn(
+                    conv, f"domanda {i}", f"risposta {i}", llm_func=slow_llm, background=True
+                )
+            self.assertTrue(res["summarizing"])
+            self.assertEqual(saved, [])  # la risposta non ha atteso il riassunto
+            await asyncio.sleep(0)  # il task di riassunto parte (snapshot del buffer)
+            # turno arrivato mentre il riassunto è in corso: resta nel buffer
+            await mm.record_conversation_turn(
+                conv, "domanda 3", "risposta 3", llm_func=slow_llm, background=True
+            )
+            gate.set()
+            await asyncio.gather(*mm._background_tasks)
+            return [t["user"] for t in epm._conversation_buffers[conv]]
+
+        with mock.patch.object(epm, "EPISODIC_BUFFER_SIZE", 3), \
+                mock.patch.object(epm, "EPISODIC_BUFFER_TOKEN_LIMIT", 1), \
+                mock.patch.object(epm, "_get_chroma_collection", return_value=FakeCollection()):
+            try:
+                remaining = asyncio.run(run())
+            finally:
+                clear_conversation_buffer(conv)
+
+        self.assertEqual(saved, ["riassunto"])
+        self.assertEqual(remaining, ["domanda 3"])
+
+
 if __name__ == "__main__":
     # Run tests
     unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_extraction_pool.py
+=============================
+Tests for the process-pool extraction stage in core/robust_content_extraction.
+"""
+
+import sys
+import os
+import time
+import unittest
+import asyncio
+import threading
+from unittest import mock
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.robust_content_extraction as rce
+
+_PARAGRAPH = "<p>Il contenuto principale della pagina di test è abbastanza lungo da estrarre.</p>"
+_SMALL = f"<html><body><article>{_PARAGRAPH * 5}</article></body></html>"
+_LARGE = f"<html><body><article>{_PARAGRAPH * 2000}</article></body></html>"
+
+
+def _expected(html, url):
+    """Risultato sync, con i placeholder di fallimento resi come stringa vuota."""
+    text = rce.extract_content_robust(html, url)
+    return "" if text.startswith("[Contenuto") else text
+
+
+class TestExtractionPool(unittest.TestCase):
+
+    def setUp(self):
+        rce._reset_pool()
+        for key in rce.EXTRACTION_STATS:
+            rce.EXTRACTION_STATS[key] = 0
+
+    def tearDown(self):
+        rce.shutdown_extraction_pool()
+
+    def test_small_page_inline(self):
+        with mock.patch.object(rce, "_get_pool") as get_pool:
+            text = asyncio.run(rce.extract_content_async(_SMALL, "https://example.com/a"))
+        get_pool.assert_not_called()
+        self.assertEqual(text, _expected(_SMALL, "https://example.com/a"))
+        self.assertEqual(rce.EXTRACTION_STATS["inline"], 1)
+
+    def test_small_page_not_parsed_on_loop(self):
+        threads = []
+        real = rce.extract_content_robust
+
+        def spy(html, url):
+            threads.append(threading.get_ident())
+            return real(html, url)
+
+        with mock.patch.object(rce, "extract_content_robust", spy):
+            asyncio.run(rce.extract_content_async(_SMALL, "https://example.com/a"))
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())  # asyncio.run gira su questo thread
+
+    def test_large_page_in_pool_matches_sync(self):
+        url = "https://example.com/long"
+        text = asyncio.run(rce.extract_content_async(_LARGE, url, timeout=30.0))
+        self.assertEqual(text, _expected(_LARGE, url))
+        self.assertEqual(rce.EXTRACTION_STATS["pool"], 1)
+
+    def test_loop_stays_responsive(self):
+        """While the pool parses, the event loop keeps ticking."""
+        async def main():
+            # warm up the workers so the measurement only covers extraction
+            await rce.extract_content_async(_LARGE, "https://example.com/w", timeout=30.0)
+            ticks = 0
+            done = False
+
+            async def ticker():
+                nonlocal ticks
+                while not done:
+                    ticks += 1
+                    await asyncio.sleep(0.005)
+
+            t = asyncio.create_task(ticker())
+            t0 = time.perf_counter()
+            await rce.extract_content_async(_LARGE, "https://example.com/x", timeout=30.0)
+            elapsed = time.perf_counter() - t0
+            done = True
+            await t
+            return ticks, elapsed
+
+        ticks, elapsed = asyncio.run(main())
+        # at least half the expected ticks happened during extraction
+        self.assertGreater(ticks, int(elapsed / 0.005 * 0.5))
+
+    def test_timeout_returns_empty(self):
+        url = "https://slow.example.com/" + "a-very-long-article-slug/" * 6
+        text = asyncio.run(rce.extract_content_async(_LARGE, url, timeout=0.001))
+        self.assertEqual(text, "")
+        self.assertEqual(rce.EXTRACTION_STATS["timeouts"], 1)
+
+    def test_failure_placeholder_is_empty(self):
+        url = "https://example.com/" + "long-path-segment/" * 8
+        self.assertTrue(rce.extract_content_robust("<html></html>", url).startswith("[Contenuto"))
+        self.assertEqual(asyncio.run(rce.extract_content_async("<html></html>", url)), "")
+
+    def test_pool_disabled_uses_thread(self):
+        with mock.patch.object(rce, "EXTRACTION_POOL_ENABLED", False):
+            text = asyncio.run(rce.extract_content_async(_LARGE, "https://example.com/t"))
+        self.assertEqual(text, _expected(_LARGE, "https://example.com/t"))
+        self.assertEqual(rce.EXTRACTION_STATS["pool"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
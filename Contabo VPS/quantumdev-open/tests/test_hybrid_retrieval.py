@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_hybrid_retrieval.py
+==============================
+Tests for core/hybrid_retrieval: reciprocal-rank fusion of the Chroma
+vector query and the BM25 keyword index, where-filters on both branches,
+single-branch degradation and per-stage latency stats.
+"""
+
+import sys
+import os
+import unittest
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.hybrid_retrieval as hr
+from utils.keyword_index import KeywordIndex
+
+DOCS = {
+    "d1": ("Milan Inter derby quota 1.85", {"user_id": "u1", "ts": 1}),
+    "d2": ("risultati serie A weekend", {"user_id": "u1", "ts": 1}),
+    "d3": ("analisi tattica del derby", {"user_id": "u1", "ts": 1}),
+    "d4": ("Milan Inter derby quota 1.85", {"user_id": "u2", "ts": 1}),
+}
+
+
+class FakeCollection:
+    """Ramo vettoriale simulato: restituisce gli id in un ordine fisso."""
+
+    def __init__(self, order, fail=False):
+        self.order = order
+        self.fail = fail
+        self.kwargs = None
+
+    def query(self, **kwargs):
+        self.kwargs = kwargs
+        if self.fail:
+            raise RuntimeError("embedding missing")
+        where = kwargs.get("where") or {}
+        ids = [i for i in self.order if all(DOCS[i][1].get(k) == v for k, v in where.items())]
+        ids = ids[: kwargs["n_results"]]
+        return {
+            "ids": [ids],
+            "documents": [[DOCS[i][0] for i in ids]],
+            "metadatas": [[DOCS[i][1] for i in ids]],
+            "distances": [[0.1 * (r + 1) for r in range(len(ids))]],
+        }
+
+
+def _kw():
+    idx = KeywordIndex(path=":memory:")
+    idx.add("docs", list(DOCS), [d[0] for d in DOCS.values()], [d[1] for d in DOCS.values()])
+    return idx
+
+
+class TestRRF(unittest.TestCase):
+
+    def test_fuse(self):
+        fused = hr.rrf_fuse([["a", "b"], ["b", "c"]], rrf_k=60)
+        self.assertAlmostEqual(fused["b"], 1 / 62 + 1 / 61)
+        self.assertEqual(max(fused, key=fused.get), "b")
+
+    def test_candidate_pool(self):
+        self.assertEqual(hr.candidate_pool(3), max(hr.HYBRID_MIN_POOL, 6))
+        self.assertGreaterEqual(hr.candidate_pool(100), 100)
+
+
+class TestHybridQuery(unittest.TestCase):
+
+    def test_exact_identifier_missed_by_vectors_is_recalled(self):
+        # il ramo vettoriale non vede d1 tra i primi 2, BM25 sì ("1.85", "milan")
+        col = FakeCollection(["d2", "d3", "d1"])
+        out = hr.hybrid_query(col, "docs", "quota milan 1.85", n=2, qargs={"query_embeddings": [[0.0]]},
+                              kw=_kw(), where={"user_id": "u1"})
+        ids = [it["id"] for it in out]
+        self.assertIn("d1", ids)
+        d1 = out[ids.index("d1")]
+        self.assertIsNone(d1["vector_rank"])
+        self.assertEqual(d1["lexical_rank"], 1)
+        self.assertGreater(d1["bm25"], 0)
+        self.assertEqual(col.kwargs["where"], {"user_id": "u1"})
+        self.assertNotIn("d4", ids)  # where applicato anche al ramo lessicale
+
+    def test_both_branches_rank_first(self):
+        col = FakeCollection(["d1", "d2", "d3"])
+        out = hr.hybrid_query(col, "docs", "milan derby", n=3, qargs={}, kw=_kw(), where={"user_id": "u1"})
+        self.assertEqual(out[0]["id"], "d1")
+        self.assertEqual(out[0]["relevance"], 1.0)
+        self.assertEqual(out[0]["collection"], "docs")
+
+    def test_vector_failure_uses_lexical(self):
+        out = hr.hybrid_query(FakeCollection([], fail=True), "docs", "derby", n=5, qargs={}, kw=_kw())
+        self.assertEqual({it["id"] for it in out}, {"d1", "d3", "d4"})
+        self.assertTrue(all(it["similarity"] == 0.0 for it in out))
+
+    def test_both_fail_raises_vector_error(self):
+        with self.assertRaises(RuntimeError):
+            hr.hybrid_query(FakeCollection([], fail=True), "docs", "derby", n=5, qargs={}, kw=None)
+
+    def test_stats_per_stage(self):
+        hr.hybrid_query(FakeCollection(["d1"]), "docs", "milan", n=1, qargs={}, kw=_kw())
+        st = hr.hybrid_stats()
+        self.assertGreaterEqual(st["queries"], 1)
+        for stage in ("vector", "lexical", "fuse", "total"):
+            self.assertIn(f"{stage}_p95_ms", st)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_inference_executor.py
+================================
+Tests for core/inference_executor: batch coalescing, admission control,
+queue-wait metrics, caller timeouts and nested calls.
+"""
+
+import sys
+import os
+import time
+import threading
+import unittest
+import asyncio
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.inference_executor import InferenceExecutor, InferenceOverloadedError
+
+
+class TestInferenceExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.ex = InferenceExecutor(workers=1, queue_max=8, name="test")
+
+    def tearDown(self):
+        self.ex.shutdown()
+
+    def _block_worker(self):
+        """Occupa il worker finché l'evento non viene settato."""
+        gate = threading.Event()
+        started = threading.Event()
+
+        def blocker():
+            started.set()
+            gate.wait(5)
+
+        self.ex.submit(blocker)
+        started.wait(5)
+        return gate
+
+    def test_concurrent_small_batches_coalesce(self):
+        calls = []
+
+        def model(items):
+            calls.append(list(items))
+            return [x * 2 for x in items]
+
+        gate = self._block_worker()
+        futs = [self.ex.submit_batch("m", model, [i, i + 10]) for i in range(3)]
+        gate.set()
+        results = [f.result(5) for f in futs]
+
+        self.assertEqual(results, [[0, 20], [2, 22], [4, 24]])
+        self.assertEqual(calls, [[0, 10, 1, 11, 2, 12]])
+        self.assertEqual(self.ex.stats()["coalesced"], 2)
+
+    def test_linger_window_gathers_late_jobs(self):
+        calls = []
+
+        def model(items):
+            calls.append(list(items))
+            return items
+
+        first = self.ex.submit_batch("m", model, [1], linger_s=0.5)
+        time.sleep(0.05)  # worker libero: senza linger eseguirebbe subito [1]
+        second = self.ex.submit_batch("m", model, [2], linger_s=0.5)
+        self.assertEqual([first.result(5), second.result(5)], [[1], [2]])
+        self.assertEqual(calls, [[1, 2]])
+
+    def test_max_batch_and_keys_respected(self):
+        calls = []
+
+        def model(items):
+            calls.append(len(items))
+            return items
+
+        gate = self._block_worker()
+        a = self.ex.submit_batch("a", model, [1, 2, 3], max_batch=4)
+        b = self.ex.submit_batch("b", model, [4])
+        c = self.ex.submit_batch("a", model, [5, 6], max_batch=4)  # 3+2 > 4: non fuso
+        gate.set()
+        self.assertEqual([a.result(5), b.result(5), c.result(5)], [[1, 2, 3], [4], [5, 6]])
+        self.assertEqual(calls, [3, 1, 2])
+
+    def test_large_batch_is_chunked(self):
+        calls = []
+
+        def model(items):
+            calls.append(len(items))
+            return items
+
+        out = self.ex.run_batch("m", model, list(range(10)), max_batch=4)
+        self.assertEqual(out, list(range(10)))
+        self.assertEqual(calls, [4, 4, 2])
+
+    def test_queue_full_rejects(self):
+        ex = InferenceExecutor(workers=1, queue_max=1, name="tiny")
+        try:
+            gate = threading.Event()
+            started = threading.Event()
+            ex.submit(lambda: (started.set(), gate.wait(5)))
+            started.wait(5)
+            ex.submit(lambda: None)  # occupa l'unico posto in coda
+            with self.assertRaises(InferenceOverloadedError):
+                ex.submit(lambda: None)
+            self.assertEqual(ex.stats()["rejected"], 1)
+            gate.set()
+        finally:
+            ex.shutdown()
+
+    def test_batch_error_propagates_to_all(self):
+        def model(items):
+            raise ValueError("boom")
+
+        gate = self._block_worker()
+        futs = [self.ex.submit_batch("m", model, [i]) for i in range(2)]
+        gate.set()
+        for f in futs:
+            with self.assertRaises(ValueError):
+                f.result(5)
+
+    def test_queue_wait_metrics(self):
+        gate = self._block_worker()
+        fut = self.ex.submit(lambda: 1)
+        time.sleep(0.05)
+        gate.set()
+        fut.result(5)
+        st = self.ex.stats()
+        self.assertGreaterEqual(st["queue_wait_p95_ms"], 40)
+        self.assertEqual(st["queue_depth"], 0)
+
+    def test_timeout_cancels_queued_job(self):
+        gate = self._block_worker()
+        ran = []
+        with self.assertRaises(FutureTimeoutError):
+            self.ex.run_batch("k", lambda xs: ran.extend(xs) or xs, [1], timeout=0.05)
+        gate.set()
+        self.ex.run(lambda: None, timeout=5)  # il worker ha svuotato la coda
+        self.assertEqual(ran, [])
+
+    def test_nested_call_runs_inline(self):
+        def outer():
+            return self.ex.run(lambda: "inner") + "!"
+
+        self.assertEqual(self.ex.run(outer, timeout=5), "inner!")
+
+    def test_run_async(self):
+        async def main():
+            return await self.ex.run_async(sum, [1, 2, 3])
+
+        self.assertEqual(asyncio.run(main()), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_keyword_index.py
+===========================
+Tests for utils/keyword_index: BM25 lookup, re-index/delete consistency,
+one-time bootstrap, and the chroma_handler fallback answering from the
+index instead of scanning the collection.
+"""
+
+import sys
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.keyword_index import KeywordIndex, tokenize
+import utils.chroma_handler as ch
+
+
+def _index():
+    return KeywordIndex(path=":memory:")
+
+
+class TestKeywordIndex(unittest.TestCase):
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Milan-Inter | odds=1.85"), ["milan", "inter", "odds", "1", "85"])
+
+    def test_bm25_ranks_rarer_and_denser_terms_higher(self):
+        idx = _index()
+        idx.add("facts", ["a", "b", "c"], [
+            "milan inter derby milan",
+            "milan juventus",
+            "roma lazio derby",
+        ])
+        hits = idx.search("facts", "milan derby", limit=10)
+        self.assertEqual([h[0] for h in hits][0], "a")
+        self.assertEqual({h[0] for h in hits}, {"a", "b", "c"})
+        self.assertEqual(idx.search("facts", "napoli"), [])
+
+    def test_collections_are_separate(self):
+        idx = _index()
+        idx.add("facts", ["f1"], ["milan"])
+        idx.add("prefs", ["p1"], ["milan"])
+        self.assertEqual([h[0] for h in idx.search("facts", "milan")], ["f1"])
+
+    def test_reindex_and_delete(self):
+        idx = _index()
+        idx.add("facts", ["a"], ["milan inter"], [{"ts": 100}])
+        idx.add("facts", ["a"], ["roma lazio"], [{"ts": 100}])  # stesso id: sostituisce
+        self.assertEqual(idx.search("facts", "milan"), [])
+        self.assertEqual([h[0] for h in idx.search("facts", "roma")], ["a"])
+
+        idx.add("facts", ["b"], ["roma napoli"], [{"ts": int(time.time())}])
+        self.assertEqual(idx.delete_older_than("facts", threshold_ts=1000), 1)
+        self.assertEqual(idx.count("facts"), 1)
+        idx.delete("facts", ["b"])
+        self.assertEqual(idx.search("facts", "roma"), [])
+
+    def test_bm25_scores_for_subset(self):
+        idx = _index()
+        idx.add("facts", ["a", "b"], ["milan inter", "roma"])
+        scores = idx.bm25_scores("facts", "milan", ["a", "b"])
+        self.assertIn("a", scores)
+        self.assertNotIn("b", scores)
+
+    def test_ensure_built_scans_once_and_persists(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "kw.sqlite")
+            scans = []
+
+            def scan():
+                scans.append(1)
+                yield ["x"], ["quote milan"], [{"source": "user"}]
+
+            self.assertTrue(KeywordIndex(path).ensure_built("facts", scan))
+            reopened = KeywordIndex(path)
+            self.assertFalse(reopened.ensure_built("facts", scan))
+            self.assertEqual(len(scans), 1)
+            self.assertEqual(reopened.get_docs("facts", ["x"])["x"], ("quote milan", {"source": "user"}))
+
+
+class TestChromaFallback(unittest.TestCase):
+
+    def test_fallback_uses_index_not_collection_scan(self):
+        idx = _index()
+        idx.add(ch.FACTS, ["f1", "f2"], ["gpu = rtx 8000", "cpu = epyc"],
+                [{"source": "system", "ts": 1}, {"source": "system", "ts": 1}])
+        idx.ensure_built(ch.FACTS, lambda: iter(()))
+        col = mock.Mock()
+        with mock.patch.object(ch, "get_keyword_index", return_value=idx), \
+                mock.patch.object(ch, "_col", return_value=col):
+            items = ch._substring_fallback(ch.FACTS, "GPU", limit=10)
+        col.get.assert_not_called()
+        self.assertEqual([it["id"] for it in items], ["f1"])
+        self.assertEqual(items[0]["metadata"]["source"], "system")
+        self.assertGreater(items[0]["bm25"], 0)
+
+    def test_rank_uses_bm25_only_when_weighted(self):
+        items = [
+            {"id": "a", "similarity": 0.5, "bm25": 0.0, "metadata": {}},
+            {"id": "b", "similarity": 0.5, "bm25": 3.0, "metadata": {}},
+        ]
+        self.assertEqual(ch._rank([dict(i) for i in items], k=2, w_kw=0.0)[0]["id"], "a")
+        self.assertEqual(ch._rank([dict(i) for i in items], k=2, w_kw=0.2)[0]["id"], "b")
+
+
+if __name__ == "__main__":
+    unittest.main()
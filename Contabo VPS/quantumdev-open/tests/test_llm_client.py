@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_llm_client.py
+========================
+Tests for core/llm_client: connection reuse across LLM calls, the
+in-flight limit, HTTP errors, SSE streaming with time-to-first-token,
+and reply_with_llm / stream_with_llm / the LLM intent classifier going
+through it. Uses a local aiohttp server on 127.0.0.1.
+"""
+
+import sys
+import os
+import unittest
+import asyncio
+import json
+from unittest import mock
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.llm_client as lc
+
+try:
+    from aiohttp import web
+except ImportError:  # pragma: no cover
+    web = None
+
+
+def _app(state):
+    async def chat(request):
+        state["peers"].add(request.transport.get_extra_info("peername"))
+        state["active"] += 1
+        state["max_active"] = max(state["max_active"], state["active"])
+        await asyncio.sleep(float(request.query.get("delay", "0")))
+        state["active"] -= 1
+        body = await request.json()
+        return web.json_response({"choices": [{"message": {"content": f"echo:{body['messages'][-1]['content']}"}}]})
+
+    async def down(request):
+        return web.Response(status=503, text="overloaded")
+
+    async def stream(request):
+        body = await request.json()
+        state["stream_payloads"].append(body)
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        await resp.write(b": keep-alive\n\n")
+        await resp.write(b'data: {"choices":[{"delta":{"role":"assistant"}}]}\n\n')
+        for tok in ("Ciao", " mondo", "!"):
+            await asyncio.sleep(0.01)
+            chunk = json.dumps({"choices": [{"delta": {"content": tok}}]})
+            await resp.write(f"data: {chunk}\n\n".encode())
+            if request.query.get("cut") and tok == " mondo":
+                request.transport.close()
+                return resp
+        await resp.write(b"data: [DONE]\n\n")
+        return resp
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat)
+    app.router.add_post("/down", down)
+    app.router.add_post("/stream", stream)
+    return app
+
+
+async def _serve(state, coro):
+    runner = web.AppRunner(_app(state))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        return await coro(f"http://127.0.0.1:{port}")
+    finally:
+        await lc.close_llm_client()
+        await runner.cleanup()
+
+
+def _payload(text="ciao"):
+    return {"model": "m", "messages": [{"role": "user", "content": text}]}
+
+
+@unittest.skipUnless(web is not None and (lc.HTTPX_AVAILABLE or lc.AIOHTTP_AVAILABLE),
+                     "async HTTP client not installed")
+class TestLLMClient(unittest.TestCase):
+
+    def setUp(self):
+        self.state = {"peers": set(), "active": 0, "max_active": 0, "stream_payloads": []}
+
+    def test_keep_alive_reuses_connection(self):
+        async def run(base):
+            out = []
+            for i in range(5):
+                out.append(await lc.post_json(f"{base}/v1/chat/completions", _payload(str(i)), timeout=5))
+            return out
+
+        out = asyncio.run(_serve(self.state, run))
+        self.assertEqual(out[4]["choices"][0]["message"]["content"], "echo:4")
+        self.assertEqual(len(self.state["peers"]), 1)
+
+    def test_inflight_limit(self):
+        async def run(base):
+            url = f"{base}/v1/chat/completions?delay=0.05"
+            await asyncio.gather(*(lc.post_json(url, _payload(), timeout=5) for _ in range(6)))
+
+        with mock.patch.object(lc, "LLM_MAX_INFLIGHT", 2):
+            asyncio.run(_serve(self.state, run))
+        self.assertEqual(self.state["max_active"], 2)
+
+    def test_http_error(self):
+        async def run(base):
+            await lc.post_json(f"{base}/down", _payload(), timeout=5)
+
+        with self.assertRaises(lc.LLMHTTPError) as ctx:
+            asyncio.run(_serve(self.state, run))
+        self.assertEqual(ctx.exception.status, 503)
+        self.assertIn("overloaded", str(ctx.exception))
+
+    def test_reply_with_llm_uses_shared_client(self):
+        import core.chat_engine as ce
+
+        async def run(base):
+            with mock.patch.object(ce, "LLM_ENDPOINT", f"{base}/v1/chat/completions"):
+                return [await ce.reply_with_llm(f"q{i}", "persona") for i in range(3)]
+
+        out = asyncio.run(_serve(self.state, run))
+        self.assertEqual(out[2], "echo:q2")
+        self.assertEqual(len(self.state["peers"]), 1)
+
+    def test_stream_sse_events_and_ttft(self):
+        async def run(base):
+            return [ev async for ev in lc.stream_sse(f"{base}/stream", _payload(), timeout=5)]
+
+        before = lc.llm_client_stats()["streams"]
+        events = asyncio.run(_serve(self.state, run))
+        self.assertEqual(len(events), 4)  # role + 3 token, commenti e [DONE] esclusi
+        st = lc.llm_client_stats()
+        self.assertEqual(st["streams"], before + 1)
+        self.assertGreater(st["ttft_p95_ms"], 0)
+
+    def test_stream_with_llm_yields_deltas(self):
+        import core.chat_engine as ce
+
+        meta = {}
+
+        async def run(base):
+            with mock.patch.object(ce, "LLM_ENDPOINT", f"{base}/stream"):
+                return [d async for d in ce.stream_with_llm("ciao", "persona", meta=meta)]
+
+        deltas = asyncio.run(_serve(self.state, run))
+        self.assertEqual(deltas, ["Ciao", " mondo", "!"])
+        self.assertTrue(self.state["stream_payloads"][0]["stream"])
+        self.assertTrue(meta["endpoint"].endswith("/stream"))
+        self.assertIn("ttft_ms", meta)
+
+    def test_stream_fails_over_before_first_token(self):
+        import core.chat_engine as ce
+
+        meta = {}
+
+        async def run(base):
+            with mock.patch.object(ce, "RETRY_BACKOFF_S", 0):
+                return [d async for d in ce.stream_completion(
+                    _payload(), endpoints=[f"{base}/down", f"{base}/stream"], meta=meta)]
+
+        deltas = asyncio.run(_serve(self.state, run))
+        self.assertEqual("".join(deltas), "Ciao mondo!")
+        self.assertTrue(meta["endpoint"].endswith("/stream"))
+
+    def test_stream_error_after_first_token_is_not_retried(self):
+        import core.chat_engine as ce
+
+        got = []
+
+        async def run(base):
+            with mock.patch.object(ce, "RETRY_BACKOFF_S", 0):
+                async for d in ce.stream_completion(_payload(), endpoints=[f"{base}/stream?cut=1"]):
+                    got.append(d)
+
+        # connessione chiusa a metà body: errore di protocollo del backend HTTP in uso
+        cut = lc.httpx.RemoteProtocolError if lc.HTTPX_AVAILABLE else lc.aiohttp.ClientPayloadError
+        with self.assertRaises(cut):
+            asyncio.run(_serve(self.state, run))
+        self.assertEqual(got, ["Ciao", " mondo"])
+        self.assertEqual(len(self.state["stream_payloads"]), 1)
+
+    def test_intent_classifier_call_is_async(self):
+        from core.llm_intent_classifier import LLMIntentClassifier
+
+        clf = LLMIntentClassifier()
+
+        async def run(base):
+            clf.chat_url = f"{base}/v1/chat/completions"
+            return await clf._call_llm("meteo roma")
+
+        with mock.patch.object(LLMIntentClassifier, "_extract_json", return_value={"intent": "WEB_SEARCH"}):
+            parsed = asyncio.run(_serve(self.state, run))
+        self.assertEqual(parsed, {"intent": "WEB_SEARCH"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_llm_scheduler.py
+===========================
+Tests for the priority scheduler in core/llm_client: interactive requests
+overtake queued background jobs, the background slot cap, queue-full
+eviction, deadline shedding with LLMOverloadedError and reply_with_llm not
+retrying a request the scheduler has rejected.
+"""
+
+import sys
+import os
+import time
+import unittest
+import asyncio
+from unittest import mock
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.llm_client as lc
+
+
+async def _job(sched, prio, order, hold=0.02, deadline_s=None):
+    await sched.acquire(prio, deadline_s)
+    order.append(prio)
+    try:
+        await asyncio.sleep(hold)
+    finally:
+        sched.release(prio, hold)
+
+
+class TestLLMScheduler(unittest.TestCase):
+
+    def test_interactive_overtakes_background(self):
+        async def run():
+            sched = lc.LLMScheduler(capacity=1, background_cap=1, queue_max=10)
+            order = []
+            tasks = [asyncio.create_task(_job(sched, lc.PRIORITY_BACKGROUND, order)) for _ in range(3)]
+            await asyncio.sleep(0.005)  # il primo background occupa l'unico slot
+            tasks.append(asyncio.create_task(_job(sched, lc.PRIORITY_INTERACTIVE, order)))
+            await asyncio.gather(*tasks)
+            return order
+
+        order = asyncio.run(run())
+        self.assertEqual(order[:2], [lc.PRIORITY_BACKGROUND, lc.PRIORITY_INTERACTIVE])
+
+    def test_background_cap_leaves_room_for_interactive(self):
+        async def run():
+            sched = lc.LLMScheduler(capacity=4, background_cap=1, queue_max=10)
+            order, peak = [], []
+
+            async def watch():
+                while True:
+                    peak.append(sched.inflight_bg)
+                    await asyncio.sleep(0.002)
+
+            w = asyncio.create_task(watch())
+            bg = [asyncio.create_task(_job(sched, lc.PRIORITY_BACKGROUND, order)) for _ in range(4)]
+            await asyncio.sleep(0.005)
+            t0 = time.perf_counter()
+            await _job(sched, lc.PRIORITY_INTERACTIVE, order, hold=0)
+            waited = time.perf_counter() - t0
+            await asyncio.gather(*bg)
+            w.cancel()
+            return max(peak), waited
+
+        peak_bg, waited = asyncio.run(run())
+        self.assertEqual(peak_bg, 1)
+        self.assertLess(waited, 0.01)  # slot libero subito nonostante la coda background
+
+    def test_queue_full_evicts_lower_priority(self):
+        async def run():
+            sched = lc.LLMScheduler(capacity=1, background_cap=1, queue_max=1)
+            await sched.acquire(lc.PRIORITY_INTERACTIVE)
+            bg = asyncio.create_task(sched.acquire(lc.PRIORITY_BACKGROUND))
+            await asyncio.sleep(0)
+            it = asyncio.create_task(sched.acquire(lc.PRIORITY_INTERACTIVE))
+            await asyncio.sleep(0)
+            with self.assertRaises(lc.LLMOverloadedError) as ctx:
+                await bg
+            self.assertEqual(ctx.exception.priority, lc.PRIORITY_BACKGROUND)
+            # coda piena di pari priorità: il nuovo arrivato viene scartato subito
+            with self.assertRaises(lc.LLMOverloadedError):
+                await sched.acquire(lc.PRIORITY_INTERACTIVE)
+            sched.release(lc.PRIORITY_INTERACTIVE, 0.01)
+            await it
+            sched.release(lc.PRIORITY_INTERACTIVE, 0.01)
+            return sched.snapshot()
+
+        snap = asyncio.run(run())
+        self.assertEqual((snap["inflight"], snap["queued"]), (0, 0))
+
+    def test_deadline_sheds_fast(self):
+        async def run():
+            sched = lc.LLMScheduler(capacity=1, background_cap=1, queue_max=10)
+            await sched.acquire(lc.PRIORITY_NORMAL)
+            t0 = time.perf_counter()
+            with self.assertRaises(lc.LLMOverloadedError):
+                await sched.acquire(lc.PRIORITY_INTERACTIVE, deadline_s=0.05)
+            timed_out = time.perf_counter() - t0
+            # con una stima di servizio nota, lo scarto avviene senza attendere
+            sched.service_ewma_s = 5.0
+            t0 = time.perf_counter()
+            with self.assertRaises(lc.LLMOverloadedError):
+                await sched.acquire(lc.PRIORITY_INTERACTIVE, deadline_s=1.0)
+            early = time.perf_counter() - t0
+            sched.release(lc.PRIORITY_NORMAL, None)
+            return timed_out, early, sched.snapshot()
+
+        timed_out, early, snap = asyncio.run(run())
+        self.assertLess(timed_out, 0.5)
+        self.assertLess(early, 0.01)
+        self.assertEqual((snap["inflight"], snap["queued"]), (0, 0))
+
+    def test_background_wait_uses_background_slots(self):
+        sched = lc.LLMScheduler(capacity=16, background_cap=4, queue_max=64)
+        sched.service_ewma_s = 1.0
+        self.assertAlmostEqual(sched._estimated_wait_s(lc._PRIORITIES[lc.PRIORITY_BACKGROUND]), 1 / 4)
+        self.assertAlmostEqual(sched._estimated_wait_s(lc._PRIORITIES[lc.PRIORITY_NORMAL]), 1 / 16)
+
+    def test_background_batch_bounded_by_slots_is_not_shed(self):
+        async def run():
+            sched = lc.LLMScheduler(capacity=16, background_cap=0, queue_max=64)
+            sem = asyncio.Semaphore(sched.background_cap)  # come /cache/warm
+            order = []
+
+            async def one():
+                async with sem:
+                    await _job(sched, lc.PRIORITY_BACKGROUND, order, hold=0.001)
+
+            await asyncio.gather(*(one() for _ in range(100)))
+            return order
+
+        self.assertEqual(len(asyncio.run(run())), 100)
+
+    def test_priority_context(self):
+        self.assertEqual(lc.current_priority(), lc.PRIORITY_NORMAL)
+        with lc.llm_priority(lc.PRIORITY_BACKGROUND):
+            self.assertEqual(lc.current_priority(), lc.PRIORITY_BACKGROUND)
+        self.assertEqual(lc.current_priority(), lc.PRIORITY_NORMAL)
+
+    def test_reply_with_llm_does_not_retry_overloaded(self):
+        import core.chat_engine as ce
+
+        post = mock.AsyncMock(side_effect=lc.LLMOverloadedError(lc.PRIORITY_INTERACTIVE, "queue full"))
+        with mock.patch.object(ce, "post_json", post), mock.patch.object(ce, "RETRY_BACKOFF_S", 0):
+            with self.assertRaises(lc.LLMOverloadedError):
+                asyncio.run(ce.reply_with_llm("ciao", "persona", priority=lc.PRIORITY_INTERACTIVE))
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(post.call_args.kwargs["priority"], lc.PRIORITY_INTERACTIVE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_reranker.py
+======================
+Tests for core/reranker: fixed-size batching, warmup and the
+(query_hash, url) → score cache. The model backend is faked.
+"""
+
+import sys
+import os
+import unittest
+from unittest import mock
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.reranker as rrmod
+
+
+class FakeBackend:
+    name = "fake"
+
+    def __init__(self):
+        self.calls = []
+
+    def score(self, pairs):
+        self.calls.append(len(pairs))
+        # più parole in comune con la query → score più alto
+        return [len(set(q.split()) & set(t.lower().split())) / 10.0 for q, t in pairs]
+
+
+def _results(n):
+    return [
+        {"url": f"https://e.com/{i}", "title": "bitcoin prezzo" if i % 3 == 0 else "altro", "snippet": str(i)}
+        for i in range(n)
+    ]
+
+
+class TestReranker(unittest.TestCase):
+
+    def _make(self, batch_size=4):
+        with mock.patch.object(rrmod, "_make_backend", return_value=FakeBackend()):
+            return rrmod.Reranker(batch_size=batch_size, cache=rrmod.ScoreCache(max_size=100))
+
+    def test_fixed_size_batches(self):
+        rr = self._make(batch_size=4)
+        out = rr.rerank("prezzo bitcoin", _results(10), top_k=3)
+        self.assertEqual(rr._rr.calls, [4, 4, 2])
+        self.assertEqual(len(out), 3)
+        self.assertTrue(all(r["title"] == "bitcoin prezzo" for r in out))
+
+    def test_paraphrased_query_hits_cache(self):
+        rr = self._make()
+        rr.rerank("prezzo bitcoin", _results(6))
+        first_calls = list(rr._rr.calls)
+        out = rr.rerank("Bitcoin prezzo?", _results(6))
+        self.assertEqual(rr._rr.calls, first_calls)  # nessun nuovo scoring
+        self.assertEqual(rr.cache.stats()["hits"], 6)
+        self.assertEqual(out[0]["title"], "bitcoin prezzo")
+
+    def test_only_new_urls_are_scored(self):
+        rr = self._make(batch_size=16)
+        rr.rerank("prezzo bitcoin", _results(4))
+        rr.rerank("prezzo bitcoin", _results(6))
+        self.assertEqual(rr._rr.calls, [4, 2])
+
+    def test_warmup_runs_one_batch_and_skips_cache(self):
+        rr = self._make(batch_size=8)
+        self.assertTrue(rr.warmup())
+        self.assertTrue(rr.warmup())
+        self.assertEqual(rr._rr.calls, [8])
+        self.assertEqual(rr.cache.stats()["size"], 0)
+
+    def test_runtime_failure_falls_back_uncached(self):
+        rr = self._make()
+        rr._rr.score = mock.Mock(side_effect=RuntimeError("boom"))
+        out = rr.rerank("prezzo bitcoin", _results(3))
+        self.assertEqual(len(out), 3)
+        self.assertEqual(rr.cache.stats()["size"], 0)
+
+    def test_lexical_when_no_backend(self):
+        rr = rrmod.Reranker(backend="lexical")
+        self.assertEqual(rr.backend, "lexical")
+        self.assertFalse(rr.warmup())
+        out = rr.rerank("prezzo bitcoin", _results(4), top_k=2)
+        self.assertEqual(out[0]["title"], "bitcoin prezzo")
+
+
+class TestScoreCache(unittest.TestCase):
+
+    def test_lru_eviction_and_ttl(self):
+        cache = rrmod.ScoreCache(max_size=2, ttl_s=60)
+        cache.put(("q", "a"), 0.1)
+        cache.put(("q", "b"), 0.2)
+        cache.get(("q", "a"))
+        cache.put(("q", "c"), 0.3)
+        self.assertIsNone(cache.get(("q", "b")))
+        self.assertEqual(cache.get(("q", "a")), 0.1)
+
+        cache.ttl_s = -1
+        self.assertIsNone(cache.get(("q", "a")))
+
+
+if __name__ == "__main__":
+    unittest.main()
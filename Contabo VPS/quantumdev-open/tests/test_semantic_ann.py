@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_semantic_ann.py
+==========================
+Tests for the IVF tier of the semantic cache (core/ann_index +
+core/semantic_cache._NsIndex): recall vs exact scan, incremental
+insert/delete, TTL tombstones and compaction.
+"""
+
+import sys
+import os
+import unittest
+
+import numpy as np
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.ann_index import IVFIndex
+from core.semantic_cache import _Entry, _NsIndex
+
+_DIM = 32
+_NOW = 1_000_000
+
+
+def _unit(x):
+    return (x / np.linalg.norm(x, axis=-1, keepdims=True)).astype(np.float32)
+
+
+def _data(n, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = _unit(rng.standard_normal((50, _DIM)))
+    return _unit(centers[rng.integers(0, 50, n)] + 0.5 * rng.standard_normal((n, _DIM)) / np.sqrt(_DIM))
+
+
+def _index(data, min_items=500, compact_s=60):
+    idx = _NsIndex(ann_factory=lambda: IVFIndex(nprobe=4), ann_min_items=min_items, compact_s=compact_s)
+    for i, v in enumerate(data):
+        idx.add(v, _Entry(str(i), {"i": i}, {}), _NOW)
+    return idx
+
+
+class TestIvfTier(unittest.TestCase):
+
+    def test_built_past_threshold(self):
+        self.assertIsNone(_index(_data(400)).ann)
+        idx = _index(_data(2000))
+        self.assertIsNotNone(idx.ann)
+        self.assertEqual(idx.ann.trained_n, 500)  # addestrato quando ha superato la soglia
+
+    def test_recall_against_exact(self):
+        data = _data(3000)
+        idx = _index(data)
+        exact = _NsIndex()
+        for i, v in enumerate(data):
+            exact.add(v, _Entry(str(i), {}, {}), _NOW)
+        rng = np.random.default_rng(1)
+        queries = _unit(data[rng.integers(0, 3000, 100)] + 0.1 * rng.standard_normal((100, _DIM)) / np.sqrt(_DIM))
+        agree = sum(idx.best(q, None, _NOW, 60)[0] == exact.best(q, None, _NOW, 60)[0] for q in queries)
+        self.assertGreaterEqual(agree, 95)
+
+    def test_scores_are_exact(self):
+        data = _data(2000)
+        idx = _index(data)
+        i, sim = idx.best(data[7], None, _NOW, 60)
+        self.assertEqual(i, 7)
+        self.assertAlmostEqual(sim, 1.0, places=5)
+
+    def test_delete_keeps_assignment_consistent(self):
+        data = _data(2000)
+        idx = _index(data)
+        for _ in range(300):
+            idx.remove(0)  # swap-remove: l'ultima riga va in 0
+        for i in (0, 5, 1000):
+            row = int(idx.entries[i].q)
+            self.assertEqual(idx.best(data[row], None, _NOW, 60)[0], i)
+
+    def test_expired_rows_are_tombstones_until_compaction(self):
+        data = _data(1000)
+        idx = _index(data, compact_s=60)
+        idx._ts[:100] = _NOW - 1000  # prime 100 scadute
+        idx.prune(_NOW, ttl_s=60)  # prima compaction: rimuove subito
+        self.assertEqual(len(idx), 900)
+
+        idx._ts[:50] = _NOW - 1000
+        victim = int(idx.entries[10].q)
+        self.assertEqual(idx.prune(_NOW + 1, ttl_s=60), 0)  # entro compact_s: tombstone
+        self.assertEqual(len(idx), 900)
+        self.assertNotEqual(idx.best(data[victim], None, _NOW + 1, 60)[0], 10)
+
+        self.assertEqual(idx.prune(_NOW + 61, ttl_s=120), 50)  # compaction periodica
+        self.assertEqual(len(idx), 850)
+
+    def test_falls_back_to_exact_when_small(self):
+        idx = _index(_data(600))
+        self.assertIsNotNone(idx.ann)
+        while len(idx) >= 250:
+            idx.remove(len(idx) - 1)
+        self.assertIsNone(idx.ann)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_semantic_cache.py
+============================
+Tests for core/semantic_cache: matrix index per namespace, dedup,
+swap-remove eviction and TTL. The sentence-transformers model is faked
+with deterministic unit vectors.
+"""
+
+import sys
+import os
+import asyncio
+import zlib
+import unittest
+from unittest import mock
+
+import numpy as np
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.semantic_cache as sc
+
+_DIM = 32
+
+
+class FakeEmbedder(sc._Embedder):
+    """Vettori unitari deterministici: stesso testo → stesso vettore."""
+
+    def __init__(self):
+        super().__init__("fake")
+        self.kind = "st"
+        self.dim = _DIM
+
+    def encode(self, text):
+        rng = np.random.default_rng(zlib.crc32(text.lower().strip(" ?").encode()))
+        v = rng.standard_normal(_DIM).astype(np.float32)
+        return v / np.linalg.norm(v)
+
+    async def encode_async(self, text):
+        return self.encode(text)
+
+
+def _cache(**kw):
+    cache = sc.SemanticCache(**{"threshold": 0.9, "ttl_s": 3600, "max_items": 1000, "max_items_per_ns": 1000, **kw})
+    cache._emb = FakeEmbedder()
+    return cache
+
+
+class TestEmbedderCosine(unittest.TestCase):
+
+    def test_ndarray_takes_dense_path(self):
+        emb = sc._Embedder("none")
+        emb.kind = "st"
+        a = np.array([0.6, 0.8], dtype=np.float32)
+        self.assertAlmostEqual(emb.cosine(a, a), 1.0, places=5)
+        self.assertAlmostEqual(emb.cosine(a, [0.8, 0.6]), 0.96, places=5)
+        self.assertEqual(emb.cosine(a, {"x": 1.0}), 0.0)
+
+
+class TestSemanticCacheIndex(unittest.TestCase):
+
+    def test_hit_and_miss(self):
+        cache = _cache()
+        cache.set("meteo roma", {"r": 1}, "ns")
+        hit = cache.get("Meteo Roma?", "ns")
+        self.assertEqual(hit["response"], {"r": 1})
+        self.assertAlmostEqual(hit["similarity"], 1.0, places=5)
+        self.assertIsNone(cache.get("prezzo bitcoin", "ns"))
+        self.assertIsNone(cache.get("meteo roma", "other"))
+
+    def test_get_async_matches_get(self):
+        cache = _cache()
+        cache.set("meteo roma", {"r": 1}, "ns")
+        hit = asyncio.run(cache.get_async("Meteo Roma?", "ns"))
+        self.assertEqual(hit["response"], {"r": 1})
+        self.assertIsNone(asyncio.run(cache.get_async("prezzo bitcoin", "ns")))
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_dedup_updates_in_place(self):
+        cache = _cache()
+        cache.set("meteo roma", {"r": 1}, "ns")
+        cache.set("meteo roma?", {"r": 2}, "ns")
+        self.assertEqual(cache.count(), 1)
+        self.assertEqual(cache.get("meteo roma", "ns")["response"], {"r": 2})
+
+    def test_swap_remove_keeps_rows_aligned(self):
+        cache = _cache(max_items_per_ns=50)
+        t0 = sc._now() - 1000
+        with mock.patch.object(sc, "_now", side_effect=range(t0, t0 + 1000)):
+            for i in range(200):
+                cache.set(f"domanda {i}", {"i": i}, "ns")
+        idx = cache._store["ns"]
+        self.assertEqual(len(idx), 50)
+        self.assertEqual(cache.stats()["evictions"], 150)
+        # ogni riga rimasta risponde con la sua entry
+        for entry in idx.entries:
+            self.assertEqual(cache.get(entry.q, "ns")["response"]["i"], int(entry.q.split()[1]))
+        self.assertEqual(sorted(e.response["i"] for e in idx.entries), list(range(150, 200)))
+
+    def test_global_cap_evicts_oldest_across_namespaces(self):
+        cache = _cache(max_items=3)
+        with mock.patch.object(sc, "_now", side_effect=[1, 2, 3, 4]):
+            cache.set("a", {}, "n1")
+            cache.set("b", {}, "n2")
+            cache.set("c", {}, "n1")
+            cache.set("d", {}, "n2")
+        self.assertEqual(cache.count(), 3)
+        self.assertEqual([e.q for e in cache._store["n1"].entries], ["c"])
+
+    def test_ttl_prune(self):
+        cache = _cache(ttl_s=10)
+        with mock.patch.object(sc, "_now", return_value=100):
+            cache.set("vecchia", {}, "ns")
+        with mock.patch.object(sc, "_now", return_value=105):
+            cache.set("nuova", {}, "ns")
+        with mock.patch.object(sc, "_now", return_value=112):
+            self.assertIsNone(cache.get("vecchia", "ns"))
+            self.assertIsNotNone(cache.get("nuova", "ns"))
+        self.assertEqual(cache.count(), 1)
+
+    def test_matrix_grows_contiguously(self):
+        cache = _cache()
+        for i in range(300):
+            cache.set(f"q{i}", {}, "ns")
+        idx = cache._store["ns"]
+        self.assertEqual(idx._mat.dtype, np.float32)
+        self.assertGreaterEqual(idx._mat.shape[0], 300)
+        self.assertEqual(idx._mat.shape[1], _DIM)
+
+    def test_bow_fallback_still_works(self):
+        cache = sc.SemanticCache(threshold=0.8)
+        cache._emb.kind = "bow"
+        cache.set("quanto costa bitcoin oggi", {"r": 1}, "ns")
+        self.assertIsNotNone(cache.get("quanto costa bitcoin oggi", "ns"))
+        self.assertIsNone(cache.get("meteo milano", "ns"))
+
+
+if __name__ == "__main__":
+    unittest.main()
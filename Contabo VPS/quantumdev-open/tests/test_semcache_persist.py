@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_semcache_persist.py
+==============================
+Tests for the shared persistence layer of the semantic cache
+(core/semcache_store + SemanticCache): warm restore from an mmap'd
+snapshot, journal replay, cross-worker sync and compaction.
+Two SemanticCache instances on the same directory play two workers.
+"""
+
+import sys
+import os
+import hashlib
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.semantic_cache as sc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from test_semantic_cache import FakeEmbedder  # noqa: E402
+
+
+def _worker(path, sync_s=0.0):
+    # sync_s=0: nessun thread di sync, i test chiamano sync() esplicitamente
+    cache = sc.SemanticCache(threshold=0.9, ttl_s=3600, max_items=1000, max_items_per_ns=1000,
+                             persist_dir=path, sync_s=sync_s)
+    cache._emb = FakeEmbedder()
+    return cache
+
+
+def _digest(path):
+    files = sorted(f for f in os.listdir(path) if f.startswith("vectors-"))
+    with open(os.path.join(path, files[-1]), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class TestSemanticCachePersistence(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_journal_replay_on_restart(self):
+        a = _worker(self.path)
+        a.set("meteo roma", {"r": 1}, "ns", meta={"src": "t"})
+        restarted = _worker(self.path)
+        hit = restarted.get("meteo roma", "ns")
+        self.assertEqual(hit["response"], {"r": 1})
+        self.assertEqual(hit["meta"]["src"], "t")
+
+    def test_cross_worker_visibility(self):
+        a, b = _worker(self.path), _worker(self.path)
+        self.assertIsNone(b.get("prezzo bitcoin", "ns"))
+        a.set("prezzo bitcoin", {"r": 2}, "ns")
+        b.sync()
+        self.assertEqual(b.get("prezzo bitcoin", "ns")["response"], {"r": 2})
+        self.assertEqual(a.count(), 1)  # A non riapplica il proprio record
+
+    def test_snapshot_restore_is_mmapped_and_lazy(self):
+        a = _worker(self.path)
+        for i in range(100):
+            a.set(f"domanda {i}", {"i": i}, "ns")
+        self.assertTrue(a.compact())
+        self.assertEqual(a._persist.journal_bytes(), 0)
+
+        c = _worker(self.path)
+        idx = c._store["ns"]
+        self.assertEqual(len(idx), 100)
+        self.assertIsInstance(idx._mat.base if idx._mat.base is not None else idx._mat, np.memmap)
+        self.assertTrue(all(e._raw is not None for e in idx.entries))  # JSON non ancora decodificato
+        self.assertEqual(c.get("domanda 42", "ns")["response"], {"i": 42})
+        self.assertEqual(c.stats()["persist"]["restored_items"], 100)
+
+    def test_writes_do_not_touch_snapshot_file(self):
+        a = _worker(self.path)
+        for i in range(10):
+            a.set(f"q{i}", {"i": i}, "ns")
+        a.compact()
+        before = _digest(self.path)
+        c = _worker(self.path)
+        c.set("q3", {"i": "nuovo"}, "ns")  # dedup → scrive sulla riga mmap (copy-on-write)
+        c._store["ns"].remove(0)
+        self.assertEqual(_digest(self.path), before)
+        self.assertEqual(c.get("q3", "ns")["response"], {"i": "nuovo"})
+
+    def test_other_worker_reloads_after_compaction(self):
+        a, b = _worker(self.path), _worker(self.path)
+        a.set("uno", {"n": 1}, "ns")
+        b.sync()
+        a.set("due", {"n": 2}, "ns")
+        a.compact()
+        a.set("tre", {"n": 3}, "ns")
+        b.sync()
+        for q, n in (("uno", 1), ("due", 2), ("tre", 3)):
+            self.assertEqual(b.get(q, "ns")["response"], {"n": n})
+        self.assertEqual(b._persist.generation, a._persist.generation)
+
+    def test_flush_is_persisted(self):
+        a = _worker(self.path)
+        a.set("uno", {"n": 1}, "ns")
+        a.set("altro", {"n": 2}, "keep")
+        a.flush("ns")
+        c = _worker(self.path)
+        self.assertIsNone(c.get("uno", "ns"))
+        self.assertIsNotNone(c.get("altro", "keep"))
+
+    def test_expired_entries_dropped_at_compaction(self):
+        a = _worker(self.path)
+        a.set("vecchia", {}, "ns")
+        a.set("nuova", {}, "ns")
+        a._store["ns"]._ts[0] = sc._now() - 10_000
+        a.compact()
+        c = _worker(self.path)
+        self.assertEqual([e.q for e in c._store["ns"].entries], ["nuova"])
+
+    def test_get_set_do_no_file_io(self):
+        a, b = _worker(self.path), _worker(self.path)
+        a.set("uno", {"n": 1}, "ns")
+
+        def _io(*args, **kwargs):
+            raise AssertionError("I/O sul percorso della richiesta")
+
+        b._persist.poll = _io
+        b._persist.compaction = _io
+        self.assertIsNone(b.get("uno", "ns"))  # il journal di A non è ancora stato letto
+        b.set("due", {"n": 2}, "ns")
+        self.assertEqual(b.get("due", "ns")["response"], {"n": 2})
+
+    def test_background_thread_tails_journal(self):
+        a = _worker(self.path)
+        b = _worker(self.path, sync_s=0.02)
+        try:
+            a.set("prezzo bitcoin", {"r": 2}, "ns")
+            deadline = time.monotonic() + 5.0
+            hit = None
+            while hit is None and time.monotonic() < deadline:
+                time.sleep(0.02)
+                hit = b.get("prezzo bitcoin", "ns")
+            self.assertEqual(hit["response"], {"r": 2})
+        finally:
+            b.close()
+        self.assertIsNone(b._sync_thread)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_singleflight.py
+==========================
+Tests for request coalescing in core/singleflight.py.
+"""
+
+import sys
+import os
+import unittest
+import asyncio
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.singleflight import SingleFlight, normalize_query
+
+
+class TestNormalizeQuery(unittest.TestCase):
+
+    def test_case_whitespace_punctuation(self):
+        self.assertEqual(normalize_query("  Meteo   ROMA? "), "meteo roma")
+        self.assertEqual(normalize_query("prezzo bitcoin!"), "prezzo bitcoin")
+        self.assertEqual(normalize_query(None), "")
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_share_one_execution(self):
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"summary": "ok", "results": [1, 2]}
+
+        async def main():
+            sf = SingleFlight("t")
+            return sf, await asyncio.gather(*[sf.do("k", work) for _ in range(5)])
+
+        sf, results = asyncio.run(main())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sf.stats, {"leaders": 1, "coalesced": 4})
+        self.assertTrue(all(r == results[0] for r in results))
+        # every caller owns its copy
+        results[0]["results"].append(3)
+        self.assertEqual(results[1]["results"], [1, 2])
+
+    def test_different_keys_run_separately(self):
+        calls = []
+
+        async def work(tag):
+            calls.append(tag)
+            await asyncio.sleep(0.01)
+            return tag
+
+        async def main():
+            sf = SingleFlight("t")
+            return await asyncio.gather(sf.do("a", lambda: work("a")), sf.do("b", lambda: work("b")))
+
+        self.assertEqual(asyncio.run(main()), ["a", "b"])
+        self.assertEqual(sorted(calls), ["a", "b"])
+
+    def test_key_released_after_completion(self):
+        calls = []
+
+        async def work():
+            calls.append(1)
+            return len(calls)
+
+        async def main():
+            sf = SingleFlight("t")
+            first = await sf.do("k", work)
+            second = await sf.do("k", work)
+            return first, second, sf.in_flight("k")
+
+        self.assertEqual(asyncio.run(main()), (1, 2, False))
+
+    def test_exception_propagates_to_all_waiters(self):
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise ValueError("provider down")
+
+        async def main():
+            sf = SingleFlight("t")
+            return await asyncio.gather(
+                sf.do("k", boom), sf.do("k", boom), return_exceptions=True
+            )
+
+        results = asyncio.run(main())
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+    def test_cancelled_caller_does_not_cancel_others(self):
+        async def work():
+            await asyncio.sleep(0.1)
+            return "done"
+
+        async def main():
+            sf = SingleFlight("t")
+            leader = asyncio.ensure_future(sf.do("k", work))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(sf.do("k", work))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+
+        self.assertEqual(asyncio.run(main()), "done")
+
+    def test_on_join_closes_unused_coroutine(self):
+        closed = []
+
+        async def work():
+            await asyncio.sleep(0.02)
+            return "x"
+
+        async def main():
+            sf = SingleFlight("t", copy_result=False)
+            return await asyncio.gather(
+                sf.do("k", work),
+                sf.do("k", work, on_join=lambda: closed.append(True)),
+            )
+
+        self.assertEqual(asyncio.run(main()), ["x", "x"])
+        self.assertEqual(closed, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_speculative_prefetch.py
+==================================
+Tests for SpeculativePrefetcher in backend/parallel_fetch_optimizer.
+Uses a local aiohttp server on 127.0.0.1.
+"""
+
+import sys
+import os
+import time
+import unittest
+import asyncio
+from unittest import mock
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.web_tools as wt
+from core.circuit_breaker import BreakerRegistry
+from backend.parallel_fetch_optimizer import SpeculativePrefetcher, parallel_fetch_and_extract
+
+try:
+    from aiohttp import web
+except ImportError:  # pragma: no cover
+    web = None
+
+_ARTICLE = (
+    "<html><head><title>T</title></head><body><article>"
+    + "<p>Testo della pagina di prova, abbastanza lungo da passare le soglie.</p>" * 10
+    + "</article></body></html>"
+)
+
+
+@unittest.skipUnless(web is not None and wt.AIOHTTP_AVAILABLE, "aiohttp not installed")
+class TestSpeculativePrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.requests = []
+        self._patch = mock.patch.object(wt, "DOMAIN_BREAKERS", BreakerRegistry(3, 60.0))
+        self._patch.start()
+
+    def tearDown(self):
+        self._patch.stop()
+
+    async def _serve(self, coro_fn):
+        async def page(request):
+            self.requests.append(request.path)
+            await asyncio.sleep(0.3)
+            return web.Response(text=_ARTICLE, content_type="text/html")
+
+        app = web.Application()
+        app.router.add_get("/{name}", page)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            return await coro_fn(f"http://127.0.0.1:{port}")
+        finally:
+            await wt.close_http_session()
+            await runner.cleanup()
+
+    def test_prefetch_overlaps_ranking_and_is_reused(self):
+        async def run(base):
+            serp = [{"url": f"{base}/{n}", "title": n} for n in ("a", "b", "c")]
+            pf = SpeculativePrefetcher(timeout_per_url=3.0)
+            pf.start(serp, limit=2)
+            await asyncio.sleep(0.3)  # "reranking"
+            topk = [serp[1], serp[2]]  # "a" dropped by ranking
+            pf.retain([r["url"] for r in topk])
+            t0 = time.perf_counter()
+            docs, stats = await parallel_fetch_and_extract(
+                topk, timeout_per_url=3.0, min_successful=0, prefetcher=pf
+            )
+            fetch_s = time.perf_counter() - t0
+            pf.cancel_all()
+            return docs, stats, pf.stats, fetch_s
+
+        docs, stats, pf_stats, fetch_s = asyncio.run(self._serve(run))
+        self.assertEqual(len(docs), 2)
+        self.assertEqual(stats["prefetched"], 1)
+        self.assertEqual(pf_stats, {"started": 2, "used": 1, "cancelled": 1})
+        # /b was fetched once (by the prefetch), /c normally; /a was cancelled
+        self.assertEqual(self.requests.count("/b"), 1)
+        self.assertEqual(self.requests.count("/c"), 1)
+        # the fetch stage only waits for /c: /b was already done
+        self.assertLess(fetch_s, 0.55)
+
+    def test_cancel_all_cancels_pending(self):
+        async def run(base):
+            pf = SpeculativePrefetcher(timeout_per_url=3.0)
+            pf.start([{"url": f"{base}/x"}], limit=3)
+            tasks = list(pf._tasks.values())
+            pf.cancel_all()
+            await asyncio.sleep(0)
+            return tasks
+
+        tasks = asyncio.run(self._serve(run))
+        self.assertTrue(all(t.cancelled() for t in tasks))
+
+    def test_zero_limit_disables(self):
+        async def run(base):
+            pf = SpeculativePrefetcher()
+            pf.start([{"url": f"{base}/x"}], limit=0)
+            return pf.stats["started"]
+
+        self.assertEqual(asyncio.run(self._serve(run)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_streaming_endpoints.py
+=================================
+Tests for the stream=true variants of /generate, /chat and /web/summarize
+(backend/quantum_api) and for stream_reply in scripts/telegram_bot.py:
+SSE event order (delta… then done, or error), cache and autosave only
+after a completed stream, and the overloaded fallback. The LLM stream is
+a stub; Redis, persona, memory and semantic cache are faked.
+"""
+
+import sys
+import os
+import json
+import asyncio
+import importlib.util
+import unittest
+from unittest import mock
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("CHROMA_PERSIST_DIR", "/tmp/test_chroma")
+
+from fastapi.testclient import TestClient
+
+import backend.quantum_api as qa
+
+
+def _events(resp):
+    return [json.loads(chunk[len("data: "):]) for chunk in resp.text.split("\n\n") if chunk.startswith("data: ")]
+
+
+def _stream(log, deltas, fail=None):
+    """Stub di stream_completion / stream_with_llm: produce `deltas`, poi solleva `fail`."""
+    async def gen(*args, **kwargs):
+        for d in deltas:
+            log.append(("delta", d))
+            yield d
+        if fail is not None:
+            raise fail
+    return gen
+
+
+class FakeRedis:
+    def __init__(self):
+        self.writes = []
+
+    def get(self, key):
+        return None
+
+    def setex(self, key, ttl, value):
+        self.writes.append((key, ttl))
+
+
+class FakeSemcache:
+    async def get_async(self, prompt, ctx_fp):
+        return None
+
+
+class _EndpointCase(unittest.TestCase):
+
+    def setUp(self):
+        self.log = []
+        self.redis = FakeRedis()
+
+        def autosave(text, source=""):
+            self.log.append(("autosave", source))
+            return {}
+
+        async def dualwrite(prompt, *args, **kwargs):
+            self.log.append(("cache", prompt))
+
+        async def record_turn(**kwargs):
+            self.log.append(("memory", kwargs["assistant_message"]))
+            return {}
+
+        patches = [
+            mock.patch.object(qa, "autosave", side_effect=autosave),
+            mock.patch.object(qa, "_semcache_dualwrite_async", side_effect=dualwrite),
+            mock.patch.object(qa, "_SEMCACHE", FakeSemcache()),
+            mock.patch.object(qa, "get_persona", mock.AsyncMock(return_value="persona")),
+            mock.patch.object(qa, "redis_client", self.redis),
+            mock.patch.object(qa, "_get_redis_str", return_value=None),
+            mock.patch.object(qa, "get_llm_classifier", return_value=None),
+            mock.patch.object(qa._SMART_INTENT, "classify",
+                              return_value={"intent": "DIRECT_LLM", "confidence": 0.9, "reason": "test"}),
+            mock.patch.object(qa, "_ordered_endpoints", return_value=["http://llm"]),
+            mock.patch.object(qa, "search_topk_async", mock.AsyncMock(return_value=[])),
+            mock.patch("core.memory_manager.process_user_message", mock.AsyncMock(return_value={})),
+            mock.patch("core.memory_manager.gather_memory_context", mock.AsyncMock(return_value={})),
+            mock.patch("core.memory_manager.record_conversation_turn", side_effect=record_turn),
+            mock.patch.object(qa, "fetch_and_extract", mock.AsyncMock(return_value=("testo pagina", None))),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.client = TestClient(qa.app)
+
+    def _after_stream(self):
+        """Voci di log dopo l'ultimo delta (autosave dell'input escluso)."""
+        last = max(i for i, e in enumerate(self.log) if e[0] == "delta")
+        return self.log[last + 1:]
+
+
+class TestGenerateStream(_EndpointCase):
+
+    def _post(self):
+        return self.client.post("/generate?stream=true", json={"prompt": "scrivi una poesia sul mare"})
+
+    def test_deltas_then_done_and_cache_after_stream(self):
+        with mock.patch.object(qa, "stream_completion", _stream(self.log, ["Onde", " lente"])):
+            evs = _events(self._post())
+        self.assertEqual([e.get("delta") for e in evs[:-1]], ["Onde", " lente"])
+        self.assertTrue(evs[-1]["done"])
+        self.assertEqual(evs[-1]["response"]["choices"][0]["message"]["content"], "Onde lente")
+        self.assertEqual(self._after_stream(), [("autosave", "direct_llm"), ("cache", "scrivi una poesia sul mare")])
+        self.assertEqual([ttl for _, ttl in self.redis.writes], [86400])
+
+    def test_interrupted_stream_is_not_cached(self):
+        with mock.patch.object(qa, "stream_completion", _stream(self.log, ["Onde"], RuntimeError("cut"))):
+            evs = _events(self._post())
+        self.assertEqual(evs, [{"delta": "Onde"}, {"error": "stream_interrupted"}])
+        self.assertEqual(self._after_stream(), [])
+        self.assertEqual(self.redis.writes, [])
+
+    def test_overloaded_is_a_done_event_without_cache(self):
+        overloaded = qa.LLMOverloadedError("interactive", "queue full")
+        with mock.patch.object(qa, "stream_completion", _stream(self.log, [], overloaded)):
+            evs = _events(self._post())
+        self.assertEqual(len(evs), 1)
+        self.assertTrue(evs[0]["done"] and evs[0]["overloaded"])
+        self.assertEqual(evs[0]["error"], qa.LLM_OVERLOADED_REPLY)
+        self.assertNotIn("cache", [e[0] for e in self.log])
+        self.assertEqual(self.redis.writes, [])
+
+
+class TestChatStream(_EndpointCase):
+
+    def _post(self):
+        return self.client.post("/chat", json={"source": "tg", "source_id": "1", "text": "ciao come va", "stream": True})
+
+    def test_deltas_then_done_and_memory_after_stream(self):
+        with mock.patch.object(qa, "stream_with_llm", _stream(self.log, ["Tutto", " bene"])):
+            evs = _events(self._post())
+        self.assertEqual([e.get("delta") for e in evs[:-1]], ["Tutto", " bene"])
+        self.assertEqual((evs[-1]["done"], evs[-1]["reply"]), (True, "Tutto bene"))
+        self.assertEqual(self._after_stream(),
+                         [("memory", "Tutto bene"), ("autosave", "chat_reply"), ("cache", "ciao come va")])
+
+    def test_interrupted_stream_skips_memory_and_cache(self):
+        with mock.patch.object(qa, "stream_with_llm", _stream(self.log, ["Tutto"], RuntimeError("cut"))):
+            evs = _events(self._post())
+        self.assertEqual(evs, [{"delta": "Tutto"}, {"error": "stream_interrupted"}])
+        self.assertEqual(self._after_stream(), [])
+
+    def test_overloaded_streams_fallback_reply(self):
+        overloaded = qa.LLMOverloadedError("interactive", "queue full")
+        with mock.patch.object(qa, "stream_with_llm", _stream(self.log, [], overloaded)):
+            evs = _events(self._post())
+        self.assertEqual(evs[0], {"delta": qa.LLM_OVERLOADED_REPLY})
+        self.assertEqual(evs[1], {"done": True, "reply": qa.LLM_OVERLOADED_REPLY, "overloaded": True})
+        self.assertFalse([e for e in self.log if e[0] in ("memory", "cache")])
+
+
+class TestWebSummarizeStream(_EndpointCase):
+
+    def _post(self):
+        return self.client.post("/web/summarize", json={"url": "https://example.com", "source_id": "1", "stream": True})
+
+    def test_deltas_then_done_and_autosave_after_stream(self):
+        with mock.patch.object(qa, "stream_with_llm", _stream(self.log, ["- punto", " uno"])):
+            evs = _events(self._post())
+        self.assertEqual([e.get("delta") for e in evs[:-1]], ["- punto", " uno"])
+        self.assertEqual((evs[-1]["done"], evs[-1]["summary"]), (True, "- punto uno"))
+        self.assertEqual(self._after_stream(), [("autosave", "web_summarize")])
+
+    def test_interrupted_stream_skips_autosave(self):
+        with mock.patch.object(qa, "stream_with_llm", _stream(self.log, ["- punto"], RuntimeError("cut"))):
+            evs = _events(self._post())
+        self.assertEqual(evs, [{"delta": "- punto"}, {"error": "stream_interrupted"}])
+        self.assertEqual(self._after_stream(), [])
+
+
+def _load_telegram_bot():
+    try:
+        import telegram  # noqa: F401
+    except ImportError:
+        return None
+    spec = importlib.util.spec_from_file_location("telegram_bot", os.path.join(ROOT, "scripts", "telegram_bot.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+class FakeSent:
+    def __init__(self, chat, text):
+        self.chat, self.text = chat, text
+
+    async def edit_text(self, text, **kwargs):
+        if self.chat.flood:
+            raise RuntimeError("Flood control exceeded")
+        self.text = text
+
+
+class FakeMessage:
+    def __init__(self):
+        self.sent = []
+        self.flood = False
+
+    async def reply_text(self, text, **kwargs):
+        m = FakeSent(self, text)
+        self.sent.append(m)
+        return m
+
+
+class TestTelegramStreamReply(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tg = _load_telegram_bot()
+        if cls.tg is None:
+            raise unittest.SkipTest("python-telegram-bot not installed")
+
+    def _run(self, events, msg, size):
+        async def fake_iter(http, url, payload):
+            for ev in events:
+                if ev.get("delta") == "FLOOD":
+                    msg.flood = True
+                    continue
+                yield ev
+
+        with mock.patch.object(self.tg, "_iter_sse", fake_iter), mock.patch.object(self.tg, "TG_STREAM_EDIT_S", 0.0):
+            return asyncio.run(self.tg.stream_reply(None, "http://b/chat", {}, msg, size=size))
+
+    def test_chunk_is_delivered_when_edit_fails(self):
+        msg = FakeMessage()
+        events = [{"delta": "a" * 6}, {"delta": "FLOOD"}, {"delta": "b" * 6}, {"done": True}]
+        text = self._run(events, msg, size=10)
+        self.assertEqual(text, "a" * 6 + "b" * 6)
+        shown = "".join(m.text for m in msg.sent[1:])  # il primo messaggio è la preview non più editabile
+        self.assertEqual(shown, "a" * 6 + "b" * 6)
+
+    def test_chunks_split_at_size(self):
+        msg = FakeMessage()
+        text = self._run([{"delta": "x" * 25}, {"done": True}], msg, size=10)
+        self.assertEqual(text, "x" * 25)
+        self.assertEqual([m.text for m in msg.sent], ["x" * 10, "x" * 10, "x" * 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
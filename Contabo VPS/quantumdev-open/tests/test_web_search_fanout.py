@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_web_search_fanout.py
+===============================
+Tests for the concurrent provider fan-out in core/web_search.py.
+Providers are replaced with local fakes: no network access.
+"""
+
+import sys
+import os
+import time
+import unittest
+import asyncio
+from unittest import mock
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.web_search as ws
+from core.circuit_breaker import BreakerRegistry
+
+
+def _rows(prefix: str, n: int):
+    return [
+        {"url": f"https://{prefix}.example.com/{i}", "title": f"{prefix} {i}"}
+        for i in range(n)
+    ]
+
+
+def _slow(rows, delay: float):
+    def _provider(query, num):
+        time.sleep(delay)
+        return rows[:num]
+    return _provider
+
+
+class _FakeProvidersTestCase(unittest.TestCase):
+    """All providers return nothing unless a test patches them."""
+
+    def setUp(self):
+        self._patches = [
+            mock.patch.object(ws, "_SERP_CACHE", ws.SerpCache(use_redis=False)),
+            mock.patch.object(ws, "SEARCH_BACKEND", "ddg"),
+            mock.patch.object(ws, "HEDGING_ENABLED", False),
+            mock.patch.object(ws, "_SCHEDULER", ws.ProviderScheduler()),
+            mock.patch.object(ws, "PROVIDER_BREAKERS", BreakerRegistry(3, 30.0)),
+            mock.patch.object(ws, "HEURISTIC_SEEDS_ENABLED", False),
+            mock.patch.object(ws, "_rank_by_domain_policy", lambda rows, q: rows),
+            mock.patch.object(ws, "_search_ddg_html_post", _slow([], 0.0)),
+            mock.patch.object(ws, "_search_ddg_html_get_all", _slow([], 0.0)),
+            mock.patch.object(ws, "_search_ddg_lite", _slow([], 0.0)),
+            mock.patch.object(ws, "_search_bing_html", _slow([], 0.0)),
+        ]
+        for p in self._patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self._patches:
+            p.stop()
+
+
+class TestSearchFanOut(_FakeProvidersTestCase):
+    """Fan-out across variants and providers (broadcast mode)."""
+
+    def test_providers_run_concurrently(self):
+        """Four 0.3s providers must finish in well under 4 × 0.3s."""
+        with mock.patch.object(ws, "_search_ddg_html_post", _slow(_rows("a", 2), 0.3)), \
+             mock.patch.object(ws, "_search_ddg_lite", _slow(_rows("b", 2), 0.3)), \
+             mock.patch.object(ws, "_search_bing_html", _slow(_rows("c", 2), 0.3)):
+            t0 = time.perf_counter()
+            results = asyncio.run(ws.search_async("q", num=10, variants=["q"]))
+            elapsed = time.perf_counter() - t0
+        self.assertEqual(len(results), 6)
+        self.assertLess(elapsed, 0.8)
+
+    def test_early_return_when_enough_results(self):
+        """A slow provider is not awaited once `num` results are in."""
+        with mock.patch.object(ws, "_search_ddg_html_post", _slow(_rows("fast", 5), 0.0)), \
+             mock.patch.object(ws, "_search_bing_html", _slow(_rows("slow", 5), 2.0)):
+            t0 = time.perf_counter()
+            results = asyncio.run(ws.search_async("q", num=5, variants=["q"]))
+            elapsed = time.perf_counter() - t0
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all("fast" in r["url"] for r in results))
+        self.assertLess(elapsed, 1.0)
+
+    def test_provider_deadline(self):
+        """A provider past its deadline is dropped, the others are kept."""
+        with mock.patch.object(ws, "PROVIDER_DEADLINE_S", 0.2), \
+             mock.patch.object(ws, "_search_ddg_html_post", _slow(_rows("ok", 2), 0.0)), \
+             mock.patch.object(ws, "_search_bing_html", _slow(_rows("late", 2), 1.5)):
+            t0 = time.perf_counter()
+            results = asyncio.run(ws.search_async("q", num=10, variants=["q"]))
+            elapsed = time.perf_counter() - t0
+        self.assertEqual([r["url"] for r in results], [r["url"] for r in _rows("ok", 2)])
+        self.assertLess(elapsed, 1.0)
+
+    def test_variants_merged_in_priority_order(self):
+        """Results are ordered by (variant, provider, rank), not arrival time."""
+        def provider(query, num):
+            if query == "first":
+                time.sleep(0.2)
+                return _rows("first", 2)
+            return _rows("second", 2)
+
+        with mock.patch.object(ws, "_search_ddg_html_post", provider):
+            results = asyncio.run(
+                ws.search_async("first", num=10, variants=["first", "second", "FIRST"])
+            )
+        urls = [r["url"] for r in results]
+        self.assertEqual(urls[:2], [r["url"] for r in _rows("first", 2)])
+        self.assertEqual(len(urls), 4)
+
+    def test_sync_wrapper(self):
+        """search() works both without and inside a running event loop."""
+        with mock.patch.object(ws, "_search_ddg_html_post", _slow(_rows("s", 3), 0.0)), \
+             mock.patch.object(ws, "_expand_variants", lambda q: [q]):
+            self.assertEqual(len(ws.search("sync query", num=3)), 3)
+
+            async def inside_loop():
+                return ws.search("loop query", num=3)
+
+            self.assertEqual(len(asyncio.run(inside_loop())), 3)
+
+
+class TestHedgedRouting(_FakeProvidersTestCase):
+    """Latency-aware routing with hedged requests."""
+
+    def test_fastest_provider_answers_alone(self):
+        """If the first provider answers within its p90, no hedge is sent."""
+        calls = []
+
+        def provider(tag):
+            def _p(query, num):
+                calls.append(tag)
+                return _rows(tag, 3)
+            return _p
+
+        with mock.patch.object(ws, "HEDGING_ENABLED", True), \
+             mock.patch.object(ws, "_search_ddg_html_post", provider("post")), \
+             mock.patch.object(ws, "_search_bing_html", provider("bing")):
+            results = asyncio.run(ws.search_async("q", num=10, variants=["q"]))
+        self.assertEqual(calls, ["post"])
+        self.assertEqual(len(results), 3)
+
+    def test_hedge_after_p90(self):
+        """A provider slower than its hedge delay is covered by the next one."""
+        with mock.patch.object(ws, "HEDGING_ENABLED", True), \
+             mock.patch.object(ws, "HEDGE_DEFAULT_DELAY_S", 0.1), \
+             mock.patch.object(ws, "_search_ddg_html_post", _slow(_rows("stuck", 3), 1.5)), \
+             mock.patch.object(ws, "_search_ddg_html_get_all", _slow(_rows("hedge", 3), 0.0)):
+            t0 = time.perf_counter()
+            results = asyncio.run(ws.search_async("q", num=10, variants=["q"]))
+            elapsed = time.perf_counter() - t0
+        self.assertTrue(results)
+        self.assertTrue(all("hedge" in r["url"] for r in results))
+        self.assertLess(elapsed, 1.0)
+
+    def test_empty_answer_falls_through(self):
+        """An empty answer immediately moves on to the next provider."""
+        with mock.patch.object(ws, "HEDGING_ENABLED", True), \
+             mock.patch.object(ws, "_search_bing_html", _slow(_rows("bing", 2), 0.0)):
+            results = asyncio.run(ws.search_async("q", num=10, variants=["q"]))
+        self.assertEqual(len(results), 2)
+
+
+class TestProviderCircuitBreaker(_FakeProvidersTestCase):
+    """Providers with an open circuit are skipped without being called."""
+
+    def test_open_provider_is_skipped(self):
+        calls = []
+
+        def failing(query, num):
+            calls.append(query)
+            return []
+
+        with mock.patch.object(ws, "_search_ddg_html_post", failing), \
+             mock.patch.object(ws, "_search_bing_html", _slow(_rows("bing", 2), 0.0)):
+            for i in range(5):
+                results = asyncio.run(ws.search_async(f"q{i}", num=10, variants=[f"q{i}"]))
+                self.assertEqual(len(results), 2)
+        # 3 consecutive empty parses open the circuit, the last 2 calls are skipped
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(ws.PROVIDER_BREAKERS.get("ddg_post").state, "open")
+
+
+class TestSerpCache(_FakeProvidersTestCase):
+    """Two-tier SERP cache with per-category TTL and stale-while-revalidate."""
+
+    def test_fresh_hit_skips_network(self):
+        calls = []
+
+        def provider(query, num):
+            calls.append(query)
+            return _rows("c", 2)
+
+        with mock.patch.object(ws, "_search_ddg_html_post", provider):
+            first = asyncio.run(ws.search_async("cache me", num=5, variants=["cache me"]))
+            second = asyncio.run(ws.search_async("cache me", num=5, variants=["cache me"]))
+        self.assertEqual(first, second)
+        self.assertEqual(len(calls), 1)
+
+    def test_stale_entry_served_and_refreshed(self):
+        cache = ws._SERP_CACHE
+        cache.set("q", 5, _rows("old", 2), ttl=10)
+        key = cache.key("q", 5)
+        ts, ttl, data = cache._l1[key]
+        cache._l1[key] = (ts - 15, ttl, data)  # expired 5s ago, inside the stale window
+
+        with mock.patch.object(ws, "_search_ddg_html_post", _slow(_rows("new", 2), 0.0)):
+            served = asyncio.run(ws.search_async("q", num=5, variants=["q"]))
+            self.assertTrue(all("old" in r["url"] for r in served))
+            deadline = time.time() + 2.0
+            while time.time() < deadline:
+                hit = cache.get("q", 5)
+                if hit and not hit[1]:
+                    break
+                time.sleep(0.02)
+        data, stale = cache.get("q", 5)
+        self.assertFalse(stale)
+        self.assertTrue(all("new" in r["url"] for r in data))
+
+    def test_expired_past_stale_window_is_a_miss(self):
+        cache = ws.SerpCache(use_redis=False)
+        cache.set("q", 5, _rows("x", 1), ttl=10)
+        key = cache.key("q", 5)
+        ts, ttl, data = cache._l1[key]
+        cache._l1[key] = (ts - 10 - cache.stale_window(10) - 1, ttl, data)
+        self.assertIsNone(cache.get("q", 5))
+        self.assertNotIn(key, cache._l1)
+
+    def test_lru_eviction(self):
+        cache = ws.SerpCache(max_size=2, use_redis=False)
+        cache.set("a", 1, [], ttl=60)
+        cache.set("b", 1, [], ttl=60)
+        cache.get("a", 1)
+        cache.set("c", 1, [], ttl=60)
+        self.assertIsNotNone(cache.get("a", 1))
+        self.assertIsNone(cache.get("b", 1))
+
+    def test_category_ttl(self):
+        with mock.patch.object(ws, "_serp_category", lambda q: "price"):
+            asyncio.run(ws.search_async("btc price", num=5, variants=["btc price"]))
+        key = ws._SERP_CACHE.key("btc price", 5)
+        self.assertEqual(ws._SERP_CACHE._l1[key][1], ws.get_ttl_for_category("price"))
+
+
+class TestProviderScheduler(unittest.TestCase):
+    """EWMA bookkeeping and ordering."""
+
+    def test_order_by_latency_and_health(self):
+        sched = ws.ProviderScheduler(alpha=0.5)
+        for _ in range(5):
+            sched.record("ddg_post", 2.0, ok=True)
+            sched.record("bing", 0.2, ok=True)
+            sched.record("ddg_lite", 0.1, ok=False)
+        self.assertEqual(
+            sched.order(["ddg_post", "ddg_lite", "bing"]),
+            ["bing", "ddg_post", "ddg_lite"],
+        )
+        self.assertFalse(sched.healthy("ddg_lite"))
+
+    def test_unmeasured_keeps_static_priority(self):
+        sched = ws.ProviderScheduler()
+        self.assertEqual(sched.order(["a", "b", "c"]), ["a", "b", "c"])
+
+    def test_p90_and_hedge_delay(self):
+        sched = ws.ProviderScheduler()
+        self.assertIsNone(sched.p90("x"))
+        for i in range(10):
+            sched.record("x", 0.1 * (i + 1), ok=True)
+        self.assertAlmostEqual(sched.p90("x"), 1.0)
+        self.assertAlmostEqual(sched.hedge_delay("x"), min(1.0, ws.PROVIDER_DEADLINE_S))
+
+    def test_censored_sample_does_not_count_as_error(self):
+        sched = ws.ProviderScheduler()
+        sched.record("x", 3.0, ok=True, censored=True)
+        self.assertEqual(sched.snapshot()["x"]["error_ewma"], 0.0)
+        self.assertEqual(sched.snapshot()["x"]["latency_ewma_ms"], 3000)
+
+    def test_censored_sample_never_lowers_latency(self):
+        sched = ws.ProviderScheduler()
+        for _ in range(10):
+            sched.record("slow", 2.0, ok=True)
+        p90 = sched.p90("slow")
+        for _ in range(20):  # hedge perso ogni volta dopo 0.3s
+            sched.record("slow", 0.3, ok=True, censored=True)
+        self.assertEqual(sched.snapshot()["slow"]["latency_ewma_ms"], 2000)
+        self.assertEqual(sched.p90("slow"), p90)
+        sched.record("slow", 5.0, ok=True, censored=True)  # limite inferiore più alto: conta
+        self.assertGreater(sched.snapshot()["slow"]["latency_ewma_ms"], 2000)
+
+
+class TestProvidersForBackend(unittest.TestCase):
+    """Backend → provider selection."""
+
+    def test_default_backend(self):
+        self.assertEqual(
+            ws._providers_for_backend("ddg"),
+            [n for n in ("ddg_post", "ddg_get", "ddg_lite", "bing") if ws._provider_enabled(n)],
+        )
+
+    def test_serpapi_requires_key(self):
+        with mock.patch.dict(os.environ, {"SERPAPI_KEY": ""}):
+            self.assertEqual(ws._providers_for_backend("serpapi"), [])
+        with mock.patch.dict(os.environ, {"SERPAPI_KEY": "k"}):
+            self.assertEqual(ws._providers_for_backend("serpapi"), ["serpapi"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tests/test_web_tools_async.py
+=============================
+Tests for the native aiohttp fetch path in core/web_tools (streaming
+download, charset detection) and backend/parallel_fetch_optimizer.
+Uses a local aiohttp server on 127.0.0.1.
+"""
+
+import sys
+import os
+import time
+import unittest
+import asyncio
+from unittest import mock
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.web_tools as wt
+from core.circuit_breaker import BreakerRegistry
+
+try:
+    from aiohttp import web
+except ImportError:  # pragma: no cover
+    web = None
+
+_ARTICLE = (
+    "<html><head><title>Test</title></head><body><article>"
+    + "<p>Questo è un paragrafo di prova con abbastanza testo per l'estrazione. </p>" * 20
+    + "</article></body></html>"
+)
+
+
+async def _page(request):
+    await asyncio.sleep(float(request.query.get("delay", "0")))
+    return web.Response(text=_ARTICLE, content_type="text/html")
+
+
+async def _json(request):
+    return web.json_response({"a": 1})
+
+
+async def _huge(request):
+    """Article first, then megabytes of trailing markup streamed slowly."""
+    resp = web.StreamResponse(headers={"Content-Type": "text/html; charset=iso-8859-1"})
+    await resp.prepare(request)
+    await resp.write(_ARTICLE.replace("</body></html>", "").encode("latin-1", "replace"))
+    for _ in range(40):
+        await resp.write(b"<div>" + b"x" * 65536 + b"</div>")
+        await asyncio.sleep(0.05)
+    await resp.write_eof()
+    return resp
+
+
+async def _down(request):
+    return web.Response(status=503, text="down", content_type="text/html")
+
+
+async def _serve(app_coro):
+    """Run `app_coro(base_url)` against a local test server."""
+    app = web.Application()
+    app.router.add_get("/page", _page)
+    app.router.add_get("/json", _json)
+    app.router.add_get("/down", _down)
+    app.router.add_get("/huge", _huge)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        return await app_coro(f"http://127.0.0.1:{port}")
+    finally:
+        await wt.close_http_session()
+        await runner.cleanup()
+
+
+@unittest.skipUnless(web is not None and wt.AIOHTTP_AVAILABLE, "aiohttp not installed")
+class TestAsyncFetch(unittest.TestCase):
+
+    def setUp(self):
+        self._patch = mock.patch.object(wt, "DOMAIN_BREAKERS", BreakerRegistry(2, 60.0))
+        self._patch.start()
+
+    def tearDown(self):
+        self._patch.stop()
+
+    def test_fetch_and_extract_robust(self):
+        async def run(base):
+            return await wt.fetch_and_extract_robust(f"{base}/page", timeout=3.0)
+
+        text, _ = asyncio.run(_serve(run))
+        self.assertIn("paragrafo di prova", text)
+        self.assertEqual(wt.DOMAIN_BREAKERS.get("127.0.0.1").state, "closed")
+
+    def test_non_html_is_skipped(self):
+        async def run(base):
+            return await wt._http_get_async(f"{base}/json", 3.0)
+
+        self.assertIsNone(asyncio.run(_serve(run)))
+
+    def test_failure_status_opens_domain_circuit(self):
+        async def run(base):
+            for _ in range(2):
+                await wt._http_get_async(f"{base}/down", 3.0)
+            return await wt._http_get_async(f"{base}/page", 3.0)
+
+        self.assertIsNone(asyncio.run(_serve(run)))
+        self.assertEqual(wt.DOMAIN_BREAKERS.get("127.0.0.1").state, "open")
+
+    def test_half_open_probe_held_until_extraction_judged(self):
+        wt.DOMAIN_BREAKERS = BreakerRegistry(1, 0.05)
+        gate = None
+
+        async def slow_extract(html, url):
+            await gate.wait()
+            return "testo estratto " * 20
+
+        async def run(base):
+            nonlocal gate
+            gate = asyncio.Event()
+            await wt._http_get_async(f"{base}/down", 3.0)
+            await asyncio.sleep(0.1)  # cooldown scaduto: half-open
+            probe = asyncio.ensure_future(wt.fetch_page_extract(f"{base}/page", timeout=3.0, max_retries=1))
+            await asyncio.sleep(0.2)  # il probe è in estrazione
+            second = await wt._http_get_async(f"{base}/page", 3.0)
+            gate.set()
+            return second, await probe
+
+        with mock.patch.object(wt, "extract_content_async", slow_extract):
+            second, page = asyncio.run(_serve(run))
+        self.assertIsNone(second)  # un solo probe alla volta
+        self.assertTrue(page.ok)
+        self.assertEqual(wt.DOMAIN_BREAKERS.get("127.0.0.1").state, "closed")
+
+    def test_session_is_shared(self):
+        async def run(base):
+            await wt._http_get_async(f"{base}/page", 3.0)
+            first = wt._get_aio_session()
+            await wt._http_get_async(f"{base}/page", 3.0)
+            return first is wt._get_aio_session()
+
+        self.assertTrue(asyncio.run(_serve(run)))
+
+    def test_streaming_stops_after_article(self):
+        """The 2.6 MB tail after </article> is never downloaded."""
+        async def run(base):
+            return await wt._http_get_async(f"{base}/huge", 5.0)
+
+        t0 = time.perf_counter()
+        page = asyncio.run(_serve(run))
+        elapsed = time.perf_counter() - t0
+        self.assertEqual(page.cutoff, "marker")
+        self.assertEqual(page.encoding, "cp1252")
+        self.assertLess(page.bytes_read, 200_000)
+        self.assertIn("paragrafo di prova", page.html)
+        self.assertLess(elapsed, 1.0)
+
+    def test_parallel_fetch_scales_past_executor_cap(self):
+        """12 pages × 0.4s fetched with 12 in flight finish in about one round."""
+        from backend.parallel_fetch_optimizer import parallel_fetch_and_extract
+
+        async def run(base):
+            items = [{"url": f"{base}/page?delay=0.4&i={i}", "title": str(i)} for i in range(12)]
+            return await parallel_fetch_and_extract(
+                items, max_concurrent=12, timeout_per_url=5.0, min_successful=0
+            )
+
+        t0 = time.perf_counter()
+        docs, stats = asyncio.run(_serve(run))
+        elapsed = time.perf_counter() - t0
+        self.assertEqual(stats["ok"], 12)
+        self.assertEqual(len(docs), 12)
+        self.assertLess(elapsed, 0.4 * 2 + 0.6)
+
+
+class TestHtmlStreamDecoder(unittest.TestCase):
+    """Incremental decode, charset detection and early cutoff."""
+
+    def _decode(self, data: bytes, charset=None, chunk=7, **kw):
+        dec = wt._HtmlStreamDecoder(charset, **kw)
+        for i in range(0, len(data), chunk):
+            if dec.feed(data[i:i + chunk]):
+                break
+        return dec, dec.finish()
+
+    def test_header_charset(self):
+        dec, html = self._decode("<p>perché</p>".encode("cp1252"), "ISO-8859-1")
+        self.assertEqual(dec.charset, "cp1252")
+        self.assertEqual(html, "<p>perché</p>")
+
+    def test_meta_charset_sniffed(self):
+        data = '<html><head><meta charset="windows-1252"></head><p>città</p>'.encode("cp1252")
+        dec, html = self._decode(data)
+        self.assertEqual(dec.charset, "cp1252")
+        self.assertIn("città", html)
+
+    def test_bom_wins_over_header(self):
+        data = "\ufeff<p>€</p>".encode("utf-8")
+        dec, html = self._decode(data, "iso-8859-1")
+        self.assertEqual(html, "<p>€</p>")
+
+    def test_utf8_default_split_multibyte(self):
+        """Multibyte characters split across chunks decode correctly."""
+        dec, html = self._decode("<p>àèìòù€</p>".encode("utf-8"), chunk=1)
+        self.assertEqual(dec.charset, "utf-8")
+        self.assertEqual(html, "<p>àèìòù€</p>")
+
+    def test_marker_across_chunk_boundary(self):
+        data = b"<main><p>x</p></MA" + b"IN>" + b"<footer>" + b"y" * 10000
+        dec, html = self._decode(data, "utf-8", chunk=18)
+        self.assertEqual(dec.cutoff, "marker")
+        self.assertLess(len(html), 40)
+
+    def test_byte_cap(self):
+        dec, html = self._decode(b"a" * 5000, "utf-8", chunk=1000, max_bytes=2500)
+        self.assertEqual(dec.cutoff, "max_bytes")
+        self.assertEqual(len(html), 2500)
+
+    def test_early_cutoff_disabled(self):
+        dec, html = self._decode(b"</article>" + b"z" * 100, "utf-8", early_cutoff=False)
+        self.assertIsNone(dec.cutoff)
+        self.assertTrue(html.endswith("z"))
+
+
+if __name__ == "__main__":
+    unittest.main()
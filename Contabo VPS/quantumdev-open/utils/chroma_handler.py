@@ -11,17 +11,35 @@
 # - ADVANCED: filtri where + batch insert + cleanup dry-run + migrazione
 # - PATCH (2025-11-07): _col() ora auto-crea la collection se non esiste (get-or-create con metadata corretti)
 # - FIX (2025-11-24): search_topk → _rank(... half_life_days=half_life_days)
+# - PERF: embedding_function sull'executor di inferenza condiviso (core/inference_executor)
+# - PERF: search_topk_async(): collection interrogate in parallelo fuori dall'event loop,
+#         un solo embedding della query, deadline con risultati parziali; _rank vettorizzato
+# - PERF: indice invertito (utils/keyword_index) in sync sugli add_*: fallback keyword/BM25
+#         senza scansionare la collection + segnale BM25 opzionale nel ranking (MEM_WEIGHT_KW)
+# - PERF: reembed_collection/migrate_collection → utils/chroma_reembed (streaming, embeddings=
+#         scritti direttamente, checkpoint/resume, throughput)
+# - HYBRID: _query_collection → BM25 + vettoriale in parallelo fusi con RRF (core/hybrid_retrieval);
+#           _rank tiene la similarità assoluta e somma il BM25 come segnale separato (MEM_WEIGHT_KW):
+#           la relevance RRF è normalizzata per collection, non confrontabile tra facts/prefs/bets
 
 import os
 import time
 import math
+import asyncio
 import logging
 from typing import Dict, List, Tuple, Any, Optional
 
+import numpy as np
+
 import chromadb
 from chromadb.config import Settings
 from chromadb.utils import embedding_functions
 
+from core.embedding_service import get_embedding_service
+from core.embedding_context import cached_embedding, cached_embedding_async
+from core.hybrid_retrieval import HYBRID_ENABLED, candidate_pool, hybrid_query
+from utils.keyword_index import KeywordIndex, get_keyword_index
+
 # === PersistentClient (se disponibile) ===
 try:
     # chromadb>=0.5.x
@@ -41,7 +59,9 @@ EMBED_MODEL = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniL
 W_SIM   = float(os.getenv("MEM_WEIGHT_SIM", 0.7))   # similarità semantica
 W_TIME  = float(os.getenv("MEM_WEIGHT_TIME", 0.2))  # recency
 W_SRC   = float(os.getenv("MEM_WEIGHT_SRC", 0.1))   # prior fonte
+W_KW    = float(os.getenv("MEM_WEIGHT_KW", 0.2 if HYBRID_ENABLED else 0.0))  # BM25 (indice keyword), 0 = disattivo
 HALF_LIFE_D = float(os.getenv("MEM_HALF_LIFE_D", 7))
+MEM_SEARCH_TIMEOUT_S = float(os.getenv("MEM_SEARCH_TIMEOUT_S", 1.5))  # deadline search_topk_async
 
 SOURCE_PRIOR: Dict[str, float] = {
     "system": 1.00,
@@ -65,8 +85,71 @@ log = logging.getLogger("chroma_handler")
 # Client & Embedding
 # ---------------------------------------------------------------------
 
-def _embedder():
-    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBED_MODEL)
+class _SharedEmbeddingFunction(embedding_functions.EmbeddingFunction):
+    """
+    Embedding function Chroma sopra core/embedding_service: modello caricato
+    una volta per processo, LRU globale, encode concorrenti fusi in un batch.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    def __call__(self, input):  # firma richiesta da chromadb: (self, input)
+        return [v.tolist() for v in get_embedding_service(self.model_name).encode(list(input))]
+
+    # chromadb>=1.x persiste nome e config della embedding function e rifiuta
+    # un nome diverso alla riapertura: ci presentiamo come la funzione stock
+    # (sentence_transformer) con cui sono state create le collection esistenti.
+    @staticmethod
+    def name() -> str:
+        return "sentence_transformer"
+
+    def default_space(self) -> str:
+        return "cosine"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "device": "cpu", "normalize_embeddings": False, "kwargs": {}}
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "_SharedEmbeddingFunction":
+        return _SharedEmbeddingFunction(config.get("model_name") or EMBED_MODEL)
+
+
+def _embedder(model_name: str = EMBED_MODEL):
+    return _SharedEmbeddingFunction(model_name)
+
+def _encode_query(text: str) -> np.ndarray:
+    return get_embedding_service(EMBED_MODEL).encode_one(text)  # già normalizzato
+
+def embed_query(text: str) -> np.ndarray:
+    """
+    Vettore (normalizzato) della query per EMBED_MODEL. Dentro un
+    embedding_scope() viene calcolato una sola volta per richiesta e
+    condiviso con semantic cache e memorie (stesso modello → stessa chiave).
+    """
+    return cached_embedding(text, EMBED_MODEL, _encode_query)
+
+async def _encode_query_async(text: str) -> np.ndarray:
+    return await get_embedding_service(EMBED_MODEL).encode_one_async(text)
+
+async def embed_query_async(text: str) -> np.ndarray:
+    """Come embed_query, attendendo il batch dell'executor senza bloccare l'event loop."""
+    return await cached_embedding_async(text, EMBED_MODEL, _encode_query_async)
+
+def query_args(text: str) -> Dict[str, Any]:
+    """kwargs per col.query(): query_embeddings precalcolati, query_texts se l'embedding fallisce."""
+    try:
+        return {"query_embeddings": [embed_query(text).tolist()]}
+    except Exception as e:
+        log.debug(f"embed_query failed, using query_texts: {e}")
+        return {"query_texts": [text]}
+
+async def query_args_async(text: str) -> Dict[str, Any]:
+    try:
+        return {"query_embeddings": [(await embed_query_async(text)).tolist()]}
+    except Exception as e:
+        log.debug(f"embed_query failed, using query_texts: {e}")
+        return {"query_texts": [text]}
 
 def get_client():
     """
@@ -128,6 +211,120 @@ def _col(name: str):
             # se un'altra istanza l'ha creata nel frattempo
             return client.get_collection(name=name, embedding_function=_embedder())
 
+# ---------------------------------------------------------------------
+# Keyword index (token → ids)
+# ---------------------------------------------------------------------
+
+def _kw() -> Optional[KeywordIndex]:
+    """Indice keyword condiviso; None se non apribile (si torna alla scansione)."""
+    try:
+        return get_keyword_index()
+    except Exception as e:
+        log.warning(f"keyword index unavailable: {e}")
+        return None
+
+def keyword_index_add(name: str, ids: List[str], docs: List[str], metas: List[Dict[str, Any]]) -> None:
+    """Indicizza i documenti nel keyword index (no-op se non disponibile; errori solo loggati)."""
+    idx = _kw()
+    if idx is None:
+        return
+    try:
+        idx.add(name, ids, docs, metas)
+    except Exception as e:
+        log.warning(f"keyword index add failed on {name}: {e}")
+
+def keyword_index_delete(name: str, ids: List[str]) -> None:
+    """Rimuove gli id dal keyword index (no-op se non disponibile; errori solo loggati)."""
+    idx = _kw()
+    if idx is None:
+        return
+    try:
+        idx.delete(name, ids)
+    except Exception as e:
+        log.warning(f"keyword index delete failed on {name}: {e}")
+
+def _scan_collection(name: str, batch: int = 512):
+    """Batch (ids, docs, metas) dell'intera collection; solo per il bootstrap dell'indice."""
+    col = _col(name)
+    try:
+        offset = 0
+        while True:
+            data = col.get(include=["documents", "metadatas"], limit=batch, offset=offset)
+            ids = data.get("ids") or []
+            if not ids:
+                return
+            yield ids, data.get("documents") or [], data.get("metadatas") or []
+            offset += len(ids)
+    except Exception:
+        # versioni che non supportano include/offset/limit → full get
+        data = col.get()
+        yield data.get("ids") or [], data.get("documents") or [], data.get("metadatas") or []
+
+def _kw_ready(name: str) -> Optional[KeywordIndex]:
+    """Indice pronto per `name` (indicizza la collection alla prima richiesta)."""
+    idx = _kw()
+    if idx is None:
+        return None
+    try:
+        idx.ensure_built(name, lambda: _scan_collection(name))
+        return idx
+    except Exception as e:
+        log.warning(f"keyword index build failed on {name}: {e}")
+        return None
+
+def keyword_search(name: str, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Top `limit` documenti di `name` per BM25 sulla query (indice keyword).
+    Stesso formato di _query_collection, con similarity 0 e campo "bm25".
+    """
+    idx = _kw_ready(name)
+    if idx is None:
+        raise RuntimeError("keyword index unavailable")
+    hits = idx.search(name, query, limit=limit)
+    docs = idx.get_docs(name, [h[0] for h in hits])
+    out: List[Dict[str, Any]] = []
+    for _id, bm25 in hits:
+        doc, md = docs.get(_id, (None, {}))
+        out.append({
+            "id": _id,
+            "document": doc,
+            "metadata": md,
+            "distance": 1.0,          # peggiore (non abbiamo embedding)
+            "similarity": 0.0,        # sim 0 → verrà tenuta in ranking via recency/src/bm25
+            "bm25": round(bm25, 6),
+            "collection": name
+        })
+    return out
+
+def hybrid_collection_query(name: str, query: str, n: int, where: Optional[Dict[str, Any]] = None,
+                            qargs: Optional[Dict[str, Any]] = None, col: Any = None) -> List[Dict[str, Any]]:
+    """
+    Top `n` di `name` per RRF di query vettoriale Chroma e BM25 (stesso `where`).
+    `col` permette di passare una collection già aperta (es. get_collection senza create).
+    """
+    return hybrid_query(
+        col if col is not None else _col(name), name, query, n,
+        qargs or query_args(query), kw=_kw_ready(name), where=where,
+    )
+
+def _kw_annotate(pool: List[Dict[str, Any]], query: str) -> None:
+    """Aggiunge "bm25" agli item del pool che non ce l'hanno (segnale per _rank)."""
+    idx = _kw()
+    if idx is None:
+        return
+    by_col: Dict[str, List[Dict[str, Any]]] = {}
+    for it in pool:
+        if "bm25" not in it:
+            by_col.setdefault(str(it.get("collection")), []).append(it)
+    for name, its in by_col.items():
+        try:
+            scores = idx.bm25_scores(name, query, [str(it["id"]) for it in its])
+        except Exception as e:
+            log.debug(f"bm25 annotate failed on {name}: {e}")
+            continue
+        for it in its:
+            it["bm25"] = round(scores.get(str(it["id"]), 0.0), 6)
+
 # ---------------------------------------------------------------------
 # Setup Collections
 # ---------------------------------------------------------------------
@@ -148,6 +345,7 @@ def add_fact(subject: str, value: str, source: str = "system", metadata: Dict[st
     md = {"subject": subject, "value": value, "source": source, "ts": int(time.time())}
     if metadata: md.update(metadata)
     col.add(ids=[_id], documents=[f"{subject} = {value}"], metadatas=[md])
+    keyword_index_add(FACTS, [_id], [f"{subject} = {value}"], [md])
     return _id
 
 def add_pref(key: str, value: str, scope: str = "global", source: str = "user",
@@ -157,6 +355,7 @@ def add_pref(key: str, value: str, scope: str = "global", source: str = "user",
     md = {"key": key, "value": value, "scope": scope, "source": source, "ts": int(time.time())}
     if metadata: md.update(metadata)
     col.add(ids=[_id], documents=[f"{key}={value} (scope:{scope})"], metadatas=[md])
+    keyword_index_add(PREFS, [_id], [f"{key}={value} (scope:{scope})"], [md])
     return _id
 
 def add_bet(event: str, market: str, odds: float, stake: float, result: str | None = None,
@@ -170,6 +369,7 @@ def add_bet(event: str, market: str, odds: float, stake: float, result: str | No
     team_part = f" | team={md.get('team')}" if md.get("team") else ""
     doc = f"{event} | {market} | odds={odds} | stake={stake} | result={md['result']}{team_part}"
     col.add(ids=[_id], documents=[doc], metadatas=[md])
+    keyword_index_add(BETS, [_id], [doc], [md])
     return _id
 
 # ---------------------------------------------------------------------
@@ -191,24 +391,39 @@ def _to_similarity(dist: float) -> float:
 
 def _rank(items: List[Dict[str, Any]], k: int,
           w_sim: float = W_SIM, w_time: float = W_TIME, w_src: float = W_SRC,
-          half_life_days: float = HALF_LIFE_D) -> List[Dict[str, Any]]:
-    ranked = []
-    for it in items:
-        md = it.get("metadata", {}) or {}
-        sim = float(it.get("similarity", 0.0))
-        rec = _recency_score(int(md.get("ts") or 0), half_life_days=half_life_days)
-        src = _src_prior(str(md.get("source") or ""))
-        score = w_sim * sim + w_time * rec + w_src * src
-        it["score"] = round(score, 6)
-        it["sim"] = round(sim, 6)
-        it["recency"] = round(rec, 6)
-        it["src_prior"] = round(src, 3)
-        ranked.append(it)
-    ranked.sort(key=lambda x: x["score"], reverse=True)
-    return ranked[:k]
-
-# --- Fallback substring search (se non ci sono embedding/query fallisce)
+          half_life_days: float = HALF_LIFE_D, w_kw: float = W_KW) -> List[Dict[str, Any]]:
+    if not items:
+        return []
+    mds = [it.get("metadata", {}) or {} for it in items]
+    # similarità assoluta (confrontabile tra collection); il contributo lessicale
+    # degli item ibridi entra come BM25 pesato da w_kw, non tramite la relevance RRF
+    sim = np.array([float(it.get("similarity", 0.0)) for it in items], dtype=np.float64)
+    ts  = np.array([int(md.get("ts") or 0) for md in mds], dtype=np.float64)
+    src = np.array([_src_prior(str(md.get("source") or "")) for md in mds], dtype=np.float64)
+    # stessa formula di _recency_score, su tutto il pool; ts=0 → recency 0
+    age_days = np.maximum(0.0, (int(time.time()) - ts) / 86400.0)
+    rec = np.where(ts > 0, np.exp(-math.log(2) * age_days / max(1e-9, half_life_days)), 0.0)
+    score = w_sim * sim + w_time * rec + w_src * src
+    if w_kw:
+        # BM25 normalizzato sul massimo del pool → [0, 1] come gli altri segnali
+        bm25 = np.array([float(it.get("bm25") or 0.0) for it in items], dtype=np.float64)
+        if bm25.max() > 0:
+            score = score + w_kw * bm25 / bm25.max()
+    for i, it in enumerate(items):
+        it["score"] = round(float(score[i]), 6)
+        it["sim"] = round(float(sim[i]), 6)
+        it["recency"] = round(float(rec[i]), 6)
+        it["src_prior"] = round(float(src[i]), 3)
+    # argsort stabile su -score: a parità l'ordine di arrivo resta quello del pool
+    order = np.argsort(-np.round(score, 6), kind="stable")[:k]
+    return [items[i] for i in order]
+
+# --- Fallback keyword search (se non ci sono embedding/query fallisce)
 def _substring_fallback(name: str, query: str, limit: int = 128) -> List[Dict[str, Any]]:
+    try:
+        return keyword_search(name, query, limit=limit)
+    except Exception as e:
+        log.debug(f"keyword fallback unavailable on {name}, scanning: {e}")
     col = _col(name)
     out: List[Dict[str, Any]] = []
     q = (query or "").lower()
@@ -235,11 +450,17 @@ def _substring_fallback(name: str, query: str, limit: int = 128) -> List[Dict[st
             })
     return out
 
-def _query_collection(name: str, query: str, n: int) -> List[Dict[str, Any]]:
+def _query_collection(name: str, query: str, n: int,
+                      qargs: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    if HYBRID_ENABLED:
+        try:
+            return hybrid_collection_query(name, query, n, qargs=qargs)
+        except Exception:
+            return _substring_fallback(name, query, limit=max(128, n*10))
     col = _col(name)
     try:
         res = col.query(
-            query_texts=[query],
+            **(qargs or query_args(query)),
             n_results=n,
             include=["documents", "metadatas", "distances"]  # ← niente "ids"
         )
@@ -264,55 +485,75 @@ def _query_collection(name: str, query: str, n: int) -> List[Dict[str, Any]]:
 def search_topk(query: str, k: int = 5, expand: Optional[int] = None,
                 w_sim: float = W_SIM, w_time: float = W_TIME, w_src: float = W_SRC,
                 half_life_days: float = HALF_LIFE_D,
-                collections: Tuple[str, ...] = (FACTS, PREFS, BETS)) -> List[Dict[str, Any]]:
-    expand = expand or (k * 3)
+                collections: Tuple[str, ...] = (FACTS, PREFS, BETS),
+                w_kw: float = W_KW) -> List[Dict[str, Any]]:
+    expand = expand or (candidate_pool(k) if HYBRID_ENABLED else k * 3)
+    qargs = query_args(query)
     pool: List[Dict[str, Any]] = []
     for c in collections:
         try:
-            pool.extend(_query_collection(c, query, n=expand))
+            pool.extend(_query_collection(c, query, n=expand, qargs=qargs))
         except Exception:
             pass
-    return _rank(pool, k=k, w_sim=w_sim, w_time=w_time, w_src=w_src, half_life_days=half_life_days)
+    if w_kw:
+        _kw_annotate(pool, query)
+    return _rank(pool, k=k, w_sim=w_sim, w_time=w_time, w_src=w_src,
+                 half_life_days=half_life_days, w_kw=w_kw)
+
+async def search_topk_async(query: str, k: int = 5, expand: Optional[int] = None,
+                            w_sim: float = W_SIM, w_time: float = W_TIME, w_src: float = W_SRC,
+                            half_life_days: float = HALF_LIFE_D,
+                            collections: Tuple[str, ...] = (FACTS, PREFS, BETS),
+                            timeout_s: float = MEM_SEARCH_TIMEOUT_S,
+                            w_kw: float = W_KW) -> List[Dict[str, Any]]:
+    """
+    Come search_topk, ma per handler async: l'embedding della query viene
+    calcolato una volta (sul batch dell'executor, attendendolo senza
+    bloccare l'event loop) e condiviso; ogni collection è
+    interrogata in un thread proprio, in parallelo. Scaduto `timeout_s` si
+    classificano i risultati delle collection già rientrate (le altre sono
+    abbandonate, non attese).
+    """
+    expand = expand or (candidate_pool(k) if HYBRID_ENABLED else k * 3)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max(0.0, timeout_s)
+
+    qargs = await query_args_async(query)
+    tasks = {
+        asyncio.ensure_future(asyncio.to_thread(_query_collection, c, query, expand, qargs)): c
+        for c in collections
+    }
+    done, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - loop.time()))
+    for t in pending:
+        t.cancel()  # il thread finisce per conto suo, il risultato viene scartato
+    if pending:
+        log.warning(f"search_topk_async: deadline {timeout_s}s, skipped {sorted(tasks[t] for t in pending)}")
+
+    pool: List[Dict[str, Any]] = []
+    for t in tasks:  # ordine delle collection, come search_topk
+        if t in done and t.exception() is None:
+            pool.extend(t.result())
+    if w_kw:
+        await asyncio.to_thread(_kw_annotate, pool, query)
+    return _rank(pool, k=k, w_sim=w_sim, w_time=w_time, w_src=w_src,
+                 half_life_days=half_life_days, w_kw=w_kw)
 
 # ---------------------------------------------------------------------
 # Re-embed utilities
 # ---------------------------------------------------------------------
 
-def reembed_collection(name: str, batch: int = 512) -> int:
+def reembed_collection(name: str, batch: int = 512, resume: bool = True) -> int:
     """
-    Rigenera gli embedding per TUTTI i record della collection (se presenti).
-    Ritorna il numero processato. Compat con versioni senza include/offset.
+    Rigenera gli embedding per TUTTI i record della collection (se presenti),
+    in streaming con checkpoint (utils/chroma_reembed). Ritorna il numero
+    processato, -1 se il job fallisce (riprende dal checkpoint alla prossima chiamata).
     """
-    col = _col(name)
-
-    # 1) API recente: include/offset/limit (senza "ids" in include)
+    from utils.chroma_reembed import reembed
     try:
-        total = 0
-        offset = 0
-        while True:
-            data = col.get(include=["documents", "metadatas"], limit=batch, offset=offset)
-            ids  = data.get("ids") or []
-            if not ids:
-                break
-            docs = data.get("documents") or []
-            metas= data.get("metadatas") or []
-            col.update(ids=ids, documents=docs, metadatas=metas)
-            offset += len(ids)
-            total  += len(ids)
-        return total
-    except Exception:
-        # 2) fallback: versioni che non supportano include/offset/limit
-        try:
-            data = col.get()
-            ids  = data.get("ids") or []
-            if not ids:
-                return 0
-            docs = data.get("documents") or []
-            metas= data.get("metadatas") or []
-            col.update(ids=ids, documents=docs, metadatas=metas)
-            return len(ids)
-        except Exception:
-            return -1
+        return int(reembed(name, model_name=EMBED_MODEL, batch=batch, resume=resume)["processed"])
+    except Exception as e:
+        log.error(f"[reembed] {name} failed: {e}")
+        return -1
 
 def reembed_all(batch: int = 512) -> Dict[str, int]:
     out = {}
@@ -370,7 +611,7 @@ def _query_collection_where(name: str, query: str, n: int, where: dict | None =
     col = _col(name)
     try:
         res = col.query(
-            query_texts=[query],
+            **query_args(query),
             n_results=int(n),
             where=where or {},
             include=["documents", "metadatas", "distances"]
@@ -471,6 +712,7 @@ def add_bets_batch(items: List[Dict[str, Any]]) -> Dict[str, Any]:
 
     if ids:
         col.add(ids=ids, documents=docs, metadatas=metas)
+        keyword_index_add(BETS, ids, docs, metas)
 
     return {"inserted": ids, "skipped": skipped, "count": len(ids)}
 
@@ -489,6 +731,12 @@ def cleanup_old(collection: str, older_than_days: int, dry_run: bool = False) ->
     try:
         if not dry_run:
             col.delete(where={"ts": {"$lt": threshold}})
+            idx = _kw()
+            if idx is not None:
+                try:
+                    idx.delete_older_than(collection, threshold)
+                except Exception as e:
+                    log.warning(f"keyword index cleanup failed on {collection}: {e}")
             return {"deleted": -1, "method": "where_clause", "dry_run": False}
     except Exception:
         pass
@@ -512,6 +760,7 @@ def cleanup_old(collection: str, older_than_days: int, dry_run: bool = False) ->
 
         if to_del:
             col.delete(ids=[c["id"] for c in to_del])
+            keyword_index_delete(collection, [c["id"] for c in to_del])
 
         return {"deleted": len(to_del), "candidates": to_del[:10], "dry_run": False}
     except Exception as e:
@@ -524,17 +773,17 @@ def cleanup_old_bets(days: int = 365, dry_run: bool = False) -> Dict[str, Any]:
     return cleanup_old(BETS, days, dry_run=dry_run)
 
 def migrate_collection(old_name: str, new_name: str, new_model: str,
-                       batch_size: int = 500, delete_old: bool = False) -> Dict[str, Any]:
+                       batch_size: int = 500, delete_old: bool = False,
+                       resume: bool = True) -> Dict[str, Any]:
     """
     Copia old_name -> new_name rigenerando embedding con 'new_model'.
-    Supporta batch per collezioni grandi e metriche di progresso.
+    Streaming a batch con checkpoint/resume e metriche di throughput
+    (utils/chroma_reembed); old_name resta interrogabile durante la copia.
     """
-    import time as time_module
+    from utils.chroma_reembed import reembed
 
-    start = time_module.time()
     client = get_client()
-
-    new_embed = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=new_model)
+    new_embed = _embedder(new_model)
     try:
         new_col = client.create_collection(name=new_name, embedding_function=new_embed)
         log.info(f"[migrate] created {new_name}")
@@ -545,48 +794,28 @@ def migrate_collection(old_name: str, new_name: str, new_model: str,
         else:
             raise
 
-    old_col = _col(old_name)
-
-    total_migrated, batch_count, offset = 0, 0, 0
-    try:
-        while True:
-            data = old_col.get(include=["documents","metadatas"], limit=batch_size, offset=offset)
-            ids   = data.get("ids") or []
-            if not ids:
-                break
-            docs  = data.get("documents") or []
-            metas = data.get("metadatas") or []
-            new_col.add(ids=ids, documents=docs, metadatas=metas)
-            total_migrated += len(ids)
-            batch_count    += 1
-            offset         += batch_size
-            log.info(f"[migrate] batch {batch_count}: +{len(ids)} (total={total_migrated})")
-    except Exception:
-        # Fallback: full get (collezione piccola / client vecchio)
-        log.warning("[migrate] offset/limit unsupported, using full get()")
-        data = old_col.get()
-        ids   = data.get("ids") or []
-        docs  = data.get("documents") or []
-        metas = data.get("metadatas") or []
-        if ids:
-            new_col.add(ids=ids, documents=docs, metadatas=metas)
-            total_migrated = len(ids)
-            batch_count = 1
+    report = reembed(old_name, model_name=new_model, batch=batch_size,
+                     target=new_name, target_col=new_col, resume=resume)
 
-    elapsed = time_module.time() - start
     old_deleted = False
-    if delete_old and total_migrated > 0:
+    if delete_old and report["processed"] > 0:
         try:
             client.delete_collection(old_name)
             old_deleted = True
+            idx = _kw()
+            if idx is not None:
+                idx.drop(old_name)
             log.info(f"[migrate] deleted old collection {old_name}")
         except Exception as e:
             log.error(f"[migrate] delete old failed: {e}")
 
     return {
-        "migrated": total_migrated,
-        "time_seconds": round(elapsed, 2),
-        "batches": batch_count,
+        "migrated": report["processed"],
+        "time_seconds": report["time_seconds"],
+        "batches": report["batches"],
         "old_deleted": old_deleted,
-        "rate_per_second": round(total_migrated/elapsed, 2) if elapsed > 0 else 0.0
+        "rate_per_second": report["rate_per_second"],
+        "resumed_from": report["resumed_from"],
+        "embed_seconds": report["embed_seconds"],
+        "write_seconds": report["write_seconds"],
     }
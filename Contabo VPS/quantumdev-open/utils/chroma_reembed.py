@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/chroma_reembed.py — Re-embedding / migrazione di collection Chroma in streaming
+
+Prima `reembed_collection` e `migrate_collection` paginavano con `offset` e
+chiamavano col.update(documents=...): Chroma ri-embeddava un batch alla volta
+sul suo thread, e il fallback per i client vecchi caricava tutta la
+collection in memoria. Qui:
+
+- Streaming a pagine: la pagina successiva si legge mentre si codifica la
+  corrente (un thread di prefetch). Sui client senza offset/limit si leggono
+  solo gli id (include=[]) e poi i documenti a blocchi di id.
+- Encoder batched: SentenceTransformer condiviso (core/embedding_service),
+  `batch_size=REEMBED_ENCODE_BATCH`; con REEMBED_PROCESSES > 1 usa il pool
+  multi-processo di sentence-transformers. Non passa dalla LRU né
+  dall'executor di inferenza: un job lungo non svuota la cache e non occupa
+  la coda delle richieste online.
+- Scrittura diretta `embeddings=` (update in place, upsert sulla collection
+  di destinazione per le migrazioni): Chroma non ricalcola nulla.
+- Checkpoint JSON dopo ogni batch scritto (REEMBED_CHECKPOINT_DIR): un job
+  interrotto riparte dall'ultimo offset con resume=True.
+- Report di throughput: record/s, tempo di embedding e di scrittura.
+
+Per cambiare modello senza fermo: migrate_collection verso una nuova
+collection (la vecchia resta servibile), poi si punta la config alla nuova.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from core.embedding_service import canonical_model_name, get_sentence_model
+from utils.chroma_handler import EMBED_MODEL, PERSIST_DIR, _col, keyword_index_add
+
+log = logging.getLogger(__name__)
+
+# ===================== ENVIRONMENT CONFIG =====================
+REEMBED_ENCODE_BATCH = int(os.getenv("REEMBED_ENCODE_BATCH", "64"))
+REEMBED_PROCESSES = int(os.getenv("REEMBED_PROCESSES", "1"))
+REEMBED_CHECKPOINT_DIR = os.getenv("REEMBED_CHECKPOINT_DIR", f"{PERSIST_DIR.rstrip('/')}_reembed")
+
+Page = Tuple[int, List[str], List[Any], List[Any]]  # (offset, ids, documents, metadatas)
+
+
+def _pages(col: Any, batch: int, start: int = 0) -> Iterator[Page]:
+    """Pagine della collection a partire da `start`, senza caricarla tutta."""
+    offset = start
+    while True:
+        try:
+            data = col.get(include=["documents", "metadatas"], limit=batch, offset=offset)
+        except Exception:
+            if offset != start:
+                raise  # errore a metà job: il checkpoint permette il resume
+            break      # client senza include/offset/limit
+        ids = data.get("ids") or []
+        if not ids:
+            return
+        yield offset, ids, data.get("documents") or [], data.get("metadatas") or []
+        offset += len(ids)
+    try:
+        all_ids = col.get(include=[]).get("ids") or []
+    except Exception:
+        all_ids = None
+    if all_ids is None:
+        # ultimo fallback: get() completo, comunque scritto a batch
+        data = col.get()
+        all_ids = data.get("ids") or []
+        docs, metas = data.get("documents") or [], data.get("metadatas") or []
+        for off in range(start, len(all_ids), batch):
+            yield off, all_ids[off:off + batch], docs[off:off + batch], metas[off:off + batch]
+        return
+    for off in range(start, len(all_ids), batch):
+        chunk = all_ids[off:off + batch]
+        try:
+            data = col.get(ids=chunk, include=["documents", "metadatas"])
+        except TypeError:
+            data = col.get(ids=chunk)
+        yield off, data.get("ids") or chunk, data.get("documents") or [], data.get("metadatas") or []
+
+
+class BatchEncoder:
+    """Encoder per job di re-embedding: batch grandi, opzionalmente multi-processo."""
+
+    def __init__(self, model_name: str, processes: int = REEMBED_PROCESSES,
+                 batch_size: int = REEMBED_ENCODE_BATCH, model: Any = None) -> None:
+        self.model_name = canonical_model_name(model_name)
+        self.batch_size = max(1, batch_size)
+        self.model = model if model is not None else get_sentence_model(self.model_name)
+        if self.model is None:
+            raise RuntimeError("sentence-transformers not available")
+        self._mp_pool = None
+        if processes > 1 and hasattr(self.model, "start_multi_process_pool"):
+            self._mp_pool = self.model.start_multi_process_pool(target_devices=["cpu"] * processes)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if self._mp_pool is not None:
+            vecs = np.asarray(self.model.encode_multi_process(
+                texts, self._mp_pool, batch_size=self.batch_size), dtype=np.float32)
+            norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+            return vecs / np.maximum(norms, 1e-12)
+        return np.asarray(self.model.encode(
+            texts, batch_size=self.batch_size, normalize_embeddings=True), dtype=np.float32)
+
+    def close(self) -> None:
+        if self._mp_pool is not None:
+            self.model.stop_multi_process_pool(self._mp_pool)
+            self._mp_pool = None
+
+
+class Checkpoint:
+    """Progresso di un job (offset già scritto) in un file JSON, scritto in modo atomico."""
+
+    def __init__(self, job_id: str, directory: str = REEMBED_CHECKPOINT_DIR) -> None:
+        self.path = os.path.join(directory, re.sub(r"[^\w.-]+", "_", job_id) + ".json")
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, **state: Any) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**state, "updated": int(time.time())}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def reembed(
+    name: str,
+    model_name: str = EMBED_MODEL,
+    batch: int = 512,
+    target: Optional[str] = None,
+    target_col: Any = None,
+    resume: bool = True,
+    encoder: Optional[BatchEncoder] = None,
+    checkpoint_dir: str = REEMBED_CHECKPOINT_DIR,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Ricalcola gli embedding di `name` con `model_name`.
+
+    Senza `target` aggiorna la collection in place (col.update(embeddings=...));
+    con `target` copia documenti, metadati ed embedding nella collection
+    `target` (upsert, `target_col` se già aperta) e aggiorna l'indice keyword.
+    Ritorna il report del job; solleva se la lettura o la scrittura falliscono
+    (il checkpoint resta per il resume).
+    """
+    src = _col(name)
+    dst = target_col if target_col is not None else (_col(target) if target else src)
+    job_id = f"{name}->{target or name}@{canonical_model_name(model_name)}"
+    ckpt = Checkpoint(job_id, checkpoint_dir)
+    state = ckpt.load() if resume else {}
+    start = int(state.get("offset", 0))
+    processed = base = int(state.get("processed", 0))
+    if start:
+        log.info(f"[reembed] {job_id}: resuming from offset {start}")
+
+    own_encoder = encoder is None
+    enc = encoder or BatchEncoder(model_name)
+    report: Dict[str, Any] = {
+        "collection": name, "target": target or name, "model": enc.model_name,
+        "resumed_from": start, "batches": 0, "embed_seconds": 0.0, "write_seconds": 0.0,
+    }
+    t0 = time.perf_counter()
+    pages = _pages(src, max(1, batch), start)
+    try:
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="reembed-read") as reader:
+            nxt = reader.submit(next, pages, None)
+            while True:
+                page = nxt.result()
+                if page is None:
+                    break
+                nxt = reader.submit(next, pages, None)  # prefetch mentre si codifica
+                offset, ids, docs, metas = page
+                docs = [d or "" for d in docs]
+
+                t = time.perf_counter()
+                vecs = enc.encode(docs)
+                report["embed_seconds"] += time.perf_counter() - t
+
+                t = time.perf_counter()
+                embeddings = vecs.tolist()
+                if target:
+                    dst.upsert(ids=ids, embeddings=embeddings, documents=docs, metadatas=metas or None)
+                    keyword_index_add(target, ids, docs, metas)
+                else:
+                    dst.update(ids=ids, embeddings=embeddings)
+                report["write_seconds"] += time.perf_counter() - t
+
+                processed += len(ids)
+                report["batches"] += 1
+                ckpt.save(job=job_id, offset=offset + len(ids), processed=processed)
+                elapsed = time.perf_counter() - t0
+                log.info(f"[reembed] {job_id}: +{len(ids)} (total={processed}, "
+                         f"{(processed - base) / max(elapsed, 1e-9):.1f}/s)")
+                if progress is not None:
+                    progress({"processed": processed, "offset": offset + len(ids)})
+    finally:
+        if own_encoder:
+            enc.close()
+
+    ckpt.clear()
+    elapsed = time.perf_counter() - t0
+    done_now = processed - base
+    report.update({
+        "processed": processed,
+        "time_seconds": round(elapsed, 2),
+        "embed_seconds": round(report["embed_seconds"], 2),
+        "write_seconds": round(report["write_seconds"], 2),
+        "rate_per_second": round(done_now / elapsed, 2) if elapsed > 0 else 0.0,
+    })
+    return report
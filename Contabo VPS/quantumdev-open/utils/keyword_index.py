@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+utils/keyword_index.py — Indice invertito (token → id) per le collection Chroma
+
+Quando una query Chroma falliva, `_substring_fallback` leggeva l'intera
+collection (col.get() senza limit sui client vecchi) e faceva lower() di ogni
+documento in Python: O(collection) per ogni query degradata. Questo indice,
+tenuto in sync dagli add_* di utils/chroma_handler, risponde in O(postings
+dei token della query):
+
+- keyword lookup / BM25 (k1, b classici) per collection → path di fallback
+  e ramo lessicale del retriever ibrido (core/hybrid_retrieval);
+- filtri `where` di uguaglianza sui metadati (come Chroma: user_id, file_id…);
+- bm25_scores(ids) → segnale lessicale per il ranking ibrido.
+
+Persistenza: SQLite in WAL accanto a CHROMA_PERSIST_DIR (default
+"<CHROMA_PERSIST_DIR>_kw.sqlite"), quindi condiviso tra i worker.
+Le collection già popolate prima dell'indice vengono indicizzate una volta
+(`ensure_built`, unica scansione completa) e marcate come costruite.
+
+Tokenizzazione: lower-case, sequenze \\w+ (unicode). A differenza del vecchio
+substring match un frammento di parola ("mil") non trova "milan".
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+# ===================== ENVIRONMENT CONFIG =====================
+_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "/memory/chroma")
+KW_INDEX_PATH = os.getenv("KW_INDEX_PATH", f"{_PERSIST_DIR.rstrip('/')}_kw.sqlite")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    collection TEXT NOT NULL,
+    id         TEXT NOT NULL,
+    document   TEXT,
+    metadata   TEXT,
+    ts         INTEGER NOT NULL DEFAULT 0,
+    len        INTEGER NOT NULL,
+    PRIMARY KEY (collection, id)
+);
+CREATE INDEX IF NOT EXISTS docs_ts ON docs (collection, ts);
+CREATE TABLE IF NOT EXISTS postings (
+    collection TEXT NOT NULL,
+    token      TEXT NOT NULL,
+    id         TEXT NOT NULL,
+    tf         INTEGER NOT NULL,
+    PRIMARY KEY (collection, token, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS built (
+    collection TEXT PRIMARY KEY,
+    ts         INTEGER NOT NULL
+);
+"""
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+class KeywordIndex:
+    """
+    Uso:
+        idx = get_keyword_index()
+        idx.add("facts", ids, documents, metadatas)
+        hits = idx.search("facts", "quote milan", limit=20)   # [(id, bm25), ...]
+    """
+
+    def __init__(self, path: str = KW_INDEX_PATH, k1: float = BM25_K1, b: float = BM25_B) -> None:
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    # ---------------- scrittura ----------------
+
+    def add(self, collection: str, ids: Sequence[str], documents: Sequence[Optional[str]],
+            metadatas: Optional[Sequence[Optional[Dict[str, Any]]]] = None) -> None:
+        """Indicizza (o re-indicizza) i documenti; idempotente sullo stesso id."""
+        metas = list(metadatas or [None] * len(ids))
+        docs_rows, post_rows = [], []
+        for _id, doc, md in zip(ids, documents, metas, strict=True):
+            toks = Counter(tokenize(doc or ""))
+            md = md or {}
+            docs_rows.append((collection, _id, doc, json.dumps(md, ensure_ascii=False, default=str),
+                              int(md.get("ts") or 0), sum(toks.values())))
+            post_rows.extend((collection, t, _id, tf) for t, tf in toks.items())
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM postings WHERE collection=? AND id=?", [(collection, i) for i in ids]
+            )
+            self._conn.executemany("INSERT OR REPLACE INTO docs VALUES (?,?,?,?,?,?)", docs_rows)
+            self._conn.executemany("INSERT INTO postings VALUES (?,?,?,?)", post_rows)
+
+    def delete(self, collection: str, ids: Iterable[str]) -> None:
+        rows = [(collection, i) for i in ids]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM postings WHERE collection=? AND id=?", rows)
+            self._conn.executemany("DELETE FROM docs WHERE collection=? AND id=?", rows)
+
+    def delete_older_than(self, collection: str, threshold_ts: int) -> int:
+        """Specchio di col.delete(where={"ts": {"$lt": ...}}); i doc senza ts restano."""
+        with self._lock:
+            ids = [r[0] for r in self._conn.execute(
+                "SELECT id FROM docs WHERE collection=? AND ts>0 AND ts<?", (collection, threshold_ts)
+            )]
+        self.delete(collection, ids)
+        return len(ids)
+
+    def drop(self, collection: str) -> None:
+        with self._lock, self._conn:
+            for table in ("postings", "docs", "built"):
+                self._conn.execute(f"DELETE FROM {table} WHERE collection=?", (collection,))  # noqa: S608
+
+    # ---------------- bootstrap ----------------
+
+    def is_built(self, collection: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM built WHERE collection=?", (collection,)
+            ).fetchone() is not None
+
+    def ensure_built(self, collection: str,
+                     scan: Callable[[], Iterable[Tuple[List[str], List[Any], List[Any]]]]) -> bool:
+        """
+        Prima volta per `collection`: indicizza tutti i batch (ids, docs, metas)
+        prodotti da `scan` e marca la collection come costruita. True se ha scansionato.
+        """
+        if self.is_built(collection):
+            return False
+        n = 0
+        for ids, docs, metas in scan():
+            self.add(collection, ids, docs, metas)
+            n += len(ids)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO built VALUES (?,?)", (collection, int(time.time())))
+        log.info(f"keyword index built for [{collection}]: {n} docs")
+        return True
+
+    # ---------------- lettura ----------------
+
+    def _stats(self, collection: str) -> Tuple[int, float]:
+        n, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(len), 0) FROM docs WHERE collection=?", (collection,)
+        ).fetchone()
+        return int(n), (float(total) / n if n else 0.0)
+
+    @staticmethod
+    def _where_sql(where: Optional[Dict[str, Any]]) -> Tuple[str, List[Any]]:
+        """Filtro di uguaglianza sui metadati ({k: v} o {"$and": [{k: v}, ...]})."""
+        if not where:
+            return "", []
+        conds = where.get("$and") if set(where) == {"$and"} else [where]
+        sql, args = "", []
+        for cond in conds or []:
+            for key, value in cond.items():
+                if key.startswith("$") or isinstance(value, (dict, list)):
+                    raise ValueError(f"unsupported where clause: {key}")
+                sql += " AND json_extract(d.metadata, ?) = ?"
+                args += [f'$."{key}"', value]
+        return sql, args
+
+    def _bm25(self, collection: str, query: str,
+              ids: Optional[Sequence[str]] = None,
+              where: Optional[Dict[str, Any]] = None) -> Dict[str, float]:
+        terms = set(tokenize(query))
+        if not terms:
+            return {}
+        scores: Dict[str, float] = {}
+        where_sql, where_args = self._where_sql(where)
+        with self._lock:
+            n_docs, avgdl = self._stats(collection)
+            if not n_docs:
+                return {}
+            id_filter, id_args = "", []
+            if ids is not None:
+                if not ids:
+                    return {}
+                id_filter = f" AND p.id IN ({','.join('?' * len(ids))})"
+                id_args = list(ids)
+            # i filtri sono solo segnaposto "?": la query è la stessa per ogni token
+            sql = ("SELECT p.id, p.tf, d.len FROM postings p JOIN docs d"  # noqa: S608
+                   " ON d.collection=p.collection AND d.id=p.id"
+                   " WHERE p.collection=? AND p.token=?" + id_filter + where_sql)
+            for term in terms:
+                df = self._conn.execute(
+                    "SELECT COUNT(*) FROM postings WHERE collection=? AND token=?", (collection, term)
+                ).fetchone()[0]
+                if not df:
+                    continue
+                idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+                rows = self._conn.execute(sql, [collection, term, *id_args, *where_args])
+                for _id, tf, dl in rows:
+                    norm = tf + self.k1 * (1.0 - self.b + self.b * dl / max(avgdl, 1e-9))
+                    scores[_id] = scores.get(_id, 0.0) + idf * tf * (self.k1 + 1.0) / norm
+        return scores
+
+    def search(self, collection: str, query: str, limit: int = 20,
+               where: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """Top `limit` (id, bm25) che contengono almeno un token della query."""
+        scores = self._bm25(collection, query, where=where)
+        return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:max(0, limit)]
+
+    def bm25_scores(self, collection: str, query: str, ids: Sequence[str]) -> Dict[str, float]:
+        """BM25 della query solo per `ids` (0 se nessun token in comune, quindi assenti)."""
+        return self._bm25(collection, query, ids=list(ids))
+
+    def get_docs(self, collection: str, ids: Sequence[str]) -> Dict[str, Tuple[Optional[str], Dict[str, Any]]]:
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, document, metadata FROM docs WHERE collection=? AND id IN ({','.join('?' * len(ids))})",  # noqa: S608
+                [collection, *ids],
+            ).fetchall()
+        return {r[0]: (r[1], json.loads(r[2] or "{}")) for r in rows}
+
+    def count(self, collection: str) -> int:
+        with self._lock:
+            return self._stats(collection)[0]
+
+
+_INDEX: Optional[KeywordIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_keyword_index() -> KeywordIndex:
+    global _INDEX
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None:
+                _INDEX = KeywordIndex()
+    return _INDEX